@@ -5,6 +5,7 @@ Endpoints API para gestión de NAT/Port Forwarding (PREROUTING DNAT)
 from fastapi import APIRouter, HTTPException, status, Depends
 from typing import List, Optional
 import logging
+import os
 
 from models.nat import (
     PortForwardRequest, 
@@ -21,8 +22,8 @@ logger = logging.getLogger(__name__)
 # Router para endpoints NAT
 router = APIRouter(prefix="/nat", tags=["NAT/Port Forwarding"])
 
-# Instancia del servicio NAT (singleton)
-nat_service = NATService()
+# Instancia del servicio NAT (singleton); backend configurable por entorno
+nat_service = NATService(backend=os.getenv("GATEWAY_NAT_BACKEND", "iptables"))
 
 
 def get_nat_service() -> NATService:
@@ -136,15 +137,18 @@ async def delete_port_forward(
             summary="Listar reglas de port forwarding",
             description="Lista todas las reglas DNAT activas en PREROUTING")
 async def list_port_forwards(
+    internal_ip: Optional[str] = None,
     service: NATService = Depends(get_nat_service)
 ) -> PortForwardListResponse:
     """
     Lista todas las reglas de port forwarding activas
     
     Retorna todas las reglas DNAT configuradas en la cadena PREROUTING
+    
+    - **internal_ip**: Filtrar por IP interna de destino (opcional)
     """
     try:
-        rules = service.list_port_forwards()
+        rules = service.list_port_forwards(internal_ip=internal_ip)
         return PortForwardListResponse(
             success=True,
             total_count=len(rules),
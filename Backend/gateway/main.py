@@ -14,9 +14,9 @@ except ImportError:
     print("FastAPI no está instalado. Ejecutar: pip install fastapi uvicorn")
     exit(1)
 
-from api.nat import router as nat_router
+# Instancia del servicio NAT compartida con el router (un solo escritor del journal)
+from api.nat import router as nat_router, nat_service
 from models.nat import GatewayStatus, APIResponse
-from services.nat import NATService
 
 
 # Configurar logging
@@ -26,10 +26,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Instancia global del servicio NAT
-nat_service = NATService()
-
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Gestión del ciclo de vida de la aplicación"""
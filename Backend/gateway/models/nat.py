@@ -3,7 +3,7 @@ Modelos Pydantic para gestión de NAT/Port Forwarding
 """
 
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 import ipaddress
 
@@ -91,6 +91,15 @@ class DeletePortForwardRequest(BaseModel):
         return v
 
 
+class CommandStats(BaseModel):
+    """Contadores de ejecución de una clase de comando"""
+    calls: int = Field(..., description="Número de ejecuciones")
+    failures: int = Field(..., description="Ejecuciones fallidas")
+    total_ms: float = Field(..., description="Tiempo total en milisegundos")
+    avg_ms: float = Field(..., description="Tiempo medio en milisegundos")
+    max_ms: float = Field(..., description="Tiempo máximo en milisegundos")
+
+
 class GatewayStatus(BaseModel):
     """Estado del gateway"""
     service: str = Field(default="gateway", description="Nombre del servicio")
@@ -98,7 +107,12 @@ class GatewayStatus(BaseModel):
     active_rules: int = Field(..., description="Número de reglas activas")
     total_rules: int = Field(..., description="Total de reglas configuradas")
     iptables_available: bool = Field(..., description="Si iptables está disponible")
+    nat_backend: str = Field(default="iptables", description="Backend NAT en uso (iptables/nftables)")
     last_update: datetime = Field(..., description="Última actualización de estado")
+    command_stats: Dict[str, CommandStats] = Field(
+        default_factory=dict,
+        description="Contadores por clase de comando (iptables-save, iptables-restore...)"
+    )
 
 
 class APIResponse(BaseModel):
@@ -0,0 +1,101 @@
+"""
+Ejecución de comandos del sistema sin shell, con contadores de tiempo por clase
+"""
+
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class CommandRunner:
+    """
+    Ejecuta comandos como lista de argumentos (sin /bin/sh intermedio) y
+    acumula, por clase de comando, el número de llamadas, fallos y tiempos
+    """
+
+    def __init__(self, timeout: float = 30):
+        """
+        Inicializa el ejecutor
+
+        Args:
+            timeout: Segundos máximos por comando
+        """
+        self.logger = logging.getLogger(__name__)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def run(self, argv: List[str], input: Optional[str] = None,
+            command_class: Optional[str] = None) -> subprocess.CompletedProcess:
+        """
+        Ejecuta un comando
+
+        Args:
+            argv: Comando como lista de argumentos
+            input: Texto para la entrada estándar (p.ej. un lote de iptables-restore)
+            command_class: Clase para los contadores (por defecto el ejecutable)
+
+        Returns:
+            CompletedProcess con el resultado
+
+        Raises:
+            RuntimeError: Si el comando falla, no existe o supera el timeout
+        """
+        command_class = command_class or os.path.basename(argv[0])
+        self.logger.debug(f"Ejecutando comando: {' '.join(argv)}")
+        started = time.perf_counter()
+        try:
+            result = subprocess.run(
+                argv,
+                input=input,
+                capture_output=True,
+                text=True,
+                check=True,
+                timeout=self.timeout
+            )
+        except subprocess.CalledProcessError as e:
+            self._record(command_class, started, failed=True)
+            error_msg = f"Error ejecutando comando '{' '.join(argv)}': {e.stderr.strip()}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self._record(command_class, started, failed=True)
+            error_msg = f"Error ejecutando comando '{' '.join(argv)}': {e}"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+
+        self._record(command_class, started, failed=False)
+        return result
+
+    def _record(self, command_class: str, started: float, failed: bool) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._stats.setdefault(
+                command_class, {"calls": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stats["calls"] += 1
+            stats["failures"] += int(failed)
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Contadores por clase de comando
+
+        Returns:
+            {clase: {calls, failures, total_ms, avg_ms, max_ms}}
+        """
+        with self._lock:
+            return {
+                command_class: {
+                    "calls": stats["calls"],
+                    "failures": stats["failures"],
+                    "total_ms": round(stats["total_ms"], 2),
+                    "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                    "max_ms": round(stats["max_ms"], 2),
+                }
+                for command_class, stats in self._stats.items()
+            }
@@ -1,104 +1,48 @@
 """
-Servicio para gestión de reglas NAT/Port Forwarding usando iptables
+Servicio para gestión de reglas NAT/Port Forwarding (backends iptables y nftables)
 """
 
-import subprocess
 import logging
+import shutil
 import uuid
-import json
-import os
 from datetime import datetime
-from typing import List, Optional, Dict
+from typing import List, Optional
 
 from models.nat import PortForwardRequest, PortForwardRule, GatewayStatus
+from services.command_runner import CommandRunner
+from services.nat_backends import create_backend
+from services.rule_store import PortForwardStore
 
 
 class NATService:
     """Servicio para gestión de reglas NAT (DNAT en PREROUTING)"""
     
-    def __init__(self, rules_file: str = "/tmp/gateway_rules.json"):
+    def __init__(self, rules_file: str = "/tmp/gateway_rules.jsonl",
+                 legacy_rules_file: str = "/tmp/gateway_rules.json",
+                 backend: str = "iptables"):
         """
         Inicializa el servicio NAT
         
         Args:
-            rules_file: Archivo para persistir las reglas configuradas
+            rules_file: Journal donde se persisten las reglas configuradas
+            legacy_rules_file: Fichero JSON del formato anterior (se migra una vez)
+            backend: Backend que programa las reglas en el kernel (iptables/nftables)
         """
         self.logger = logging.getLogger(__name__)
         self.rules_file = rules_file
-        self.rules: Dict[str, PortForwardRule] = {}
-        self._load_rules()
-    
-    def _run_command(self, command: str) -> subprocess.CompletedProcess:
-        """
-        Ejecuta un comando de sistema de forma segura
-        
-        Args:
-            command: Comando a ejecutar
-            
-        Returns:
-            CompletedProcess con el resultado
-            
-        Raises:
-            RuntimeError: Si el comando falla
-        """
-        try:
-            self.logger.info(f"Ejecutando comando: {command}")
-            result = subprocess.run(
-                command, 
-                shell=True, 
-                capture_output=True, 
-                text=True, 
-                check=True
-            )
-            self.logger.debug(f"Comando exitoso: {result.stdout}")
-            return result
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error ejecutando comando '{command}': {e.stderr}"
-            self.logger.error(error_msg)
-            raise RuntimeError(error_msg)
+        self.rules = PortForwardStore(rules_file, legacy_rules_file)
+        self.runner = CommandRunner()
+        self.backend = create_backend(backend, self.runner)
+        self.logger.info(f"Backend NAT: {self.backend.name}")
     
     def _check_iptables_available(self) -> bool:
         """
         Verifica si iptables está disponible en el sistema
         
         Returns:
-            True si iptables está disponible
+            True si iptables-save e iptables-restore están disponibles
         """
-        try:
-            subprocess.run(['iptables', '--version'], 
-                         capture_output=True, check=True)
-            return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return False
-    
-    def _load_rules(self):
-        """Carga las reglas desde el archivo de persistencia"""
-        if os.path.exists(self.rules_file):
-            try:
-                with open(self.rules_file, 'r') as f:
-                    data = json.load(f)
-                    for rule_data in data.values():
-                        rule_data['created_at'] = datetime.fromisoformat(rule_data['created_at'])
-                        self.rules[rule_data['id']] = PortForwardRule(**rule_data)
-                self.logger.info(f"Cargadas {len(self.rules)} reglas desde {self.rules_file}")
-            except Exception as e:
-                self.logger.error(f"Error cargando reglas: {e}")
-                self.rules = {}
-    
-    def _save_rules(self):
-        """Guarda las reglas en el archivo de persistencia"""
-        try:
-            data = {}
-            for rule_id, rule in self.rules.items():
-                rule_dict = rule.dict()
-                rule_dict['created_at'] = rule_dict['created_at'].isoformat()
-                data[rule_id] = rule_dict
-            
-            with open(self.rules_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            self.logger.debug(f"Reglas guardadas en {self.rules_file}")
-        except Exception as e:
-            self.logger.error(f"Error guardando reglas: {e}")
+        return all(shutil.which(tool) for tool in ("iptables-save", "iptables-restore"))
     
     def _port_in_use(self, port: int, protocol: str) -> bool:
         """
@@ -111,12 +55,23 @@ class NATService:
         Returns:
             True si el puerto está en uso
         """
-        for rule in self.rules.values():
-            if (rule.external_port == port and 
-                rule.protocol == protocol and 
-                rule.active):
-                return True
-        return False
+        rule = self.rules.find_by_port(port, protocol)
+        return rule is not None and rule.active
+
+    def _rollback(self, operation, rules: List[PortForwardRule]) -> None:
+        """
+        Deshacer en el kernel un cambio que no se pudo persistir
+
+        Args:
+            operation: backend.add o backend.remove
+            rules: Reglas afectadas por el cambio
+        """
+        if not rules:
+            return
+        try:
+            operation(rules)
+        except RuntimeError as e:
+            self.logger.error(f"No se pudo deshacer el cambio en {self.backend.name}: {e}")
     
     def create_port_forward(self, request: PortForwardRequest) -> str:
         """
@@ -132,9 +87,9 @@ class NATService:
             ValueError: Si el puerto ya está en uso o datos inválidos
             RuntimeError: Si falla la creación de la regla iptables
         """
-        # Verificar si iptables está disponible
-        if not self._check_iptables_available():
-            raise RuntimeError("iptables no está disponible en el sistema")
+        # Verificar si el backend está disponible
+        if not self.backend.available():
+            raise RuntimeError(f"{self.backend.name} no está disponible en el sistema")
         
         # Verificar si el puerto ya está en uso
         if self._port_in_use(request.external_port, request.protocol):
@@ -144,19 +99,8 @@ class NATService:
         
         # Generar ID único para la regla
         rule_id = str(uuid.uuid4())[:8]
-        
-        # Crear la regla iptables DNAT en PREROUTING
-        iptables_cmd = (
-            f"iptables -t nat -A PREROUTING "
-            f"-p {request.protocol} --dport {request.external_port} "
-            f"-j DNAT --to-destination {request.internal_ip}:{request.internal_port} "
-            f"-m comment --comment 'GATEWAY-{rule_id}'"
-        )
-        
-        try:
-            self._run_command(iptables_cmd)
-        except RuntimeError as e:
-            raise RuntimeError(f"Error creando regla iptables: {e}")
+        while rule_id in self.rules:
+            rule_id = str(uuid.uuid4())[:8]
         
         # Crear el objeto regla
         rule = PortForwardRule(
@@ -170,9 +114,18 @@ class NATService:
             active=True
         )
         
-        # Guardar la regla
-        self.rules[rule_id] = rule
-        self._save_rules()
+        # Crear la regla DNAT en PREROUTING
+        try:
+            self.backend.add([rule])
+        except RuntimeError as e:
+            raise RuntimeError(f"Error creando regla {self.backend.name}: {e}")
+        
+        # Guardar la regla; si no llega al journal se deshace en el kernel
+        try:
+            self.rules.put(rule)
+        except RuntimeError:
+            self._rollback(self.backend.remove, [rule])
+            raise
         
         self.logger.info(
             f"Regla NAT creada: {request.external_port}/{request.protocol} -> "
@@ -204,55 +157,44 @@ class NATService:
         
         # Buscar la regla por ID o puerto
         if rule_id:
-            if rule_id in self.rules:
-                target_rule = self.rules[rule_id]
-                target_rule_id = rule_id
+            target_rule = self.rules.get(rule_id)
         elif external_port:
-            for rid, rule in self.rules.items():
-                if (rule.external_port == external_port and 
-                    rule.protocol == protocol and 
-                    rule.active):
-                    target_rule = rule
-                    target_rule_id = rid
-                    break
+            target_rule = self.rules.find_by_port(external_port, protocol)
+        
+        if target_rule:
+            target_rule_id = target_rule.id
         
         if not target_rule:
             raise ValueError("Regla no encontrada")
         
-        # Eliminar la regla de iptables
-        # Primero listar las reglas PREROUTING para encontrar la línea exacta
+        # Eliminar la regla del kernel
         try:
-            list_cmd = "iptables -t nat -S PREROUTING"
-            result = self._run_command(list_cmd)
-            
-            # Buscar la regla con nuestro comentario
-            for line in result.stdout.split('\n'):
-                if f"GATEWAY-{target_rule_id}" in line:
-                    # Convertir la línea de -A a -D para eliminarla
-                    delete_cmd = line.replace("-A PREROUTING", "iptables -t nat -D PREROUTING")
-                    self._run_command(delete_cmd)
-                    break
-            else:
-                self.logger.warning(f"Regla iptables no encontrada para ID: {target_rule_id}")
-        
+            self.backend.remove([target_rule])
         except RuntimeError as e:
-            raise RuntimeError(f"Error eliminando regla iptables: {e}")
+            raise RuntimeError(f"Error eliminando regla {self.backend.name}: {e}")
         
         # Marcar la regla como inactiva y eliminar del almacén
-        del self.rules[target_rule_id]
-        self._save_rules()
+        try:
+            self.rules.delete(target_rule_id)
+        except RuntimeError:
+            self._rollback(self.backend.add, [target_rule])
+            raise
         
         self.logger.info(f"Regla NAT eliminada: ID {target_rule_id}")
         return True
     
-    def list_port_forwards(self) -> List[PortForwardRule]:
+    def list_port_forwards(self, internal_ip: Optional[str] = None) -> List[PortForwardRule]:
         """
         Lista todas las reglas de port forwarding activas
         
+        Args:
+            internal_ip: Filtrar por IP interna de destino (opcional)
+            
         Returns:
             Lista de reglas activas
         """
-        return [rule for rule in self.rules.values() if rule.active]
+        rules = self.rules.find_by_internal_ip(internal_ip) if internal_ip else self.rules
+        return [rule for rule in rules if rule.active]
     
     def get_port_forward(self, rule_id: str) -> Optional[PortForwardRule]:
         """
@@ -273,15 +215,17 @@ class NATService:
         Returns:
             Estado del gateway
         """
-        active_rules = len([r for r in self.rules.values() if r.active])
+        active_rules = len([r for r in self.rules if r.active])
         total_rules = len(self.rules)
         
         return GatewayStatus(
-            status="running" if self._check_iptables_available() else "error",
+            status="running" if self.backend.available() else "error",
             active_rules=active_rules,
             total_rules=total_rules,
             iptables_available=self._check_iptables_available(),
-            last_update=datetime.now()
+            nat_backend=self.backend.name,
+            last_update=datetime.now(),
+            command_stats=self.runner.stats()
         )
     
     def flush_all_rules(self):
@@ -291,26 +235,18 @@ class NATService:
         Raises:
             RuntimeError: Si falla la eliminación
         """
+        rules = [rule for rule in self.rules if rule.active]
         try:
-            # Listar reglas PREROUTING
-            list_cmd = "iptables -t nat -S PREROUTING"
-            result = self._run_command(list_cmd)
-            
-            # Eliminar todas las reglas que contengan nuestro comentario
-            for line in result.stdout.split('\n'):
-                if "GATEWAY-" in line:
-                    delete_cmd = line.replace("-A PREROUTING", "iptables -t nat -D PREROUTING")
-                    try:
-                        self._run_command(delete_cmd)
-                    except RuntimeError:
-                        # Continuar aunque falle una regla específica
-                        continue
-        
+            # Eliminar en un único lote todas las reglas del gateway
+            self.backend.flush()
         except RuntimeError as e:
             raise RuntimeError(f"Error eliminando reglas: {e}")
         
         # Limpiar el almacén de reglas
-        self.rules.clear()
-        self._save_rules()
+        try:
+            self.rules.clear()
+        except RuntimeError:
+            self._rollback(self.backend.add, rules)
+            raise
         
         self.logger.info("Todas las reglas NAT del gateway han sido eliminadas")
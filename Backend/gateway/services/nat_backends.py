@@ -0,0 +1,251 @@
+"""
+Backends que programan las reglas DNAT del gateway en el kernel
+
+- iptables: una regla DNAT por port forward en PREROUTING (recorrido lineal
+  por cada conexión nueva)
+- nftables: una única regla DNAT que consulta un map indexado por
+  (protocolo, puerto destino); cada port forward es un elemento del map
+"""
+
+import json
+import logging
+import shutil
+from typing import Iterable, List, Optional, Set, Tuple
+
+from models.nat import PortForwardRule
+from services.command_runner import CommandRunner
+
+
+class IptablesBackend:
+    """Port forwards como reglas DNAT individuales aplicadas con iptables-restore"""
+
+    name = "iptables"
+
+    def __init__(self, runner: CommandRunner):
+        self.logger = logging.getLogger(__name__)
+        self.runner = runner
+
+    def available(self) -> bool:
+        """True si iptables-save e iptables-restore están disponibles"""
+        return all(shutil.which(tool) for tool in ("iptables-save", "iptables-restore"))
+
+    def add(self, rules: Iterable[PortForwardRule]):
+        """
+        Añade las reglas DNAT en un único lote
+
+        Raises:
+            RuntimeError: Si iptables-restore rechaza el lote
+        """
+        self._restore([f"-A {self._rule_spec(rule)}" for rule in rules])
+
+    def remove(self, rules: Iterable[PortForwardRule]):
+        """
+        Elimina las reglas DNAT en un único lote
+
+        La especificación se conoce, no hace falta listar. Si el kernel no
+        coincide (reglas editadas o borradas a mano) se buscan por comentario.
+
+        Raises:
+            RuntimeError: Si falla la eliminación
+        """
+        rules = list(rules)
+        try:
+            self._restore([f"-D {self._rule_spec(rule)}" for rule in rules])
+        except RuntimeError:
+            ids = {f"GATEWAY-{rule.id}" for rule in rules}
+            lines = self._gateway_lines(ids)
+            if len(lines) < len(ids):
+                self.logger.warning(f"{len(ids) - len(lines)} reglas iptables no encontradas en el kernel")
+            self._restore(["-D" + line[2:] for line in lines])
+
+    def flush(self):
+        """
+        Elimina todas las reglas creadas por el gateway (un iptables-save y un lote)
+
+        Raises:
+            RuntimeError: Si falla la eliminación
+        """
+        self._restore(["-D" + line[2:] for line in self._gateway_lines()])
+
+    def _restore(self, lines: List[str]):
+        """Aplica un lote atómico de líneas -A/-D de la tabla nat"""
+        if not lines:
+            return
+        script = "*nat\n" + "\n".join(lines) + "\nCOMMIT\n"
+        self.runner.run(["iptables-restore", "-w", "--noflush"], input=script)
+
+    def _gateway_lines(self, comments: Optional[set] = None) -> List[str]:
+        """
+        Lista las reglas -A de PREROUTING creadas por el gateway
+
+        Args:
+            comments: Limitar a estos comentarios (GATEWAY-<id>); por defecto todas
+
+        Returns:
+            Líneas tal como las devuelve iptables-save
+        """
+        result = self.runner.run(["iptables-save", "-t", "nat"])
+        lines = []
+        for line in result.stdout.splitlines():
+            if not line.startswith("-A PREROUTING "):
+                continue
+            tokens = line.split()
+            if comments is not None:
+                if comments.intersection(tokens):
+                    lines.append(line)
+            elif any(token.startswith("GATEWAY-") for token in tokens):
+                lines.append(line)
+        return lines
+
+    @staticmethod
+    def _rule_spec(rule: PortForwardRule) -> str:
+        """Especificación iptables (sin -A/-D) de la regla DNAT de un port forward"""
+        return (
+            f"PREROUTING -p {rule.protocol} --dport {rule.external_port} "
+            f"-j DNAT --to-destination {rule.internal_ip}:{rule.internal_port} "
+            f"-m comment --comment GATEWAY-{rule.id}"
+        )
+
+
+class NftablesBackend:
+    """
+    Port forwards como elementos de un map de nftables
+
+    La tabla contiene una sola regla en prerouting:
+
+        dnat ip to meta l4proto . th dport map @port_forwards
+
+    con el map (protocolo . puerto) -> (ip . puerto). La búsqueda es un hash
+    independiente del número de port forwards y cada alta/baja es una
+    operación atómica sobre un elemento.
+    """
+
+    name = "nftables"
+    TABLE = "telecluster_gateway"
+    MAP = "port_forwards"
+
+    def __init__(self, runner: CommandRunner):
+        self.logger = logging.getLogger(__name__)
+        self.runner = runner
+        self._ready = False
+
+    def available(self) -> bool:
+        """True si nft está disponible"""
+        return shutil.which("nft") is not None
+
+    def add(self, rules: Iterable[PortForwardRule]):
+        """
+        Añade los elementos al map en una sola transacción
+
+        Raises:
+            RuntimeError: Si nft rechaza la transacción
+        """
+        elements = [
+            f"{rule.protocol} . {rule.external_port} : {rule.internal_ip} . {rule.internal_port}"
+            for rule in rules
+        ]
+        if elements:
+            self._apply([f"add element ip {self.TABLE} {self.MAP} {{ {', '.join(elements)} }}"])
+
+    def remove(self, rules: Iterable[PortForwardRule]):
+        """
+        Elimina los elementos del map en una sola transacción
+
+        nft rechaza la transacción entera si falta un elemento (borrado a
+        mano o map recreado); en ese caso se lista el map y se eliminan solo
+        los que existen.
+
+        Raises:
+            RuntimeError: Si falla la eliminación
+        """
+        keys = list(dict.fromkeys((rule.protocol, rule.external_port) for rule in rules))
+        try:
+            self._delete(keys)
+        except RuntimeError:
+            elements = self._elements()
+            present = [key for key in keys if key in elements]
+            if len(present) < len(keys):
+                self.logger.warning(f"{len(keys) - len(present)} elementos nftables no encontrados en el map")
+            self._delete(present)
+
+    def flush(self):
+        """
+        Vacía el map (la regla DNAT y la tabla se mantienen)
+
+        Raises:
+            RuntimeError: Si falla nft
+        """
+        self._apply([f"flush map ip {self.TABLE} {self.MAP}"])
+
+    def _delete(self, keys: List[Tuple[str, int]]):
+        """Elimina los elementos (protocolo, puerto) en una transacción"""
+        if keys:
+            elements = ", ".join(f"{protocol} . {port}" for protocol, port in keys)
+            self._apply([f"delete element ip {self.TABLE} {self.MAP} {{ {elements} }}"])
+
+    def _elements(self) -> Set[Tuple[str, int]]:
+        """
+        Claves (protocolo, puerto) presentes en el map, según nft -j
+
+        Raises:
+            RuntimeError: Si falla nft
+        """
+        if not self._ready:
+            self._apply([])
+        result = self.runner.run(["nft", "-j", "list", "map", "ip", self.TABLE, self.MAP])
+        try:
+            objects = json.loads(result.stdout).get("nftables", [])
+        except ValueError as e:
+            raise RuntimeError(f"Salida JSON de nft no válida: {e}")
+
+        keys = set()
+        for obj in objects:
+            for elem in obj.get("map", {}).get("elem", []):
+                # Cada elemento es [clave, valor]; la clave es {"concat": [proto, puerto]}
+                key = elem[0] if isinstance(elem, list) and elem else {}
+                concat = key.get("concat", []) if isinstance(key, dict) else []
+                if len(concat) == 2 and str(concat[1]).isdigit():
+                    keys.add((str(concat[0]), int(concat[1])))
+        return keys
+
+    def _apply(self, commands: List[str]):
+        """Ejecuta los comandos como una transacción de nft -f"""
+        if not self._ready:
+            commands = self._setup_commands() + commands
+        if not commands:
+            return
+        self.runner.run(["nft", "-f", "-"], input="\n".join(commands) + "\n")
+        self._ready = True
+
+    def _setup_commands(self) -> List[str]:
+        """Crear (de forma idempotente) la tabla, el map y la regla DNAT"""
+        return [
+            f"add table ip {self.TABLE}",
+            f"add chain ip {self.TABLE} prerouting {{ type nat hook prerouting priority -100; policy accept; }}",
+            f"add map ip {self.TABLE} {self.MAP} {{ type inet_proto . inet_service : ipv4_addr . inet_service; }}",
+            f"flush chain ip {self.TABLE} prerouting",
+            f"add rule ip {self.TABLE} prerouting dnat ip to meta l4proto . th dport map @{self.MAP}",
+        ]
+
+
+BACKENDS = {
+    IptablesBackend.name: IptablesBackend,
+    NftablesBackend.name: NftablesBackend,
+}
+
+
+def create_backend(name: str, runner: CommandRunner):
+    """
+    Crea el backend NAT configurado
+
+    Args:
+        name: iptables o nftables
+        runner: Ejecutor de comandos compartido
+
+    Raises:
+        ValueError: Si el backend no existe
+    """
+    try:
+        return BACKENDS[name.lower()](runner)
+    except KeyError:
+        raise ValueError(f"Backend NAT desconocido: {name} (opciones: {', '.join(BACKENDS)})")
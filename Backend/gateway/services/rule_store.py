@@ -0,0 +1,277 @@
+"""
+Almacén indexado de reglas de port forwarding con journal append-only
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from models.nat import PortForwardRule
+
+
+class PortForwardStore:
+    """
+    Reglas de port forwarding indexadas por id, por (puerto externo, protocolo)
+    y por IP interna
+
+    Cada cambio se añade como una línea JSON al journal (put / del / clear)
+    con un único fsync, en lugar de reescribir el fichero completo. Cuando
+    el journal acumula demasiadas entradas obsoletas se compacta a una
+    instantánea (una línea put por regla) escrita en un temporal y renombrada
+    de forma atómica.
+
+    Si no se puede escribir el journal, put/delete/clear deshacen el cambio
+    en memoria y lanzan RuntimeError para que el llamante deshaga el suyo;
+    la siguiente escritura parte de una instantánea, por si el fallo dejó
+    media línea en el fichero.
+    """
+
+    # Compactar cuando el journal supere max(COMPACT_MIN_ENTRIES, COMPACT_RATIO * reglas)
+    COMPACT_MIN_ENTRIES = 1000
+    COMPACT_RATIO = 2
+
+    def __init__(self, journal_file: str, legacy_file: Optional[str] = None):
+        """
+        Inicializa el almacén
+
+        Args:
+            journal_file: Journal JSONL donde se persisten los cambios
+            legacy_file: Fichero JSON del formato anterior a migrar, si existe
+        """
+        self.logger = logging.getLogger(__name__)
+        self.journal_file = journal_file
+        self._lock = threading.Lock()
+        self._by_id: Dict[str, PortForwardRule] = {}
+        self._by_port: Dict[Tuple[int, str], str] = {}
+        self._by_ip: Dict[str, Set[str]] = {}
+        self._entries = 0
+        self._journal = None
+        self._damaged = False
+
+        if os.path.exists(journal_file):
+            self._replay()
+        elif legacy_file and os.path.exists(legacy_file):
+            self._migrate(legacy_file)
+
+        self._journal = open(journal_file, 'a')
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, rule_id: str) -> bool:
+        return rule_id in self._by_id
+
+    def __iter__(self) -> Iterator[PortForwardRule]:
+        return iter(list(self._by_id.values()))
+
+    def get(self, rule_id: str) -> Optional[PortForwardRule]:
+        """Regla por ID"""
+        return self._by_id.get(rule_id)
+
+    def find_by_port(self, external_port: int, protocol: str) -> Optional[PortForwardRule]:
+        """Regla que usa un puerto externo/protocolo"""
+        rule_id = self._by_port.get((external_port, protocol))
+        return self._by_id.get(rule_id) if rule_id else None
+
+    def find_by_internal_ip(self, internal_ip: str) -> List[PortForwardRule]:
+        """Reglas que redirigen hacia una IP interna"""
+        return [self._by_id[rule_id] for rule_id in self._by_ip.get(internal_ip, ())]
+
+    def put(self, rule: PortForwardRule) -> None:
+        """
+        Añadir o reemplazar una regla y registrarla en el journal
+
+        Raises:
+            RuntimeError: Si no se pudo escribir el journal (la regla no se guarda)
+        """
+        with self._lock:
+            previous = self._by_id.get(rule.id)
+            self._index(rule)
+            try:
+                self._append({"op": "put", "rule": self._serialize(rule)})
+            except RuntimeError:
+                self._unindex(rule.id)
+                if previous is not None:
+                    self._index(previous)
+                raise
+
+    def delete(self, rule_id: str) -> Optional[PortForwardRule]:
+        """
+        Eliminar una regla; devuelve la regla eliminada o None
+
+        Raises:
+            RuntimeError: Si no se pudo escribir el journal (la regla se conserva)
+        """
+        with self._lock:
+            rule = self._unindex(rule_id)
+            if rule is not None:
+                try:
+                    self._append({"op": "del", "id": rule_id})
+                except RuntimeError:
+                    self._index(rule)
+                    raise
+            return rule
+
+    def clear(self) -> None:
+        """
+        Eliminar todas las reglas
+
+        Raises:
+            RuntimeError: Si no se pudo escribir el journal (las reglas se conservan)
+        """
+        with self._lock:
+            rules = list(self._by_id.values())
+            self._by_id.clear()
+            self._by_port.clear()
+            self._by_ip.clear()
+            try:
+                self._append({"op": "clear"})
+            except RuntimeError:
+                for rule in rules:
+                    self._index(rule)
+                raise
+
+    def compact(self) -> None:
+        """Reescribir el journal como instantánea del estado actual"""
+        with self._lock:
+            self._compact()
+
+    def _index(self, rule: PortForwardRule) -> None:
+        self._unindex(rule.id)
+        self._by_id[rule.id] = rule
+        if rule.active:
+            self._by_port[(rule.external_port, rule.protocol)] = rule.id
+        self._by_ip.setdefault(rule.internal_ip, set()).add(rule.id)
+
+    def _unindex(self, rule_id: str) -> Optional[PortForwardRule]:
+        rule = self._by_id.pop(rule_id, None)
+        if rule is None:
+            return None
+        key = (rule.external_port, rule.protocol)
+        if self._by_port.get(key) == rule_id:
+            del self._by_port[key]
+        ids = self._by_ip.get(rule.internal_ip)
+        if ids is not None:
+            ids.discard(rule_id)
+            if not ids:
+                del self._by_ip[rule.internal_ip]
+        return rule
+
+    @staticmethod
+    def _serialize(rule: PortForwardRule) -> dict:
+        rule_dict = rule.dict()
+        rule_dict['created_at'] = rule_dict['created_at'].isoformat()
+        return rule_dict
+
+    @staticmethod
+    def _deserialize(rule_data: dict) -> PortForwardRule:
+        rule_data['created_at'] = datetime.fromisoformat(rule_data['created_at'])
+        return PortForwardRule(**rule_data)
+
+    def _append(self, entry: dict) -> None:
+        """
+        Escribir una entrada en el journal y sincronizarla a disco
+
+        Raises:
+            RuntimeError: Si la escritura o el fsync fallan
+        """
+        try:
+            if self._damaged:
+                # La instantánea ya incluye el cambio (el índice está actualizado)
+                self._write_snapshot()
+                self._damaged = False
+                return
+            self._journal.write(json.dumps(entry, separators=(',', ':')) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        except OSError as e:
+            self._damaged = True
+            self.logger.error(f"Error escribiendo journal de reglas: {e}")
+            raise RuntimeError(f"Error escribiendo journal de reglas: {e}")
+
+        self._entries += 1
+        if self._entries > max(self.COMPACT_MIN_ENTRIES, self.COMPACT_RATIO * len(self._by_id)):
+            self._compact()
+
+    def _replay(self) -> None:
+        """
+        Reconstruir el estado aplicando el journal en orden
+
+        Si alguna entrada no se puede aplicar (típicamente la última línea
+        truncada por una caída) o el fichero no termina en salto de línea,
+        el journal se compacta antes de volver a abrirlo para añadir: si no,
+        la siguiente entrada quedaría pegada a la línea rota y se perdería
+        en el próximo arranque.
+        """
+        damaged = False
+        with open(self.journal_file, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.endswith("\n"):
+                    damaged = True
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    op = entry['op']
+                    if op == "put":
+                        self._index(self._deserialize(entry['rule']))
+                    elif op == "del":
+                        self._unindex(entry['id'])
+                    elif op == "clear":
+                        self._by_id.clear()
+                        self._by_port.clear()
+                        self._by_ip.clear()
+                except Exception as e:
+                    self.logger.warning(f"Entrada {line_number} del journal ignorada: {e}")
+                    damaged = True
+                    continue
+                self._entries += 1
+        self.logger.info(f"Cargadas {len(self._by_id)} reglas desde {self.journal_file}")
+
+        if damaged:
+            self.logger.warning(f"Journal {self.journal_file} dañado, reescribiendo instantánea")
+            self._compact()
+
+    def _migrate(self, legacy_file: str) -> None:
+        """Importar el fichero JSON antiguo y escribir la primera instantánea"""
+        try:
+            with open(legacy_file, 'r') as f:
+                data = json.load(f)
+            for rule_data in data.values():
+                self._index(self._deserialize(rule_data))
+        except Exception as e:
+            self.logger.error(f"Error migrando reglas desde {legacy_file}: {e}")
+            return
+
+        self._compact()
+        self.logger.info(f"Migradas {len(self._by_id)} reglas de {legacy_file} a {self.journal_file}")
+
+    def _compact(self) -> None:
+        try:
+            self._write_snapshot()
+        except OSError as e:
+            self.logger.error(f"Error compactando journal de reglas: {e}")
+            return
+        self.logger.debug(f"Journal compactado: {self._entries} reglas")
+
+    def _write_snapshot(self) -> None:
+        """Reemplazar el journal por una instantánea del estado actual (lanza OSError)"""
+        tmp_file = f"{self.journal_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            for rule in self._by_id.values():
+                f.write(json.dumps({"op": "put", "rule": self._serialize(rule)}, separators=(',', ':')) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.journal_file)
+
+        if self._journal is not None:
+            try:
+                # Lo que quedara en el buffer va al fichero ya reemplazado
+                self._journal.close()
+            except OSError:
+                pass
+            self._journal = open(self.journal_file, 'a')
+        self._entries = len(self._by_id)
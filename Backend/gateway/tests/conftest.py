@@ -0,0 +1,22 @@
+"""
+Configuración común de los tests del Gateway Agent
+"""
+
+import os
+import sys
+
+import pytest
+
+# Los módulos del agente se importan desde su directorio raíz (models, services)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKEBIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakebin")
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    """nft, iptables-restore e iptables-save falsos (tests/fakebin) con estado en tmp_path"""
+    monkeypatch.setenv("PATH", FAKEBIN_DIR + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.setenv("FAKE_NFT_STATE", str(tmp_path / "nft.json"))
+    monkeypatch.setenv("FAKE_IPTABLES_STATE", str(tmp_path / "iptables.rules"))
+    return tmp_path
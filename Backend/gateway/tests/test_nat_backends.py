@@ -0,0 +1,78 @@
+"""
+Tests de los backends DNAT contra binarios nft/iptables falsos (tests/fakebin)
+"""
+
+import json
+import logging
+from datetime import datetime
+
+from models.nat import PortForwardRule
+from services.command_runner import CommandRunner
+from services.nat_backends import IptablesBackend, NftablesBackend
+
+
+def make_rule(rule_id: str, port: int, protocol: str = "tcp") -> PortForwardRule:
+    return PortForwardRule(
+        id=rule_id,
+        external_port=port,
+        internal_ip="10.0.0.10",
+        internal_port=22,
+        protocol=protocol,
+        created_at=datetime(2024, 1, 1)
+    )
+
+
+def nft_state(fake_bin) -> dict:
+    return json.loads((fake_bin / "nft.json").read_text())
+
+
+def test_nft_add_creates_table_once(fake_bin):
+    backend = NftablesBackend(CommandRunner())
+    backend.add([make_rule("a", 2201)])
+    backend.add([make_rule("b", 2202, "udp")])
+
+    state = nft_state(fake_bin)
+    assert len(state["rules"]) == 1
+    assert state["elements"] == {"tcp . 2201": "10.0.0.10 . 22", "udp . 2202": "10.0.0.10 . 22"}
+
+
+def test_nft_remove_tolerates_missing_elements(fake_bin, caplog):
+    backend = NftablesBackend(CommandRunner())
+    backend.add([make_rule("a", 2201), make_rule("b", 2202)])
+
+    # "a" se borró a mano: la transacción completa fallaría en nft
+    NftablesBackend(CommandRunner()).remove([make_rule("a", 2201)])
+
+    with caplog.at_level(logging.WARNING, logger="services.nat_backends"):
+        backend.remove([make_rule("a", 2201), make_rule("b", 2202)])
+
+    assert nft_state(fake_bin)["elements"] == {}
+    assert "1 elementos nftables no encontrados" in caplog.text
+
+
+def test_nft_remove_on_fresh_host_does_not_fail(fake_bin):
+    # Proceso recién arrancado y sin tabla: el map se crea y no hay nada que borrar
+    NftablesBackend(CommandRunner()).remove([make_rule("a", 2201)])
+    assert nft_state(fake_bin)["elements"] == {}
+
+
+def test_nft_flush_keeps_dnat_rule(fake_bin):
+    backend = NftablesBackend(CommandRunner())
+    backend.add([make_rule(str(port), port) for port in range(2200, 2210)])
+    backend.flush()
+
+    state = nft_state(fake_bin)
+    assert state["elements"] == {}
+    assert len(state["rules"]) == 1
+
+
+def test_iptables_remove_tolerates_missing_rules(fake_bin, caplog):
+    backend = IptablesBackend(CommandRunner())
+    backend.add([make_rule("a", 2201), make_rule("b", 2202)])
+    backend.remove([make_rule("a", 2201)])
+
+    with caplog.at_level(logging.WARNING, logger="services.nat_backends"):
+        backend.remove([make_rule("a", 2201), make_rule("b", 2202)])
+
+    assert (fake_bin / "iptables.rules").read_text() == ""
+    assert "1 reglas iptables no encontradas" in caplog.text
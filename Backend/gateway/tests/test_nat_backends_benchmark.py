@@ -0,0 +1,97 @@
+"""
+Microbenchmark de escalado de los backends DNAT con el número de port forwards
+
+Con binarios falsos no se mide el kernel, pero sí lo que cada backend le
+entrega: cuántas reglas recorre un paquete nuevo hasta su DNAT (iptables:
+cadena lineal; nftables: una regla + búsqueda en el map) y el coste de una
+alta/baja con N reglas cargadas. Ejecutar con -s para ver la tabla.
+"""
+
+import json
+import time
+from datetime import datetime
+from typing import List
+
+import pytest
+
+from models.nat import PortForwardRule
+from services.command_runner import CommandRunner
+from services.nat_backends import IptablesBackend, NftablesBackend
+
+
+SIZES = (10, 2000)
+UPDATES = 5
+BASE_PORT = 20000
+
+
+class RecordingRunner(CommandRunner):
+    """CommandRunner que guarda el tamaño de la entrada de cada comando"""
+
+    def __init__(self):
+        super().__init__()
+        self.inputs: List[int] = []
+
+    def run(self, argv, input=None, command_class=None):
+        self.inputs.append(len(input or ""))
+        return super().run(argv, input=input, command_class=command_class)
+
+
+def make_rule(port: int) -> PortForwardRule:
+    return PortForwardRule(
+        id=f"pf{port}",
+        external_port=port,
+        internal_ip="10.0.0.10",
+        internal_port=22,
+        protocol="tcp",
+        created_at=datetime(2024, 1, 1)
+    )
+
+
+def rules_walked(backend, fake_bin, port: int) -> int:
+    """Reglas de PREROUTING evaluadas hasta el DNAT de un puerto"""
+    if isinstance(backend, NftablesBackend):
+        state = json.loads((fake_bin / "nft.json").read_text())
+        assert f"tcp . {port}" in state["elements"]
+        return len(state["rules"])
+    rules = (fake_bin / "iptables.rules").read_text().splitlines()
+    return next(i for i, rule in enumerate(rules, 1) if f"--dport {port} " in rule)
+
+
+def measure(backend_class, fake_bin, size: int) -> dict:
+    for state in ("nft.json", "iptables.rules"):
+        (fake_bin / state).unlink(missing_ok=True)
+    runner = RecordingRunner()
+    backend = backend_class(runner)
+    backend.add([make_rule(BASE_PORT + i) for i in range(size)])
+    walked = rules_walked(backend, fake_bin, BASE_PORT + size - 1)
+
+    runner.inputs.clear()
+    started = time.perf_counter()
+    for i in range(UPDATES):
+        rule = make_rule(BASE_PORT + size + i)
+        backend.add([rule])
+        backend.remove([rule])
+    elapsed_ms = (time.perf_counter() - started) * 1000 / (2 * UPDATES)
+
+    return {"walked": walked, "update_ms": elapsed_ms, "update_bytes": max(runner.inputs)}
+
+
+@pytest.mark.parametrize("backend_class", [IptablesBackend, NftablesBackend])
+def test_backend_scaling(fake_bin, backend_class):
+    results = {size: measure(backend_class, fake_bin, size) for size in SIZES}
+
+    for size, result in results.items():
+        print(
+            f"\n{backend_class.name:>9} N={size:<5} reglas recorridas={result['walked']:<5} "
+            f"alta/baja={result['update_ms']:.1f} ms ({result['update_bytes']} bytes)"
+        )
+
+    small, large = (results[size] for size in SIZES)
+    # Cada alta/baja envía lo mismo con 10 que con 2000 reglas en ambos backends
+    assert small["update_bytes"] == large["update_bytes"]
+    if backend_class is NftablesBackend:
+        # Una sola regla DNAT: la búsqueda no depende de N
+        assert small["walked"] == large["walked"] == 1
+    else:
+        # La cadena de PREROUTING crece con cada port forward
+        assert large["walked"] == SIZES[1]
@@ -0,0 +1,169 @@
+"""
+Tests del almacén de reglas de port forwarding (journal append-only)
+"""
+
+from datetime import datetime
+
+import pytest
+
+from models.nat import PortForwardRequest, PortForwardRule
+from services import rule_store
+from services.nat import NATService
+from services.rule_store import PortForwardStore
+
+
+def make_rule(rule_id: str, port: int) -> PortForwardRule:
+    return PortForwardRule(
+        id=rule_id,
+        external_port=port,
+        internal_ip="10.0.0.10",
+        internal_port=22,
+        protocol="tcp",
+        created_at=datetime(2024, 1, 1)
+    )
+
+
+def test_replay_restores_rules(tmp_path):
+    journal = tmp_path / "rules.jsonl"
+    store = PortForwardStore(str(journal))
+    store.put(make_rule("a", 2201))
+    store.put(make_rule("b", 2202))
+    store.delete("a")
+
+    reloaded = PortForwardStore(str(journal))
+    assert [rule.id for rule in reloaded] == ["b"]
+    assert reloaded.find_by_port(2202, "tcp").id == "b"
+
+
+def test_torn_last_line_does_not_swallow_next_entry(tmp_path):
+    journal = tmp_path / "rules.jsonl"
+    store = PortForwardStore(str(journal))
+    store.put(make_rule("a", 2201))
+    store.put(make_rule("b", 2202))
+
+    # Caída a mitad de escribir un put: línea truncada y sin salto de línea
+    with open(journal, "a") as f:
+        f.write('{"op":"put","rule":{"id":"c"')
+
+    recovered = PortForwardStore(str(journal))
+    assert sorted(rule.id for rule in recovered) == ["a", "b"]
+    recovered.delete("a")
+
+    restarted = PortForwardStore(str(journal))
+    assert [rule.id for rule in restarted] == ["b"]
+    for line in journal.read_text().splitlines():
+        assert line.startswith('{"op"') and line.endswith("}")
+
+
+def test_valid_last_line_without_newline_is_kept(tmp_path):
+    journal = tmp_path / "rules.jsonl"
+    store = PortForwardStore(str(journal))
+    store.put(make_rule("a", 2201))
+    content = journal.read_text()
+    journal.write_text(content.rstrip("\n"))
+
+    recovered = PortForwardStore(str(journal))
+    recovered.put(make_rule("b", 2202))
+
+    restarted = PortForwardStore(str(journal))
+    assert sorted(rule.id for rule in restarted) == ["a", "b"]
+
+
+class FailingFsync:
+    """os.fsync que falla las primeras `failures` llamadas"""
+
+    def __init__(self, failures: int = 1):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, fd):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise OSError(28, "No space left on device")
+
+
+def test_journal_write_error_is_raised_and_rolled_back(tmp_path, monkeypatch):
+    journal = tmp_path / "rules.jsonl"
+    store = PortForwardStore(str(journal))
+    store.put(make_rule("a", 2201))
+
+    monkeypatch.setattr(rule_store.os, "fsync", FailingFsync())
+    with pytest.raises(RuntimeError, match="journal"):
+        store.put(make_rule("b", 2202))
+    assert "b" not in store
+    assert store.find_by_port(2202, "tcp") is None
+
+    # La siguiente escritura parte de una instantánea sin la regla fallida
+    store.put(make_rule("c", 2203))
+    restarted = PortForwardStore(str(journal))
+    assert sorted(rule.id for rule in restarted) == ["a", "c"]
+
+
+def test_delete_and_clear_keep_rules_when_journal_fails(tmp_path, monkeypatch):
+    store = PortForwardStore(str(tmp_path / "rules.jsonl"))
+    store.put(make_rule("a", 2201))
+    store.put(make_rule("b", 2202))
+
+    monkeypatch.setattr(rule_store.os, "fsync", FailingFsync(failures=2))
+    with pytest.raises(RuntimeError):
+        store.delete("a")
+    with pytest.raises(RuntimeError):
+        store.clear()
+
+    assert sorted(rule.id for rule in store) == ["a", "b"]
+    assert store.find_by_port(2201, "tcp").id == "a"
+
+
+def test_nat_service_undoes_kernel_change_when_journal_fails(fake_bin, tmp_path, monkeypatch):
+    service = NATService(str(tmp_path / "rules.jsonl"), str(tmp_path / "legacy.json"))
+    kept = service.create_port_forward(PortForwardRequest(
+        external_port=2201, internal_ip="10.0.0.10", internal_port=22
+    ))
+
+    monkeypatch.setattr(rule_store.os, "fsync", FailingFsync())
+    with pytest.raises(RuntimeError):
+        service.create_port_forward(PortForwardRequest(
+            external_port=2202, internal_ip="10.0.0.11", internal_port=22
+        ))
+
+    nat_rules = (fake_bin / "iptables.rules").read_text()
+    assert "--dport 2201" in nat_rules
+    assert "--dport 2202" not in nat_rules
+    assert [rule.id for rule in service.list_port_forwards()] == [kept]
+
+
+def test_constant_fsync_cost_and_periodic_compaction_at_50k_rules(tmp_path, monkeypatch):
+    """Cada cambio es una línea y un fsync, sea cual sea el número de reglas"""
+    rules = 50_000
+    journal = tmp_path / "rules.jsonl"
+    store = PortForwardStore(str(journal))
+    fsync = FailingFsync(failures=0)
+    monkeypatch.setattr(rule_store.os, "fsync", fsync)
+    compactions = []
+    write_snapshot = store._write_snapshot
+    monkeypatch.setattr(store, "_write_snapshot", lambda: (compactions.append(len(store)), write_snapshot()))
+
+    for i in range(rules):
+        store.put(make_rule(f"{i:08x}", 1024 + i))
+    # Carga inicial: el journal solo se compacta al superar COMPACT_RATIO entradas por regla
+    assert compactions == []
+    assert fsync.calls == rules
+
+    # Con 50000 reglas, un cambio sigue siendo una línea y un fsync
+    size = journal.stat().st_size
+    fsync.calls = 0
+    store.delete(f"{0:08x}")
+    assert fsync.calls == 1
+    assert journal.stat().st_size - size < 100
+
+    # Churn: las reescrituras compactan cada COMPACT_RATIO * reglas entradas
+    for i in range(1, 2 * rules):
+        store.put(make_rule(f"{i % rules:08x}", 1024 + i % rules))
+    assert len(compactions) == 1
+    assert rules - 1 <= compactions[0] <= rules
+    lines = journal.read_text().count("\n")
+    assert lines <= PortForwardStore.COMPACT_RATIO * len(store)
+
+    restarted = PortForwardStore(str(journal))
+    assert len(restarted) == len(store)
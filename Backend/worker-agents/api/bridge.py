@@ -8,6 +8,7 @@ from models.bridge import (
 )
 from models.network import APIResponse, ResponseStatus
 from services.bridge import BridgeService
+from utils.executor import run_blocking
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -26,10 +27,12 @@ async def create_bridge(request: BridgeCreateRequest):
     - **stp**: Habilitar Spanning Tree Protocol
     """
     try:
-        result = BridgeService.create_bridge(
+        result = await run_blocking(
+            BridgeService.create_bridge,
             name=request.name,
             bridge_type=request.type,
-            stp=request.stp
+            stp=request.stp,
+            resource="ovs"
         )
         
         if result.get("success", False):
@@ -61,9 +64,11 @@ async def delete_bridge(request: BridgeDeleteRequest):
     - **force**: Forzar eliminación aunque tenga interfaces conectadas
     """
     try:
-        result = BridgeService.delete_bridge(
+        result = await run_blocking(
+            BridgeService.delete_bridge,
             name=request.name,
-            force=request.force
+            force=request.force,
+            resource="ovs"
         )
         
         if result.get("success", False):
@@ -96,10 +101,12 @@ async def add_port_to_bridge(request: BridgeAddPortRequest):
     - **vlan**: VLAN ID opcional (1-4094)
     """
     try:
-        result = BridgeService.add_port(
+        result = await run_blocking(
+            BridgeService.add_port,
             bridge_name=request.bridge_name,
             port_name=request.port_name,
-            vlan=request.vlan
+            vlan=request.vlan,
+            resource="ovs"
         )
         
         if result.get("success", False):
@@ -131,9 +138,11 @@ async def remove_port_from_bridge(request: BridgeRemovePortRequest):
     - **port_name**: Nombre del puerto/interfaz a remover
     """
     try:
-        result = BridgeService.remove_port(
+        result = await run_blocking(
+            BridgeService.remove_port,
             bridge_name=request.bridge_name,
-            port_name=request.port_name
+            port_name=request.port_name,
+            resource="ovs"
         )
         
         if result.get("success", False):
@@ -164,7 +173,7 @@ async def list_bridges():
     Devuelve información detallada de todos los bridges (Linux y OVS)
     """
     try:
-        bridges = BridgeService.list_bridges()
+        bridges = await run_blocking(BridgeService.list_bridges, resource="ovs")
         return BridgeListResponse(bridges=bridges)
         
     except Exception as e:
@@ -183,7 +192,7 @@ async def get_bridge_info(bridge_name: str):
     - **bridge_name**: Nombre del bridge a consultar
     """
     try:
-        bridge_info = BridgeService.get_bridge_info(bridge_name)
+        bridge_info = await run_blocking(BridgeService.get_bridge_info, bridge_name, resource="ovs")
         
         if bridge_info:
             return APIResponse(
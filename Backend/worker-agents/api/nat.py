@@ -3,10 +3,11 @@ import logging
 
 from models.nat import (
     PortForwardRequest, PortForwardDeleteRequest, MasqueradeRequest,
-    NATStatus, Protocol
+    NATBulkRequest, NATStatus, Protocol
 )
 from models.network import APIResponse, ResponseStatus
 from services.nat import NATService
+from utils.executor import run_blocking
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -28,13 +29,15 @@ async def add_port_forward(request: PortForwardRequest):
     - **description**: Descripción de la regla
     """
     try:
-        result = NATService.add_port_forward(
+        result = await run_blocking(
+            NATService.add_port_forward,
             external_port=request.external_port,
             internal_ip=request.internal_ip,
             internal_port=request.internal_port,
             protocol=request.protocol,
             interface=request.interface,
-            description=request.description
+            description=request.description,
+            resource="iptables"
         )
         
         if result.get("success", False):
@@ -69,11 +72,13 @@ async def remove_port_forward(request: PortForwardDeleteRequest):
     - **internal_port**: Puerto interno
     """
     try:
-        result = NATService.remove_port_forward(
+        result = await run_blocking(
+            NATService.remove_port_forward,
             rule_id=request.rule_id,
             external_port=request.external_port,
             internal_ip=request.internal_ip,
-            internal_port=request.internal_port
+            internal_port=request.internal_port,
+            resource="iptables"
         )
         
         if result.get("success", False):
@@ -96,6 +101,48 @@ async def remove_port_forward(request: PortForwardDeleteRequest):
         )
 
 
+@router.post("/bulk", response_model=APIResponse)
+async def apply_bulk(request: NATBulkRequest):
+    """
+    Aplicar un lote de reglas NAT en una sola transacción (iptables-restore)
+    
+    - **port_forwards**: Port forwards a crear
+    - **masquerades**: Reglas de masquerade a crear
+    - **remove_rule_ids**: IDs de reglas a eliminar
+    
+    Si iptables rechaza alguna regla no se aplica ningún cambio del lote.
+    """
+    try:
+        result = await run_blocking(
+            NATService.apply_bulk,
+            port_forwards=request.port_forwards,
+            masquerades=request.masquerades,
+            remove_rule_ids=request.remove_rule_ids,
+            resource="iptables"
+        )
+        
+        if result.get("success", False):
+            return APIResponse(
+                status=ResponseStatus.ok,
+                message=f"Lote NAT aplicado: {len(result['added'])} altas, {len(result['removed'])} bajas",
+                data=result
+            )
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=result.get("error", "Error desconocido")
+            )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en apply_bulk: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno del servidor: {str(e)}"
+        )
+
+
 @router.post("/masquerade", response_model=APIResponse)
 async def add_masquerade(request: MasqueradeRequest):
     """
@@ -106,9 +153,11 @@ async def add_masquerade(request: MasqueradeRequest):
     - **enabled**: Habilitar masquerade (por defecto true)
     """
     try:
-        result = NATService.add_masquerade(
+        result = await run_blocking(
+            NATService.add_masquerade,
             source_network=request.source_network,
-            output_interface=request.output_interface
+            output_interface=request.output_interface,
+            resource="iptables"
         )
         
         if result.get("success", False):
@@ -140,9 +189,11 @@ async def remove_masquerade(source_network: str, output_interface: str):
     - **output_interface**: Interfaz de salida
     """
     try:
-        result = NATService.remove_masquerade(
+        result = await run_blocking(
+            NATService.remove_masquerade,
             source_network=source_network,
-            output_interface=output_interface
+            output_interface=output_interface,
+            resource="iptables"
         )
         
         if result.get("success", False):
@@ -187,14 +238,16 @@ async def add_firewall_rule(
     - **interface**: Interfaz opcional
     """
     try:
-        result = NATService.add_firewall_rule(
+        result = await run_blocking(
+            NATService.add_firewall_rule,
             chain=chain,
             action=action,
             protocol=protocol,
             source=source,
             destination=destination,
             port=port,
-            interface=interface
+            interface=interface,
+            resource="iptables"
         )
         
         if result.get("success", False):
@@ -217,6 +270,44 @@ async def add_firewall_rule(
         )
 
 
+@router.delete("/firewall/{rule_id}", response_model=APIResponse)
+async def remove_firewall_rule(rule_id: str):
+    """
+    Eliminar regla de firewall por ID
+    
+    Si era la última regla de su grupo también se eliminan el set de ipset
+    y la regla iptables que lo referencia.
+    """
+    try:
+        result = await run_blocking(NATService.remove_firewall_rule, rule_id, resource="iptables")
+        
+        if result.get("success", False):
+            return APIResponse(
+                status=ResponseStatus.ok,
+                message=f"Regla firewall eliminada: {rule_id}",
+                data=result
+            )
+        elif "no encontrada" in result.get("error", ""):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=result["error"]
+            )
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=result.get("error", "Error desconocido")
+            )
+            
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error en remove_firewall_rule: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error interno del servidor: {str(e)}"
+        )
+
+
 @router.get("/status", response_model=NATStatus)
 async def get_nat_status():
     """
@@ -228,7 +319,7 @@ async def get_nat_status():
     - Reglas de firewall
     """
     try:
-        nat_status = NATService.list_nat_rules()
+        nat_status = await run_blocking(NATService.list_nat_rules, resource="iptables")
         return nat_status
         
     except Exception as e:
@@ -248,7 +339,7 @@ async def flush_nat_rules():
     y masquerade. Use con precaución.
     """
     try:
-        result = NATService.flush_nat_rules()
+        result = await run_blocking(NATService.flush_nat_rules, resource="iptables")
         
         if result.get("success", False):
             return APIResponse(
@@ -279,7 +370,7 @@ async def flush_firewall_rules():
     Use con precaución ya que puede afectar la conectividad.
     """
     try:
-        result = NATService.flush_firewall_rules()
+        result = await run_blocking(NATService.flush_firewall_rules, resource="iptables")
         
         if result.get("success", False):
             return APIResponse(
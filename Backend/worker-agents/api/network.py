@@ -5,7 +5,10 @@ import logging
 # Importar todos los sub-routers
 from api import bridge, veth, vlan, tuntap, nat
 from models.network import NetworkInterface, NetworkTopology, HealthStatus, APIResponse, ResponseStatus
+from models.topology import TopologyApplyRequest
 from services.network import NetworkService
+from services.topology import TopologyService
+from utils.executor import run_blocking
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -51,7 +54,7 @@ async def list_interfaces():
     - Virtuales (lo, docker)
     """
     try:
-        interfaces = NetworkService.list_interfaces()
+        interfaces = await run_blocking(NetworkService.list_interfaces, resource="ip")
         return interfaces
         
     except Exception as e:
@@ -70,7 +73,7 @@ async def get_interface_info(interface_name: str):
     - **interface_name**: Nombre de la interfaz a consultar
     """
     try:
-        interface = NetworkService.get_interface_info(interface_name)
+        interface = await run_blocking(NetworkService.get_interface_info, interface_name, resource="ip")
         
         return APIResponse(
             status=ResponseStatus.ok,
@@ -97,7 +100,7 @@ async def get_network_topology():
     - Tabla de rutas
     """
     try:
-        topology = NetworkService.get_network_topology()
+        topology = await run_blocking(NetworkService.get_network_topology, resource="ip")
         return topology
         
     except Exception as e:
@@ -120,7 +123,7 @@ async def get_system_health():
     - Tiempo de actividad
     """
     try:
-        health = NetworkService.get_system_health()
+        health = await run_blocking(NetworkService.get_system_health, resource="ip")
         return health
         
     except Exception as e:
@@ -140,7 +143,7 @@ async def ping_host(target: str, count: int = Query(default=4, ge=1, le=20)):
     - **count**: Número de pings (1-20, por defecto 4)
     """
     try:
-        result = NetworkService.ping_host(target=target, count=count)
+        result = await NetworkService.ping_host(target=target, count=count)
         
         if result.get("success", False):
             return APIResponse(
@@ -171,7 +174,7 @@ async def traceroute_host(target: str):
     - **target**: IP o hostname destino
     """
     try:
-        result = NetworkService.traceroute(target=target)
+        result = await NetworkService.traceroute(target=target)
         
         if result.get("success", False):
             return APIResponse(
@@ -202,7 +205,7 @@ async def get_routing_table():
     Devuelve todas las rutas configuradas en el sistema
     """
     try:
-        topology = NetworkService.get_network_topology()
+        topology = await run_blocking(NetworkService.get_network_topology, resource="ip")
         
         return APIResponse(
             status=ResponseStatus.ok,
@@ -226,7 +229,7 @@ async def get_bridges_summary():
     Lista simplificada de bridges (Linux y OVS)
     """
     try:
-        topology = NetworkService.get_network_topology()
+        topology = await run_blocking(NetworkService.get_network_topology, resource="ip")
         
         return APIResponse(
             status=ResponseStatus.ok,
@@ -240,3 +243,39 @@ async def get_bridges_summary():
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error obteniendo bridges: {str(e)}"
         )
+
+
+@router.post("/apply", response_model=APIResponse)
+async def apply_topology(topology: TopologyApplyRequest):
+    """
+    Aplicar una topología de red completa en una sola operación
+    
+    Crea bridges, pares veth, interfaces TAP, VLANs y direcciones IP con un
+    único `ip -batch` (más una transacción ovs-vsctl para bridges OVS) y
+    devuelve el resultado de cada objeto. Los objetos que ya existen no se
+    vuelven a crear y se reportan como `unchanged`.
+    
+    - **dry_run**: Solo compilar y devolver los comandos sin ejecutarlos
+    """
+    try:
+        result = await run_blocking(TopologyService.apply_topology, topology, resource="ip")
+        
+        if result.get("success", False):
+            return APIResponse(
+                status=ResponseStatus.ok,
+                message="Topología aplicada" if not topology.dry_run else "Topología compilada",
+                data=result
+            )
+        else:
+            return APIResponse(
+                status=ResponseStatus.warning,
+                message=f"Topología aplicada con {result['failed']} objetos fallidos",
+                data=result
+            )
+        
+    except Exception as e:
+        logger.error(f"Error en apply_topology: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error aplicando topología: {str(e)}"
+        )
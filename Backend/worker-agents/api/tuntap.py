@@ -8,6 +8,7 @@ from models.tuntap import (
 )
 from models.network import APIResponse, ResponseStatus
 from services.tuntap import TunTapService
+from utils.executor import run_blocking
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -30,14 +31,16 @@ async def create_tuntap(request: TunTapCreateRequest):
     - **persistent**: Hacer la interfaz persistente
     """
     try:
-        result = TunTapService.create_tuntap(
+        result = await run_blocking(
+            TunTapService.create_tuntap,
             name=request.name,
             tap_type=request.type,
             mode=request.mode,
             owner=request.owner,
             group=request.group,
             bridge=request.bridge,
-            persistent=request.persistent
+            persistent=request.persistent,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -68,7 +71,7 @@ async def delete_tuntap(request: TunTapDeleteRequest):
     - **name**: Nombre de la interfaz a eliminar
     """
     try:
-        result = TunTapService.delete_tuntap(request.name)
+        result = await run_blocking(TunTapService.delete_tuntap, request.name, resource="ip")
         
         if result.get("success", False):
             return APIResponse(
@@ -99,9 +102,11 @@ async def attach_tap_to_bridge(request: TunTapAttachRequest):
     - **bridge_name**: Nombre del bridge destino
     """
     try:
-        result = TunTapService.attach_to_bridge(
+        result = await run_blocking(
+            TunTapService.attach_to_bridge,
             tap_name=request.tap_name,
-            bridge_name=request.bridge_name
+            bridge_name=request.bridge_name,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -132,7 +137,7 @@ async def detach_tap_from_bridge(request: TunTapDetachRequest):
     - **tap_name**: Nombre de la interfaz TAP a desconectar
     """
     try:
-        result = TunTapService.detach_from_bridge(request.tap_name)
+        result = await run_blocking(TunTapService.detach_from_bridge, request.tap_name, resource="ip")
         
         if result.get("success", False):
             return APIResponse(
@@ -164,10 +169,12 @@ async def set_interface_ip(interface_name: str, ip_address: str, netmask: str =
     - **netmask**: Máscara de red (por defecto 24)
     """
     try:
-        result = TunTapService.set_interface_ip(
+        result = await run_blocking(
+            TunTapService.set_interface_ip,
             interface_name=interface_name,
             ip_address=ip_address,
-            netmask=netmask
+            netmask=netmask,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -200,10 +207,12 @@ async def remove_interface_ip(interface_name: str, ip_address: str, netmask: str
     - **netmask**: Máscara de red (por defecto 24)
     """
     try:
-        result = TunTapService.remove_interface_ip(
+        result = await run_blocking(
+            TunTapService.remove_interface_ip,
             interface_name=interface_name,
             ip_address=ip_address,
-            netmask=netmask
+            netmask=netmask,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -234,7 +243,7 @@ async def list_tuntaps():
     Devuelve información detallada de todas las interfaces TUN/TAP
     """
     try:
-        tuntaps = TunTapService.list_tuntaps()
+        tuntaps = await run_blocking(TunTapService.list_tuntaps, resource="ip")
         return tuntaps
         
     except Exception as e:
@@ -253,7 +262,7 @@ async def get_tuntap_info(interface_name: str):
     - **interface_name**: Nombre de la interfaz a consultar
     """
     try:
-        tuntap_info = TunTapService.get_tuntap_info(interface_name)
+        tuntap_info = await run_blocking(TunTapService.get_tuntap_info, interface_name, resource="ip")
         
         if tuntap_info:
             return APIResponse(
@@ -5,6 +5,7 @@ import logging
 from models.veth import VethCreateRequest, VethDeleteRequest, VethMoveRequest, VethInfo
 from models.network import APIResponse, ResponseStatus
 from services.veth import VethService
+from utils.executor import run_blocking
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -26,13 +27,15 @@ async def create_veth_pair(request: VethCreateRequest):
     - **namespace2**: Namespace opcional para mover el segundo extremo
     """
     try:
-        result = VethService.create_veth_pair(
+        result = await run_blocking(
+            VethService.create_veth_pair,
             name1=request.name1,
             name2=request.name2,
             bridge1=request.bridge1,
             bridge2=request.bridge2,
             namespace1=request.namespace1,
-            namespace2=request.namespace2
+            namespace2=request.namespace2,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -63,7 +66,7 @@ async def delete_veth_pair(request: VethDeleteRequest):
     - **name**: Nombre de cualquier extremo del par veth (elimina todo el par)
     """
     try:
-        result = VethService.delete_veth_pair(request.name)
+        result = await run_blocking(VethService.delete_veth_pair, request.name, resource="ip")
         
         if result.get("success", False):
             return APIResponse(
@@ -100,9 +103,11 @@ async def move_veth_to_bridge(request: VethMoveRequest):
                 detail="target_bridge es requerido"
             )
         
-        result = VethService.move_veth_to_bridge(
+        result = await run_blocking(
+            VethService.move_veth_to_bridge,
             veth_name=request.veth_name,
-            bridge_name=request.target_bridge
+            bridge_name=request.target_bridge,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -142,9 +147,11 @@ async def move_veth_to_namespace(request: VethMoveRequest):
                 detail="target_namespace es requerido"
             )
         
-        result = VethService.move_veth_to_namespace(
+        result = await run_blocking(
+            VethService.move_veth_to_namespace,
             veth_name=request.veth_name,
-            namespace=request.target_namespace
+            namespace=request.target_namespace,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -177,7 +184,7 @@ async def list_veth_pairs():
     Devuelve información detallada de todos los pares veth
     """
     try:
-        veth_pairs = VethService.list_veth_pairs()
+        veth_pairs = await run_blocking(VethService.list_veth_pairs, resource="ip")
         return veth_pairs
         
     except Exception as e:
@@ -196,7 +203,7 @@ async def get_veth_info(veth_name: str):
     - **veth_name**: Nombre del veth a consultar
     """
     try:
-        veth_info = VethService.get_veth_info(veth_name)
+        veth_info = await run_blocking(VethService.get_veth_info, veth_name, resource="ip")
         
         if veth_info:
             return APIResponse(
@@ -8,6 +8,7 @@ from models.vlan import (
 )
 from models.network import APIResponse, ResponseStatus
 from services.vlan import VLANService
+from utils.executor import run_blocking
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -27,11 +28,13 @@ async def create_vlan(request: VLANCreateRequest):
     - **protocol**: Protocolo VLAN (802.1Q o 802.1ad)
     """
     try:
-        result = VLANService.create_vlan(
+        result = await run_blocking(
+            VLANService.create_vlan,
             parent_interface=request.parent_interface,
             vlan_id=request.vlan_id,
             name=request.name,
-            protocol=request.protocol
+            protocol=request.protocol,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -63,9 +66,11 @@ async def delete_vlan(request: VLANDeleteRequest):
     - **vlan_id**: ID de la VLAN a eliminar
     """
     try:
-        result = VLANService.delete_vlan(
+        result = await run_blocking(
+            VLANService.delete_vlan,
             parent_interface=request.parent_interface,
-            vlan_id=request.vlan_id
+            vlan_id=request.vlan_id,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -99,11 +104,13 @@ async def add_vlan_to_bridge(request: VLANAddToBridgeRequest):
     - **tagged**: VLAN tagged (true) o untagged (false)
     """
     try:
-        result = VLANService.add_vlan_to_bridge(
+        result = await run_blocking(
+            VLANService.add_vlan_to_bridge,
             bridge_name=request.bridge_name,
             port_name=request.port_name,
             vlan_id=request.vlan_id,
-            tagged=request.tagged
+            tagged=request.tagged,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -136,10 +143,12 @@ async def remove_vlan_from_bridge(request: VLANRemoveFromBridgeRequest):
     - **vlan_id**: ID de la VLAN a remover
     """
     try:
-        result = VLANService.remove_vlan_from_bridge(
+        result = await run_blocking(
+            VLANService.remove_vlan_from_bridge,
             bridge_name=request.bridge_name,
             port_name=request.port_name,
-            vlan_id=request.vlan_id
+            vlan_id=request.vlan_id,
+            resource="ip"
         )
         
         if result.get("success", False):
@@ -170,7 +179,7 @@ async def list_vlans():
     Devuelve información detallada de todas las VLANs configuradas
     """
     try:
-        vlans = VLANService.list_vlans()
+        vlans = await run_blocking(VLANService.list_vlans, resource="ip")
         return vlans
         
     except Exception as e:
@@ -189,7 +198,7 @@ async def list_bridge_vlans():
     Devuelve información de VLANs tagged y untagged en puertos de bridges OVS
     """
     try:
-        bridge_vlans = VLANService.list_bridge_vlans()
+        bridge_vlans = await run_blocking(VLANService.list_bridge_vlans, resource="ip")
         return bridge_vlans
         
     except Exception as e:
@@ -216,7 +225,7 @@ async def get_vlan_info(parent_interface: str, vlan_id: int):
                 detail="VLAN ID debe estar entre 1 y 4094"
             )
         
-        vlan_info = VLANService.get_vlan_info(parent_interface, vlan_id)
+        vlan_info = await run_blocking(VLANService.get_vlan_info, parent_interface, vlan_id, resource="ip")
         
         if vlan_info:
             return APIResponse(
@@ -5,16 +5,27 @@ TeleCluster Orchestrator - Worker Agent
 """
 
 from fastapi import APIRouter, HTTPException, status, Query, Path
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import json
 import logging
+import time
 
 from models.vm import (
     VMConfig, VMInfo, VMStats, VMSnapshot, VMSnapshotCreate,
     VMMigrationConfig, VMAction, VMActionRequest, HypervisorInfo,
     VMListFilter, VMResponse, VMListResponse, HypervisorResponse,
-    VMStatsResponse, VMSnapshotResponse, VMSnapshotListResponse
+    VMStatsResponse, VMSnapshotResponse, VMSnapshotListResponse,
+    VMStatsHistory, VMStatsHistoryResponse, BaseImageListResponse,
+    VMBulkCreateRequest, VMCacheStatsResponse, MigrationJob,
+    MigrationJobResponse, MigrationJobListResponse, LibvirtConnectionStatsResponse,
+    VMBackupRequest, BackupJobResponse, BackupJobListResponse, VMBackupChainResponse,
+    PlacementUsageResponse, HugepagePoolListResponse, DiskIOTune, DiskIOTuneResponse
 )
+from services.vm_migration import FINAL_STATES, PROGRESS_INTERVAL
 from services.vm import VMService
+from utils.executor import run_blocking, run_libvirt
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -33,7 +44,7 @@ vm_service = VMService()
 async def get_hypervisor_info():
     """Obtener información del hipervisor"""
     try:
-        hypervisor = vm_service.get_hypervisor_info()
+        hypervisor = await run_libvirt(vm_service.get_hypervisor_info)
         return HypervisorResponse(success=True, hypervisor=hypervisor)
     except Exception as e:
         logger.error(f"Error obteniendo info del hipervisor: {e}")
@@ -43,6 +54,23 @@ async def get_hypervisor_info():
         )
 
 
+@router.post("/hypervisor/refresh",
+             response_model=HypervisorResponse,
+             summary="Releer capacidades del host",
+             description="Vuelve a leer de libvirt la topología NUMA, CPU y hugepages del host")
+async def refresh_hypervisor_info():
+    """Refrescar el modelo de capacidad del host"""
+    try:
+        hypervisor = await run_libvirt(vm_service.refresh_host_capacity)
+        return HypervisorResponse(success=True, hypervisor=hypervisor)
+    except Exception as e:
+        logger.error(f"Error refrescando capacidades del host: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error refrescando capacidades del host: {str(e)}"
+        )
+
+
 @router.get("/list",
             response_model=VMListResponse,
             summary="Listar Máquinas Virtuales",
@@ -62,8 +90,7 @@ async def list_vms(
             offset=offset
         )
         
-        vms = vm_service.list_vms(filters)
-        total_count = len(vm_service.list_vms())  # Sin filtros para total
+        vms, total_count = await run_libvirt(vm_service.list_vms_with_total, filters)
         
         return VMListResponse(
             success=True,
@@ -79,6 +106,186 @@ async def list_vms(
         )
 
 
+@router.get("/base-images",
+            response_model=BaseImageListResponse,
+            summary="Imágenes base",
+            description="Lista las imágenes base y los discos overlay que dependen de cada una")
+async def list_base_images():
+    """Listar imágenes base con su contador de referencias"""
+    try:
+        images = await run_blocking(vm_service.list_base_images)
+        return BaseImageListResponse(success=True, images=images)
+    except Exception as e:
+        logger.error(f"Error listando imágenes base: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listando imágenes base: {str(e)}"
+        )
+
+
+@router.get("/cache/stats",
+            response_model=VMCacheStatsResponse,
+            summary="Estadísticas de caché",
+            description="Aciertos, fallos e invalidaciones de las cachés de XML de dominios")
+async def get_cache_stats():
+    """Contadores de la caché de dispositivos y de plantillas XML"""
+    return VMCacheStatsResponse(success=True, caches=vm_service.get_cache_stats())
+
+
+@router.get("/connections/stats",
+            response_model=LibvirtConnectionStatsResponse,
+            summary="Estadísticas de conexiones libvirt",
+            description="Conexiones abiertas, reconexiones y tiempo de espera al obtener conexión, por URI")
+async def get_connection_stats():
+    """Contadores de los pools de conexiones libvirt (local y hosts remotos)"""
+    return LibvirtConnectionStatsResponse(success=True, pools=vm_service.get_connection_stats())
+
+
+@router.get("/placement",
+            response_model=PlacementUsageResponse,
+            summary="Uso de CPUs y memoria por nodo NUMA",
+            description="vCPUs fijadas, CPUs exclusivas y memoria reservada por nodo NUMA")
+async def get_placement_usage():
+    """Reservas de la colocación NUMA por nodo"""
+    try:
+        nodes = await run_libvirt(vm_service.get_placement_usage)
+        return PlacementUsageResponse(success=True, nodes=nodes)
+    except Exception as e:
+        logger.error(f"Error obteniendo uso de nodos NUMA: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error obteniendo uso de nodos NUMA: {str(e)}"
+        )
+
+
+@router.get("/hugepages",
+            response_model=HugepagePoolListResponse,
+            summary="Pools de hugepages",
+            description="Páginas reservadas, libres y comprometidas por VMs, globales y por nodo NUMA")
+async def get_hugepage_pools():
+    """Disponibilidad de los pools de hugepages del host"""
+    try:
+        pools = await run_libvirt(vm_service.get_hugepage_pools)
+        return HugepagePoolListResponse(success=True, pools=pools)
+    except Exception as e:
+        logger.error(f"Error obteniendo pools de hugepages: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error obteniendo pools de hugepages: {str(e)}"
+        )
+
+
+@router.get("/migrations",
+            response_model=MigrationJobListResponse,
+            summary="Listar migraciones",
+            description="Migraciones en curso y terminadas recientemente, con su progreso")
+async def list_migrations(vm_name: Optional[str] = Query(None, description="Filtrar por VM")):
+    """Listar trabajos de migración"""
+    jobs = vm_service.list_migrations(vm_name)
+    return MigrationJobListResponse(success=True, jobs=jobs)
+
+
+@router.get("/migrations/{job_id}",
+            response_model=MigrationJobResponse,
+            summary="Estado de migración",
+            description="Estado y progreso (jobStats) de una migración")
+async def get_migration(job_id: str = Path(..., description="Id del trabajo de migración")):
+    """Obtener un trabajo de migración"""
+    try:
+        job = vm_service.get_migration(job_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return MigrationJobResponse(success=True, message=f"Migración {job.status.value}", job=job)
+
+
+@router.get("/migrations/{job_id}/events",
+            summary="Progreso de migración",
+            description="Emite el progreso de la migración como NDJSON hasta que termina")
+async def stream_migration(job_id: str = Path(..., description="Id del trabajo de migración")):
+    """
+    Seguir una migración
+    
+    Cada línea es el trabajo serializado, emitida cuando cambia su estado o
+    su progreso; la última línea corresponde al estado final.
+    """
+    try:
+        job = vm_service.get_migration(job_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return StreamingResponse(_migration_events(job), media_type="application/x-ndjson")
+
+
+async def _migration_events(job: MigrationJob) -> AsyncIterator[str]:
+    """Emitir el trabajo cada vez que cambia, hasta un estado final"""
+    last = None
+    while True:
+        line = job.json()
+        if line != last:
+            yield line + "\n"
+            last = line
+        if job.status in FINAL_STATES:
+            break
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        try:
+            job = vm_service.get_migration(job.job_id)
+        except RuntimeError:
+            # Podado del historial: ya había terminado
+            break
+
+
+@router.delete("/migrations/{job_id}",
+               response_model=MigrationJobResponse,
+               summary="Cancelar migración",
+               description="Cancela una migración en cola o aborta una en curso (no en post-copy)")
+async def cancel_migration(job_id: str = Path(..., description="Id del trabajo de migración")):
+    """Cancelar un trabajo de migración"""
+    try:
+        job = await run_libvirt(vm_service.cancel_migration, job_id)
+        return MigrationJobResponse(success=True, message=f"Migración {job_id} cancelada", job=job)
+    except RuntimeError as e:
+        if "no encontrada" in str(e):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@router.get("/backups",
+            response_model=BackupJobListResponse,
+            summary="Listar backups",
+            description="Backups en curso y terminados recientemente, con su progreso")
+async def list_backups(vm_name: Optional[str] = Query(None, description="Filtrar por VM")):
+    """Listar trabajos de backup"""
+    jobs = vm_service.list_backups(vm_name)
+    return BackupJobListResponse(success=True, jobs=jobs)
+
+
+@router.get("/backups/{job_id}",
+            response_model=BackupJobResponse,
+            summary="Estado de backup",
+            description="Estado y bytes copiados de un backup")
+async def get_backup(job_id: str = Path(..., description="Id del trabajo de backup")):
+    """Obtener un trabajo de backup"""
+    try:
+        job = vm_service.get_backup(job_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+    return BackupJobResponse(success=True, message=f"Backup {job.status.value}", job=job)
+
+
+@router.delete("/backups/{job_id}",
+               response_model=BackupJobResponse,
+               summary="Cancelar backup",
+               description="Cancela un backup en cola o aborta el block job en curso")
+async def cancel_backup(job_id: str = Path(..., description="Id del trabajo de backup")):
+    """Cancelar un trabajo de backup"""
+    try:
+        job = await run_libvirt(vm_service.cancel_backup, job_id)
+        return BackupJobResponse(success=True, message=f"Backup {job_id} cancelado", job=job)
+    except RuntimeError as e:
+        if "no encontrado" in str(e):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
 @router.get("/{vm_name}",
             response_model=VMResponse,
             summary="Información de VM",
@@ -88,7 +295,7 @@ async def get_vm_info(
 ):
     """Obtener información de una VM específica"""
     try:
-        vm_info = vm_service.get_vm_info(vm_name)
+        vm_info = await run_libvirt(vm_service.get_vm_info, vm_name)
         return VMResponse(
             success=True,
             message="Información de VM obtenida",
@@ -120,7 +327,7 @@ async def get_vm_info(
 async def create_vm(config: VMConfig):
     """Crear nueva VM"""
     try:
-        vm_uuid = vm_service.create_vm(config)
+        vm_uuid = await run_libvirt(vm_service.create_vm, config, resource=f"vm:{config.name}")
         return VMResponse(
             success=True,
             message=f"VM '{config.name}' creada exitosamente",
@@ -128,11 +335,16 @@ async def create_vm(config: VMConfig):
             vm_name=config.name
         )
     except RuntimeError as e:
-        if "Ya existe" in str(e):
+        if "Ya existe" in str(e) or "Sin capacidad" in str(e):
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=str(e)
             )
+        if "Sin soporte" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -145,6 +357,80 @@ async def create_vm(config: VMConfig):
         )
 
 
+@router.post("/bulk-create",
+             summary="Crear lote de VMs",
+             description="Crea (y arranca) N VMs a partir de una plantilla; el progreso se devuelve como NDJSON")
+async def bulk_create_vms(request: VMBulkCreateRequest):
+    """
+    Crear un lote de VMs idénticas
+    
+    Cada línea de la respuesta es un evento JSON: `{"vm_name", "status", ...}`
+    con status `created`, `started` o `error`, y una última línea con
+    `{"summary": {...}}`. Las VMs se procesan con una concurrencia acotada.
+    """
+    configs = request.configs()
+    return StreamingResponse(
+        _bulk_create_events(configs, request.start, request.concurrency),
+        media_type="application/x-ndjson"
+    )
+
+
+async def _bulk_create_events(configs: List[VMConfig], start: bool,
+                              concurrency: int) -> AsyncIterator[str]:
+    """Crear las VMs en paralelo y emitir un evento por etapa completada"""
+    started_at = time.monotonic()
+    events: asyncio.Queue = asyncio.Queue()
+    # Cada VM ocupa un hilo del pool de libvirt mientras se define y arranca
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def provision(config: VMConfig) -> bool:
+        async with semaphore:
+            try:
+                vm_uuid = await run_libvirt(vm_service.create_vm, config, resource=f"vm:{config.name}")
+                await events.put({"vm_name": config.name, "status": "created", "uuid": vm_uuid})
+                if start:
+                    await run_libvirt(
+                        vm_service.execute_vm_action,
+                        config.name,
+                        VMAction.START,
+                        resource=f"vm:{config.name}"
+                    )
+                    await events.put({"vm_name": config.name, "status": "started"})
+                return True
+            except Exception as e:
+                logger.error(f"Error en creación en lote de VM {config.name}: {e}")
+                await events.put({"vm_name": config.name, "status": "error", "error": str(e)})
+                return False
+
+    async def run_all() -> List[bool]:
+        try:
+            return await asyncio.gather(*(provision(config) for config in configs))
+        finally:
+            await events.put(None)
+
+    runner = asyncio.create_task(run_all())
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            event["elapsed_ms"] = round((time.monotonic() - started_at) * 1000, 1)
+            yield json.dumps(event) + "\n"
+
+        results = await runner
+        summary: Dict[str, Any] = {
+            "requested": len(configs),
+            "succeeded": sum(results),
+            "failed": len(results) - sum(results),
+            "duration_ms": round((time.monotonic() - started_at) * 1000, 1)
+        }
+        yield json.dumps({"summary": summary}) + "\n"
+    finally:
+        # Cliente desconectado: no seguir lanzando VMs pendientes
+        if not runner.done():
+            runner.cancel()
+
+
 @router.post("/{vm_name}/action",
              response_model=VMResponse,
              summary="Ejecutar Acción en VM",
@@ -155,10 +441,12 @@ async def execute_vm_action(
 ):
     """Ejecutar acción en VM"""
     try:
-        result = vm_service.execute_vm_action(
+        result = await run_libvirt(
+            vm_service.execute_vm_action,
             vm_name, 
             action_request.action, 
-            action_request.force
+            action_request.force,
+            resource=f"vm:{vm_name}"
         )
         return VMResponse(
             success=True,
@@ -193,7 +481,7 @@ async def delete_vm(
 ):
     """Eliminar VM"""
     try:
-        result = vm_service.delete_vm(vm_name, remove_disks)
+        result = await run_libvirt(vm_service.delete_vm, vm_name, remove_disks, resource=f"vm:{vm_name}")
         return VMResponse(
             success=True,
             message=result,
@@ -226,7 +514,7 @@ async def get_vm_stats(
 ):
     """Obtener estadísticas de VM"""
     try:
-        stats = vm_service.get_vm_stats(vm_name)
+        stats = await run_libvirt(vm_service.get_vm_stats, vm_name)
         return VMStatsResponse(success=True, stats=stats)
     except RuntimeError as e:
         if "no encontrada" in str(e) or "no está ejecutándose" in str(e):
@@ -246,6 +534,44 @@ async def get_vm_stats(
         )
 
 
+@router.get("/{vm_name}/stats/history",
+            response_model=VMStatsHistoryResponse,
+            summary="Historial de Estadísticas de VM",
+            description="Obtiene min/avg/max/p95 de las métricas de una VM en una ventana de tiempo")
+async def get_vm_stats_history(
+    vm_name: str = Path(..., description="Nombre de la VM"),
+    window: int = Query(300, description="Ventana en segundos", ge=1, le=86400),
+    resolution: Optional[str] = Query(None, description="Resolución (1s, 10s, 60s); automática si se omite"),
+    include_points: bool = Query(False, description="Incluir la serie completa")
+):
+    """Obtener historial de estadísticas de VM"""
+    try:
+        # El historial está en memoria: la agregación no ocupa hilos del pool de libvirt
+        history = await run_blocking(vm_service.get_vm_stats_history, vm_name, window, resolution, include_points)
+        return VMStatsHistoryResponse(success=True, history=VMStatsHistory(**history))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except RuntimeError as e:
+        if "sin historial" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error obteniendo historial de VM {vm_name}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error obteniendo historial: {str(e)}"
+        )
+
+
 # Endpoints de Snapshots
 @router.post("/{vm_name}/snapshots",
              response_model=VMSnapshotResponse,
@@ -257,7 +583,7 @@ async def create_snapshot(
 ):
     """Crear snapshot de VM"""
     try:
-        snapshot = vm_service.create_snapshot(vm_name, snapshot_config)
+        snapshot = await run_libvirt(vm_service.create_snapshot, vm_name, snapshot_config, resource=f"vm:{vm_name}")
         return VMSnapshotResponse(
             success=True,
             message=f"Snapshot '{snapshot_config.name}' creado",
@@ -284,17 +610,24 @@ async def create_snapshot(
 @router.get("/{vm_name}/snapshots",
             response_model=VMSnapshotListResponse,
             summary="Listar Snapshots",
-            description="Lista todos los snapshots de una VM")
+            description="Lista los snapshots de una VM en orden de creación, paginados")
 async def list_snapshots(
-    vm_name: str = Path(..., description="Nombre de la VM")
+    vm_name: str = Path(..., description="Nombre de la VM"),
+    current_chain: bool = Query(False, description="Solo el snapshot actual y sus ancestros"),
+    limit: int = Query(100, description="Límite de resultados", ge=1, le=1000),
+    offset: int = Query(0, description="Offset para paginación", ge=0)
 ):
     """Listar snapshots de VM"""
     try:
-        snapshots = vm_service.list_snapshots(vm_name)
+        snapshots, total_count, current = await run_libvirt(
+            vm_service.list_snapshots, vm_name, offset, limit, current_chain
+        )
         return VMSnapshotListResponse(
             success=True,
             vm_name=vm_name,
-            snapshots=snapshots
+            snapshots=snapshots,
+            total_count=total_count,
+            current=current
         )
     except RuntimeError as e:
         if "no encontrada" in str(e):
@@ -324,7 +657,7 @@ async def restore_snapshot(
 ):
     """Restaurar VM desde snapshot"""
     try:
-        result = vm_service.restore_snapshot(vm_name, snapshot_name)
+        result = await run_libvirt(vm_service.restore_snapshot, vm_name, snapshot_name, resource=f"vm:{vm_name}")
         return VMResponse(
             success=True,
             message=result,
@@ -358,7 +691,7 @@ async def delete_snapshot(
 ):
     """Eliminar snapshot de VM"""
     try:
-        result = vm_service.delete_snapshot(vm_name, snapshot_name)
+        result = await run_libvirt(vm_service.delete_snapshot, vm_name, snapshot_name, resource=f"vm:{vm_name}")
         return VMResponse(
             success=True,
             message=result,
@@ -383,20 +716,21 @@ async def delete_snapshot(
 
 
 @router.post("/{vm_name}/migrate",
-             response_model=VMResponse,
+             response_model=MigrationJobResponse,
+             status_code=status.HTTP_202_ACCEPTED,
              summary="Migrar VM",
-             description="Migra la VM a otro host")
+             description="Encola la migración de la VM a otro host; el progreso se consulta en /migrations/{job_id}")
 async def migrate_vm(
     vm_name: str = Path(..., description="Nombre de la VM"),
     migration_config: VMMigrationConfig = ...
 ):
     """Migrar VM a otro host"""
     try:
-        result = vm_service.migrate_vm(vm_name, migration_config)
-        return VMResponse(
+        job = await run_libvirt(vm_service.migrate_vm, vm_name, migration_config, resource=f"vm:{vm_name}")
+        return MigrationJobResponse(
             success=True,
-            message=result,
-            vm_name=vm_name
+            message=f"Migración de VM '{vm_name}' a {migration_config.destination_host} encolada",
+            job=job
         )
     except RuntimeError as e:
         if "no encontrada" in str(e):
@@ -404,6 +738,11 @@ async def migrate_vm(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=str(e)
             )
+        if "Ya existe" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(e)
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -414,3 +753,116 @@ async def migrate_vm(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error migrando VM: {str(e)}"
         )
+
+
+@router.post("/{vm_name}/backups",
+             response_model=BackupJobResponse,
+             status_code=status.HTTP_202_ACCEPTED,
+             summary="Backup de VM",
+             description="Encola un backup de la VM en ejecución: incremental desde el último checkpoint o completo")
+async def backup_vm(
+    vm_name: str = Path(..., description="Nombre de la VM"),
+    request: VMBackupRequest = VMBackupRequest()
+):
+    """Iniciar backup de VM"""
+    try:
+        job = await run_libvirt(vm_service.backup_vm, vm_name, request, resource=f"vm:{vm_name}")
+        return BackupJobResponse(
+            success=True,
+            message=f"Backup de VM '{vm_name}' encolado",
+            job=job
+        )
+    except RuntimeError as e:
+        if "no encontrada" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        if "Ya existe" in str(e) or "no está ejecutándose" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=str(e)
+            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error(f"Error iniciando backup de VM {vm_name}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error iniciando backup: {str(e)}"
+        )
+
+
+@router.get("/{vm_name}/backups",
+            response_model=VMBackupChainResponse,
+            summary="Cadena de backups",
+            description="Backups completados de la VM (checkpoint, padre y ficheros), del más antiguo al más reciente")
+async def get_backup_chain(vm_name: str = Path(..., description="Nombre de la VM")):
+    """Listar la cadena de backups de una VM"""
+    backups = await run_blocking(vm_service.get_backup_chain, vm_name)
+    return VMBackupChainResponse(success=True, vm_name=vm_name, backups=backups)
+
+
+@router.get("/{vm_name}/disks/{device}/iotune",
+            response_model=DiskIOTuneResponse,
+            summary="Límites de E/S de disco",
+            description="IOPS y ancho de banda máximos de un disco de la VM (p.ej. vda)")
+async def get_disk_iotune(
+    vm_name: str = Path(..., description="Nombre de la VM"),
+    device: str = Path(..., description="Dispositivo del disco (vda, vdb...)")
+):
+    """Obtener los límites de E/S de un disco"""
+    try:
+        iotune = await run_libvirt(vm_service.get_disk_iotune, vm_name, device)
+        return DiskIOTuneResponse(
+            success=True,
+            message=f"Límites de E/S de '{device}'",
+            vm_name=vm_name,
+            device=device,
+            iotune=iotune
+        )
+    except RuntimeError as e:
+        if "no encontrad" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@router.put("/{vm_name}/disks/{device}/iotune",
+            response_model=DiskIOTuneResponse,
+            summary="Limitar E/S de disco",
+            description="Cambia en caliente los límites de IOPS y ancho de banda de un disco (0 quita el límite)")
+async def set_disk_iotune(
+    iotune: DiskIOTune,
+    vm_name: str = Path(..., description="Nombre de la VM"),
+    device: str = Path(..., description="Dispositivo del disco (vda, vdb...)")
+):
+    """Cambiar los límites de E/S de un disco"""
+    try:
+        current = await run_libvirt(
+            vm_service.set_disk_iotune, vm_name, device, iotune, resource=f"vm:{vm_name}"
+        )
+        return DiskIOTuneResponse(
+            success=True,
+            message=f"Límites de E/S de '{device}' actualizados",
+            vm_name=vm_name,
+            device=device,
+            iotune=current
+        )
+    except RuntimeError as e:
+        if "no encontrad" in str(e):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=str(e)
+            )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
@@ -73,6 +73,7 @@ install_system_deps() {
                 iproute2 \
                 bridge-utils \
                 iptables \
+                ipset \
                 iputils-ping \
                 net-tools \
                 traceroute \
@@ -102,6 +103,7 @@ install_system_deps() {
                 iproute \
                 bridge-utils \
                 iptables \
+                ipset \
                 iputils \
                 net-tools \
                 traceroute \
@@ -360,6 +362,12 @@ verify_installation() {
         return 1
     fi
     
+    # Las reglas de firewall se compilan a sets de ipset
+    if ! command -v ipset >/dev/null 2>&1; then
+        log_error "ipset no encontrado"
+        return 1
+    fi
+    
     # Verificar bridges
     if ! ip link show br-ex >/dev/null 2>&1; then
         log_warn "Bridge br-ex no encontrado"
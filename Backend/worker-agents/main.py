@@ -20,6 +20,7 @@ from fastapi.openapi.utils import get_openapi
 
 # Importar configuración y utilidades
 from utils.logging import setup_logging, validate_environment, check_permissions
+from utils.executor import run_blocking, shutdown_executors
 from utils.middleware import (
     logging_middleware, security_headers_middleware,
     validation_error_handler, http_error_handler, general_exception_handler
@@ -61,12 +62,21 @@ async def lifespan(app: FastAPI):
     else:
         logger.warning("⚠️  No ejecutando como root - funcionalidad limitada")
     
+    # Cargar inventario de VMs y suscribirse a eventos libvirt
+    try:
+        vm.vm_service.start()
+        logger.info("✅ Inventario de VMs cargado")
+    except Exception as e:
+        logger.warning(f"⚠️  Inventario de VMs no disponible, se consultará libvirt directamente: {e}")
+    
     logger.info("🎯 Worker Agent iniciado correctamente")
     
     yield
     
     # Shutdown
     logger.info("🛑 Cerrando TeleCluster Worker Agent...")
+    vm.vm_service.stop()
+    shutdown_executors()
 
 
 # Crear aplicación FastAPI
@@ -128,7 +138,8 @@ app.add_exception_handler(HTTPException, http_error_handler)
 app.add_exception_handler(Exception, general_exception_handler)
 
 # Registrar routers principales
-app.include_router(network.router, prefix="/network", tags=["network"])
+# network.router ya declara el prefijo /network
+app.include_router(network.router, tags=["network"])
 app.include_router(vm.router, prefix="/vm", tags=["vm"])
 
 # Registrar sub-routers de red (para compatibilidad)
@@ -161,8 +172,8 @@ async def health_check():
     """
     try:
         # Verificar comandos básicos
-        env_check = validate_environment()
-        perms = check_permissions()
+        env_check = await run_blocking(validate_environment)
+        perms = await run_blocking(check_permissions)
         
         status = "healthy"
         if not env_check['all_required_available']:
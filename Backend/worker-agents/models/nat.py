@@ -62,6 +62,13 @@ class MasqueradeRequest(BaseModel):
     enabled: bool = Field(default=True, description="Habilitar masquerade")
 
 
+class NATBulkRequest(BaseModel):
+    """Lote de altas y bajas de reglas NAT aplicado en una sola transacción"""
+    port_forwards: List[PortForwardRequest] = Field(default_factory=list, description="Port forwards a crear")
+    masquerades: List[MasqueradeRequest] = Field(default_factory=list, description="Masquerades a crear")
+    remove_rule_ids: List[str] = Field(default_factory=list, description="IDs de reglas a eliminar")
+
+
 class FirewallRule(BaseModel):
     """Regla de firewall"""
     id: Optional[str] = None
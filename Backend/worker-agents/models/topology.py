@@ -0,0 +1,107 @@
+from pydantic import BaseModel, Field, validator
+from typing import Optional, List
+import ipaddress
+import re
+
+from models.bridge import BridgeType
+from models.tuntap import TunTapType
+from models.vlan import VLANProtocol
+
+
+# Nombres de interfaz/namespace seguros para una línea de ip -batch
+_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_.\-]{1,15}$')
+
+
+def _validate_name(v: Optional[str]) -> Optional[str]:
+    if v is not None and not _NAME_PATTERN.match(v):
+        raise ValueError(f"Nombre '{v}' inválido: solo letras, números, '.', '-', '_' (máx. 15)")
+    return v
+
+
+class TopologyBridge(BaseModel):
+    """Bridge declarado en una topología"""
+    name: str = Field(..., description="Nombre del bridge")
+    type: BridgeType = Field(default=BridgeType.linux, description="Tipo de bridge")
+    stp: bool = Field(default=False, description="Habilitar Spanning Tree Protocol")
+
+    _check_name = validator('name', allow_reuse=True)(_validate_name)
+
+
+class TopologyVeth(BaseModel):
+    """Par veth declarado en una topología"""
+    name1: str = Field(..., description="Nombre del primer extremo")
+    name2: str = Field(..., description="Nombre del segundo extremo")
+    bridge1: Optional[str] = Field(None, description="Bridge para el primer extremo")
+    bridge2: Optional[str] = Field(None, description="Bridge para el segundo extremo")
+    namespace1: Optional[str] = Field(None, description="Namespace para el primer extremo")
+    namespace2: Optional[str] = Field(None, description="Namespace para el segundo extremo")
+    vlan: Optional[int] = Field(None, description="Tag VLAN en puertos OVS", ge=1, le=4094)
+
+    _check_names = validator(
+        'name1', 'name2', 'bridge1', 'bridge2', 'namespace1', 'namespace2', allow_reuse=True
+    )(_validate_name)
+
+    @validator('name2')
+    def validate_different_names(cls, v, values):
+        if 'name1' in values and v == values['name1']:
+            raise ValueError('Los nombres de los extremos del veth deben ser diferentes')
+        return v
+
+
+class TopologyTap(BaseModel):
+    """Interfaz TUN/TAP declarada en una topología"""
+    name: str = Field(..., description="Nombre de la interfaz")
+    type: TunTapType = Field(default=TunTapType.tap, description="Tipo: tun o tap")
+    owner: Optional[str] = Field(None, description="Usuario propietario")
+    group: Optional[str] = Field(None, description="Grupo propietario")
+    bridge: Optional[str] = Field(None, description="Bridge al que conectar (solo TAP)")
+    vlan: Optional[int] = Field(None, description="Tag VLAN en puertos OVS", ge=1, le=4094)
+
+    _check_names = validator('name', 'owner', 'group', 'bridge', allow_reuse=True)(_validate_name)
+
+    @validator('bridge')
+    def validate_bridge_for_tap(cls, v, values):
+        if v and values.get('type') == TunTapType.tun:
+            raise ValueError('Las interfaces TUN no pueden conectarse directamente a bridges')
+        return v
+
+
+class TopologyVLAN(BaseModel):
+    """Interfaz VLAN declarada en una topología"""
+    parent_interface: str = Field(..., description="Interfaz padre")
+    vlan_id: int = Field(..., description="ID de la VLAN", ge=1, le=4094)
+    name: Optional[str] = Field(None, description="Nombre de la interfaz (por defecto padre.id)")
+    protocol: VLANProtocol = Field(default=VLANProtocol.ieee8021q, description="Protocolo VLAN")
+    bridge: Optional[str] = Field(None, description="Bridge al que conectar la VLAN")
+
+    _check_names = validator('parent_interface', 'name', 'bridge', allow_reuse=True)(_validate_name)
+
+    @property
+    def interface_name(self) -> str:
+        return self.name or f"{self.parent_interface}.{self.vlan_id}"
+
+
+class TopologyAddress(BaseModel):
+    """Dirección IP a asignar a una interfaz"""
+    interface: str = Field(..., description="Interfaz destino")
+    address: str = Field(..., description="Dirección en notación CIDR (p.ej. 10.0.0.1/24)")
+
+    _check_name = validator('interface', allow_reuse=True)(_validate_name)
+
+    @validator('address')
+    def validate_address(cls, v):
+        try:
+            return str(ipaddress.ip_interface(v))
+        except ValueError:
+            raise ValueError(f"Dirección '{v}' inválida (usar notación CIDR)")
+
+
+class TopologyApplyRequest(BaseModel):
+    """Topología declarativa a aplicar en una sola transacción"""
+    bridges: List[TopologyBridge] = Field(default_factory=list)
+    veths: List[TopologyVeth] = Field(default_factory=list)
+    taps: List[TopologyTap] = Field(default_factory=list)
+    vlans: List[TopologyVLAN] = Field(default_factory=list)
+    addresses: List[TopologyAddress] = Field(default_factory=list)
+    dry_run: bool = Field(default=False, description="Solo compilar y devolver los comandos")
+
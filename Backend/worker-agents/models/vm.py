@@ -4,10 +4,12 @@ Modelos para Gestión de Máquinas Virtuales
 TeleCluster Orchestrator - Worker Agent
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 from typing import Dict, List, Optional, Any
 from enum import Enum
 
+from utils.executor import BULK_CREATE_LIMIT
+
 
 class VMState(str, Enum):
     """Estados de VM según libvirt"""
@@ -37,12 +39,85 @@ class NetworkType(str, Enum):
     HOSTDEV = "hostdev"
 
 
+class DiskIOProfile(str, Enum):
+    """Perfiles de E/S de disco"""
+    DEFAULT = "default"            # Valores por defecto de QEMU (caché del host)
+    PERFORMANCE = "performance"    # cache=none, io=native/io_uring y un iothread
+
+
+class DiskCacheMode(str, Enum):
+    """Modos de caché de disco de QEMU"""
+    NONE = "none"
+    WRITEBACK = "writeback"
+    WRITETHROUGH = "writethrough"
+    DIRECTSYNC = "directsync"
+    UNSAFE = "unsafe"
+
+
+class DiskIOMode(str, Enum):
+    """Backends de E/S asíncrona de QEMU"""
+    NATIVE = "native"
+    THREADS = "threads"
+    IO_URING = "io_uring"
+
+
+class DiskIOTune(BaseModel):
+    """Límites de E/S de un disco (0 o ausente = sin límite)"""
+    total_iops_sec: Optional[int] = Field(None, ge=0, description="IOPS totales")
+    read_iops_sec: Optional[int] = Field(None, ge=0, description="IOPS de lectura")
+    write_iops_sec: Optional[int] = Field(None, ge=0, description="IOPS de escritura")
+    total_bytes_sec: Optional[int] = Field(None, ge=0, description="Bytes/s totales")
+    read_bytes_sec: Optional[int] = Field(None, ge=0, description="Bytes/s de lectura")
+    write_bytes_sec: Optional[int] = Field(None, ge=0, description="Bytes/s de escritura")
+
+    @validator('read_iops_sec', 'write_iops_sec')
+    def validate_iops(cls, v, values):
+        if v and values.get('total_iops_sec'):
+            raise ValueError('total_iops_sec no se puede combinar con límites de lectura/escritura')
+        return v
+
+    @validator('read_bytes_sec', 'write_bytes_sec')
+    def validate_bytes(cls, v, values):
+        if v and values.get('total_bytes_sec'):
+            raise ValueError('total_bytes_sec no se puede combinar con límites de lectura/escritura')
+        return v
+
+
 class DiskConfig(BaseModel):
     """Configuración de disco para VM"""
     path: str = Field(..., description="Ruta del archivo de disco")
     size_gb: Optional[int] = Field(None, description="Tamaño en GB (para nuevos discos)")
     format: DiskFormat = Field(DiskFormat.QCOW2, description="Formato del disco")
     bus: str = Field("virtio", description="Tipo de bus (virtio, ide, scsi)")
+    backing_image: Optional[str] = Field(
+        None, description="Imagen base: el disco se crea como overlay qcow2 copy-on-write"
+    )
+
+    profile: DiskIOProfile = Field(DiskIOProfile.DEFAULT, description="Perfil de E/S (default, performance)")
+    cache: Optional[DiskCacheMode] = Field(None, description="Modo de caché (sustituye al del perfil)")
+    io: Optional[DiskIOMode] = Field(None, description="Backend de E/S (sustituye al del perfil)")
+    discard: bool = Field(False, description="Propagar TRIM/discard del invitado al fichero")
+    iothread: Optional[int] = Field(None, ge=1, description="IOThread de la VM que atiende el disco")
+    iotune: Optional[DiskIOTune] = Field(None, description="Límites de IOPS y ancho de banda")
+
+    @validator('backing_image')
+    def validate_backing_image(cls, v, values):
+        if v and values.get('format') != DiskFormat.QCOW2:
+            raise ValueError('Los discos con imagen base deben ser qcow2')
+        return v
+
+    @validator('io')
+    def validate_io(cls, v, values):
+        cache = values.get('cache')
+        if v == DiskIOMode.NATIVE and cache not in (None, DiskCacheMode.NONE, DiskCacheMode.DIRECTSYNC):
+            raise ValueError('io=native requiere cache none o directsync')
+        return v
+
+    @validator('iothread')
+    def validate_iothread(cls, v, values):
+        if v is not None and values.get('bus') != "virtio":
+            raise ValueError('Solo los discos virtio pueden usar un iothread')
+        return v
 
 
 class NetworkConfig(BaseModel):
@@ -51,6 +126,51 @@ class NetworkConfig(BaseModel):
     source: Optional[str] = Field(None, description="Fuente de red (bridge name, network name)")
     mac_address: Optional[str] = Field(None, description="Dirección MAC específica")
     model: str = Field("virtio", description="Modelo de tarjeta de red")
+    queues: Optional[int] = Field(
+        None, ge=1, le=256, description="Colas virtio-net (por defecto una por vCPU)"
+    )
+    vhost: Optional[bool] = Field(
+        None, description="Backend vhost-net en el kernel (None = el que elija libvirt)"
+    )
+    ioeventfd: Optional[bool] = Field(None, description="Notificaciones del invitado por ioeventfd")
+    event_idx: Optional[bool] = Field(None, description="Supresión de interrupciones por event_idx")
+    rx_queue_size: Optional[int] = Field(None, description="Descriptores por cola de recepción (256-1024)")
+    tx_queue_size: Optional[int] = Field(
+        None, description="Descriptores por cola de transmisión (256-1024; con tap QEMU usa 256)"
+    )
+    mtu: Optional[int] = Field(None, ge=68, le=65535, description="MTU de la interfaz")
+
+    @validator('queues', 'vhost', 'ioeventfd', 'event_idx', 'rx_queue_size', 'tx_queue_size')
+    def validate_virtio_only(cls, v, values):
+        if v is not None and values.get('model') != "virtio":
+            raise ValueError('Las opciones de colas y vhost solo aplican a interfaces virtio')
+        if v is not None and values.get('network_type') == NetworkType.HOSTDEV:
+            raise ValueError('Las interfaces hostdev no admiten opciones de colas ni vhost')
+        return v
+
+    @validator('rx_queue_size', 'tx_queue_size')
+    def validate_queue_size(cls, v):
+        if v is not None and (v < 256 or v > 1024 or v & (v - 1)):
+            raise ValueError('El tamaño de cola debe ser potencia de 2 entre 256 y 1024')
+        return v
+
+
+class PlacementPolicy(str, Enum):
+    """Políticas de colocación NUMA y fijado de vCPUs"""
+    NONE = "none"          # Sin fijar: el kernel planifica libremente
+    PACK = "pack"
+    SPREAD = "spread"
+    ISOLATE = "isolate"
+
+
+class HugepageSize(str, Enum):
+    """Tamaños de hugepage para respaldar la memoria de una VM"""
+    SIZE_2M = "2M"
+    SIZE_1G = "1G"
+
+    @property
+    def size_kib(self) -> int:
+        return 2048 if self is HugepageSize.SIZE_2M else 1024 * 1024
 
 
 class VMConfig(BaseModel):
@@ -65,6 +185,78 @@ class VMConfig(BaseModel):
     boot_order: List[str] = Field(["hd"], description="Orden de booteo (hd, cdrom, network)")
     vnc_port: Optional[int] = Field(None, description="Puerto VNC (auto si no se especifica)")
     autostart: bool = Field(False, description="Iniciar automáticamente con el host")
+    placement: PlacementPolicy = Field(
+        PlacementPolicy.NONE, description="Colocación NUMA: none, pack, spread o isolate"
+    )
+    hugepages: Optional[HugepageSize] = Field(
+        None, description="Respaldar la memoria con hugepages (2M o 1G) del pool del host"
+    )
+    memory_locked: bool = Field(False, description="Bloquear la memoria en RAM (sin swap)")
+    balloon: bool = Field(True, description="Dispositivo virtio-balloon con estadísticas de memoria")
+    ksm_mergeable: bool = Field(True, description="Permitir que KSM fusione páginas de la VM")
+    iothreads: int = Field(0, ge=0, le=64, description="IOThreads dedicados a E/S de disco")
+
+    @validator('hugepages')
+    def validate_hugepages(cls, v, values):
+        memory_mb = values.get('memory_mb')
+        if v is not None and memory_mb is not None and (memory_mb * 1024) % v.size_kib:
+            raise ValueError(f'memory_mb debe ser múltiplo del tamaño de hugepage ({v.value})')
+        return v
+
+    @validator('iothreads', always=True)
+    def validate_iothreads(cls, v, values):
+        for disk in values.get('disks') or []:
+            if disk.iothread is not None and disk.iothread > v:
+                raise ValueError(f'El disco {disk.path} usa el iothread {disk.iothread} y la VM tiene {v}')
+        return v
+
+
+class VMBulkCreateRequest(BaseModel):
+    """Creación de un lote de VMs idénticas a partir de una plantilla"""
+    template: VMConfig = Field(..., description="Configuración base (el nombre se ignora)")
+    count: int = Field(..., ge=1, le=200, description="Número de VMs a crear")
+    name_pattern: str = Field(..., description="Patrón de nombre, p.ej. 'lab1-vm{index:02d}'")
+    start_index: int = Field(1, ge=0, description="Primer valor de {index}")
+    start: bool = Field(True, description="Arrancar cada VM tras definirla")
+    concurrency: int = Field(
+        BULK_CREATE_LIMIT, ge=1, le=BULK_CREATE_LIMIT,
+        description="VMs procesadas en paralelo (como máximo la mitad del pool de libvirt)"
+    )
+
+    @validator('name_pattern')
+    def validate_name_pattern(cls, v):
+        try:
+            first, second = v.format(index=1), v.format(index=2)
+        except (KeyError, IndexError, ValueError, AttributeError, TypeError):
+            raise ValueError("El patrón solo admite el campo {index}")
+        if first == second:
+            raise ValueError("El patrón debe incluir {index}")
+        return v
+
+    @validator('template')
+    def validate_disk_paths(cls, v, values):
+        for disk in v.disks:
+            if "{name}" not in disk.path:
+                raise ValueError(
+                    f"La ruta de disco '{disk.path}' debe incluir {{name}} para no compartirse entre VMs"
+                )
+        return v
+
+    def configs(self) -> List[VMConfig]:
+        """Configuración concreta de cada VM del lote"""
+        configs = []
+        for index in range(self.start_index, self.start_index + self.count):
+            name = self.name_pattern.format(index=index)
+            config = self.template.copy(deep=True)
+            config.name = name
+            # Puerto VNC y MAC deben ser únicos: se asignan automáticamente
+            config.vnc_port = None
+            for disk in config.disks:
+                disk.path = disk.path.replace("{name}", name)
+            for net in config.networks:
+                net.mac_address = None
+            configs.append(config)
+        return configs
 
 
 class VMInfo(BaseModel):
@@ -96,6 +288,32 @@ class VMStats(BaseModel):
     network_rx_bytes: int
     network_tx_bytes: int
     uptime_seconds: int
+    disk_read_bytes_per_sec: float = 0.0
+    disk_write_bytes_per_sec: float = 0.0
+    network_rx_bytes_per_sec: float = 0.0
+    network_tx_bytes_per_sec: float = 0.0
+    sampled_at: Optional[float] = None
+
+
+class MetricSummary(BaseModel):
+    """Resumen de una métrica en una ventana de tiempo"""
+    min: float
+    avg: float
+    max: float
+    p95: float
+
+
+class VMStatsHistory(BaseModel):
+    """Historial de métricas de una VM"""
+    name: str
+    resolution: str
+    window_seconds: int
+    samples: int
+    start: Optional[float] = None
+    end: Optional[float] = None
+    metrics: Dict[str, MetricSummary] = {}
+    timestamps: Optional[List[float]] = None
+    points: Optional[Dict[str, List[float]]] = None
 
 
 class VMSnapshot(BaseModel):
@@ -106,6 +324,8 @@ class VMSnapshot(BaseModel):
     description: Optional[str] = None
     state: VMState
     memory_snapshot: bool = False
+    parent: Optional[str] = None
+    current: bool = False
 
 
 class VMSnapshotCreate(BaseModel):
@@ -113,6 +333,18 @@ class VMSnapshotCreate(BaseModel):
     name: str = Field(..., description="Nombre del snapshot")
     description: Optional[str] = Field(None, description="Descripción del snapshot")
     memory: bool = Field(False, description="Incluir estado de memoria")
+    disk_only: bool = Field(
+        False, description="Snapshot externo solo de discos: overlays nuevos, sin pausar la VM"
+    )
+    quiesce: bool = Field(False, description="Congelar sistemas de archivos (requiere qemu-guest-agent)")
+
+    @validator('quiesce', always=True)
+    def validate_quiesce(cls, v, values):
+        if values.get('disk_only') and values.get('memory'):
+            raise ValueError('Un snapshot solo de discos no puede incluir memoria')
+        if v and not values.get('disk_only'):
+            raise ValueError('quiesce solo aplica a snapshots solo de discos')
+        return v
 
 
 class VMMigrationConfig(BaseModel):
@@ -121,6 +353,51 @@ class VMMigrationConfig(BaseModel):
     live: bool = Field(True, description="Migración en vivo")
     compressed: bool = Field(False, description="Comprimir datos de migración")
     bandwidth_mbps: Optional[int] = Field(None, description="Ancho de banda límite en Mbps")
+    auto_converge: bool = Field(False, description="Ralentizar vCPUs si la memoria se ensucia más rápido de lo que se copia")
+    postcopy: bool = Field(False, description="Permitir pasar a post-copy si la pre-copia no converge")
+    postcopy_after_iterations: int = Field(
+        2, ge=1, description="Iteraciones de pre-copia antes de cambiar a post-copy"
+    )
+    parallel_connections: Optional[int] = Field(
+        None, ge=2, le=16, description="Conexiones paralelas (multi-fd)"
+    )
+    max_downtime_ms: Optional[int] = Field(None, ge=1, description="Downtime máximo tolerado en ms")
+
+
+class MigrationStatus(str, Enum):
+    """Estados de un trabajo de migración"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    POSTCOPY = "postcopy"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class MigrationProgress(BaseModel):
+    """Progreso de una migración según domain.jobStats()"""
+    data_total: int = 0
+    data_processed: int = 0
+    data_remaining: int = 0
+    memory_dirty_rate: int = 0        # Páginas/s
+    memory_iteration: int = 0
+    downtime_ms: Optional[int] = None
+    elapsed_ms: int = 0
+    percent: float = 0.0
+
+
+class MigrationJob(BaseModel):
+    """Trabajo de migración en segundo plano"""
+    job_id: str
+    vm_name: str
+    destination_host: str
+    status: MigrationStatus
+    config: VMMigrationConfig
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    progress: MigrationProgress = Field(default_factory=MigrationProgress)
+    error: Optional[str] = None
 
 
 class VMAction(str, Enum):
@@ -142,6 +419,65 @@ class VMActionRequest(BaseModel):
     force: bool = Field(False, description="Forzar acción si es necesario")
 
 
+class CPUTopology(BaseModel):
+    """Topología de CPU del host"""
+    sockets: int = 1
+    dies: int = 1
+    cores: int = 1              # Por socket (y die)
+    threads: int = 1            # Por core
+
+
+class HugepagePool(BaseModel):
+    """Hugepages reservadas de un tamaño en un nodo NUMA"""
+    size_kib: int
+    total: int
+
+
+class HugepagePoolStatus(BaseModel):
+    """Estado de un pool de hugepages (global o de un nodo NUMA)"""
+    size_kib: int
+    node: Optional[int] = None         # None = pool global del host
+    total: int
+    free: int
+    reserved: int = 0
+    committed: int = 0                 # Páginas asignadas a VMs definidas por el worker
+    available: int = 0                 # total - committed
+
+
+class NUMACell(BaseModel):
+    """Nodo NUMA del host"""
+    id: int
+    memory_mb: int
+    cpus: List[int]
+    siblings: Dict[int, str] = {}      # CPU -> hermanos SMT ("0,8")
+    hugepages: List[HugepagePool] = []
+
+
+class NodeUsage(BaseModel):
+    """Uso de un nodo NUMA por las VMs fijadas"""
+    node: int
+    cpus: int
+    pinned_vcpus: int
+    exclusive_cpus: int
+    memory_mb: int
+    committed_memory_mb: int
+
+
+class HostCapacity(BaseModel):
+    """Capacidad estática del host (leída de getCapabilities)"""
+    type: str
+    version: str
+    hostname: str
+    max_vcpus: int
+    cpu_model: str
+    cpu_count: int
+    memory_mb: int
+    architecture: str
+    topology: CPUTopology
+    numa_cells: List[NUMACell] = []
+    io_uring: bool = False             # Discos con io='io_uring' soportados
+
+
 class HypervisorInfo(BaseModel):
     """Información del hipervisor"""
     type: str
@@ -156,6 +492,12 @@ class HypervisorInfo(BaseModel):
     cpu_count: int
     cpu_model: str
     architecture: str
+    topology: Optional[CPUTopology] = None
+    numa_cells: List[NUMACell] = []
+    committed_vcpus: int = 0            # Todas las VMs definidas
+    committed_memory_mb: int = 0
+    active_vcpus: int = 0               # Solo VMs en ejecución
+    active_memory_mb: int = 0
 
 
 class VMListFilter(BaseModel):
@@ -166,6 +508,15 @@ class VMListFilter(BaseModel):
     offset: int = Field(0, description="Offset para paginación")
 
 
+class BaseImage(BaseModel):
+    """Imagen base compartida por overlays qcow2"""
+    path: str
+    format: Optional[str] = None
+    refcount: int
+    overlays: List[str] = []
+    exists: bool
+
+
 # Responses API
 class VMResponse(BaseModel):
     """Response estándar para operaciones de VM"""
@@ -195,6 +546,12 @@ class VMStatsResponse(BaseModel):
     stats: VMStats
 
 
+class VMStatsHistoryResponse(BaseModel):
+    """Response para historial de estadísticas de VM"""
+    success: bool
+    history: VMStatsHistory
+
+
 class VMSnapshotResponse(BaseModel):
     """Response para operaciones de snapshot"""
     success: bool
@@ -207,3 +564,127 @@ class VMSnapshotListResponse(BaseModel):
     success: bool
     vm_name: str
     snapshots: List[VMSnapshot]
+    total_count: int = 0
+    current: Optional[str] = None
+
+
+class BaseImageListResponse(BaseModel):
+    """Response para listado de imágenes base"""
+    success: bool
+    images: List[BaseImage]
+
+
+class VMCacheStatsResponse(BaseModel):
+    """Response para los contadores de las cachés de XML"""
+    success: bool
+    caches: Dict[str, Dict[str, Any]]
+
+
+class BackupMode(str, Enum):
+    """Tipo de backup"""
+    FULL = "full"
+    INCREMENTAL = "incremental"
+
+
+class BackupStatus(str, Enum):
+    """Estados de un trabajo de backup"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class VMBackupRequest(BaseModel):
+    """Solicitud de backup de una VM"""
+    incremental: bool = Field(
+        True, description="Copiar solo los bloques cambiados desde el último checkpoint (si existe)"
+    )
+    disks: Optional[List[str]] = Field(None, description="Discos a copiar (vda, vdb...); por defecto todos")
+
+
+class BackupEntry(BaseModel):
+    """Backup completado de una VM (un checkpoint de la cadena)"""
+    checkpoint: str
+    parent: Optional[str] = None
+    mode: BackupMode
+    created_at: str
+    files: Dict[str, str]             # disco -> fichero de backup
+    size_bytes: int = 0
+
+
+class BackupJob(BaseModel):
+    """Trabajo de backup en segundo plano"""
+    job_id: str
+    vm_name: str
+    status: BackupStatus
+    mode: Optional[BackupMode] = None
+    checkpoint: Optional[str] = None
+    parent: Optional[str] = None
+    disks: List[str] = []
+    bytes_total: int = 0
+    bytes_processed: int = 0
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+
+
+class LibvirtConnectionStatsResponse(BaseModel):
+    """Response para los contadores de los pools de conexiones libvirt"""
+    success: bool
+    pools: Dict[str, Dict[str, Any]]
+
+
+class MigrationJobResponse(BaseModel):
+    """Response para un trabajo de migración"""
+    success: bool
+    message: str
+    job: MigrationJob
+
+
+class MigrationJobListResponse(BaseModel):
+    """Response para listado de trabajos de migración"""
+    success: bool
+    jobs: List[MigrationJob]
+
+
+class BackupJobResponse(BaseModel):
+    """Response para un trabajo de backup"""
+    success: bool
+    message: str
+    job: BackupJob
+
+
+class BackupJobListResponse(BaseModel):
+    """Response para listado de trabajos de backup"""
+    success: bool
+    jobs: List[BackupJob]
+
+
+class VMBackupChainResponse(BaseModel):
+    """Response con la cadena de backups de una VM"""
+    success: bool
+    vm_name: str
+    backups: List[BackupEntry]
+
+
+class PlacementUsageResponse(BaseModel):
+    """Response con el uso de los nodos NUMA"""
+    success: bool
+    nodes: List[NodeUsage]
+
+
+class HugepagePoolListResponse(BaseModel):
+    """Response con los pools de hugepages del host"""
+    success: bool
+    pools: List[HugepagePoolStatus]
+
+
+class DiskIOTuneResponse(BaseModel):
+    """Response con los límites de E/S de un disco"""
+    success: bool
+    message: str
+    vm_name: str
+    device: str
+    iotune: DiskIOTune
@@ -0,0 +1,302 @@
+import subprocess
+import hashlib
+import ipaddress
+import logging
+import shlex
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from models.nat import Protocol
+from services.iptables import IptablesRuleEngine, ManagedRule, comment_args
+
+
+logger = logging.getLogger(__name__)
+
+SET_PREFIX = "tcfw-"
+GROUP_TAG = "firewall-set"
+
+
+class FirewallGroup(NamedTuple):
+    """Reglas de firewall que solo difieren en origen/destino/puerto"""
+    chain: str
+    action: str
+    protocol: Protocol
+    interface: Optional[str]
+    fields: Tuple[str, ...]        # Dimensiones presentes: src, dst, port
+
+    @property
+    def group_id(self) -> str:
+        """Id estable del grupo (8 hex): nombra el set y la regla iptables"""
+        key = "|".join([self.chain, self.action, self.protocol.value, self.interface or ""] + list(self.fields))
+        return hashlib.sha1(key.encode()).hexdigest()[:8]
+
+    @property
+    def set_name(self) -> str:
+        return f"{SET_PREFIX}{self.group_id}"
+
+    @property
+    def set_type(self) -> str:
+        return {
+            ("src",): "hash:net",
+            ("dst",): "hash:net",
+            ("port",): "bitmap:port",
+            ("src", "port"): "hash:net,port",
+            ("dst", "port"): "hash:net,port",
+            ("src", "dst"): "hash:net,net",
+            ("src", "dst", "port"): "hash:net,port,net",
+        }[self.fields]
+
+    @property
+    def match_flags(self) -> str:
+        return {
+            ("src",): "src",
+            ("dst",): "dst",
+            ("port",): "dst",
+            ("src", "port"): "src,dst",
+            ("dst", "port"): "dst,dst",
+            ("src", "dst"): "src,dst",
+            ("src", "dst", "port"): "src,dst,dst",
+        }[self.fields]
+
+
+class FirewallPolicyCompiler:
+    """
+    Compilador de reglas de firewall a sets de ipset
+
+    Las reglas con la misma cadena, acción, protocolo e interfaz se agrupan
+    en un set (hash:net, hash:net,port, ...) referenciado por una única regla
+    `-m set --match-set`. Añadir o quitar una regla de un grupo existente es
+    un `ipset add/del` (O(1) en el kernel), sin tocar las cadenas de iptables.
+
+    Las reglas de cada grupo (y las directas) se añaden al final de la cadena
+    en el orden de alta, así que se mantiene la semántica de primera
+    coincidencia: un miembro nuevo de un grupo existente hereda la posición
+    del grupo. El estado se reconstruye de `ipset save` (el id de cada regla
+    es el comentario del elemento).
+    """
+
+    def __init__(self, engine: IptablesRuleEngine):
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._members: Dict[str, Tuple[str, str]] = {}   # rule_id -> (set, elemento)
+        self._elements: Dict[Tuple[str, str], str] = {}  # (set, elemento) -> rule_id
+        self._set_sizes: Dict[str, int] = {}
+        self._loaded = False
+
+    def add_rule(self, rule_id: str, chain: str, action: str, protocol: Protocol,
+                 source: Optional[str], destination: Optional[str], port: Optional[int],
+                 interface: Optional[str]) -> str:
+        """
+        Añadir una regla; devuelve su id (el de la regla existente si ya estaba)
+
+        Raises:
+            ValueError: Si una dirección no es una red IPv4 válida
+            RuntimeError: Si ipset o iptables rechazan el cambio
+        """
+        if port and protocol not in (Protocol.tcp, Protocol.udp):
+            port = None
+
+        values = {"src": self._network(source), "dst": self._network(destination), "port": port}
+        fields = tuple(name for name in ("src", "dst", "port") if values[name])
+        if interface and chain not in ("INPUT", "OUTPUT"):
+            interface = None
+        group = FirewallGroup(chain, action, protocol, interface, fields)
+
+        if not fields:
+            # Sin origen/destino/puerto no hay nada que agrupar: regla directa
+            self._engine.apply(add={rule_id: [self._rule(group, [], rule_id, "firewall")]})
+            return rule_id
+
+        element = self._element(group, values)
+        with self._lock:
+            self._ensure_loaded()
+            existing = self._elements.get((group.set_name, element))
+            if existing:
+                return existing
+
+            new_set = group.set_name not in self._set_sizes
+            lines = []
+            if new_set:
+                lines.append(self._create_line(group))
+            lines.append(f'add {group.set_name} {element} comment "{rule_id}"')
+            self._ipset_restore(lines)
+
+            if new_set:
+                try:
+                    match = ["-m", "set", "--match-set", group.set_name, group.match_flags]
+                    rule = self._rule(group, match, group.group_id, GROUP_TAG)
+                    self._engine.apply(add={group.group_id: [rule]})
+                except RuntimeError:
+                    self._ipset(["destroy", group.set_name])
+                    raise
+
+            self._members[rule_id] = (group.set_name, element)
+            self._elements[(group.set_name, element)] = rule_id
+            self._set_sizes[group.set_name] = self._set_sizes.get(group.set_name, 0) + 1
+            return rule_id
+
+    def remove_rule(self, rule_id: str) -> bool:
+        """
+        Eliminar una regla de su set; el último miembro elimina también la
+        regla iptables del grupo y el set
+
+        Returns:
+            False si la regla no existe
+
+        Raises:
+            RuntimeError: Si ipset o iptables rechazan el cambio
+        """
+        with self._lock:
+            self._ensure_loaded()
+            member = self._members.get(rule_id)
+            if member is None:
+                return self._remove_plain(rule_id)
+            set_name, element = member
+
+            if self._set_sizes[set_name] == 1:
+                # Quitar primero la regla que referencia el set
+                self._engine.apply(remove=[set_name[len(SET_PREFIX):]])
+                self._ipset(["destroy", set_name])
+                del self._set_sizes[set_name]
+            else:
+                self._ipset(["-exist", "del", set_name, element])
+                self._set_sizes[set_name] -= 1
+
+            del self._members[rule_id]
+            del self._elements[member]
+            return True
+
+    def is_group(self, rule_id: str) -> bool:
+        """
+        Indica si un id es el de la regla iptables de un grupo
+
+        Los ids de grupo y de regla comparten el formato (8 hex) en los
+        comentarios de iptables; la regla de un grupo solo se elimina al
+        quitar su último miembro, junto con el set.
+        """
+        return self._engine.tag(rule_id) == GROUP_TAG
+
+    def _remove_plain(self, rule_id: str) -> bool:
+        """Eliminar una regla de firewall directa (sin set)"""
+        if self.is_group(rule_id):
+            return False
+        rules = self._engine.rules(rule_id)
+        # Los port forwards también tienen una regla en filter, pero además una en nat
+        if not rules or any(rule.table != "filter" for rule in rules):
+            return False
+        return bool(self._engine.apply(remove=[rule_id]))
+
+    def forget(self) -> None:
+        """Destruir los sets (tras un flush de la tabla filter, que ya no los referencia)"""
+        with self._lock:
+            try:
+                self._ensure_loaded()
+            except RuntimeError as e:
+                # Sin ipset no hay sets que destruir; el estado se relee en el próximo uso
+                logger.warning(f"No se pudieron leer los sets de firewall: {e}")
+                self._loaded = False
+                return
+            for set_name in list(self._set_sizes):
+                try:
+                    self._ipset(["destroy", set_name])
+                except RuntimeError as e:
+                    logger.warning(f"No se pudo destruir el set {set_name}: {e}")
+            self._members.clear()
+            self._elements.clear()
+            self._set_sizes.clear()
+
+    def groups(self) -> Dict[str, int]:
+        """Número de miembros por set"""
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._set_sizes)
+
+    @staticmethod
+    def _network(value: Optional[str]) -> Optional[str]:
+        if not value:
+            return None
+        try:
+            network = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            raise ValueError(f"Dirección '{value}' inválida")
+        if network.version != 4:
+            raise ValueError(f"Dirección '{value}' no soportada: solo IPv4")
+        return str(network.network_address) if network.prefixlen == 32 else str(network)
+
+    @staticmethod
+    def _element(group: FirewallGroup, values: Dict[str, object]) -> str:
+        port = f"{group.protocol.value}:{values['port']}" if values["port"] else None
+        if group.fields == ("port",):
+            return str(values["port"])
+        parts = {
+            ("src",): [values["src"]],
+            ("dst",): [values["dst"]],
+            ("src", "port"): [values["src"], port],
+            ("dst", "port"): [values["dst"], port],
+            ("src", "dst"): [values["src"], values["dst"]],
+            ("src", "dst", "port"): [values["src"], port, values["dst"]],
+        }[group.fields]
+        return ",".join(parts)
+
+    @staticmethod
+    def _create_line(group: FirewallGroup) -> str:
+        if group.set_type == "bitmap:port":
+            return f"create {group.set_name} bitmap:port range 0-65535 comment"
+        return f"create {group.set_name} {group.set_type} family inet comment"
+
+    @staticmethod
+    def _rule(group: FirewallGroup, match: List[str], rule_id: str, tag: str) -> ManagedRule:
+        spec = []
+        if group.interface:
+            spec.extend(["-i" if group.chain == "INPUT" else "-o", group.interface])
+        if group.protocol != Protocol.all:
+            spec.extend(["-p", group.protocol.value])
+        spec.extend(match)
+        spec.extend(comment_args(rule_id, tag))
+        spec.extend(["-j", group.action])
+        return ManagedRule("filter", group.chain, tuple(spec))
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        members, elements, sizes = {}, {}, {}
+        for line in self._ipset(["save"]).splitlines():
+            args = shlex.split(line)
+            if len(args) < 2 or not args[1].startswith(SET_PREFIX):
+                continue
+            if args[0] == "create":
+                sizes.setdefault(args[1], 0)
+            elif args[0] == "add" and len(args) >= 5 and args[3] == "comment":
+                members[args[4]] = (args[1], args[2])
+                elements[(args[1], args[2])] = args[4]
+                sizes[args[1]] = sizes.get(args[1], 0) + 1
+
+        # Sets vacíos (p.ej. una baja interrumpida): no son grupos válidos
+        for set_name in [name for name, size in sizes.items() if size == 0]:
+            del sizes[set_name]
+        self._members, self._elements, self._set_sizes = members, elements, sizes
+        self._loaded = True
+        logger.info(f"Compilador de firewall sincronizado: {len(members)} reglas en {len(sizes)} sets")
+
+    @staticmethod
+    def _ipset(args: List[str]) -> str:
+        try:
+            result = subprocess.run(["ipset"] + args, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"ipset {args[0]} falló: {e.stderr.strip()}")
+        except OSError as e:
+            raise RuntimeError(f"ipset no disponible: {e}")
+        return result.stdout
+
+    @staticmethod
+    def _ipset_restore(lines: List[str]) -> None:
+        """Aplicar varias órdenes de ipset con un solo proceso"""
+        try:
+            subprocess.run(
+                ["ipset", "restore", "-exist"],
+                input="\n".join(lines) + "\n", capture_output=True, text=True, check=True
+            )
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"ipset restore falló: {e.stderr.strip()}")
+        except OSError as e:
+            raise RuntimeError(f"ipset no disponible: {e}")
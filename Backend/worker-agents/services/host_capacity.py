@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Modelo de capacidad del host (NUMA, topología de CPU, hugepages)
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import libvirt
+import logging
+import platform
+import re
+import threading
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+from models.vm import CPUTopology, HostCapacity, HugepagePool, NUMACell
+
+
+class HostCapacityModel:
+    """
+    Capacidad estática del host leída una vez de libvirt
+
+    getCapabilities() devuelve un XML de decenas de KB que no cambia mientras
+    el host no cambie (CPUs, memoria, hugepages reservadas), así que se
+    analiza al arrancar y solo se vuelve a leer bajo demanda (refresh), por
+    ejemplo tras reservar más hugepages.
+    """
+
+    def __init__(self, vm_service):
+        """
+        Inicializar modelo
+
+        Args:
+            vm_service: VMService propietario (provee la conexión)
+        """
+        self.vm_service = vm_service
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._capacity: Optional[HostCapacity] = None
+
+    def get(self) -> HostCapacity:
+        """
+        Capacidad del host (se lee de libvirt solo la primera vez)
+
+        Raises:
+            RuntimeError: Si no se puede leer de libvirt
+        """
+        with self._lock:
+            capacity = self._capacity
+        return capacity if capacity is not None else self.refresh()
+
+    def refresh(self) -> HostCapacity:
+        """
+        Volver a leer la capacidad del host
+
+        Raises:
+            RuntimeError: Si no se puede leer de libvirt
+        """
+        try:
+            capacity = self._read(self.vm_service._get_connection())
+        except libvirt.libvirtError as e:
+            raise RuntimeError(f"Error leyendo capacidades del host: {e}")
+
+        with self._lock:
+            self._capacity = capacity
+        self.logger.info(
+            f"Capacidad del host: {capacity.cpu_count} CPUs, {capacity.memory_mb} MB, "
+            f"{len(capacity.numa_cells)} nodos NUMA"
+        )
+        return capacity
+
+    @staticmethod
+    def _read(conn: libvirt.virConnect) -> HostCapacity:
+        host_info = conn.getInfo()
+        host = ET.fromstring(conn.getCapabilities()).find("host")
+        cpu = host.find("cpu") if host is not None else None
+
+        topology = CPUTopology()
+        cpu_model = host_info[0]
+        arch = "unknown"
+        if cpu is not None:
+            arch = cpu.findtext("arch") or arch
+            cpu_model = cpu.findtext("model") or cpu_model
+            topo = cpu.find("topology")
+            if topo is not None:
+                topology = CPUTopology(
+                    sockets=int(topo.get("sockets", 1)),
+                    dies=int(topo.get("dies", 1)),
+                    cores=int(topo.get("cores", 1)),
+                    threads=int(topo.get("threads", 1))
+                )
+
+        cells = []
+        for cell in host.iterfind("topology/cells/cell") if host is not None else ():
+            memory = cell.find("memory")
+            memory_kib = memory_to_kib(int(memory.text), memory.get("unit")) if memory is not None else 0
+            cpus = sorted(int(cpu_elem.get("id")) for cpu_elem in cell.iterfind("cpus/cpu"))
+            siblings = {
+                int(cpu_elem.get("id")): cpu_elem.get("siblings", cpu_elem.get("id"))
+                for cpu_elem in cell.iterfind("cpus/cpu")
+            }
+            cells.append(NUMACell(
+                id=int(cell.get("id")),
+                memory_mb=memory_kib // 1024,
+                cpus=cpus,
+                siblings=siblings,
+                hugepages=[
+                    HugepagePool(size_kib=int(pages.get("size")), total=int(pages.text or 0))
+                    for pages in cell.iterfind("pages")
+                    if int(pages.get("size")) > 4
+                ]
+            ))
+
+        return HostCapacity(
+            type=conn.getType(),
+            version=str(conn.getVersion()),
+            hostname=conn.getHostname(),
+            max_vcpus=conn.getMaxVcpus(None),
+            cpu_model=cpu_model,
+            cpu_count=host_info[2],
+            memory_mb=host_info[1],
+            architecture=arch,
+            topology=topology,
+            numa_cells=cells,
+            io_uring=_io_uring_supported(conn)
+        )
+
+
+def _io_uring_supported(conn: libvirt.virConnect) -> bool:
+    """io_uring en discos: libvirt >= 6.3, QEMU >= 5.0 y kernel >= 5.1"""
+    kernel = tuple(int(part) for part in re.findall(r"\d+", platform.release())[:2])
+    return conn.getLibVersion() >= 6003000 and conn.getVersion() >= 5000000 and kernel >= (5, 1)
+
+
+# Unidades de memoria del XML de libvirt, en bytes (KB/MB/... son decimales)
+MEMORY_UNITS = {
+    "b": 1, "bytes": 1,
+    "KB": 10 ** 3, "k": 1024, "KiB": 1024,
+    "MB": 10 ** 6, "M": 1024 ** 2, "MiB": 1024 ** 2,
+    "GB": 10 ** 9, "G": 1024 ** 3, "GiB": 1024 ** 3,
+    "TB": 10 ** 12, "T": 1024 ** 4, "TiB": 1024 ** 4,
+}
+
+
+def memory_to_kib(value: int, unit: Optional[str]) -> int:
+    """Convertir un valor de memoria de libvirt a KiB (sin unidad: KiB)"""
+    return value * MEMORY_UNITS.get(unit or "KiB", 1024) // 1024
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Lectura de los pools de hugepages del kernel (sysfs)
+TeleCluster Orchestrator - Worker Agent
+
+Los contadores de getCapabilities() son una foto del arranque; los pools se
+pueden redimensionar en caliente (sysctl vm.nr_hugepages, hugeadm), así que
+la disponibilidad se lee siempre de /sys, que es barato (unos pocos ficheros
+de una línea por tamaño).
+"""
+
+import os
+import re
+from typing import Dict, NamedTuple, Optional
+
+
+HUGEPAGES_DIR = "/sys/kernel/mm/hugepages"
+NODE_DIR = "/sys/devices/system/node"
+
+_POOL_DIR = re.compile(r"^hugepages-(\d+)kB$")
+
+
+class HugepageCounters(NamedTuple):
+    """Contadores de un pool de hugepages de un tamaño"""
+    size_kib: int
+    total: int
+    free: int
+    reserved: int
+
+
+def read_pools(node: Optional[int] = None) -> Dict[int, HugepageCounters]:
+    """
+    Pools de hugepages por tamaño (KiB)
+
+    Args:
+        node: Nodo NUMA, o None para los pools globales del host
+
+    Returns:
+        Contadores por tamaño; vacío si el kernel no expone el directorio
+    """
+    base = HUGEPAGES_DIR if node is None else os.path.join(NODE_DIR, f"node{node}", "hugepages")
+    try:
+        entries = os.listdir(base)
+    except OSError:
+        return {}
+
+    pools = {}
+    for entry in entries:
+        match = _POOL_DIR.match(entry)
+        if not match:
+            continue
+        size_kib = int(match.group(1))
+        path = os.path.join(base, entry)
+        pools[size_kib] = HugepageCounters(
+            size_kib=size_kib,
+            total=_read_counter(path, "nr_hugepages"),
+            free=_read_counter(path, "free_hugepages"),
+            # Los pools por nodo no exponen resv_hugepages
+            reserved=_read_counter(path, "resv_hugepages")
+        )
+    return pools
+
+
+def _read_counter(path: str, name: str) -> int:
+    try:
+        with open(os.path.join(path, name)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
@@ -0,0 +1,211 @@
+import subprocess
+import logging
+import re
+import shlex
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Comentario de las reglas gestionadas: "<id de 8 hex>:<etiqueta>"
+_MANAGED_COMMENT = re.compile(r'^([0-9a-f]{8}):(.*)$')
+_UNSAFE_ARG = re.compile(r'[\s"\'\\#]')
+
+TABLES = ("nat", "filter")
+
+
+class ManagedRule(NamedTuple):
+    """Regla iptables gestionada: tabla, cadena y especificación (sin -A/-D)"""
+    table: str
+    chain: str
+    spec: Tuple[str, ...]
+
+    def render(self, op: str) -> str:
+        """Línea de iptables-restore para añadir (-A) o borrar (-D) la regla"""
+        return " ".join([op, self.chain] + [_quote(arg) for arg in self.spec])
+
+
+def _quote(arg: str) -> str:
+    # iptables-restore solo entiende comillas dobles
+    if arg and not _UNSAFE_ARG.search(arg):
+        return arg
+    return '"' + arg.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def comment_args(rule_id: str, tag: str) -> List[str]:
+    """Argumentos del match comment que identifica una regla gestionada"""
+    tag = re.sub(r'[\r\n"\\]', ' ', tag)
+    return ["-m", "comment", "--comment", f"{rule_id}:{tag}"[:255]]
+
+
+class IptablesRuleEngine:
+    """
+    Motor de reglas iptables basado en iptables-restore
+
+    Mantiene en memoria las reglas gestionadas por el worker, agrupadas por
+    id (un port forward son dos reglas: DNAT y FORWARD). Cada cambio se
+    aplica como un único `iptables-restore --noflush` con las líneas -D/-A
+    del lote, así que el coste no depende del tamaño de la tabla y no hay
+    borrados por número de línea. El estado se carga de `iptables-save` en
+    el primer uso, por lo que sobrevive a reinicios del worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups: Dict[str, List[ManagedRule]] = {}   # id -> reglas
+        self._tags: Dict[str, str] = {}                    # id -> etiqueta de la primera regla
+        self._loaded = False
+
+    def sync(self) -> None:
+        """Recargar el estado gestionado desde iptables-save"""
+        with self._lock:
+            self._load()
+
+    def _load(self) -> None:
+        groups: Dict[str, List[ManagedRule]] = {}
+        tags: Dict[str, str] = {}
+
+        for table in TABLES:
+            result = subprocess.run(
+                ["iptables-save", "-t", table], capture_output=True, text=True, check=True
+            )
+            for line in result.stdout.splitlines():
+                if not line.startswith("-A "):
+                    continue
+                parsed = self._parse_save_line(table, line)
+                if parsed is None:
+                    continue
+                rule_id, tag, rule = parsed
+                groups.setdefault(rule_id, []).append(rule)
+                tags.setdefault(rule_id, tag)
+
+        self._groups = groups
+        self._tags = tags
+        self._loaded = True
+        logger.info(f"Motor iptables sincronizado: {len(groups)} grupos de reglas gestionadas")
+
+    @staticmethod
+    def _parse_save_line(table: str, line: str) -> Optional[Tuple[str, str, ManagedRule]]:
+        """Extraer (id, etiqueta, regla) de una línea -A de iptables-save"""
+        args = shlex.split(line)
+        try:
+            comment = args[args.index("--comment") + 1]
+        except (ValueError, IndexError):
+            return None
+
+        match = _MANAGED_COMMENT.match(comment)
+        if not match:
+            return None
+        return match.group(1), match.group(2), ManagedRule(table, args[1], tuple(args[2:]))
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self._load()
+
+    def apply(self, add: Optional[Dict[str, List[ManagedRule]]] = None,
+              remove: Iterable[str] = ()) -> List[str]:
+        """
+        Aplicar un lote de altas y bajas en una sola transacción
+
+        Args:
+            add: Grupos nuevos {id: reglas}
+            remove: Ids de grupos a eliminar (los desconocidos se ignoran)
+
+        Returns:
+            Ids eliminados
+
+        Raises:
+            RuntimeError: Si iptables-restore rechaza el lote (no se aplica nada
+                del estado en memoria)
+        """
+        add = add or {}
+        with self._lock:
+            self._ensure_loaded()
+
+            removed = [rule_id for rule_id in dict.fromkeys(remove) if rule_id in self._groups]
+            lines: Dict[str, List[str]] = {table: [] for table in TABLES}
+            for rule_id in removed:
+                for rule in self._groups[rule_id]:
+                    lines[rule.table].append(rule.render("-D"))
+            for rules in add.values():
+                for rule in rules:
+                    lines[rule.table].append(rule.render("-A"))
+
+            try:
+                self._restore(lines)
+            except RuntimeError:
+                # Posible desfase con el kernel (reglas borradas a mano): resincronizar
+                self._loaded = False
+                raise
+
+            for rule_id in removed:
+                del self._groups[rule_id]
+                self._tags.pop(rule_id, None)
+            for rule_id, rules in add.items():
+                self._groups[rule_id] = list(rules)
+                self._tags[rule_id] = self._tag_of(rules[0]) if rules else ""
+
+            return removed
+
+    @staticmethod
+    def _restore(lines: Dict[str, List[str]]) -> None:
+        """Ejecutar iptables-restore --noflush con las líneas de cada tabla"""
+        script = []
+        for table, table_lines in lines.items():
+            if table_lines:
+                script.append(f"*{table}")
+                script.extend(table_lines)
+                script.append("COMMIT")
+        if not script:
+            return
+
+        result = subprocess.run(
+            ["iptables-restore", "-w", "--noflush"],
+            input="\n".join(script) + "\n", capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"iptables-restore rechazó el lote: {result.stderr.strip()}")
+
+    @staticmethod
+    def _tag_of(rule: ManagedRule) -> str:
+        try:
+            comment = rule.spec[rule.spec.index("--comment") + 1]
+        except (ValueError, IndexError):
+            return ""
+        match = _MANAGED_COMMENT.match(comment)
+        return match.group(2) if match else ""
+
+    def forget_table(self, table: str) -> None:
+        """Descartar las reglas de una tabla (tras un flush externo)"""
+        with self._lock:
+            for rule_id in list(self._groups):
+                rules = [rule for rule in self._groups[rule_id] if rule.table != table]
+                if rules:
+                    self._groups[rule_id] = rules
+                else:
+                    del self._groups[rule_id]
+                    self._tags.pop(rule_id, None)
+
+    def find(self, predicate) -> List[str]:
+        """Ids de los grupos con alguna regla que cumpla predicate(regla, etiqueta)"""
+        with self._lock:
+            self._ensure_loaded()
+            return [
+                rule_id for rule_id, rules in self._groups.items()
+                if any(predicate(rule, self._tags.get(rule_id, "")) for rule in rules)
+            ]
+
+    def tag(self, rule_id: str) -> Optional[str]:
+        """Etiqueta del comentario de un grupo (None si no existe)"""
+        with self._lock:
+            self._ensure_loaded()
+            if rule_id not in self._groups:
+                return None
+            return self._tags.get(rule_id, "")
+
+    def rules(self, rule_id: str) -> List[ManagedRule]:
+        """Reglas de un grupo"""
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._groups.get(rule_id, ()))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Conexiones a libvirt por hilo, con keepalive y reconexión
+TeleCluster Orchestrator - Worker Agent
+
+Las llamadas a libvirt se ejecutan en pools de hilos (utils.executor, el
+sampler, las migraciones). Con una sola conexión compartida todas las
+peticiones se serializan en el mismo socket de libvirtd; aquí cada hilo
+obtiene su propia conexión, que conserva mientras viva. Las conexiones se
+abren con keepalive para que libvirt detecte un libvirtd caído, así que
+basta con consultar isAlive() cada pocos segundos en lugar de en cada
+petición.
+"""
+
+import libvirt
+import logging
+import threading
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+
+# Keepalive de libvirt: sonda cada N segundos, conexión muerta tras M sin respuesta
+KEEPALIVE_INTERVAL = 5
+KEEPALIVE_COUNT = 3
+
+# Segundos entre comprobaciones de isAlive() de una misma conexión
+HEALTH_CHECK_INTERVAL = 5.0
+
+# Reintentos de apertura y espera máxima entre reintentos
+CONNECT_RETRIES = 3
+INITIAL_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+
+class _Handle:
+    """Conexión de un hilo (o la principal) y su última comprobación"""
+
+    __slots__ = ("conn", "checked_at", "broken", "close", "__weakref__")
+
+    def __init__(self, conn: libvirt.virConnect):
+        self.conn = conn
+        self.checked_at = time.monotonic()
+        self.broken = False
+        # Cierra la conexión una sola vez: al descartarla o al terminar su hilo
+        self.close = weakref.finalize(self, _close_quietly, conn)
+
+
+def _close_quietly(conn: libvirt.virConnect) -> None:
+    try:
+        conn.close()
+    except libvirt.libvirtError:
+        pass
+
+
+class LibvirtConnectionPool:
+    """
+    Conexiones a una URI de libvirt, una por hilo más una principal
+
+    La conexión principal es la que recibe los callbacks de eventos (ver
+    DomainInventory); las de los hilos solo sirven peticiones. Si abrir una
+    conexión falla se reintenta con espera exponencial y, agotados los
+    reintentos, el resto de hilos falla sin esperar hasta que termina la
+    espera en curso, para no bloquear todos los workers contra un libvirtd
+    caído.
+    """
+
+    def __init__(self, uri: str, keepalive_interval: int = KEEPALIVE_INTERVAL,
+                 keepalive_count: int = KEEPALIVE_COUNT,
+                 health_interval: float = HEALTH_CHECK_INTERVAL,
+                 retries: int = CONNECT_RETRIES, max_backoff: float = MAX_BACKOFF):
+        """
+        Inicializar pool
+
+        Args:
+            uri: URI de libvirt (qemu:///system, qemu+ssh://host/system...)
+            keepalive_interval: Segundos entre sondas de keepalive
+            keepalive_count: Sondas sin respuesta antes de dar la conexión por muerta
+            health_interval: Segundos entre comprobaciones de isAlive() por conexión
+            retries: Intentos de apertura por llamada
+            max_backoff: Espera máxima entre intentos
+        """
+        self.uri = uri
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.health_interval = health_interval
+        self.retries = retries
+        self.max_backoff = max_backoff
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._primary_lock = threading.Lock()
+        self._local = threading.local()
+        self._handles: "weakref.WeakSet[_Handle]" = weakref.WeakSet()
+        self._primary: Optional[_Handle] = None
+        self._backoff = INITIAL_BACKOFF
+        self._retry_at = 0.0
+        self._last_error: Optional[str] = None
+        self._stats = {
+            "acquires": 0, "reused": 0, "opened": 0, "reconnects": 0,
+            "failures": 0, "health_checks": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0
+        }
+
+    def get(self) -> libvirt.virConnect:
+        """
+        Conexión del hilo actual (abierta o reabierta si hace falta)
+
+        Raises:
+            RuntimeError: Si no se puede conectar a libvirt
+        """
+        started = time.monotonic()
+        handle = getattr(self._local, "handle", None)
+        reused = handle is not None and self._healthy(handle)
+        if not reused:
+            if handle is not None:
+                self._discard(handle)
+            handle = self._open(reconnect=handle is not None)
+            self._local.handle = handle
+        self._record_acquire(started, reused)
+        return handle.conn
+
+    def primary(self) -> libvirt.virConnect:
+        """
+        Conexión principal compartida (la que recibe los eventos)
+
+        Raises:
+            RuntimeError: Si no se puede conectar a libvirt
+        """
+        started = time.monotonic()
+        with self._primary_lock:
+            handle = self._primary
+            reused = handle is not None and self._healthy(handle)
+            if not reused:
+                if handle is not None:
+                    self._discard(handle)
+                handle = self._open(reconnect=handle is not None)
+                self._primary = handle
+        self._record_acquire(started, reused)
+        return handle.conn
+
+    def mark_broken(self, conn: libvirt.virConnect) -> None:
+        """Marcar una conexión como rota (p.ej. desde un close callback)"""
+        with self._lock:
+            for handle in list(self._handles):
+                if handle.conn is conn:
+                    handle.broken = True
+
+    def close_all(self) -> None:
+        """Cerrar todas las conexiones; cada hilo abrirá una nueva en su próxima llamada"""
+        with self._primary_lock, self._lock:
+            handles = list(self._handles)
+            self._primary = None
+        for handle in handles:
+            self._discard(handle)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aperturas, reconexiones y espera al obtener conexión"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_handles"] = sum(1 for handle in self._handles if not handle.broken)
+            stats["last_error"] = self._last_error
+            stats["retry_in_s"] = round(max(0.0, self._retry_at - time.monotonic()), 1)
+        stats["wait_ms_avg"] = (
+            round(stats["wait_ms_total"] / stats["acquires"], 3) if stats["acquires"] else 0.0
+        )
+        stats["wait_ms_total"] = round(stats["wait_ms_total"], 2)
+        stats["wait_ms_max"] = round(stats["wait_ms_max"], 2)
+        stats["uri"] = self.uri
+        return stats
+
+    def _healthy(self, handle: _Handle) -> bool:
+        if handle.broken:
+            return False
+        now = time.monotonic()
+        if now - handle.checked_at < self.health_interval:
+            return True
+        with self._lock:
+            self._stats["health_checks"] += 1
+        try:
+            alive = handle.conn.isAlive() == 1
+        except libvirt.libvirtError:
+            alive = False
+        handle.checked_at = now
+        handle.broken = not alive
+        return alive
+
+    def _open(self, reconnect: bool) -> _Handle:
+        with self._lock:
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                self._stats["failures"] += 1
+                raise RuntimeError(
+                    f"No se pudo conectar a libvirt: {self._last_error} (reintento en {wait:.1f}s)"
+                )
+
+        delay = INITIAL_BACKOFF
+        for attempt in range(1, self.retries + 1):
+            try:
+                conn = libvirt.open(self.uri)
+                break
+            except libvirt.libvirtError as e:
+                error = str(e)
+                self.logger.warning(f"Error conectando a {self.uri} (intento {attempt}/{self.retries}): {e}")
+                if attempt < self.retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_backoff)
+        else:
+            with self._lock:
+                self._stats["failures"] += 1
+                self._last_error = error
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+            raise RuntimeError(f"No se pudo conectar a libvirt: {error}")
+
+        try:
+            conn.setKeepAlive(self.keepalive_interval, self.keepalive_count)
+        except libvirt.libvirtError as e:
+            # Requiere una implementación de eventos registrada (ver DomainInventory.start)
+            self.logger.debug(f"Keepalive no disponible en {self.uri}: {e}")
+
+        handle = _Handle(conn)
+        with self._lock:
+            self._handles.add(handle)
+            self._stats["opened"] += 1
+            self._stats["reconnects"] += int(reconnect)
+            self._backoff = INITIAL_BACKOFF
+            self._retry_at = 0.0
+            self._last_error = None
+        self.logger.info(f"Conectado a libvirt: {self.uri}")
+        return handle
+
+    def _discard(self, handle: _Handle) -> None:
+        handle.broken = True
+        with self._lock:
+            self._handles.discard(handle)
+        handle.close()
+
+    def _record_acquire(self, started: float, reused: bool) -> None:
+        wait_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._stats["acquires"] += 1
+            self._stats["reused"] += int(reused)
+            self._stats["wait_ms_total"] += wait_ms
+            self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+
+
+class LibvirtConnectionManager:
+    """Pool local del worker y pools de los hosts remotos (p.ej. destinos de migración)"""
+
+    def __init__(self, local_uri: str = "qemu:///system"):
+        self.local = LibvirtConnectionPool(local_uri)
+        self._lock = threading.Lock()
+        self._remote: Dict[str, LibvirtConnectionPool] = {}
+
+    def remote(self, uri: str) -> LibvirtConnectionPool:
+        """Pool de conexiones a una URI remota (creado en el primer uso)"""
+        with self._lock:
+            pool = self._remote.get(uri)
+            if pool is None:
+                pool = LibvirtConnectionPool(uri)
+                self._remote[uri] = pool
+            return pool
+
+    def close(self) -> None:
+        """Cerrar todas las conexiones locales y remotas"""
+        with self._lock:
+            pools = [self.local] + list(self._remote.values())
+        for pool in pools:
+            pool.close_all()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Contadores por URI"""
+        with self._lock:
+            pools = [self.local] + list(self._remote.values())
+        return {pool.uri: pool.stats() for pool in pools}
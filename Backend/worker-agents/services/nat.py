@@ -1,13 +1,20 @@
 import subprocess
+import ipaddress
 import logging
 import re
 import uuid
 from typing import Dict, Any, List, Optional
 from models.nat import NATAction, Protocol, NATRule, PortForwardRequest, MasqueradeRequest, FirewallRule, NATStatus
+from services.firewall import FirewallPolicyCompiler
+from services.iptables import IptablesRuleEngine, ManagedRule, comment_args
 
 
 logger = logging.getLogger(__name__)
 
+# Estado en memoria de las reglas gestionadas por el worker
+rule_engine = IptablesRuleEngine()
+firewall_compiler = FirewallPolicyCompiler(rule_engine)
+
 
 class NATService:
     """Servicio para gestionar NAT, port forwarding y firewall"""
@@ -18,42 +25,13 @@ class NATService:
                         description: Optional[str] = None) -> Dict[str, Any]:
         """Añadir regla de port forwarding (DNAT)"""
         try:
-            rule_id = str(uuid.uuid4())[:8]
-            
-            # Construir regla DNAT
-            cmd = ["iptables", "-t", "nat", "-A", "PREROUTING"]
-            
-            if interface:
-                cmd.extend(["-i", interface])
-            
-            if protocol != Protocol.all:
-                cmd.extend(["-p", protocol.value])
-            
-            cmd.extend([
-                "--dport", str(external_port),
-                "-j", "DNAT",
-                "--to-destination", f"{internal_ip}:{internal_port}"
-            ])
-            
-            # Añadir comentario para identificar la regla
-            if description:
-                cmd.extend(["-m", "comment", "--comment", f"{rule_id}:{description}"])
-            else:
-                cmd.extend(["-m", "comment", "--comment", f"{rule_id}:port_forward"])
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            # Añadir regla FORWARD para permitir el tráfico
-            forward_cmd = ["iptables", "-A", "FORWARD", "-d", internal_ip]
-            if protocol != Protocol.all:
-                forward_cmd.extend(["-p", protocol.value])
-            forward_cmd.extend([
-                "--dport", str(internal_port),
-                "-j", "ACCEPT",
-                "-m", "comment", "--comment", f"{rule_id}:forward"
-            ])
+            rule_id = NATService._new_rule_id()
+            rules = NATService._port_forward_rules(
+                rule_id, external_port, internal_ip, internal_port, protocol, interface, description
+            )
             
-            subprocess.run(forward_cmd, capture_output=True, text=True, check=True)
+            # DNAT + FORWARD en una sola transacción
+            rule_engine.apply(add={rule_id: rules})
             
             logger.info(f"Port forward creado: {external_port} -> {internal_ip}:{internal_port}")
             return {
@@ -65,8 +43,8 @@ class NATService:
                 "protocol": protocol.value
             }
             
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error creando port forward: {e.stderr}"
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            error_msg = f"Error creando port forward: {NATService._error_text(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
@@ -75,20 +53,19 @@ class NATService:
                            internal_ip: Optional[str] = None, internal_port: Optional[int] = None) -> Dict[str, Any]:
         """Remover regla de port forwarding"""
         try:
-            removed_rules = []
+            rule_ids = []
             
             if rule_id:
                 # Buscar y remover por ID
-                removed_rules.extend(NATService._remove_rules_by_comment(rule_id))
+                rule_ids.append(rule_id)
             else:
                 # Buscar por parámetros
                 if external_port and internal_ip and internal_port:
-                    # Buscar reglas que coincidan
-                    matching_rules = NATService._find_matching_forward_rules(
+                    rule_ids.extend(NATService._find_matching_forward_rules(
                         external_port, internal_ip, internal_port
-                    )
-                    for rule in matching_rules:
-                        removed_rules.extend(NATService._remove_rules_by_comment(rule))
+                    ))
+            
+            removed_rules = NATService._remove_rule_groups(rule_ids)
             
             if removed_rules:
                 logger.info(f"Reglas de port forward removidas: {removed_rules}")
@@ -97,7 +74,7 @@ class NATService:
                 return {"success": False, "error": "No se encontraron reglas coincidentes"}
                 
         except Exception as e:
-            error_msg = f"Error removiendo port forward: {str(e)}"
+            error_msg = f"Error removiendo port forward: {NATService._error_text(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
@@ -105,18 +82,10 @@ class NATService:
     def add_masquerade(source_network: str, output_interface: str) -> Dict[str, Any]:
         """Añadir regla de masquerade/SNAT"""
         try:
-            rule_id = str(uuid.uuid4())[:8]
-            
-            # Añadir regla MASQUERADE
-            cmd = [
-                "iptables", "-t", "nat", "-A", "POSTROUTING",
-                "-s", source_network,
-                "-o", output_interface,
-                "-j", "MASQUERADE",
-                "-m", "comment", "--comment", f"{rule_id}:masquerade"
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            rule_id = NATService._new_rule_id()
+            rule_engine.apply(add={
+                rule_id: NATService._masquerade_rules(rule_id, source_network, output_interface)
+            })
             
             # Habilitar IP forwarding si no está habilitado
             NATService._enable_ip_forwarding()
@@ -129,8 +98,8 @@ class NATService:
                 "output_interface": output_interface
             }
             
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error añadiendo masquerade: {e.stderr}"
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            error_msg = f"Error añadiendo masquerade: {NATService._error_text(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
@@ -138,21 +107,24 @@ class NATService:
     def remove_masquerade(source_network: str, output_interface: str) -> Dict[str, Any]:
         """Remover regla de masquerade"""
         try:
-            # Buscar y remover reglas coincidentes
-            cmd = [
-                "iptables", "-t", "nat", "-D", "POSTROUTING",
-                "-s", source_network,
-                "-o", output_interface,
-                "-j", "MASQUERADE"
-            ]
+            source = NATService._normalize_network(source_network)
+            
+            def matches(rule: ManagedRule, tag: str) -> bool:
+                return (
+                    tag == "masquerade" and
+                    NATService._normalize_network(NATService._arg(rule, "-s")) == source and
+                    NATService._arg(rule, "-o") == output_interface
+                )
             
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            removed_rules = NATService._remove_rule_groups(rule_engine.find(matches))
+            if not removed_rules:
+                return {"success": False, "error": "No se encontraron reglas coincidentes"}
             
             logger.info(f"Masquerade removido: {source_network} -> {output_interface}")
             return {"success": True, "source_network": source_network, "output_interface": output_interface}
             
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error removiendo masquerade: {e.stderr}"
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            error_msg = f"Error removiendo masquerade: {NATService._error_text(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
@@ -160,37 +132,14 @@ class NATService:
     def add_firewall_rule(chain: str, action: str, protocol: Protocol = Protocol.all,
                          source: Optional[str] = None, destination: Optional[str] = None,
                          port: Optional[int] = None, interface: Optional[str] = None) -> Dict[str, Any]:
-        """Añadir regla de firewall"""
+        """Añadir regla de firewall (agrupada en un set de ipset con las de su misma política)"""
         try:
-            rule_id = str(uuid.uuid4())[:8]
-            
-            cmd = ["iptables", "-A", chain.upper()]
-            
-            if interface:
-                if chain.upper() == "INPUT":
-                    cmd.extend(["-i", interface])
-                elif chain.upper() == "OUTPUT":
-                    cmd.extend(["-o", interface])
-            
-            if protocol != Protocol.all:
-                cmd.extend(["-p", protocol.value])
-            
-            if source:
-                cmd.extend(["-s", source])
-            
-            if destination:
-                cmd.extend(["-d", destination])
-            
-            if port:
-                if protocol == Protocol.tcp or protocol == Protocol.udp:
-                    cmd.extend(["--dport", str(port)])
-            
-            cmd.extend(["-j", action.upper()])
-            cmd.extend(["-m", "comment", "--comment", f"{rule_id}:firewall"])
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            rule_id = firewall_compiler.add_rule(
+                NATService._new_rule_id(), chain.upper(), action.upper(), protocol,
+                source, destination, port, interface
+            )
             
-            logger.info(f"Regla firewall añadida: {chain} {action}")
+            logger.info(f"Regla firewall añadida: {chain} {action} (ID: {rule_id})")
             return {
                 "success": True,
                 "rule_id": rule_id,
@@ -199,8 +148,81 @@ class NATService:
                 "protocol": protocol.value
             }
             
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error añadiendo regla firewall: {e.stderr}"
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            error_msg = f"Error añadiendo regla firewall: {NATService._error_text(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    @staticmethod
+    def remove_firewall_rule(rule_id: str) -> Dict[str, Any]:
+        """Eliminar una regla de firewall por ID"""
+        try:
+            if not firewall_compiler.remove_rule(rule_id):
+                return {"success": False, "error": f"Regla firewall {rule_id} no encontrada"}
+            
+            logger.info(f"Regla firewall eliminada: {rule_id}")
+            return {"success": True, "rule_id": rule_id}
+            
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            error_msg = f"Error eliminando regla firewall: {NATService._error_text(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    @staticmethod
+    def apply_bulk(port_forwards: List[PortForwardRequest], masquerades: List[MasqueradeRequest],
+                   remove_rule_ids: List[str]) -> Dict[str, Any]:
+        """Aplicar altas y bajas de reglas NAT en una única transacción"""
+        try:
+            add = {}
+            added = []
+            
+            for request in port_forwards:
+                rule_id = NATService._new_rule_id()
+                add[rule_id] = NATService._port_forward_rules(
+                    rule_id, request.external_port, request.internal_ip, request.internal_port,
+                    request.protocol, request.interface, request.description
+                )
+                added.append({
+                    "rule_id": rule_id,
+                    "type": "port_forward",
+                    "external_port": request.external_port,
+                    "internal_ip": request.internal_ip,
+                    "internal_port": request.internal_port,
+                    "protocol": request.protocol.value
+                })
+            
+            for request in masquerades:
+                rule_id = NATService._new_rule_id()
+                add[rule_id] = NATService._masquerade_rules(
+                    rule_id, request.source_network, request.output_interface
+                )
+                added.append({
+                    "rule_id": rule_id,
+                    "type": "masquerade",
+                    "source_network": request.source_network,
+                    "output_interface": request.output_interface
+                })
+            
+            # Las reglas de los grupos de firewall solo se quitan con su último miembro
+            removable = [rule_id for rule_id in remove_rule_ids if not firewall_compiler.is_group(rule_id)]
+            removed = rule_engine.apply(add=add, remove=removable)
+            
+            if masquerades:
+                NATService._enable_ip_forwarding()
+            
+            not_found = [rule_id for rule_id in remove_rule_ids if rule_id not in removed]
+            logger.info(f"Lote NAT aplicado: {len(added)} altas, {len(removed)} bajas")
+            return {
+                "success": True,
+                "added": added,
+                "removed": removed,
+                "not_found": not_found
+            }
+            
+        except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+            error_msg = f"Error aplicando lote NAT: {NATService._error_text(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
@@ -243,6 +265,7 @@ class NATService:
         try:
             # Flush NAT table
             subprocess.run(["iptables", "-t", "nat", "-F"], capture_output=True, text=True, check=True)
+            rule_engine.forget_table("nat")
             
             logger.info("Reglas NAT limpiadas")
             return {"success": True}
@@ -258,12 +281,14 @@ class NATService:
         try:
             # Flush filter table
             subprocess.run(["iptables", "-F"], capture_output=True, text=True, check=True)
+            rule_engine.forget_table("filter")
+            firewall_compiler.forget()
             
             logger.info("Reglas firewall limpiadas")
             return {"success": True}
             
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Error limpiando reglas firewall: {e.stderr}"
+        except (RuntimeError, subprocess.CalledProcessError) as e:
+            error_msg = f"Error limpiando reglas firewall: {NATService._error_text(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
@@ -277,69 +302,93 @@ class NATService:
             logger.warning(f"No se pudo habilitar IP forwarding: {e}")
 
     @staticmethod
-    def _remove_rules_by_comment(rule_id: str) -> List[str]:
-        """Remover reglas por comentario/ID"""
-        removed = []
-        
-        try:
-            # Buscar en tabla NAT
-            nat_cmd = ["iptables", "-t", "nat", "-L", "-n", "--line-numbers"]
-            nat_result = subprocess.run(nat_cmd, capture_output=True, text=True, check=True)
-            
-            lines = nat_result.stdout.split('\n')
-            for line in lines:
-                if rule_id in line:
-                    # Extraer cadena y número de línea
-                    parts = line.split()
-                    if len(parts) > 0 and parts[0].isdigit():
-                        line_num = parts[0]
-                        chain = NATService._find_chain_for_line(nat_result.stdout, line)
-                        if chain:
-                            del_cmd = ["iptables", "-t", "nat", "-D", chain, line_num]
-                            subprocess.run(del_cmd, capture_output=True, text=True)
-                            removed.append(f"nat:{chain}:{line_num}")
-            
-            # Buscar en tabla filter
-            filter_cmd = ["iptables", "-L", "-n", "--line-numbers"]
-            filter_result = subprocess.run(filter_cmd, capture_output=True, text=True, check=True)
-            
-            lines = filter_result.stdout.split('\n')
-            for line in lines:
-                if rule_id in line:
-                    parts = line.split()
-                    if len(parts) > 0 and parts[0].isdigit():
-                        line_num = parts[0]
-                        chain = NATService._find_chain_for_line(filter_result.stdout, line)
-                        if chain:
-                            del_cmd = ["iptables", "-D", chain, line_num]
-                            subprocess.run(del_cmd, capture_output=True, text=True)
-                            removed.append(f"filter:{chain}:{line_num}")
-        
-        except subprocess.CalledProcessError:
-            pass
-        
-        return removed
+    def _new_rule_id() -> str:
+        return str(uuid.uuid4())[:8]
 
     @staticmethod
-    def _find_chain_for_line(iptables_output: str, target_line: str) -> Optional[str]:
-        """Encontrar la cadena a la que pertenece una línea"""
-        lines = iptables_output.split('\n')
-        current_chain = None
+    def _port_forward_rules(rule_id: str, external_port: int, internal_ip: str, internal_port: int,
+                            protocol: Protocol, interface: Optional[str],
+                            description: Optional[str]) -> List[ManagedRule]:
+        """Reglas DNAT (nat/PREROUTING) y ACCEPT (filter/FORWARD) de un port forward"""
+        dnat = []
+        if interface:
+            dnat.extend(["-i", interface])
+        if protocol != Protocol.all:
+            dnat.extend(["-p", protocol.value])
+        dnat.extend(["--dport", str(external_port)])
+        # Añadir comentario para identificar la regla
+        dnat.extend(comment_args(rule_id, description or "port_forward"))
+        dnat.extend(["-j", "DNAT", "--to-destination", f"{internal_ip}:{internal_port}"])
         
-        for line in lines:
-            if line.startswith('Chain '):
-                current_chain = line.split()[1]
-            elif line == target_line and current_chain:
-                return current_chain
+        # Regla FORWARD para permitir el tráfico
+        forward = ["-d", internal_ip]
+        if protocol != Protocol.all:
+            forward.extend(["-p", protocol.value])
+        forward.extend(["--dport", str(internal_port)])
+        forward.extend(comment_args(rule_id, "forward"))
+        forward.extend(["-j", "ACCEPT"])
         
-        return None
+        return [
+            ManagedRule("nat", "PREROUTING", tuple(dnat)),
+            ManagedRule("filter", "FORWARD", tuple(forward))
+        ]
+
+    @staticmethod
+    def _masquerade_rules(rule_id: str, source_network: str, output_interface: str) -> List[ManagedRule]:
+        """Regla MASQUERADE (nat/POSTROUTING)"""
+        spec = ["-s", source_network, "-o", output_interface]
+        spec.extend(comment_args(rule_id, "masquerade"))
+        spec.extend(["-j", "MASQUERADE"])
+        return [ManagedRule("nat", "POSTROUTING", tuple(spec))]
+
+    @staticmethod
+    def _remove_rule_groups(rule_ids: List[str]) -> List[str]:
+        """Eliminar grupos de reglas en una transacción; devuelve tabla:cadena:id"""
+        rule_ids = [rule_id for rule_id in rule_ids if not firewall_compiler.is_group(rule_id)]
+        described = {
+            rule_id: [f"{rule.table}:{rule.chain}:{rule_id}" for rule in rule_engine.rules(rule_id)]
+            for rule_id in rule_ids
+        }
+        removed = rule_engine.apply(remove=rule_ids)
+        return [entry for rule_id in removed for entry in described[rule_id]]
+
+    @staticmethod
+    def _arg(rule: ManagedRule, option: str) -> Optional[str]:
+        """Valor de una opción en la especificación de una regla"""
+        try:
+            return rule.spec[rule.spec.index(option) + 1]
+        except (ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def _normalize_network(network: Optional[str]) -> Optional[str]:
+        """Forma canónica de una red (iptables-save muestra 10.0.0.0/24, no 10.0.0.5/24)"""
+        if not network:
+            return network
+        try:
+            return str(ipaddress.ip_network(network, strict=False))
+        except ValueError:
+            return network
+
+    @staticmethod
+    def _error_text(e: Exception) -> str:
+        if isinstance(e, subprocess.CalledProcessError):
+            return e.stderr
+        return str(e)
 
     @staticmethod
     def _find_matching_forward_rules(external_port: int, internal_ip: str, internal_port: int) -> List[str]:
         """Encontrar reglas de port forward que coincidan con los parámetros"""
-        # Implementación simplificada que busca comentarios
-        # En una implementación real, se parsearian las reglas más detalladamente
-        return []
+        destination = f"{internal_ip}:{internal_port}"
+        
+        def matches(rule: ManagedRule, tag: str) -> bool:
+            return (
+                rule.table == "nat" and
+                NATService._arg(rule, "--dport") == str(external_port) and
+                NATService._arg(rule, "--to-destination") == destination
+            )
+        
+        return rule_engine.find(matches)
 
     @staticmethod
     def _parse_dnat_rules(nat_output: str) -> List[NATRule]:
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Consulta de interfaces de red vía rtnetlink
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import errno
+import logging
+import os
+import socket
+import struct
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Cabeceras netlink (linux/netlink.h, linux/rtnetlink.h)
+NLMSG_HDR = struct.Struct("=IHHII")        # len, type, flags, seq, pid
+IFINFOMSG = struct.Struct("=BxHiII")       # family, type, index, flags, change
+IFADDRMSG = struct.Struct("=BBBBI")        # family, prefixlen, flags, scope, index
+RTATTR = struct.Struct("=HH")              # len, type
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+
+# Atributos de enlace
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_LINK = 5
+IFLA_MASTER = 10
+IFLA_OPERSTATE = 16
+IFLA_LINKINFO = 18
+IFLA_LINK_NETNSID = 37
+
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+
+IFLA_VLAN_ID = 1
+IFLA_VLAN_PROTOCOL = 5
+
+IFLA_TUN_OWNER = 1
+IFLA_TUN_GROUP = 2
+IFLA_TUN_TYPE = 3
+IFLA_TUN_PERSIST = 6
+
+# Atributos de dirección
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+IFF_UP = 0x1
+IFF_LOOPBACK = 0x8
+NLA_TYPE_MASK = 0x3fff   # Sin los bits NLA_F_NESTED / NLA_F_NET_BYTEORDER
+TUN_TYPE_TAP = 2
+ETH_P_8021AD = 0x88a8    # VLAN QinQ (IFLA_VLAN_PROTOCOL)
+NO_OWNER = 0xffffffff
+
+OPERSTATES = ("unknown", "notpresent", "down", "lowerlayerdown", "testing", "dormant", "up")
+
+
+class NetlinkError(RuntimeError):
+    """Error devuelto por el kernel en una petición rtnetlink"""
+
+
+class Address(NamedTuple):
+    """Dirección IP asignada a una interfaz"""
+    family: int          # socket.AF_INET / socket.AF_INET6
+    address: str
+    prefixlen: int
+
+    @property
+    def cidr(self) -> str:
+        return f"{self.address}/{self.prefixlen}"
+
+
+class Link(NamedTuple):
+    """Interfaz de red tal como la describe RTM_NEWLINK"""
+    index: int
+    name: str
+    flags: int
+    operstate: str
+    mtu: Optional[int]
+    mac_address: Optional[str]
+    kind: Optional[str]             # bridge, veth, vlan, tun, bond, openvswitch... (None = física)
+    master_index: Optional[int]     # Bridge/bond al que pertenece
+    link_index: Optional[int]       # Padre (vlan) o peer (veth)
+    link_netnsid: Optional[int]     # El peer está en otro namespace
+    vlan_id: Optional[int] = None
+    vlan_protocol: Optional[int] = None
+    tun_type: Optional[int] = None
+    tun_owner: Optional[int] = None
+    tun_group: Optional[int] = None
+    tun_persist: Optional[bool] = None
+
+    @property
+    def up(self) -> bool:
+        return bool(self.flags & IFF_UP)
+
+    @property
+    def loopback(self) -> bool:
+        return bool(self.flags & IFF_LOOPBACK)
+
+
+class InterfaceTable:
+    """Resultado de un volcado de enlaces y direcciones, indexado por nombre e índice"""
+
+    def __init__(self, links: List[Link], addresses: Dict[int, List[Address]]):
+        self.links = sorted(links, key=lambda link: link.index)
+        self._by_index = {link.index: link for link in self.links}
+        self._by_name = {link.name: link for link in self.links}
+        self._addresses = addresses
+
+    def get(self, name: str) -> Optional[Link]:
+        """Enlace por nombre"""
+        return self._by_name.get(name)
+
+    def by_index(self, index: Optional[int]) -> Optional[Link]:
+        """Enlace por ifindex"""
+        return self._by_index.get(index) if index else None
+
+    def of_kind(self, kind: str) -> List[Link]:
+        """Enlaces de un tipo (linkinfo kind)"""
+        return [link for link in self.links if link.kind == kind]
+
+    def master_name(self, link: Link) -> Optional[str]:
+        """Nombre del bridge/bond maestro de un enlace"""
+        master = self.by_index(link.master_index)
+        return master.name if master else None
+
+    def peer_name(self, link: Link) -> Optional[str]:
+        """Nombre del enlace padre (vlan) o peer (veth); ifN si está en otro namespace"""
+        if link.link_index is None:
+            return None
+        if link.link_netnsid is not None:
+            return f"if{link.link_index}"
+        peer = self.by_index(link.link_index)
+        return peer.name if peer else f"if{link.link_index}"
+
+    def addresses(self, link: Link, family: Optional[int] = None) -> List[Address]:
+        """Direcciones de un enlace, opcionalmente filtradas por familia"""
+        addresses = self._addresses.get(link.index, [])
+        if family is not None:
+            addresses = [address for address in addresses if address.family == family]
+        return addresses
+
+
+def dump_interfaces() -> InterfaceTable:
+    """
+    Volcar todos los enlaces y direcciones del namespace actual
+
+    Hace dos peticiones dump (RTM_GETLINK y RTM_GETADDR) por el mismo socket,
+    sin lanzar procesos.
+
+    Raises:
+        NetlinkError: Si el kernel rechaza la petición
+    """
+    with _open_socket() as sock:
+        links = [
+            _parse_link(payload)
+            for msg_type, payload in _request(sock, RTM_GETLINK, IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), 1)
+            if msg_type == RTM_NEWLINK
+        ]
+
+        addresses: Dict[int, List[Address]] = {}
+        for msg_type, payload in _request(sock, RTM_GETADDR, IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), 2):
+            if msg_type != RTM_NEWADDR:
+                continue
+            index, address = _parse_address(payload)
+            if address is not None:
+                addresses.setdefault(index, []).append(address)
+
+    return InterfaceTable(links, addresses)
+
+
+def _open_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.bind((0, 0))
+    return sock
+
+
+def _request(sock: socket.socket, msg_type: int, body: bytes, seq: int) -> Iterator[Tuple[int, bytes]]:
+    """Enviar una petición dump y devolver (tipo, payload) de cada respuesta"""
+    header = NLMSG_HDR.pack(NLMSG_HDR.size + len(body), msg_type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0)
+    sock.send(header + body)
+
+    while True:
+        data = sock.recv(1 << 16)
+        offset = 0
+        while offset + NLMSG_HDR.size <= len(data):
+            length, reply_type, _, reply_seq, _ = NLMSG_HDR.unpack_from(data, offset)
+            if length < NLMSG_HDR.size:
+                return
+            payload = data[offset + NLMSG_HDR.size:offset + length]
+            offset += _align(length)
+
+            if reply_seq != seq:
+                continue
+            if reply_type == NLMSG_DONE:
+                return
+            if reply_type == NLMSG_ERROR:
+                code = -struct.unpack_from("=i", payload)[0]
+                if code:
+                    raise NetlinkError(f"Error netlink: {os.strerror(code)} ({errno.errorcode.get(code, code)})")
+                continue
+            yield reply_type, payload
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def _attributes(data: bytes, offset: int = 0) -> Dict[int, bytes]:
+    """Parsear una secuencia de rtattr a {tipo: valor}"""
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type & NLA_TYPE_MASK] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _u32(value: Optional[bytes]) -> Optional[int]:
+    return struct.unpack("=I", value[:4])[0] if value else None
+
+
+def _string(value: bytes) -> str:
+    return value.split(b"\0", 1)[0].decode(errors="replace")
+
+
+def _parse_link(payload: bytes) -> Link:
+    """Convertir un mensaje RTM_NEWLINK en Link"""
+    _, _, index, flags, _ = IFINFOMSG.unpack_from(payload)
+    attrs = _attributes(payload, IFINFOMSG.size)
+
+    mac = attrs.get(IFLA_ADDRESS)
+    operstate = attrs.get(IFLA_OPERSTATE)
+    netnsid = attrs.get(IFLA_LINK_NETNSID)
+
+    fields = {
+        "index": index,
+        "name": _string(attrs.get(IFLA_IFNAME, b"")),
+        "flags": flags,
+        "operstate": OPERSTATES[operstate[0]] if operstate and operstate[0] < len(OPERSTATES) else "unknown",
+        "mtu": _u32(attrs.get(IFLA_MTU)),
+        "mac_address": ":".join(f"{byte:02x}" for byte in mac) if mac and len(mac) == 6 else None,
+        "kind": None,
+        "master_index": _u32(attrs.get(IFLA_MASTER)),
+        "link_index": _u32(attrs.get(IFLA_LINK)),
+        "link_netnsid": struct.unpack("=i", netnsid[:4])[0] if netnsid else None,
+    }
+
+    # El IFLA_LINK de una interfaz sin padre apunta a sí misma
+    if fields["link_index"] in (0, index):
+        fields["link_index"] = None
+
+    linkinfo = attrs.get(IFLA_LINKINFO)
+    if linkinfo:
+        info = _attributes(linkinfo)
+        if IFLA_INFO_KIND in info:
+            fields["kind"] = _string(info[IFLA_INFO_KIND])
+        data = _attributes(info[IFLA_INFO_DATA]) if IFLA_INFO_DATA in info else {}
+
+        if fields["kind"] == "vlan" and IFLA_VLAN_ID in data:
+            fields["vlan_id"] = struct.unpack("=H", data[IFLA_VLAN_ID][:2])[0]
+            if IFLA_VLAN_PROTOCOL in data:
+                fields["vlan_protocol"] = struct.unpack("!H", data[IFLA_VLAN_PROTOCOL][:2])[0]
+        elif fields["kind"] == "tun":
+            if IFLA_TUN_TYPE in data:
+                fields["tun_type"] = data[IFLA_TUN_TYPE][0]
+            owner = _u32(data.get(IFLA_TUN_OWNER))
+            group = _u32(data.get(IFLA_TUN_GROUP))
+            fields["tun_owner"] = owner if owner != NO_OWNER else None
+            fields["tun_group"] = group if group != NO_OWNER else None
+            if IFLA_TUN_PERSIST in data:
+                fields["tun_persist"] = bool(data[IFLA_TUN_PERSIST][0])
+
+    return Link(**fields)
+
+
+def _parse_address(payload: bytes) -> Tuple[int, Optional[Address]]:
+    """Convertir un mensaje RTM_NEWADDR en (ifindex, Address)"""
+    family, prefixlen, _, _, index = IFADDRMSG.unpack_from(payload)
+    attrs = _attributes(payload, IFADDRMSG.size)
+
+    # En enlaces punto a punto IFA_ADDRESS es el extremo remoto
+    raw = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+    if raw is None or family not in (socket.AF_INET, socket.AF_INET6):
+        return index, None
+    return index, Address(family, socket.inet_ntop(family, raw), prefixlen)
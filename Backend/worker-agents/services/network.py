@@ -4,8 +4,11 @@ import psutil
 import re
 from typing import Dict, Any, List
 from models.network import NetworkInterface, InterfaceType, InterfaceStatus, NetworkTopology, HealthStatus
+from services.netlink import InterfaceTable, Link, NetlinkError, TUN_TYPE_TAP, dump_interfaces
+from utils.executor import run_command
 from datetime import datetime
 import platform
+import socket
 
 
 logger = logging.getLogger(__name__)
@@ -20,40 +23,14 @@ class NetworkService:
         interfaces = []
         
         try:
-            # Usar ip link para obtener interfaces
-            cmd = ["ip", "link", "show"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            current_interface = None
-            
-            for line in result.stdout.split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Línea principal de interfaz: "2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP>"
-                if re.match(r'^\d+:', line):
-                    if current_interface:
-                        interfaces.append(current_interface)
-                    
-                    current_interface = NetworkService._parse_interface_line(line)
-                
-                # Línea secundaria con MAC: "link/ether 00:11:22:33:44:55"
-                elif current_interface and line.startswith('link/'):
-                    mac_match = re.search(r'link/\w+\s+([a-f0-9:]{17})', line)
-                    if mac_match:
-                        current_interface.mac_address = mac_match.group(1)
-            
-            # Añadir la última interfaz
-            if current_interface:
-                interfaces.append(current_interface)
+            # Un único volcado netlink de enlaces y direcciones
+            table = dump_interfaces()
             
-            # Enriquecer con información adicional
-            for interface in interfaces:
-                NetworkService._enrich_interface_info(interface)
+            for link in table.links:
+                interfaces.append(NetworkService._interface_from_link(link, table))
         
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error listando interfaces: {e.stderr}")
+        except (OSError, NetlinkError) as e:
+            logger.error(f"Error listando interfaces: {e}")
         
         return interfaces
 
@@ -61,20 +38,13 @@ class NetworkService:
     def get_interface_info(interface_name: str) -> NetworkInterface:
         """Obtener información detallada de una interfaz"""
         try:
-            cmd = ["ip", "link", "show", interface_name]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            interface = None
-            for line in result.stdout.split('\n'):
-                if re.match(r'^\d+:', line):
-                    interface = NetworkService._parse_interface_line(line)
-                    break
+            table = dump_interfaces()
+            link = table.get(interface_name)
             
-            if interface:
-                NetworkService._enrich_interface_info(interface)
-                return interface
+            if link:
+                return NetworkService._interface_from_link(link, table)
             
-        except subprocess.CalledProcessError:
+        except (OSError, NetlinkError):
             pass
         
         # Retornar interfaz básica si no se puede obtener info
@@ -157,11 +127,11 @@ class NetworkService:
             )
 
     @staticmethod
-    def ping_host(target: str, count: int = 4) -> Dict[str, Any]:
+    async def ping_host(target: str, count: int = 4) -> Dict[str, Any]:
         """Hacer ping a un host"""
         try:
             cmd = ["ping", "-c", str(count), target]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            result = await run_command(cmd, resource="diagnostics", check=True)
             
             # Parsear resultados
             lines = result.stdout.split('\n')
@@ -192,11 +162,11 @@ class NetworkService:
         return {"success": False, "target": target, "error": "Unknown error"}
 
     @staticmethod
-    def traceroute(target: str) -> Dict[str, Any]:
+    async def traceroute(target: str) -> Dict[str, Any]:
         """Hacer traceroute a un destino"""
         try:
             cmd = ["traceroute", "-n", target]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True, timeout=30)
+            result = await run_command(cmd, timeout=30, resource="diagnostics", check=True)
             
             return {
                 "success": True,
@@ -218,92 +188,46 @@ class NetworkService:
             }
 
     @staticmethod
-    def _parse_interface_line(line: str) -> NetworkInterface:
-        """Parsear línea de interfaz de 'ip link show'"""
-        # Ejemplo: "2: eth0: <BROADCAST,MULTICAST,UP,LOWER_UP> mtu 1500"
-        
-        # Extraer nombre
-        name_match = re.search(r'^\d+:\s+([^:@]+)', line)
-        name = name_match.group(1) if name_match else "unknown"
-        
-        # Determinar tipo de interfaz
-        interface_type = NetworkService._determine_interface_type(name, line)
-        
-        # Determinar estado
-        status = InterfaceStatus.up if "UP" in line else InterfaceStatus.down
-        
-        # Extraer MTU
-        mtu_match = re.search(r'mtu\s+(\d+)', line)
-        mtu = int(mtu_match.group(1)) if mtu_match else None
-        
+    def _interface_from_link(link: Link, table: InterfaceTable) -> NetworkInterface:
+        """Construir NetworkInterface a partir de un enlace netlink"""
         return NetworkInterface(
-            name=name,
-            type=interface_type,
-            status=status,
-            mtu=mtu
+            name=link.name,
+            type=NetworkService._determine_interface_type(link),
+            status=InterfaceStatus.up if link.up else InterfaceStatus.down,
+            mtu=link.mtu,
+            mac_address=link.mac_address,
+            ip_addresses=[address.cidr for address in table.addresses(link, socket.AF_INET)],
+            bridge=table.master_name(link),
+            vlans=[link.vlan_id] if link.vlan_id is not None else []
         )
 
     @staticmethod
-    def _determine_interface_type(name: str, line: str) -> InterfaceType:
-        """Determinar el tipo de interfaz basado en nombre y características"""
+    def _determine_interface_type(link: Link) -> InterfaceType:
+        """Determinar el tipo de interfaz a partir del tipo netlink y del nombre"""
+        name = link.name
         
-        # Interfaces físicas comunes
-        if any(prefix in name for prefix in ['eth', 'ens', 'enp', 'em', 'p']):
-            return InterfaceType.physical
-        
-        # Bridges
-        if 'bridge' in line or name.startswith('br-') or name.startswith('virbr'):
+        # Tipo declarado por el kernel (IFLA_INFO_KIND)
+        if link.kind in ('bridge', 'openvswitch'):
             return InterfaceType.bridge
-        
-        # Veth pairs
-        if 'veth' in name or '@' in line:
+        if link.kind == 'veth':
             return InterfaceType.veth
-        
-        # TUN/TAP
-        if name.startswith('tun'):
-            return InterfaceType.tun
-        elif name.startswith('tap') or name.startswith('vnet'):
-            return InterfaceType.tap
-        
-        # VLAN
-        if '.' in name and any(char.isdigit() for char in name.split('.')[-1]):
+        if link.kind == 'vlan':
             return InterfaceType.vlan
-        
-        # Bond
-        if name.startswith('bond'):
+        if link.kind == 'bond':
             return InterfaceType.bond
+        if link.kind == 'tun':
+            return InterfaceType.tap if link.tun_type == TUN_TYPE_TAP else InterfaceType.tun
         
         # Loopback y otras interfaces virtuales
-        if name == 'lo' or name.startswith('docker') or name.startswith('veth'):
+        if link.loopback or link.kind or name.startswith('docker'):
             return InterfaceType.virtual
         
+        # Sin tipo: interfaz física o creada fuera del kernel (p.ej. vnet de libvirt)
+        if name.startswith('vnet'):
+            return InterfaceType.tap
+        
         return InterfaceType.physical  # Por defecto
 
-    @staticmethod
-    def _enrich_interface_info(interface: NetworkInterface):
-        """Enriquecer información de interfaz con detalles adicionales"""
-        try:
-            # Obtener direcciones IP
-            ip_cmd = ["ip", "addr", "show", interface.name]
-            ip_result = subprocess.run(ip_cmd, capture_output=True, text=True, check=True)
-            
-            # Extraer IPs
-            ip_addresses = []
-            for line in ip_result.stdout.split('\n'):
-                ip_match = re.search(r'inet\s+([0-9.]+/\d+)', line)
-                if ip_match:
-                    ip_addresses.append(ip_match.group(1))
-            
-            interface.ip_addresses = ip_addresses
-            
-            # Obtener bridge master si aplica
-            master_match = re.search(r'master\s+(\S+)', ip_result.stdout)
-            if master_match:
-                interface.bridge = master_match.group(1)
-            
-        except subprocess.CalledProcessError:
-            pass
-
     @staticmethod
     def _get_bridges() -> List[str]:
         """Obtener lista de bridges"""
@@ -311,15 +235,9 @@ class NetworkService:
         
         try:
             # Bridges Linux
-            cmd = ["ip", "link", "show", "type", "bridge"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            for line in result.stdout.split('\n'):
-                match = re.search(r'^\d+:\s+([^:]+):', line)
-                if match:
-                    bridges.append(match.group(1))
+            bridges.extend(link.name for link in dump_interfaces().of_kind('bridge'))
         
-        except subprocess.CalledProcessError:
+        except (OSError, NetlinkError):
             pass
         
         try:
@@ -0,0 +1,370 @@
+import subprocess
+import logging
+import os
+import pwd
+import grp
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from models.bridge import BridgeType
+from models.topology import TopologyApplyRequest
+from models.tuntap import TunTapType
+from services.netlink import InterfaceTable, NetlinkError, dump_interfaces
+
+
+logger = logging.getLogger(__name__)
+
+# Línea de error de ip -batch: "Command failed -:<línea>"
+_FAILED_LINE = re.compile(r'^Command failed -:(\d+)$')
+
+
+class _CompiledTopology:
+    """Topología compilada: script de ip -batch y transacción ovs-vsctl"""
+
+    def __init__(self):
+        self.objects: Dict[str, Dict[str, Any]] = {}   # clave -> {"kind", "name", "errors", "unchanged"}
+        self.ip_lines: List[str] = []
+        self.ip_owners: List[str] = []                  # objeto dueño de cada línea
+        self.ovs_args: List[List[str]] = []
+        self.ovs_owners: List[str] = []
+
+    def add_object(self, kind: str, name: str) -> str:
+        key = f"{kind}:{name}"
+        self.objects.setdefault(key, {"kind": kind, "name": name, "errors": [], "unchanged": False})
+        return key
+
+    def exists(self, owner: str) -> None:
+        """El objeto ya existe: no se vuelve a crear (solo se ajusta su estado)"""
+        self.objects[owner]["unchanged"] = True
+
+    def ip(self, owner: str, line: str) -> None:
+        self.ip_lines.append(line)
+        self.ip_owners.append(owner)
+
+    def ovs(self, owner: str, args: List[str]) -> None:
+        self.ovs_args.append(args)
+        self.ovs_owners.append(owner)
+
+    def fail(self, owner: str, error: str) -> None:
+        self.objects[owner]["errors"].append(error)
+
+    @property
+    def ip_script(self) -> str:
+        return "".join(f"{line}\n" for line in self.ip_lines)
+
+    @property
+    def ovs_command(self) -> List[str]:
+        cmd = ["ovs-vsctl"]
+        for i, args in enumerate(self.ovs_args):
+            if i:
+                cmd.append("--")
+            cmd.extend(args)
+        return cmd
+
+
+class TopologyService:
+    """Servicio para aplicar topologías de red completas en una sola operación"""
+
+    @staticmethod
+    def apply_topology(topology: TopologyApplyRequest) -> Dict[str, Any]:
+        """
+        Aplicar una topología declarativa
+
+        Todos los objetos gestionados por iproute2 se compilan en un único
+        script ejecutado con `ip -force -batch -` (un solo proceso; -force
+        continúa tras un error y reporta la línea fallida). Los bridges y
+        puertos OVS se encadenan en una sola transacción de ovs-vsctl.
+
+        Es idempotente: los objetos que ya están en la tabla de interfaces
+        no se vuelven a crear y se reportan como unchanged (solo se repiten
+        los `link set` de estado, que no fallan si ya se cumplen).
+        """
+        started = time.monotonic()
+        compiled = TopologyService._compile(topology, TopologyService._interfaces())
+
+        if topology.dry_run:
+            return {
+                "success": True,
+                "dry_run": True,
+                "ip_batch": compiled.ip_lines,
+                "ovs_command": compiled.ovs_command if compiled.ovs_args else None,
+                "results": TopologyService._results(compiled)
+            }
+
+        if compiled.ip_lines:
+            TopologyService._run_ip_batch(compiled)
+
+        # Los puertos OVS deben existir antes de añadirlos: va después del batch
+        if compiled.ovs_args:
+            TopologyService._run_ovs_transaction(compiled)
+
+        results = TopologyService._results(compiled)
+        failed = sum(1 for result in results if not result["success"])
+        unchanged = sum(1 for result in results if result["success"] and result["unchanged"])
+        elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+
+        logger.info(
+            f"Topología aplicada: {len(results) - failed - unchanged} objetos creados, "
+            f"{unchanged} sin cambios, {failed} con error "
+            f"({len(compiled.ip_lines)} comandos ip, {len(compiled.ovs_args)} ovs, {elapsed_ms} ms)"
+        )
+        return {
+            "success": failed == 0,
+            "applied": len(results) - failed - unchanged,
+            "unchanged": unchanged,
+            "failed": failed,
+            "duration_ms": elapsed_ms,
+            "results": results
+        }
+
+    @staticmethod
+    def _compile(topology: TopologyApplyRequest, table: InterfaceTable) -> _CompiledTopology:
+        """
+        Traducir la topología a líneas de ip -batch y argumentos de ovs-vsctl
+
+        Args:
+            topology: Topología declarada
+            table: Interfaces existentes (las que ya están no se crean)
+        """
+        compiled = _CompiledTopology()
+        bridge_types = TopologyService._bridge_types(topology, table)
+
+        def attach(owner: str, port: str, bridge: Optional[str], vlan: Optional[int] = None):
+            if not bridge:
+                return
+            if bridge_types.get(bridge) == BridgeType.ovs:
+                args = ["--may-exist", "add-port", bridge, port]
+                if vlan:
+                    args.append(f"tag={vlan}")
+                compiled.ovs(owner, args)
+            else:
+                compiled.ip(owner, f"link set {port} master {bridge}")
+
+        # 1. Bridges
+        for bridge in topology.bridges:
+            owner = compiled.add_object("bridge", bridge.name)
+            if table.get(bridge.name):
+                compiled.exists(owner)
+                if bridge.type != BridgeType.ovs:
+                    compiled.ip(owner, f"link set {bridge.name} up")
+                continue
+            if bridge.type == BridgeType.ovs:
+                compiled.ovs(owner, ["--may-exist", "add-br", bridge.name])
+                continue
+            line = f"link add name {bridge.name} type bridge"
+            if bridge.stp:
+                line += " stp_state 1"
+            compiled.ip(owner, line)
+            compiled.ip(owner, f"link set {bridge.name} up")
+
+        # 2. Interfaces TUN/TAP
+        for tap in topology.taps:
+            owner = compiled.add_object("tap", tap.name)
+            error = (
+                TopologyService._check_bridge(tap.bridge, bridge_types) or
+                TopologyService._check_owner(tap.owner, tap.group)
+            )
+            if error:
+                compiled.fail(owner, error)
+                continue
+            if table.get(tap.name):
+                compiled.exists(owner)
+            else:
+                line = f"tuntap add dev {tap.name} mode {tap.type.value}"
+                if tap.owner:
+                    line += f" user {tap.owner}"
+                if tap.group:
+                    line += f" group {tap.group}"
+                compiled.ip(owner, line)
+            compiled.ip(owner, f"link set {tap.name} up")
+            if tap.type == TunTapType.tap:
+                attach(owner, tap.name, tap.bridge, tap.vlan)
+
+        # 3. Pares veth
+        for veth in topology.veths:
+            owner = compiled.add_object("veth", f"{veth.name1}-{veth.name2}")
+            error = (
+                TopologyService._check_bridge(veth.bridge1, bridge_types) or
+                TopologyService._check_bridge(veth.bridge2, bridge_types) or
+                TopologyService._check_namespace(veth.namespace1) or
+                TopologyService._check_namespace(veth.namespace2)
+            )
+            if error:
+                compiled.fail(owner, error)
+                continue
+            ends = (
+                (veth.name1, veth.bridge1, veth.namespace1),
+                (veth.name2, veth.bridge2, veth.namespace2),
+            )
+            # Los extremos movidos a otro namespace no aparecen en la tabla
+            existing = any(table.get(name) for name, _, namespace in ends if not namespace)
+            if existing:
+                compiled.exists(owner)
+            else:
+                compiled.ip(owner, f"link add {veth.name1} type veth peer name {veth.name2}")
+            for name, bridge, namespace in ends:
+                if namespace:
+                    if not existing:
+                        compiled.ip(owner, f"link set {name} netns {namespace}")
+                    continue
+                attach(owner, name, bridge, veth.vlan)
+                compiled.ip(owner, f"link set {name} up")
+
+        # 4. VLANs
+        for vlan in topology.vlans:
+            name = vlan.interface_name
+            owner = compiled.add_object("vlan", name)
+            error = TopologyService._check_bridge(vlan.bridge, bridge_types)
+            if error:
+                compiled.fail(owner, error)
+                continue
+            if table.get(name):
+                compiled.exists(owner)
+            else:
+                compiled.ip(
+                    owner,
+                    f"link add link {vlan.parent_interface} name {name} type vlan "
+                    f"id {vlan.vlan_id} protocol {vlan.protocol.value}"
+                )
+            attach(owner, name, vlan.bridge)
+            compiled.ip(owner, f"link set {name} up")
+
+        # 5. Direcciones (al final: las interfaces ya existen)
+        for address in topology.addresses:
+            owner = compiled.add_object("address", f"{address.address}@{address.interface}")
+            link = table.get(address.interface)
+            if link and any(assigned.cidr == address.address for assigned in table.addresses(link)):
+                compiled.exists(owner)
+                continue
+            compiled.ip(owner, f"addr add {address.address} dev {address.interface}")
+
+        return compiled
+
+    @staticmethod
+    def _check_bridge(bridge: Optional[str], bridge_types: Dict[str, BridgeType]) -> Optional[str]:
+        """Un bridge inexistente aborta todo el batch (no es un fallo de línea)"""
+        if bridge and bridge not in bridge_types:
+            return f"Bridge {bridge} no encontrado"
+        return None
+
+    @staticmethod
+    def _check_namespace(namespace: Optional[str]) -> Optional[str]:
+        """Un namespace inexistente también aborta el batch"""
+        if namespace and not os.path.exists(f"/var/run/netns/{namespace}"):
+            return f"Namespace {namespace} no existe"
+        return None
+
+    @staticmethod
+    def _check_owner(owner: Optional[str], group: Optional[str]) -> Optional[str]:
+        """Validar usuario y grupo antes de compilar la línea tuntap"""
+        if owner:
+            try:
+                pwd.getpwnam(owner)
+            except KeyError:
+                return f"Usuario {owner} no existe"
+        if group:
+            try:
+                grp.getgrnam(group)
+            except KeyError:
+                return f"Grupo {group} no existe"
+        return None
+
+    @staticmethod
+    def _interfaces() -> InterfaceTable:
+        """Interfaces existentes (tabla vacía si no se pueden leer)"""
+        try:
+            return dump_interfaces()
+        except (OSError, NetlinkError) as e:
+            logger.warning(f"No se pudieron leer las interfaces existentes: {e}")
+            return InterfaceTable([], {})
+
+    @staticmethod
+    def _bridge_types(topology: TopologyApplyRequest, table: InterfaceTable) -> Dict[str, BridgeType]:
+        """Tipo de cada bridge referenciado: declarado en la topología o existente"""
+        types = {bridge.name: bridge.type for bridge in topology.bridges}
+        for link in table.links:
+            if link.name in types:
+                continue
+            if link.kind == "openvswitch":
+                types[link.name] = BridgeType.ovs
+            elif link.kind == "bridge":
+                types[link.name] = BridgeType.linux
+        return types
+
+    @staticmethod
+    def _run_ip_batch(compiled: _CompiledTopology) -> None:
+        """Ejecutar el script completo con un único proceso ip"""
+        try:
+            result = subprocess.run(
+                ["ip", "-force", "-batch", "-"],
+                input=compiled.ip_script, capture_output=True, text=True, timeout=120
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            for owner in set(compiled.ip_owners):
+                compiled.fail(owner, f"Error ejecutando ip -batch: {e}")
+            return
+
+        if result.returncode == 0:
+            return
+
+        errors, fatal = TopologyService._parse_batch_errors(result.stderr)
+        for line_number, message in errors:
+            if 1 <= line_number <= len(compiled.ip_lines):
+                compiled.fail(
+                    compiled.ip_owners[line_number - 1],
+                    f"'{compiled.ip_lines[line_number - 1]}': {message}"
+                )
+
+        if fatal:
+            # ip abortó sin indicar la línea: el resto del script no se ejecutó
+            for owner in dict.fromkeys(compiled.ip_owners):
+                if not compiled.objects[owner]["errors"]:
+                    compiled.fail(owner, f"ip -batch abortado, estado desconocido: {fatal}")
+
+    @staticmethod
+    def _parse_batch_errors(stderr: str) -> Tuple[List[Tuple[int, str]], Optional[str]]:
+        """
+        Asociar cada mensaje de error de ip -batch con su número de línea
+
+        Returns:
+            Lista de (línea, mensaje) y el mensaje final si ip abortó sin
+            reportar la línea (errores de argumentos inválidos)
+        """
+        errors = []
+        pending: List[str] = []
+        for line in stderr.splitlines():
+            match = _FAILED_LINE.match(line.strip())
+            if match:
+                errors.append((int(match.group(1)), " ".join(pending) or "error desconocido"))
+                pending = []
+            elif line.strip():
+                pending.append(line.strip())
+        return errors, " ".join(pending) or None
+
+    @staticmethod
+    def _run_ovs_transaction(compiled: _CompiledTopology) -> None:
+        """Ejecutar todos los cambios OVS como una transacción de ovs-vsctl"""
+        try:
+            subprocess.run(compiled.ovs_command, capture_output=True, text=True, check=True, timeout=60)
+        except subprocess.CalledProcessError as e:
+            # La transacción es atómica: fallan todos los objetos OVS
+            for owner in set(compiled.ovs_owners):
+                compiled.fail(owner, f"Error en transacción ovs-vsctl: {e.stderr.strip()}")
+        except (OSError, subprocess.TimeoutExpired) as e:
+            for owner in set(compiled.ovs_owners):
+                compiled.fail(owner, f"Error ejecutando ovs-vsctl: {e}")
+
+    @staticmethod
+    def _results(compiled: _CompiledTopology) -> List[Dict[str, Any]]:
+        """Resultado por objeto en el orden de declaración"""
+        return [
+            {
+                "kind": obj["kind"],
+                "name": obj["name"],
+                "success": not obj["errors"],
+                "unchanged": obj["unchanged"],
+                "error": "; ".join(obj["errors"]) or None
+            }
+            for obj in compiled.objects.values()
+        ]
@@ -4,6 +4,7 @@ import pwd
 import grp
 from typing import Dict, Any, List, Optional
 from models.tuntap import TunTapType, TunTapMode, TunTapInfo
+from services.netlink import InterfaceTable, Link, NetlinkError, TUN_TYPE_TAP, dump_interfaces
 
 
 logger = logging.getLogger(__name__)
@@ -166,28 +167,14 @@ class TunTapService:
         tuntaps = []
         
         try:
-            # Obtener todas las interfaces
-            cmd = ["ip", "link", "show"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            # Las interfaces TUN/TAP tienen tipo netlink "tun"
+            table = dump_interfaces()
             
-            for line in result.stdout.split('\n'):
-                # Buscar líneas que contengan tun o tap
-                if any(keyword in line.lower() for keyword in ['tun', 'tap']):
-                    # Parsear nombre de la interfaz
-                    import re
-                    match = re.search(r'^\d+:\s+([^:@]+)', line)
-                    if match:
-                        interface_name = match.group(1).strip()
-                        
-                        # Determinar tipo basado en el nombre y características
-                        tuntap_type = TunTapService._determine_tuntap_type(interface_name, line)
-                        if tuntap_type:
-                            tuntap_info = TunTapService._get_tuntap_details(interface_name, tuntap_type)
-                            if tuntap_info:
-                                tuntaps.append(tuntap_info)
+            for link in table.of_kind('tun'):
+                tuntaps.append(TunTapService._tuntap_from_link(link, table))
         
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error listando interfaces TUN/TAP: {e.stderr}")
+        except (OSError, NetlinkError) as e:
+            logger.error(f"Error listando interfaces TUN/TAP: {e}")
         
         return tuntaps
 
@@ -195,84 +182,52 @@ class TunTapService:
     def get_tuntap_info(name: str) -> Optional[TunTapInfo]:
         """Obtener información de una interfaz TUN/TAP específica"""
         try:
-            cmd = ["ip", "link", "show", name]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            table = dump_interfaces()
+            link = table.get(name)
             
-            # Determinar tipo
-            tuntap_type = TunTapService._determine_tuntap_type(name, result.stdout)
-            if not tuntap_type:
+            if not link or link.kind != 'tun':
                 return None
             
-            return TunTapService._get_tuntap_details(name, tuntap_type)
+            return TunTapService._tuntap_from_link(link, table)
             
-        except subprocess.CalledProcessError:
+        except (OSError, NetlinkError):
             return None
 
     @staticmethod
-    def _determine_tuntap_type(interface_name: str, interface_info: str) -> Optional[TunTapType]:
-        """Determinar si una interfaz es TUN o TAP"""
-        # Verificar por nombre
-        if interface_name.startswith('tun'):
-            return TunTapType.tun
-        elif interface_name.startswith('tap'):
-            return TunTapType.tap
-        
-        # Verificar por información de la interfaz
-        # Las interfaces TUN no tienen dirección MAC, las TAP sí
-        if 'link/none' in interface_info:
-            return TunTapType.tun
-        elif any(keyword in interface_info.lower() for keyword in ['ether', 'link/ether']):
-            # Podría ser TAP si tiene MAC pero no es una interfaz física estándar
-            if any(keyword in interface_name.lower() for keyword in ['tap', 'vnet']):
-                return TunTapType.tap
+    def _tuntap_from_link(link: Link, table: InterfaceTable) -> TunTapInfo:
+        """Construir TunTapInfo a partir de un enlace netlink"""
+        tuntap_type = TunTapType.tap if link.tun_type == TUN_TYPE_TAP else TunTapType.tun
         
-        return None
+        return TunTapInfo(
+            name=link.name,
+            type=tuntap_type,
+            owner=TunTapService._user_name(link.tun_owner),
+            group=TunTapService._group_name(link.tun_group),
+            bridge=table.master_name(link),
+            persistent=bool(link.tun_persist),
+            status="up" if link.up else "down",
+            mtu=link.mtu
+        )
 
     @staticmethod
-    def _get_tuntap_details(name: str, tuntap_type: TunTapType) -> Optional[TunTapInfo]:
-        """Obtener detalles completos de una interfaz TUN/TAP"""
-        try:
-            cmd = ["ip", "link", "show", name]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            # Determinar estado
-            status = "up" if "UP" in result.stdout else "down"
-            
-            # Extraer MTU
-            import re
-            mtu_match = re.search(r'mtu\s+(\d+)', result.stdout)
-            mtu = int(mtu_match.group(1)) if mtu_match else None
-            
-            # Buscar bridge master
-            bridge = None
-            bridge_match = re.search(r'master\s+(\S+)', result.stdout)
-            if bridge_match:
-                bridge = bridge_match.group(1)
-            
-            # Obtener owner/group (esto es más complejo y puede requerir acceso a /proc)
-            owner, group = TunTapService._get_tuntap_ownership(name)
-            
-            return TunTapInfo(
-                name=name,
-                type=tuntap_type,
-                owner=owner,
-                group=group,
-                bridge=bridge,
-                persistent=False,  # Difícil de determinar sin acceso a configuración
-                status=status,
-                mtu=mtu
-            )
-            
-        except subprocess.CalledProcessError:
+    def _user_name(uid: Optional[int]) -> Optional[str]:
+        """Nombre del usuario propietario (o el uid si no existe)"""
+        if uid is None:
             return None
+        try:
+            return pwd.getpwuid(uid).pw_name
+        except KeyError:
+            return str(uid)
 
     @staticmethod
-    def _get_tuntap_ownership(interface_name: str) -> tuple[Optional[str], Optional[str]]:
-        """Obtener owner/group de una interfaz TUN/TAP"""
-        # Esta función es compleja de implementar sin acceso privilegiado
-        # Por simplicidad, retornamos None
-        # En una implementación real, se podría revisar /proc/net/tun o usar otras técnicas
-        return None, None
+    def _group_name(gid: Optional[int]) -> Optional[str]:
+        """Nombre del grupo propietario (o el gid si no existe)"""
+        if gid is None:
+            return None
+        try:
+            return grp.getgrgid(gid).gr_name
+        except KeyError:
+            return str(gid)
 
     @staticmethod
     def set_interface_ip(interface_name: str, ip_address: str, netmask: str = "24") -> Dict[str, Any]:
@@ -3,6 +3,7 @@ import logging
 import re
 from typing import Dict, Any, Optional, List
 from models.veth import VethInfo
+from services.netlink import InterfaceTable, Link, NetlinkError, dump_interfaces
 
 
 logger = logging.getLogger(__name__)
@@ -151,29 +152,22 @@ class VethService:
         seen_pairs = set()
         
         try:
-            # Obtener todas las interfaces veth
-            cmd = ["ip", "link", "show", "type", "veth"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            # Un único volcado netlink: el peer de cada veth es su IFLA_LINK
+            table = dump_interfaces()
+            netns = VethService._netns_names() if any(
+                link.link_netnsid is not None for link in table.of_kind('veth')) else {}
             
-            for line in result.stdout.split('\n'):
-                if 'veth' in line and '@' in line:
-                    # Parsear línea como: "4: veth1@veth2: <BROADCAST,MULTICAST,UP,LOWER_UP>"
-                    match = re.search(r'^\d+:\s+([^@]+)@([^:]+):', line)
-                    if match:
-                        veth1 = match.group(1)
-                        veth2 = match.group(2)
-                        
-                        # Evitar duplicados (cada par aparece dos veces)
-                        pair_key = tuple(sorted([veth1, veth2]))
-                        if pair_key not in seen_pairs:
-                            seen_pairs.add(pair_key)
-                            
-                            veth_info = VethService._build_veth_info(veth1, veth2)
-                            if veth_info:
-                                veth_pairs.append(veth_info)
+            for link in table.of_kind('veth'):
+                peer_name = table.peer_name(link) or ""
+                
+                # Evitar duplicados (cada par aparece dos veces)
+                pair_key = tuple(sorted([link.name, peer_name]))
+                if pair_key not in seen_pairs:
+                    seen_pairs.add(pair_key)
+                    veth_pairs.append(VethService._build_veth_info(link, table, netns))
         
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Error listando pares veth: {e.stderr}")
+        except (OSError, NetlinkError) as e:
+            logger.error(f"Error listando pares veth: {e}")
         
         return veth_pairs
 
@@ -181,69 +175,65 @@ class VethService:
     def get_veth_info(veth_name: str) -> Optional[VethInfo]:
         """Obtener información de un veth específico"""
         try:
-            # Obtener información del veth
-            cmd = ["ip", "link", "show", veth_name]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            table = dump_interfaces()
+            link = table.get(veth_name)
             
-            # Buscar el peer
-            peer_match = re.search(rf'{veth_name}@([^:]+):', result.stdout)
-            if not peer_match:
+            if not link or link.kind != 'veth' or link.link_index is None:
                 return None
             
-            peer_name = peer_match.group(1)
-            return VethService._build_veth_info(veth_name, peer_name)
+            netns = VethService._netns_names() if link.link_netnsid is not None else {}
+            return VethService._build_veth_info(link, table, netns)
             
-        except subprocess.CalledProcessError:
+        except (OSError, NetlinkError):
             return None
 
     @staticmethod
-    def _build_veth_info(veth1: str, veth2: str) -> Optional[VethInfo]:
-        """Construir objeto VethInfo a partir de los nombres"""
-        try:
-            # Obtener información de cada extremo
-            info1 = VethService._get_veth_details(veth1)
-            info2 = VethService._get_veth_details(veth2)
-            
-            return VethInfo(
-                name1=veth1,
-                name2=veth2,
-                peer1=veth2,
-                peer2=veth1,
-                bridge1=info1.get("bridge"),
-                bridge2=info2.get("bridge"),
-                namespace1=info1.get("namespace"),
-                namespace2=info2.get("namespace"),
-                status1=info1.get("status", "unknown"),
-                status2=info2.get("status", "unknown")
-            )
-            
-        except Exception as e:
-            logger.error(f"Error construyendo info veth {veth1}-{veth2}: {e}")
-            return None
+    def _build_veth_info(link: Link, table: InterfaceTable,
+                         netns: Optional[Dict[int, str]] = None) -> VethInfo:
+        """Construir objeto VethInfo a partir de un extremo y su peer"""
+        peer_name = table.peer_name(link) or ""
+        
+        # El peer solo es visible si está en el mismo namespace
+        peer = table.by_index(link.link_index) if link.link_netnsid is None else None
+        
+        # Si no, IFLA_LINK_NETNSID identifica su namespace (nsid local al root)
+        peer_namespace = None
+        if link.link_netnsid is not None:
+            peer_namespace = (netns or {}).get(link.link_netnsid)
+            if peer_namespace is None and peer_name:
+                # nsid sin nombre asignado: recorrer los namespaces con nombre
+                peer_namespace = VethService._find_veth_namespace(peer_name)
+        
+        return VethInfo(
+            name1=link.name,
+            name2=peer_name,
+            peer1=peer_name,
+            peer2=link.name,
+            bridge1=table.master_name(link),
+            bridge2=table.master_name(peer) if peer else None,
+            namespace1=None,
+            namespace2=peer_namespace,
+            status1="up" if link.up else "down",
+            status2=("up" if peer.up else "down") if peer else "unknown"
+        )
 
     @staticmethod
-    def _get_veth_details(veth_name: str) -> Dict[str, Any]:
-        """Obtener detalles de un extremo veth"""
-        details = {"status": "down", "bridge": None, "namespace": None}
-        
+    def _netns_names() -> Dict[int, str]:
+        """Mapa nsid -> nombre de los namespaces con nombre (ip netns list-id)"""
+        names = {}
         try:
-            # Intentar obtener info en el namespace por defecto
-            cmd = ["ip", "link", "show", veth_name]
+            cmd = ["ip", "netns", "list-id"]
             result = subprocess.run(cmd, capture_output=True, text=True, check=True)
             
-            # Determinar estado
-            details["status"] = "up" if "UP" in result.stdout else "down"
-            
-            # Buscar bridge master
-            bridge_match = re.search(r'master\s+(\S+)', result.stdout)
-            if bridge_match:
-                details["bridge"] = bridge_match.group(1)
-            
-        except subprocess.CalledProcessError:
-            # Puede estar en un namespace
-            details["namespace"] = VethService._find_veth_namespace(veth_name)
+            # Formato: "nsid 0 (iproute2 netns name: ns1)"
+            for match in re.finditer(r'nsid\s+(\d+)\s+\(iproute2 netns name:\s*([^)\s]+)\)',
+                                     result.stdout):
+                names[int(match.group(1))] = match.group(2)
+                
+        except (subprocess.CalledProcessError, OSError):
+            pass
         
-        return details
+        return names
 
     @staticmethod
     def _find_veth_namespace(veth_name: str) -> Optional[str]:
@@ -264,7 +254,7 @@ class VethService:
                     if veth_result.returncode == 0:
                         return namespace
             
-        except subprocess.CalledProcessError:
+        except (subprocess.CalledProcessError, OSError):
             pass
         
         return None
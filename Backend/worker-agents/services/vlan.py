@@ -1,8 +1,8 @@
 import subprocess
 import logging
-import re
 from typing import Dict, Any, List, Optional
 from models.vlan import VLANProtocol, VLANInfo, BridgeVLANInfo
+from services.netlink import ETH_P_8021AD, InterfaceTable, Link, NetlinkError, dump_interfaces
 
 
 logger = logging.getLogger(__name__)
@@ -178,28 +178,14 @@ class VLANService:
         vlans = []
         
         try:
-            # Buscar interfaces VLAN usando ip link
-            cmd = ["ip", "link", "show", "type", "vlan"]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+            # El padre y el VLAN ID vienen en el propio volcado netlink
+            table = dump_interfaces()
             
-            for line in result.stdout.split('\n'):
-                if 'vlan' in line and '@' in line:
-                    # Parsear línea como: "5: eth0.100@eth0: <BROADCAST,MULTICAST,UP,LOWER_UP>"
-                    match = re.search(r'^\d+:\s+([^@]+)@([^:]+):', line)
-                    if match:
-                        vlan_interface = match.group(1)
-                        parent_interface = match.group(2)
-                        
-                        # Extraer VLAN ID del nombre
-                        vlan_id_match = re.search(r'\.(\d+)$', vlan_interface)
-                        if vlan_id_match:
-                            vlan_id = int(vlan_id_match.group(1))
-                            
-                            vlan_info = VLANService._get_vlan_details(vlan_interface, parent_interface, vlan_id)
-                            if vlan_info:
-                                vlans.append(vlan_info)
+            for link in table.of_kind('vlan'):
+                if link.vlan_id is not None:
+                    vlans.append(VLANService._vlan_from_link(link, table))
         
-        except subprocess.CalledProcessError:
+        except (OSError, NetlinkError):
             pass
         
         return vlans
@@ -236,63 +222,51 @@ class VLANService:
     @staticmethod
     def get_vlan_info(parent_interface: str, vlan_id: int) -> Optional[VLANInfo]:
         """Obtener información de una VLAN específica"""
-        vlan_interface = VLANService._find_vlan_interface(parent_interface, vlan_id)
+        try:
+            table = dump_interfaces()
+            link = VLANService._find_vlan_link(table, parent_interface, vlan_id)
+            
+            if link:
+                return VLANService._vlan_from_link(link, table)
         
-        if vlan_interface:
-            return VLANService._get_vlan_details(vlan_interface, parent_interface, vlan_id)
+        except (OSError, NetlinkError):
+            pass
         
         return None
 
     @staticmethod
     def _find_vlan_interface(parent_interface: str, vlan_id: int) -> Optional[str]:
         """Encontrar el nombre de la interfaz VLAN"""
-        possible_names = [
-            f"{parent_interface}.{vlan_id}",
-            f"vlan{vlan_id}",
-            f"{parent_interface}_{vlan_id}"
-        ]
-        
-        for name in possible_names:
-            try:
-                cmd = ["ip", "link", "show", name]
-                result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-                if parent_interface in result.stdout and "vlan" in result.stdout:
-                    return name
-            except subprocess.CalledProcessError:
-                continue
-        
+        try:
+            link = VLANService._find_vlan_link(dump_interfaces(), parent_interface, vlan_id)
+            return link.name if link else None
+        except (OSError, NetlinkError):
+            return None
+
+    @staticmethod
+    def _find_vlan_link(table: InterfaceTable, parent_interface: str, vlan_id: int) -> Optional[Link]:
+        """Buscar la interfaz VLAN con ese padre e ID, sea cual sea su nombre"""
+        for link in table.of_kind('vlan'):
+            if link.vlan_id == vlan_id and table.peer_name(link) == parent_interface:
+                return link
         return None
 
     @staticmethod
-    def _get_vlan_details(vlan_interface: str, parent_interface: str, vlan_id: int) -> Optional[VLANInfo]:
-        """Obtener detalles de una interfaz VLAN"""
-        try:
-            cmd = ["ip", "link", "show", vlan_interface]
-            result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-            
-            # Determinar estado
-            status = "up" if "UP" in result.stdout else "down"
-            
-            # Extraer MTU
-            mtu_match = re.search(r'mtu\s+(\d+)', result.stdout)
-            mtu = int(mtu_match.group(1)) if mtu_match else None
-            
-            # Determinar protocolo (por defecto 802.1Q)
-            protocol = VLANProtocol.ieee8021q
-            if "802.1ad" in result.stdout:
-                protocol = VLANProtocol.ieee8021ad
-            
-            return VLANInfo(
-                parent_interface=parent_interface,
-                vlan_id=vlan_id,
-                interface_name=vlan_interface,
-                protocol=protocol,
-                status=status,
-                mtu=mtu
-            )
-            
-        except subprocess.CalledProcessError:
-            return None
+    def _vlan_from_link(link: Link, table: InterfaceTable) -> VLANInfo:
+        """Construir VLANInfo a partir de un enlace netlink"""
+        # Determinar protocolo (por defecto 802.1Q)
+        protocol = VLANProtocol.ieee8021q
+        if link.vlan_protocol == ETH_P_8021AD:
+            protocol = VLANProtocol.ieee8021ad
+        
+        return VLANInfo(
+            parent_interface=table.peer_name(link) or "",
+            vlan_id=link.vlan_id,
+            interface_name=link.name,
+            protocol=protocol,
+            status="up" if link.up else "down",
+            mtu=link.mtu
+        )
 
     @staticmethod
     def _get_port_vlans(bridge_name: str, port_name: str) -> List[BridgeVLANInfo]:
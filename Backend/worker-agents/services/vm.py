@@ -5,20 +5,35 @@ TeleCluster Orchestrator - Worker Agent
 """
 
 import libvirt
-import xml.etree.ElementTree as ET
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 import logging
 import time
-import subprocess
 import os
 import re
-from pathlib import Path
+
+import psutil
 
 from models.vm import (
     VMConfig, VMInfo, VMState, VMStats, VMSnapshot, VMSnapshotCreate,
     VMMigrationConfig, VMAction, HypervisorInfo, VMListFilter,
-    DiskConfig, NetworkConfig
+    BaseImage, MigrationJob, BackupJob, BackupEntry,
+    VMBackupRequest, NodeUsage, HugepagePoolStatus, DiskIOTune
 )
+from services.host_capacity import HostCapacityModel
+from services.libvirt_pool import LibvirtConnectionManager
+from services.vm_backup import BackupManager
+from services.vm_inventory import DomainInventory
+from services.vm_snapshots import SnapshotIndex, snapshot_from_xml
+from services.vm_stats import DomainStatsSampler
+from services.vm_history import MetricHistoryStore
+from services.vm_disks import BaseImageRegistry, DiskProvisioner, apply_io_profiles
+from services.vm_migration import MigrationManager
+from services.vm_placement import Placement, PlacementEngine
+from services.vm_xml import DomainDeviceCache, is_virtio_tap, render_domain_xml, template_cache_info
+
+
+# Dispositivo del backend vhost-net (módulo vhost_net del kernel)
+VHOST_NET_DEVICE = "/dev/vhost-net"
 
 
 class VMService:
@@ -32,19 +47,64 @@ class VMService:
             connection_uri: URI de conexión a libvirt
         """
         self.connection_uri = connection_uri
-        self.conn = None
         self.logger = logging.getLogger(__name__)
         
+        # Una conexión por hilo de trabajo más la principal de eventos
+        self.connections = LibvirtConnectionManager(connection_uri)
+        
+        # Dispositivos parseados del XML de cada dominio (invalidados por eventos)
+        self.device_cache = DomainDeviceCache()
+        
+        # Metadatos de snapshots por VM (evita un getXMLDesc por snapshot al listar)
+        self.snapshot_index = SnapshotIndex()
+        
+        # Capacidad del host (NUMA, topología, hugepages) leída una vez
+        self.capacity = HostCapacityModel(self)
+        
+        # Inventario en memoria mantenido por eventos libvirt
+        self.inventory = DomainInventory(self)
+        
+        # Muestreo periódico de estadísticas de dominios activos
+        self.stats_sampler = DomainStatsSampler(self)
+        
+        # Historial de métricas alimentado por el sampler
+        self.metric_history = MetricHistoryStore()
+        self.stats_sampler.add_listener(self.metric_history.record)
+        
+        # Creación de discos en paralelo y registro de imágenes base
+        self.disk_provisioner = DiskProvisioner(BaseImageRegistry())
+        
+        # Migraciones en segundo plano con seguimiento de progreso
+        self.migrations = MigrationManager(self)
+        
+        # Backups completos e incrementales (checkpoints de libvirt)
+        self.backups = BackupManager(self)
+        
+        # Fijado de vCPUs y memoria a nodos NUMA según la política de la VM
+        self.placement = PlacementEngine(self)
+        
+    def start(self) -> None:
+        """Arrancar las tareas en segundo plano y leer la capacidad del host"""
+        self.inventory.start()
+        self.stats_sampler.start()
+        self.capacity.refresh()
+    
+    def stop(self) -> None:
+        """Detener las tareas en segundo plano y cerrar la conexión"""
+        self.stats_sampler.stop()
+        self.inventory.stop()
+        self.disk_provisioner.shutdown()
+        self.migrations.shutdown()
+        self.backups.shutdown()
+        self.close_connection()
+        
     def _get_connection(self) -> libvirt.virConnect:
-        """Obtener conexión a libvirt (lazy loading)"""
-        if self.conn is None or not self.conn.isAlive():
-            try:
-                self.conn = libvirt.open(self.connection_uri)
-                self.logger.info(f"Conectado a libvirt: {self.connection_uri}")
-            except libvirt.libvirtError as e:
-                self.logger.error(f"Error conectando a libvirt: {e}")
-                raise RuntimeError(f"No se pudo conectar a libvirt: {e}")
-        return self.conn
+        """Obtener la conexión a libvirt del hilo actual (ver LibvirtConnectionPool)"""
+        pool = self.connections.local
+        if self.inventory.running:
+            # Registrar eventos en la conexión principal (no-op si ya lo están)
+            self.inventory.attach(pool.primary())
+        return pool.get()
     
     def _vm_state_to_enum(self, state_int: int) -> VMState:
         """Convertir estado entero de libvirt a enum"""
@@ -61,103 +121,204 @@ class VMService:
         return state_map.get(state_int, VMState.NOSTATE)
     
     def get_hypervisor_info(self) -> HypervisorInfo:
-        """Obtener información del hipervisor"""
+        """
+        Obtener información del hipervisor
+        
+        Con el modelo de capacidad y el inventario cargados no se consulta
+        libvirt: la memoria libre se lee del kernel (/proc/meminfo).
+        """
         try:
-            conn = self._get_connection()
-            
-            # Información básica
-            hv_type = conn.getType()
-            version = conn.getVersion()
-            hostname = conn.getHostname()
+            capacity = self.capacity.get()
             
-            # Información de CPU
-            host_info = conn.getInfo()
-            cpu_model = host_info[0]
-            memory_mb = host_info[1]
-            cpu_count = host_info[2]
-            
-            # Arquitectura
-            capabilities = conn.getCapabilities()
-            cap_xml = ET.fromstring(capabilities)
-            arch = cap_xml.find(".//arch").text if cap_xml.find(".//arch") is not None else "unknown"
-            
-            # Contar VMs
-            active_vms = len(conn.listDomainsID())
-            inactive_vms = len(conn.listDefinedDomains())
+            # Conteo de VMs y recursos comprometidos desde el inventario
+            if self.inventory.ready:
+                counts = self.inventory.counts()
+            else:
+                conn = self._get_connection()
+                counts = {"active": conn.numOfDomains(), "inactive": conn.numOfDefinedDomains()}
             
             # Memoria libre
-            free_memory = conn.getFreeMemory() // (1024 * 1024)  # Convertir a MB
-            used_memory = memory_mb - free_memory
+            free_memory = psutil.virtual_memory().available // (1024 * 1024)  # Convertir a MB
+            used_memory = max(capacity.memory_mb - free_memory, 0)
             
             return HypervisorInfo(
-                type=hv_type,
-                version=str(version),
-                hostname=hostname,
-                max_vcpus=conn.getMaxVcpus(None),
-                total_memory_mb=memory_mb,
+                type=capacity.type,
+                version=capacity.version,
+                hostname=capacity.hostname,
+                max_vcpus=capacity.max_vcpus,
+                total_memory_mb=capacity.memory_mb,
                 used_memory_mb=used_memory,
                 free_memory_mb=free_memory,
-                active_vms=active_vms,
-                inactive_vms=inactive_vms,
-                cpu_count=cpu_count,
-                cpu_model=cpu_model,
-                architecture=arch
+                active_vms=counts["active"],
+                inactive_vms=counts["inactive"],
+                cpu_count=capacity.cpu_count,
+                cpu_model=capacity.cpu_model,
+                architecture=capacity.architecture,
+                topology=capacity.topology,
+                numa_cells=capacity.numa_cells,
+                committed_vcpus=counts.get("vcpus", 0),
+                committed_memory_mb=counts.get("memory_mb", 0),
+                active_vcpus=counts.get("active_vcpus", 0),
+                active_memory_mb=counts.get("active_memory_mb", 0)
             )
             
         except Exception as e:
             self.logger.error(f"Error obteniendo info del hipervisor: {e}")
             raise RuntimeError(f"Error obteniendo información del hipervisor: {e}")
     
+    def refresh_host_capacity(self) -> HypervisorInfo:
+        """Volver a leer las capacidades del host (p.ej. tras reservar hugepages)"""
+        self.capacity.refresh()
+        return self.get_hypervisor_info()
+    
+    # Estadísticas pedidas a getAllDomainStats para construir VMInfo sin domain.info()
+    LIST_STATS = (
+        libvirt.VIR_DOMAIN_STATS_STATE |
+        libvirt.VIR_DOMAIN_STATS_BALLOON |
+        libvirt.VIR_DOMAIN_STATS_VCPU |
+        libvirt.VIR_DOMAIN_STATS_CPU_TOTAL
+    )
+    
     def list_vms(self, filters: Optional[VMListFilter] = None) -> List[VMInfo]:
         """Listar todas las VMs con filtros opcionales"""
+        vms, _ = self.list_vms_with_total(filters)
+        return vms
+    
+    def list_vms_with_total(self, filters: Optional[VMListFilter] = None) -> Tuple[List[VMInfo], int]:
+        """
+        Listar VMs y obtener el total sin filtrar en una sola pasada
+        
+        Los dominios se enumeran con listAllDomains/getAllDomainStats y los
+        filtros y la paginación se aplican antes de leer el XML, de modo que
+        solo se parsea el XML de las VMs que se devuelven.
+        
+        Returns:
+            Tupla (VMs de la página solicitada, total de VMs del host)
+        """
         try:
-            conn = self._get_connection()
-            all_vms = []
-            
-            # Obtener VMs activas
-            for domain_id in conn.listDomainsID():
-                domain = conn.lookupByID(domain_id)
-                vm_info = self._get_vm_info(domain)
-                all_vms.append(vm_info)
+            # Servir desde el inventario en memoria si está cargado
+            if self.inventory.ready:
+                return self._filter_inventory(self.inventory.list(), filters)
             
-            # Obtener VMs inactivas
-            for domain_name in conn.listDefinedDomains():
-                domain = conn.lookupByName(domain_name)
-                vm_info = self._get_vm_info(domain)
-                all_vms.append(vm_info)
+            conn = self._get_connection()
+            records = self._list_domain_records(conn)
+            total_count = len(records)
             
-            # Aplicar filtros
+            # Aplicar filtros sobre los datos de la enumeración masiva
             if filters:
-                filtered_vms = []
-                for vm in all_vms:
+                name_regex = re.compile(filters.name_pattern) if filters.name_pattern else None
+                selected = []
+                for record in records:
                     # Filtrar por estado
-                    if filters.state and vm.state != filters.state:
+                    if filters.state and self._vm_state_to_enum(record["info"][0]) != filters.state:
                         continue
                     
                     # Filtrar por patrón de nombre
-                    if filters.name_pattern and not re.search(filters.name_pattern, vm.name):
+                    if name_regex and not name_regex.search(record["name"]):
                         continue
                     
-                    filtered_vms.append(vm)
+                    selected.append(record)
                 
                 # Aplicar paginación
                 start_idx = filters.offset
                 end_idx = start_idx + filters.limit
-                all_vms = filtered_vms[start_idx:end_idx]
+                records = selected[start_idx:end_idx]
             
-            return all_vms
+            vms = [
+                self._build_vm_info(
+                    record["domain"], record["info"],
+                    record["autostart"], record["persistent"]
+                )
+                for record in records
+            ]
+            return vms, total_count
             
         except Exception as e:
             self.logger.error(f"Error listando VMs: {e}")
             raise RuntimeError(f"Error listando VMs: {e}")
     
+    def _filter_inventory(self, vms: List[VMInfo],
+                          filters: Optional[VMListFilter]) -> Tuple[List[VMInfo], int]:
+        """Aplicar filtros y paginación a las VMs del inventario"""
+        total_count = len(vms)
+        if not filters:
+            return vms, total_count
+        
+        name_regex = re.compile(filters.name_pattern) if filters.name_pattern else None
+        filtered_vms = [
+            vm for vm in vms
+            if (not filters.state or vm.state == filters.state) and
+               (not name_regex or name_regex.search(vm.name))
+        ]
+        
+        start_idx = filters.offset
+        end_idx = start_idx + filters.limit
+        return filtered_vms[start_idx:end_idx], total_count
+    
+    def _list_domain_records(self, conn: libvirt.virConnect) -> List[Dict[str, Any]]:
+        """
+        Enumerar todos los dominios con sus datos básicos en llamadas masivas
+        
+        Usa getAllDomainStats (estado, memoria, vCPUs y tiempo de CPU de todos
+        los dominios en una sola llamada) y dos listAllDomains con flags para
+        autostart y dominios transitorios, en lugar de info(), autostart() e
+        isPersistent() por dominio.
+        """
+        try:
+            domain_stats = conn.getAllDomainStats(self.LIST_STATS, 0)
+        except libvirt.libvirtError as e:
+            # Drivers sin soporte de estadísticas masivas: usar domain.info()
+            self.logger.debug(f"getAllDomainStats no disponible, usando info(): {e}")
+            domain_stats = [(domain, None) for domain in conn.listAllDomains(0)]
+        
+        autostart_uuids = {
+            domain.UUIDString()
+            for domain in conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_AUTOSTART)
+        }
+        transient_uuids = {
+            domain.UUIDString()
+            for domain in conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_TRANSIENT)
+        }
+        
+        records = []
+        for domain, stats in domain_stats:
+            uuid = domain.UUIDString()
+            records.append({
+                "domain": domain,
+                "name": domain.name(),
+                "info": self._info_from_stats(domain, stats),
+                "autostart": uuid in autostart_uuids,
+                "persistent": uuid not in transient_uuids
+            })
+        
+        # Orden estable para que la paginación sea consistente entre llamadas
+        records.sort(key=lambda record: record["name"])
+        return records
+    
+    def _info_from_stats(self, domain: libvirt.virDomain, stats: Optional[Dict[str, Any]]) -> List[int]:
+        """Construir el equivalente de domain.info() a partir de getAllDomainStats"""
+        required = ("state.state", "balloon.maximum", "vcpu.current")
+        if not stats or any(key not in stats for key in required):
+            return domain.info()
+        
+        return [
+            stats["state.state"],
+            stats["balloon.maximum"],
+            stats.get("balloon.current", stats["balloon.maximum"]),
+            stats["vcpu.current"],
+            stats.get("cpu.time", 0)
+        ]
+    
     def _get_vm_info(self, domain: libvirt.virDomain) -> VMInfo:
         """Obtener información detallada de una VM"""
+        return self._build_vm_info(
+            domain, domain.info(), bool(domain.autostart()), bool(domain.isPersistent())
+        )
+    
+    def _build_vm_info(self, domain: libvirt.virDomain, info: List[int],
+                       autostart: bool, persistent: bool) -> VMInfo:
+        """Construir VMInfo a partir de los datos básicos y el XML del dominio"""
         try:
-            info = domain.info()
-            xml_desc = domain.XMLDesc()
-            xml_root = ET.fromstring(xml_desc)
-            
             # Información básica
             vm_info = VMInfo(
                 name=domain.name(),
@@ -167,51 +328,15 @@ class VMService:
                 memory_used_mb=info[2] // 1024,
                 vcpus=info[3],
                 cpu_time=info[4],
-                autostart=bool(domain.autostart()),
-                persistent=domain.isPersistent()
+                autostart=autostart,
+                persistent=persistent
             )
             
-            # Buscar puerto VNC
-            graphics = xml_root.find(".//graphics[@type='vnc']")
-            if graphics is not None:
-                vm_info.vnc_port = int(graphics.get('port', 0))
-            
-            # Información de redes
-            interfaces = xml_root.findall(".//interface")
-            networks = []
-            for iface in interfaces:
-                net_info = {
-                    "type": iface.get("type"),
-                    "mac": iface.find("mac").get("address") if iface.find("mac") is not None else None,
-                    "source": None
-                }
-                
-                # Obtener fuente según tipo
-                source = iface.find("source")
-                if source is not None:
-                    if net_info["type"] == "bridge":
-                        net_info["source"] = source.get("bridge")
-                    elif net_info["type"] == "network":
-                        net_info["source"] = source.get("network")
-                
-                networks.append(net_info)
-            vm_info.networks = networks
-            
-            # Información de discos
-            disks = []
-            disk_elements = xml_root.findall(".//disk[@type='file']")
-            for disk in disk_elements:
-                source = disk.find("source")
-                target = disk.find("target")
-                if source is not None and target is not None:
-                    disk_info = {
-                        "path": source.get("file"),
-                        "device": target.get("dev"),
-                        "bus": target.get("bus"),
-                        "type": disk.get("device", "disk")
-                    }
-                    disks.append(disk_info)
-            vm_info.disks = disks
+            # Discos, redes y puerto VNC (sin leer el XML si no ha cambiado)
+            devices = self.device_cache.devices(domain)
+            vm_info.vnc_port = devices.vnc_port
+            vm_info.networks = devices.networks
+            vm_info.disks = devices.disks
             
             # Calcular uptime si está corriendo
             if vm_info.state == VMState.RUNNING:
@@ -225,6 +350,12 @@ class VMService:
     
     def get_vm_info(self, vm_name: str) -> VMInfo:
         """Obtener información de una VM específica"""
+        # Consultar primero el inventario en memoria
+        if self.inventory.ready:
+            vm_info = self.inventory.get(vm_name)
+            if vm_info is not None:
+                return vm_info
+        
         try:
             conn = self._get_connection()
             domain = conn.lookupByName(vm_name)
@@ -244,19 +375,41 @@ class VMService:
             except libvirt.libvirtError:
                 pass  # VM no existe, podemos continuar
             
-            # Generar XML de la VM
-            vm_xml = self._generate_vm_xml(config)
+            # Comprobar que el host soporta las opciones de red pedidas
+            self._check_network_support(config)
             
-            # Crear discos si es necesario
-            self._create_vm_disks(config.disks)
+            # Resolver los perfiles de E/S de disco (io_uring solo si el host lo soporta)
+            config = apply_io_profiles(config, self.capacity.get().io_uring)
             
-            # Definir VM
-            domain = conn.defineXML(vm_xml)
+            # Reservar CPUs y memoria NUMA (None si la VM no pide colocación)
+            placement = self.placement.place(config)
+            
+            try:
+                # Generar XML de la VM
+                vm_xml = self._generate_vm_xml(config, placement)
+                
+                # Crear discos si es necesario (todos en paralelo)
+                created_disks = self.disk_provisioner.provision(config.disks)
+                
+                # Definir VM
+                try:
+                    domain = conn.defineXML(vm_xml)
+                except libvirt.libvirtError:
+                    # No dejar discos huérfanos de una VM que no llegó a definirse
+                    self.disk_provisioner.discard(created_disks)
+                    raise
+            except Exception:
+                self.placement.release(config.name)
+                raise
             
             # Configurar autostart
             if config.autostart:
                 domain.setAutostart(True)
             
+            self.placement.bind(config.name, domain.UUIDString())
+            self.device_cache.invalidate(domain.UUIDString())
+            self.inventory.invalidate(domain.UUIDString())
+            
             self.logger.info(f"VM '{config.name}' creada exitosamente")
             return domain.UUIDString()
             
@@ -264,101 +417,30 @@ class VMService:
             self.logger.error(f"Error creando VM '{config.name}': {e}")
             raise RuntimeError(f"Error creando VM: {e}")
     
-    def _generate_vm_xml(self, config: VMConfig) -> str:
-        """Generar XML de configuración de VM"""
-        # XML base
-        xml = f"""<domain type='kvm'>
-  <name>{config.name}</name>
-  <memory unit='MiB'>{config.memory_mb}</memory>
-  <vcpu placement='static'>{config.vcpus}</vcpu>
-  <os>
-    <type arch='{config.arch}' machine='pc'>hvm</type>"""
-        
-        # Orden de boot
-        for boot_dev in config.boot_order:
-            xml += f"\n    <boot dev='{boot_dev}'/>"
-        
-        xml += """
-  </os>
-  <features>
-    <acpi/>
-    <apic/>
-  </features>
-  <cpu mode='host-model'/>
-  <clock offset='utc'/>
-  <on_poweroff>destroy</on_poweroff>
-  <on_reboot>restart</on_reboot>
-  <on_crash>destroy</on_crash>
-  <devices>
-    <emulator>/usr/bin/qemu-system-x86_64</emulator>"""
-        
-        # Agregar discos
-        for i, disk in enumerate(config.disks):
-            target_dev = f"vd{'abcdefghijklmnopqrstuvwxyz'[i]}"
-            xml += f"""
-    <disk type='file' device='disk'>
-      <driver name='qemu' type='{disk.format.value}'/>
-      <source file='{disk.path}'/>
-      <target dev='{target_dev}' bus='{disk.bus}'/>
-    </disk>"""
-        
-        # Agregar interfaces de red
-        for net in config.networks:
-            xml += f"""
-    <interface type='{net.network_type.value}'>"""
-            
-            if net.mac_address:
-                xml += f"\n      <mac address='{net.mac_address}'/>"
-            
-            if net.source:
-                if net.network_type.value == "bridge":
-                    xml += f"\n      <source bridge='{net.source}'/>"
-                elif net.network_type.value == "network":
-                    xml += f"\n      <source network='{net.source}'/>"
-            
-            xml += f"""
-      <model type='{net.model}'/>
-    </interface>"""
-        
-        # Agregar VNC si se especifica puerto
-        if config.vnc_port:
-            xml += f"""
-    <graphics type='vnc' port='{config.vnc_port}' autoport='no' listen='0.0.0.0'/>"""
-        else:
-            xml += """
-    <graphics type='vnc' port='-1' autoport='yes' listen='0.0.0.0'/>"""
-        
-        xml += """
-    <console type='pty'>
-      <target type='serial' port='0'/>
-    </console>
-  </devices>
-</domain>"""
-        
-        return xml
-    
-    def _create_vm_disks(self, disks: List[DiskConfig]) -> None:
-        """Crear archivos de disco para la VM"""
-        for disk in disks:
-            disk_path = Path(disk.path)
-            
-            # Crear directorio si no existe
-            disk_path.parent.mkdir(parents=True, exist_ok=True)
-            
-            # Si el disco no existe y se especifica tamaño, crearlo
-            if not disk_path.exists() and disk.size_gb:
-                self.logger.info(f"Creando disco {disk.path} ({disk.size_gb}GB)")
-                
-                cmd = [
-                    "qemu-img", "create", 
-                    "-f", disk.format.value,
-                    str(disk.path),
-                    f"{disk.size_gb}G"
-                ]
-                
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode != 0:
-                    raise RuntimeError(f"Error creando disco {disk.path}: {result.stderr}")
+    def _check_network_support(self, config: VMConfig) -> None:
+        """
+        Validar las NICs contra el host antes de definir la VM
+        
+        Raises:
+            RuntimeError: Si una NIC exige vhost-net y el host no lo tiene
+        """
+        virtio = [i for i, net in enumerate(config.networks) if is_virtio_tap(net)]
+        if not virtio or os.path.exists(VHOST_NET_DEVICE):
+            return
+        required = [i for i in virtio if config.networks[i].vhost]
+        if required:
+            raise RuntimeError(
+                f"Sin soporte vhost-net en el host ({VHOST_NET_DEVICE} no existe): "
+                f"requerido por las NICs {required}"
+            )
+        self.logger.warning(
+            f"{VHOST_NET_DEVICE} no existe: las NICs virtio de '{config.name}' usarán "
+            f"el backend de QEMU en espacio de usuario"
+        )
+    
+    def _generate_vm_xml(self, config: VMConfig, placement: Optional[Placement] = None) -> str:
+        """Generar XML de configuración de VM (plantilla compilada por flavor)"""
+        return render_domain_xml(config, placement)
     
     def execute_vm_action(self, vm_name: str, action: VMAction, force: bool = False) -> str:
         """Ejecutar acción en una VM"""
@@ -366,6 +448,10 @@ class VMService:
             conn = self._get_connection()
             domain = conn.lookupByName(vm_name)
             
+            # El cambio de estado se refleja también vía eventos; invalidar ya
+            # garantiza que la siguiente lectura vea el resultado de la acción
+            self.inventory.invalidate(domain.UUIDString())
+            
             if action == VMAction.START:
                 if domain.isActive():
                     return "VM ya está ejecutándose"
@@ -442,6 +528,9 @@ class VMService:
             
             # Eliminar definición
             domain.undefine()
+            self.device_cache.invalidate(domain.UUIDString())
+            self.inventory.remove(domain.UUIDString())
+            self.placement.release(vm_name)
             
             # Eliminar archivos de disco si se solicita
             if remove_disks:
@@ -451,6 +540,8 @@ class VMService:
                         self.logger.info(f"Disco eliminado: {disk_path}")
                     except OSError as e:
                         self.logger.warning(f"No se pudo eliminar disco {disk_path}: {e}")
+                        continue
+                    self.disk_provisioner.registry.release(disk_path)
             
             self.logger.info(f"VM '{vm_name}' eliminada")
             return "VM eliminada exitosamente"
@@ -458,8 +549,69 @@ class VMService:
         except libvirt.libvirtError as e:
             raise RuntimeError(f"Error eliminando VM '{vm_name}': {e}")
     
+    def get_disk_iotune(self, vm_name: str, device: str) -> DiskIOTune:
+        """Límites de E/S actuales de un disco (p.ej. vda)"""
+        try:
+            conn = self._get_connection()
+            domain = conn.lookupByName(vm_name)
+        except libvirt.libvirtError:
+            raise RuntimeError(f"VM '{vm_name}' no encontrada")
+        
+        flags = libvirt.VIR_DOMAIN_AFFECT_LIVE if domain.isActive() else libvirt.VIR_DOMAIN_AFFECT_CONFIG
+        try:
+            params = domain.blockIoTune(device, flags)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_INVALID_ARG:
+                raise RuntimeError(f"Disco '{device}' no encontrado en VM '{vm_name}'")
+            raise RuntimeError(f"Error obteniendo límites de E/S de '{device}' en VM '{vm_name}': {e}")
+        return DiskIOTune(**{name: params.get(name) for name in DiskIOTune.__fields__})
+    
+    def set_disk_iotune(self, vm_name: str, device: str, iotune: DiskIOTune) -> DiskIOTune:
+        """
+        Cambiar los límites de E/S de un disco en caliente (setBlockIoTune)
+        
+        Solo se modifican los campos enviados; 0 quita el límite. En una VM
+        activa el cambio se aplica ya y se guarda en la definición.
+        """
+        try:
+            conn = self._get_connection()
+            domain = conn.lookupByName(vm_name)
+        except libvirt.libvirtError:
+            raise RuntimeError(f"VM '{vm_name}' no encontrada")
+        
+        params = {name: value for name, value in iotune.dict().items() if value is not None}
+        flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+        if domain.isActive():
+            flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+        try:
+            domain.setBlockIoTune(device, params, flags)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_INVALID_ARG:
+                raise RuntimeError(f"Disco '{device}' no encontrado en VM '{vm_name}'")
+            raise RuntimeError(f"Error cambiando límites de E/S de '{device}' en VM '{vm_name}': {e}")
+        
+        self.logger.info(f"Límites de E/S de {vm_name}/{device} actualizados: {params}")
+        return self.get_disk_iotune(vm_name, device)
+    
+    def get_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Contadores de las cachés de XML de dominios"""
+        return {
+            "domain_devices": self.device_cache.stats(),
+            "xml_templates": template_cache_info()
+        }
+    
+    def list_base_images(self) -> List[BaseImage]:
+        """Listar imágenes base y los overlays que dependen de ellas"""
+        return self.disk_provisioner.registry.list_images()
+    
     def get_vm_stats(self, vm_name: str) -> VMStats:
         """Obtener estadísticas de rendimiento de una VM"""
+        # Respuesta desde el buffer del sampler, sin llamar a libvirt
+        if self.stats_sampler.running:
+            stats = self.stats_sampler.latest(vm_name)
+            if stats is not None:
+                return stats
+        
         try:
             conn = self._get_connection()
             domain = conn.lookupByName(vm_name)
@@ -467,46 +619,22 @@ class VMService:
             if not domain.isActive():
                 raise RuntimeError(f"VM '{vm_name}' no está ejecutándose")
             
-            # Información básica
-            info = domain.info()
-            
-            # Estadísticas de CPU (placeholder - requiere implementación más compleja)
-            cpu_stats = domain.getCPUStats(True)
-            cpu_usage = 0.0  # Placeholder
-            
-            # Estadísticas de memoria
-            memory_stats = domain.memoryStats()
-            memory_used = memory_stats.get('rss', info[2]) * 1024  # KB to bytes
-            memory_total = info[1] * 1024 * 1024  # MB to bytes
-            memory_usage_percent = (memory_used / memory_total) * 100 if memory_total > 0 else 0
-            
-            # Estadísticas de disco (placeholder)
-            disk_read_bytes = 0
-            disk_write_bytes = 0
-            
-            # Estadísticas de red (placeholder)
-            network_rx_bytes = 0
-            network_tx_bytes = 0
-            
-            # Uptime (placeholder)
-            uptime_seconds = int(time.time())
-            
-            return VMStats(
-                name=vm_name,
-                cpu_usage_percent=cpu_usage,
-                memory_usage_percent=memory_usage_percent,
-                memory_used_mb=memory_used // (1024 * 1024),
-                memory_total_mb=memory_total // (1024 * 1024),
-                disk_read_bytes=disk_read_bytes,
-                disk_write_bytes=disk_write_bytes,
-                network_rx_bytes=network_rx_bytes,
-                network_tx_bytes=network_tx_bytes,
-                uptime_seconds=uptime_seconds
-            )
+            # VM aún no muestreada (o sampler detenido): muestra puntual sin tasas
+            sample = self.stats_sampler.sample_domain(conn, domain)
+            return self.stats_sampler.build_stats(vm_name, [sample])
             
         except libvirt.libvirtError as e:
             raise RuntimeError(f"Error obteniendo estadísticas de VM '{vm_name}': {e}")
     
+    def get_vm_stats_history(self, vm_name: str, window_seconds: int,
+                             resolution: Optional[str] = None,
+                             include_points: bool = False) -> Dict[str, Any]:
+        """Obtener el resumen histórico de métricas de una VM"""
+        history = self.metric_history.query(vm_name, window_seconds, resolution, include_points)
+        if history is None:
+            raise RuntimeError(f"VM '{vm_name}' sin historial de estadísticas")
+        return history
+    
     def create_snapshot(self, vm_name: str, snapshot_config: VMSnapshotCreate) -> VMSnapshot:
         """Crear snapshot de una VM"""
         try:
@@ -514,66 +642,54 @@ class VMService:
             domain = conn.lookupByName(vm_name)
             
             # Generar XML del snapshot
+            memory_xml = "\n  <memory snapshot='no'/>" if snapshot_config.disk_only else ""
             snapshot_xml = f"""<domainsnapshot>
   <name>{snapshot_config.name}</name>
-  <description>{snapshot_config.description or ''}</description>
+  <description>{snapshot_config.description or ''}</description>{memory_xml}
 </domainsnapshot>"""
             
             # Crear snapshot
             flags = 0
-            if snapshot_config.memory and domain.isActive():
+            if snapshot_config.disk_only:
+                # Externo: cada disco pasa a escribir en un overlay nuevo
+                # (<disco>.<snapshot>) y la imagen anterior queda congelada
+                flags |= libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+                if snapshot_config.quiesce:
+                    flags |= libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_QUIESCE
+            elif snapshot_config.memory and domain.isActive():
                 flags |= libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_LIVE
             
             snapshot = domain.snapshotCreateXML(snapshot_xml, flags)
             
-            # Obtener información del snapshot
-            snap_xml = snapshot.getXMLDesc()
-            snap_root = ET.fromstring(snap_xml)
-            
-            created_at = snap_root.find("creationTime").text if snap_root.find("creationTime") is not None else str(int(time.time()))
+            # Obtener información del snapshot y registrarlo en el índice
+            vm_snapshot = snapshot_from_xml(vm_name, snapshot.getXMLDesc())
+            self.snapshot_index.added(domain, vm_snapshot)
+            if snapshot_config.disk_only:
+                # Las rutas de los discos del dominio apuntan ahora a los overlays
+                self.device_cache.invalidate(domain.UUIDString())
+                self.inventory.invalidate(domain.UUIDString())
             
-            return VMSnapshot(
-                name=snapshot_config.name,
-                vm_name=vm_name,
-                created_at=created_at,
-                description=snapshot_config.description,
-                state=self._vm_state_to_enum(domain.info()[0]),
-                memory_snapshot=snapshot_config.memory
-            )
+            return vm_snapshot.copy(update={"current": True})
             
         except libvirt.libvirtError as e:
             raise RuntimeError(f"Error creando snapshot de VM '{vm_name}': {e}")
     
-    def list_snapshots(self, vm_name: str) -> List[VMSnapshot]:
-        """Listar snapshots de una VM"""
+    def list_snapshots(self, vm_name: str, offset: int = 0, limit: Optional[int] = None,
+                       current_chain: bool = False) -> Tuple[List[VMSnapshot], int, Optional[str]]:
+        """
+        Listar snapshots de una VM desde el índice en memoria
+        
+        Returns:
+            (página de snapshots, total, nombre del snapshot actual)
+        """
         try:
             conn = self._get_connection()
             domain = conn.lookupByName(vm_name)
-            
-            snapshots = []
-            for snap in domain.listAllSnapshots():
-                snap_xml = snap.getXMLDesc()
-                snap_root = ET.fromstring(snap_xml)
-                
-                name = snap_root.find("name").text
-                description_elem = snap_root.find("description")
-                description = description_elem.text if description_elem is not None else None
-                created_at = snap_root.find("creationTime").text if snap_root.find("creationTime") is not None else str(int(time.time()))
-                
-                # Determinar si tiene memoria
-                memory_snapshot = snap_root.find("memory") is not None
-                
-                snapshots.append(VMSnapshot(
-                    name=name,
-                    vm_name=vm_name,
-                    created_at=created_at,
-                    description=description,
-                    state=VMState.SHUTOFF,  # Los snapshots no tienen estado activo
-                    memory_snapshot=memory_snapshot
-                ))
-            
-            return snapshots
-            
+        except libvirt.libvirtError:
+            raise RuntimeError(f"VM '{vm_name}' no encontrada")
+        
+        try:
+            return self.snapshot_index.list(domain, offset, limit, current_chain)
         except libvirt.libvirtError as e:
             raise RuntimeError(f"Error listando snapshots de VM '{vm_name}': {e}")
     
@@ -586,6 +702,8 @@ class VMService:
             
             # Revertir al snapshot
             domain.revertToSnapshot(snapshot)
+            self.inventory.invalidate(domain.UUIDString())
+            self.snapshot_index.reverted(domain, snapshot_name)
             
             return f"VM '{vm_name}' restaurada desde snapshot '{snapshot_name}'"
             
@@ -601,47 +719,62 @@ class VMService:
             
             # Eliminar snapshot
             snapshot.delete()
+            self.snapshot_index.deleted(domain, snapshot_name)
             
             return f"Snapshot '{snapshot_name}' de VM '{vm_name}' eliminado"
             
         except libvirt.libvirtError as e:
             raise RuntimeError(f"Error eliminando snapshot '{snapshot_name}' de VM '{vm_name}': {e}")
     
-    def migrate_vm(self, vm_name: str, migration_config: VMMigrationConfig) -> str:
-        """Migrar VM a otro host"""
-        try:
-            conn = self._get_connection()
-            domain = conn.lookupByName(vm_name)
-            
-            # Conectar al host destino
-            dest_uri = f"qemu+ssh://{migration_config.destination_host}/system"
-            dest_conn = libvirt.open(dest_uri)
-            
-            # Configurar flags de migración
-            flags = libvirt.VIR_MIGRATE_PEER2PEER
-            if migration_config.live:
-                flags |= libvirt.VIR_MIGRATE_LIVE
-            if migration_config.compressed:
-                flags |= libvirt.VIR_MIGRATE_COMPRESSED
-            
-            # Parámetros de migración
-            params = {}
-            if migration_config.bandwidth_mbps:
-                params[libvirt.VIR_MIGRATE_PARAM_BANDWIDTH] = migration_config.bandwidth_mbps
-            
-            # Ejecutar migración
-            domain.migrate3(dest_conn, params, flags)
-            
-            dest_conn.close()
-            
-            return f"VM '{vm_name}' migrada exitosamente a {migration_config.destination_host}"
-            
-        except libvirt.libvirtError as e:
-            raise RuntimeError(f"Error migrando VM '{vm_name}': {e}")
+    def migrate_vm(self, vm_name: str, migration_config: VMMigrationConfig) -> MigrationJob:
+        """Encolar la migración de una VM a otro host (ver MigrationManager)"""
+        return self.migrations.submit(vm_name, migration_config)
+    
+    def get_migration(self, job_id: str) -> MigrationJob:
+        """Estado y progreso de una migración"""
+        return self.migrations.get(job_id)
+    
+    def list_migrations(self, vm_name: Optional[str] = None) -> List[MigrationJob]:
+        """Migraciones en curso y recientes"""
+        return self.migrations.list_jobs(vm_name)
+    
+    def cancel_migration(self, job_id: str) -> MigrationJob:
+        """Cancelar una migración en cola o en curso"""
+        return self.migrations.cancel(job_id)
+    
+    def backup_vm(self, vm_name: str, request: VMBackupRequest) -> BackupJob:
+        """Encolar el backup de una VM en ejecución (ver BackupManager)"""
+        return self.backups.submit(vm_name, request)
+    
+    def get_backup(self, job_id: str) -> BackupJob:
+        """Estado y progreso de un backup"""
+        return self.backups.get(job_id)
+    
+    def list_backups(self, vm_name: Optional[str] = None) -> List[BackupJob]:
+        """Backups en curso y recientes"""
+        return self.backups.list_jobs(vm_name)
+    
+    def cancel_backup(self, job_id: str) -> BackupJob:
+        """Cancelar un backup en cola o en curso"""
+        return self.backups.cancel(job_id)
+    
+    def get_backup_chain(self, vm_name: str) -> List[BackupEntry]:
+        """Cadena de backups completados de una VM"""
+        return self.backups.chain(vm_name)
+    
+    def get_placement_usage(self) -> List[NodeUsage]:
+        """CPUs y memoria reservadas por nodo NUMA"""
+        return self.placement.usage()
+    
+    def get_hugepage_pools(self) -> List[HugepagePoolStatus]:
+        """Pools de hugepages del host con las páginas comprometidas por VMs"""
+        return self.placement.hugepage_pools()
+    
+    def get_connection_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Contadores de los pools de conexiones libvirt por URI"""
+        return self.connections.stats()
     
     def close_connection(self):
-        """Cerrar conexión a libvirt"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-            self.logger.info("Conexión a libvirt cerrada")
+        """Cerrar las conexiones a libvirt (locales y remotas)"""
+        self.connections.close()
+        self.logger.info("Conexiones a libvirt cerradas")
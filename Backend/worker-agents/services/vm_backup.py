@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Backups completos e incrementales de VMs con la API de backup de libvirt
+TeleCluster Orchestrator - Worker Agent
+
+Cada backup crea un checkpoint (un dirty bitmap persistente por disco en
+los qcow2). El siguiente backup incremental le pide a QEMU solo los bloques
+marcados en el bitmap del checkpoint anterior, así que una noche típica de
+laboratorio copia el delta y no los discos enteros.
+
+Se usa el modo push: QEMU escribe directamente los bloques en el fichero
+destino como un block job, con memoria acotada por su buffer de copia, y el
+worker solo sigue el progreso. Los ficheros incrementales son qcow2 con
+únicamente los clusters cambiados; al terminar se enlazan (qemu-img rebase
+-u, solo metadatos) al backup anterior, de modo que cualquier punto de la
+cadena se restaura con un `qemu-img convert` del fichero correspondiente.
+"""
+
+import json
+import libvirt
+import logging
+import os
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+from xml.sax.saxutils import escape
+
+from models.vm import BackupEntry, BackupJob, BackupMode, BackupStatus, VMBackupRequest
+
+
+# Directorio de backups (volumen persistente del worker)
+BACKUP_DIR = "/var/lib/telecluster/backups"
+
+# Backups simultáneos (cada uno es un block job de QEMU que lee los discos)
+BACKUP_WORKERS = 2
+
+# Checkpoints que se conservan por VM (cada uno es un bitmap en cada disco)
+KEEP_CHECKPOINTS = 7
+
+# Segundos entre lecturas de jobStats
+POLL_INTERVAL = 1.0
+
+# Trabajos terminados que se conservan para consulta
+FINISHED_JOBS_KEPT = 100
+
+CHECKPOINT_PREFIX = "tc-"
+
+FINAL_STATES = (BackupStatus.COMPLETED, BackupStatus.FAILED, BackupStatus.CANCELLED)
+
+
+def _attr(value: str) -> str:
+    return escape(value, {"'": "&apos;"})
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class BackupManager:
+    """
+    Cola de backups de VMs y cadena de checkpoints de cada una
+
+    La cadena se guarda en un manifest.json por VM junto a los ficheros de
+    backup. Un backup incremental parte del último checkpoint del manifest
+    si libvirt aún lo conserva; si no (primer backup, checkpoint podado o
+    VM redefinida) se hace uno completo.
+    """
+
+    def __init__(self, vm_service, backup_dir: str = BACKUP_DIR,
+                 keep_checkpoints: int = KEEP_CHECKPOINTS, max_workers: int = BACKUP_WORKERS):
+        """
+        Inicializar gestor
+
+        Args:
+            vm_service: VMService propietario (provee conexión y dispositivos)
+            backup_dir: Directorio raíz de los backups
+            keep_checkpoints: Checkpoints conservados por VM
+            max_workers: Backups simultáneos
+        """
+        self.vm_service = vm_service
+        self.backup_dir = backup_dir
+        self.keep_checkpoints = keep_checkpoints
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, BackupJob] = {}
+        self._requests: Dict[str, VMBackupRequest] = {}
+        self._active: Dict[str, str] = {}             # vm_name -> job_id
+        self._finished: Deque[str] = deque()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="backup")
+
+    def submit(self, vm_name: str, request: VMBackupRequest) -> BackupJob:
+        """
+        Encolar el backup de una VM
+
+        Raises:
+            RuntimeError: Si la VM no existe, no está en ejecución o ya tiene un backup en curso
+        """
+        try:
+            domain = self.vm_service._get_connection().lookupByName(vm_name)
+        except libvirt.libvirtError:
+            raise RuntimeError(f"VM '{vm_name}' no encontrada")
+        if not domain.isActive():
+            # El block job de backup lo ejecuta el proceso QEMU de la VM
+            raise RuntimeError(f"La VM '{vm_name}' no está ejecutándose")
+
+        job = BackupJob(
+            job_id=uuid.uuid4().hex[:12],
+            vm_name=vm_name,
+            status=BackupStatus.QUEUED,
+            created_at=_now()
+        )
+        with self._lock:
+            if vm_name in self._active:
+                raise RuntimeError(
+                    f"Ya existe un backup en curso de la VM '{vm_name}' ({self._active[vm_name]})"
+                )
+            self._jobs[job.job_id] = job
+            self._requests[job.job_id] = request
+            self._active[vm_name] = job.job_id
+            snapshot = job.copy(deep=True)
+
+        self._executor.submit(self._run, job.job_id)
+        self.logger.info(f"Backup {job.job_id} de VM {vm_name} encolado")
+        return snapshot
+
+    def get(self, job_id: str) -> BackupJob:
+        """
+        Estado de un trabajo
+
+        Raises:
+            RuntimeError: Si el trabajo no existe
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise RuntimeError(f"Backup '{job_id}' no encontrado")
+            return job.copy(deep=True)
+
+    def list_jobs(self, vm_name: Optional[str] = None) -> List[BackupJob]:
+        """Trabajos en curso y terminados recientemente (más recientes primero)"""
+        with self._lock:
+            jobs = [
+                job.copy(deep=True) for job in self._jobs.values()
+                if vm_name is None or job.vm_name == vm_name
+            ]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> BackupJob:
+        """
+        Cancelar un trabajo (si está en curso se aborta el block job)
+
+        Raises:
+            RuntimeError: Si el trabajo no existe o ya terminó
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise RuntimeError(f"Backup '{job_id}' no encontrado")
+            if job.status in FINAL_STATES:
+                raise RuntimeError(f"El backup '{job_id}' ya terminó ({job.status.value})")
+            if job.status == BackupStatus.QUEUED:
+                self._finish(job, BackupStatus.CANCELLED)
+                return job.copy(deep=True)
+
+        try:
+            self.vm_service._get_connection().lookupByName(job.vm_name).abortJob()
+        except libvirt.libvirtError as e:
+            raise RuntimeError(f"Error cancelando backup '{job_id}': {e}")
+        self.logger.info(f"Backup {job_id} abortado")
+        return self.get(job_id)
+
+    def chain(self, vm_name: str) -> List[BackupEntry]:
+        """Backups completados de una VM, del más antiguo al más reciente"""
+        return self._load_manifest(vm_name)
+
+    def shutdown(self) -> None:
+        """Detener el pool de backups (los block jobs en curso siguen en QEMU)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            request = self._requests.pop(job_id)
+            if job.status == BackupStatus.CANCELLED:
+                return
+            job.status = BackupStatus.RUNNING
+            job.started_at = _now()
+
+        try:
+            entry = self._backup(job, request)
+        except Exception as e:
+            with self._lock:
+                cancelled = job.status == BackupStatus.CANCELLED
+                if not cancelled:
+                    job.error = str(e)
+                    self._finish(job, BackupStatus.FAILED)
+            if not cancelled:
+                self.logger.error(f"Backup {job_id} de VM {job.vm_name} fallido: {e}")
+            return
+
+        with self._lock:
+            job.bytes_processed = job.bytes_total
+            self._finish(job, BackupStatus.COMPLETED)
+        self.logger.info(
+            f"Backup {job_id} de VM {job.vm_name} completado ({entry.mode.value}, "
+            f"{entry.size_bytes} bytes)"
+        )
+
+    def _backup(self, job: BackupJob, request: VMBackupRequest) -> BackupEntry:
+        domain = self.vm_service._get_connection().lookupByName(job.vm_name)
+        disks = self._select_disks(domain, request.disks)
+        manifest = self._load_manifest(job.vm_name)
+
+        parent = None
+        if request.incremental and manifest and self._has_checkpoint(domain, manifest[-1].checkpoint):
+            parent = manifest[-1].checkpoint
+        mode = BackupMode.INCREMENTAL if parent else BackupMode.FULL
+        checkpoint = f"{CHECKPOINT_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-{job.job_id[:6]}"
+
+        target_dir = Path(self.backup_dir) / job.vm_name
+        target_dir.mkdir(parents=True, exist_ok=True)
+        files = {disk: str(target_dir / f"{checkpoint}.{disk}.qcow2") for disk in disks}
+
+        with self._lock:
+            job.mode = mode
+            job.checkpoint = checkpoint
+            job.parent = parent
+            job.disks = disks
+
+        try:
+            domain.backupBegin(
+                self._backup_xml(files, parent),
+                self._checkpoint_xml(checkpoint, disks),
+                0
+            )
+        except libvirt.libvirtError as e:
+            raise RuntimeError(f"Error iniciando backup de VM '{job.vm_name}': {e}")
+
+        try:
+            self._wait(job, domain)
+        except Exception:
+            # Un checkpoint sin backup completo rompería la cadena incremental
+            self._delete_checkpoint(domain, checkpoint)
+            for path in files.values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+
+        if parent:
+            parent_files = manifest[-1].files
+            for disk, path in files.items():
+                if disk in parent_files:
+                    self._rebase(path, parent_files[disk])
+
+        entry = BackupEntry(
+            checkpoint=checkpoint,
+            parent=parent,
+            mode=mode,
+            created_at=_now(),
+            files=files,
+            size_bytes=sum(os.path.getsize(path) for path in files.values() if os.path.exists(path))
+        )
+        manifest.append(entry)
+        self._save_manifest(job.vm_name, manifest)
+        self._prune_checkpoints(domain, manifest)
+        return entry
+
+    def _wait(self, job: BackupJob, domain: libvirt.virDomain) -> None:
+        """Seguir el block job hasta que termina"""
+        while True:
+            time.sleep(POLL_INTERVAL)
+            stats = domain.jobStats()
+            if stats.get("type", libvirt.VIR_DOMAIN_JOB_NONE) != libvirt.VIR_DOMAIN_JOB_NONE:
+                with self._lock:
+                    job.bytes_total = stats.get("disk_total", job.bytes_total)
+                    job.bytes_processed = stats.get("disk_processed", job.bytes_processed)
+                continue
+
+            completed = domain.jobStats(libvirt.VIR_DOMAIN_JOB_STATS_COMPLETED)
+            job_type = completed.get("type")
+            if job_type == libvirt.VIR_DOMAIN_JOB_COMPLETED:
+                with self._lock:
+                    job.bytes_total = completed.get("disk_total", job.bytes_total)
+                return
+            if job_type == libvirt.VIR_DOMAIN_JOB_CANCELLED:
+                with self._lock:
+                    self._finish(job, BackupStatus.CANCELLED)
+                raise RuntimeError("Backup cancelado")
+            raise RuntimeError(completed.get("errmsg") or "El block job de backup falló")
+
+    def _select_disks(self, domain: libvirt.virDomain, requested: Optional[List[str]]) -> List[str]:
+        devices = self.vm_service.device_cache.devices(domain)
+        available = [disk["device"] for disk in devices.disks if disk.get("type") == "disk"]
+        if not requested:
+            if not available:
+                raise RuntimeError(f"La VM '{domain.name()}' no tiene discos para copiar")
+            return available
+        unknown = [disk for disk in requested if disk not in available]
+        if unknown:
+            raise RuntimeError(f"Discos no encontrados en la VM '{domain.name()}': {', '.join(unknown)}")
+        return list(requested)
+
+    @staticmethod
+    def _backup_xml(files: Dict[str, str], parent: Optional[str]) -> str:
+        parts = ["<domainbackup mode='push'>"]
+        if parent:
+            parts.append(f"  <incremental>{escape(parent)}</incremental>")
+        parts.append("  <disks>")
+        for disk, path in files.items():
+            parts.append(
+                f"    <disk name='{_attr(disk)}' backup='yes' type='file'>"
+                f"<target file='{_attr(path)}'/><driver type='qcow2'/></disk>"
+            )
+        parts.append("  </disks>")
+        parts.append("</domainbackup>")
+        return "\n".join(parts)
+
+    @staticmethod
+    def _checkpoint_xml(checkpoint: str, disks: List[str]) -> str:
+        disk_lines = "".join(f"<disk name='{_attr(disk)}' checkpoint='bitmap'/>" for disk in disks)
+        return f"<domaincheckpoint><name>{escape(checkpoint)}</name><disks>{disk_lines}</disks></domaincheckpoint>"
+
+    @staticmethod
+    def _has_checkpoint(domain: libvirt.virDomain, name: str) -> bool:
+        try:
+            domain.checkpointLookupByName(name)
+            return True
+        except libvirt.libvirtError:
+            return False
+
+    def _delete_checkpoint(self, domain: libvirt.virDomain, name: str) -> None:
+        try:
+            domain.checkpointLookupByName(name).delete()
+        except libvirt.libvirtError as e:
+            self.logger.debug(f"Checkpoint {name} no eliminado: {e}")
+
+    def _prune_checkpoints(self, domain: libvirt.virDomain, manifest: List[BackupEntry]) -> None:
+        """Eliminar checkpoints antiguos para acotar los bitmaps de cada disco"""
+        for entry in manifest[:-self.keep_checkpoints]:
+            if self._has_checkpoint(domain, entry.checkpoint):
+                self._delete_checkpoint(domain, entry.checkpoint)
+
+    def _rebase(self, path: str, parent_path: str) -> None:
+        """Enlazar un backup incremental a su padre (solo cabecera qcow2)"""
+        result = subprocess.run(
+            ["qemu-img", "rebase", "-u", "-F", "qcow2", "-b", parent_path, path],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            self.logger.warning(f"No se pudo enlazar {path} a {parent_path}: {result.stderr.strip()}")
+
+    def _manifest_path(self, vm_name: str) -> Path:
+        return Path(self.backup_dir) / vm_name / "manifest.json"
+
+    def _load_manifest(self, vm_name: str) -> List[BackupEntry]:
+        path = self._manifest_path(vm_name)
+        if not path.exists():
+            return []
+        try:
+            with open(path, "r") as f:
+                return [BackupEntry(**entry) for entry in json.load(f)]
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Error leyendo manifest de backups de VM {vm_name}: {e}")
+            return []
+
+    def _save_manifest(self, vm_name: str, manifest: List[BackupEntry]) -> None:
+        """Escribir el manifest (temporal + rename atómico)"""
+        path = self._manifest_path(vm_name)
+        tmp_path = path.with_suffix(".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump([entry.dict() for entry in manifest], f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _finish(self, job: BackupJob, status: BackupStatus) -> None:
+        """Cerrar un trabajo (con el lock tomado) y podar los terminados antiguos"""
+        job.status = status
+        job.finished_at = _now()
+        if self._active.get(job.vm_name) == job.job_id:
+            del self._active[job.vm_name]
+        self._finished.append(job.job_id)
+        while len(self._finished) > FINISHED_JOBS_KEPT:
+            self._jobs.pop(self._finished.popleft(), None)
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Aprovisionamiento de discos de VMs e imágenes base compartidas
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from models.vm import (
+    BaseImage, DiskCacheMode, DiskConfig, DiskFormat, DiskIOMode, DiskIOProfile, VMConfig
+)
+
+
+# Estado del registro de imágenes base (volumen persistente del worker)
+BASE_IMAGE_STATE_FILE = "/var/lib/telecluster/base_images.json"
+
+# Procesos qemu-img simultáneos
+DISK_WORKERS = 8
+
+
+def apply_io_profiles(config: VMConfig, io_uring: bool = False) -> VMConfig:
+    """
+    Resolver los perfiles de E/S de los discos en opciones explícitas
+
+    El perfil performance usa cache=none (sin doble caché en el host) con
+    AIO nativo para discos raw (ficheros o LVM) e io_uring para qcow2 si el
+    host lo soporta, y reparte los discos virtio entre los iothreads de la VM
+    (crea uno si no tiene). Las opciones puestas a mano en el disco se
+    respetan.
+
+    Args:
+        config: Configuración de la VM
+        io_uring: Si el host soporta io='io_uring' (ver HostCapacity)
+    """
+    if all(disk.profile == DiskIOProfile.DEFAULT for disk in config.disks):
+        return config
+
+    iothreads = config.iothreads
+    assigned = 0
+    disks = []
+    for disk in config.disks:
+        if disk.profile != DiskIOProfile.PERFORMANCE:
+            disks.append(disk)
+            continue
+        update = {}
+        cache = disk.cache or DiskCacheMode.NONE
+        update["cache"] = cache
+        if disk.io is None:
+            if cache not in (DiskCacheMode.NONE, DiskCacheMode.DIRECTSYNC):
+                update["io"] = DiskIOMode.IO_URING if io_uring else DiskIOMode.THREADS
+            elif io_uring and disk.format != DiskFormat.RAW:
+                update["io"] = DiskIOMode.IO_URING
+            else:
+                update["io"] = DiskIOMode.NATIVE
+        if disk.iothread is None and disk.bus == "virtio":
+            iothreads = max(iothreads, 1)
+            update["iothread"] = assigned % iothreads + 1
+            assigned += 1
+        disks.append(disk.copy(update=update))
+    return config.copy(update={"disks": disks, "iothreads": iothreads})
+
+
+class BaseImageRegistry:
+    """
+    Registro de imágenes base y de los overlays qcow2 que dependen de ellas
+
+    Cuenta referencias para saber qué plantillas siguen en uso; una base sin
+    overlays puede eliminarse sin romper ninguna VM. Se persiste en un JSON
+    pequeño (una entrada por base, no por VM).
+    """
+
+    def __init__(self, state_file: str = BASE_IMAGE_STATE_FILE):
+        self.logger = logging.getLogger(__name__)
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._formats: Dict[str, str] = {}          # base -> formato
+        self._overlays: Dict[str, Set[str]] = {}    # base -> overlays
+        self._base_of: Dict[str, str] = {}          # overlay -> base
+        self._load()
+
+    def format_of(self, base_path: str) -> str:
+        """
+        Formato de una imagen base (consultado con qemu-img una sola vez)
+
+        Raises:
+            RuntimeError: Si la imagen no existe o qemu-img no puede leerla
+        """
+        with self._lock:
+            if base_path in self._formats:
+                return self._formats[base_path]
+
+        if not os.path.exists(base_path):
+            raise RuntimeError(f"Imagen base {base_path} no encontrada")
+        result = subprocess.run(
+            ["qemu-img", "info", "--output=json", base_path],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Error leyendo imagen base {base_path}: {result.stderr}")
+        image_format = json.loads(result.stdout)["format"]
+
+        with self._lock:
+            self._formats[base_path] = image_format
+        return image_format
+
+    def acquire(self, base_path: str, overlay_path: str) -> None:
+        """Registrar un overlay de una imagen base"""
+        with self._lock:
+            self._overlays.setdefault(base_path, set()).add(overlay_path)
+            self._base_of[overlay_path] = base_path
+            self._save()
+
+    def release(self, overlay_path: str) -> Optional[str]:
+        """
+        Liberar la referencia de un overlay eliminado
+
+        Returns:
+            Imagen base de la que dependía, o None si no era un overlay
+        """
+        with self._lock:
+            base_path = self._base_of.pop(overlay_path, None)
+            if base_path is None:
+                return None
+            self._overlays[base_path].discard(overlay_path)
+            self._save()
+            if not self._overlays[base_path]:
+                self.logger.info(f"Imagen base {base_path} sin referencias")
+            return base_path
+
+    def refcount(self, base_path: str) -> int:
+        """Número de overlays que dependen de una imagen base"""
+        with self._lock:
+            return len(self._overlays.get(base_path, ()))
+
+    def list_images(self) -> List[BaseImage]:
+        """Imágenes base conocidas con sus referencias"""
+        with self._lock:
+            return [
+                BaseImage(
+                    path=base_path,
+                    format=self._formats.get(base_path),
+                    refcount=len(overlays),
+                    overlays=sorted(overlays),
+                    exists=os.path.exists(base_path)
+                )
+                for base_path, overlays in sorted(self._overlays.items())
+            ]
+
+    def _load(self) -> None:
+        if not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                data = json.load(f)
+            for base_path, entry in data.items():
+                if entry.get("format"):
+                    self._formats[base_path] = entry["format"]
+                self._overlays[base_path] = set(entry.get("overlays", []))
+                for overlay_path in self._overlays[base_path]:
+                    self._base_of[overlay_path] = base_path
+        except (OSError, ValueError) as e:
+            self.logger.error(f"Error cargando registro de imágenes base: {e}")
+
+    def _save(self) -> None:
+        """Escribir el registro (temporal + rename atómico)"""
+        data = {
+            base_path: {"format": self._formats.get(base_path), "overlays": sorted(overlays)}
+            for base_path, overlays in self._overlays.items()
+        }
+        tmp_file = f"{self.state_file}.tmp"
+        try:
+            Path(self.state_file).parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_file, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_file, self.state_file)
+        except OSError as e:
+            self.logger.warning(f"No se pudo guardar el registro de imágenes base: {e}")
+
+
+class DiskProvisioner:
+    """Creación concurrente de los discos de una VM con qemu-img"""
+
+    def __init__(self, registry: BaseImageRegistry, max_workers: int = DISK_WORKERS):
+        self.logger = logging.getLogger(__name__)
+        self.registry = registry
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qemu-img")
+
+    def provision(self, disks: List[DiskConfig]) -> List[str]:
+        """
+        Crear en paralelo los discos que no existen
+
+        Un disco con backing_image se crea como overlay qcow2 copy-on-write
+        de la imagen base (instantáneo y sin copiar datos). Si algún disco
+        falla se eliminan los creados en esta llamada.
+
+        Returns:
+            Rutas de los discos creados
+
+        Raises:
+            RuntimeError: Si falla la creación de algún disco
+        """
+        pending = [
+            disk for disk in disks
+            if not Path(disk.path).exists() and (disk.size_gb or disk.backing_image)
+        ]
+        if not pending:
+            return []
+
+        futures = [(disk, self._executor.submit(self._create_disk, disk)) for disk in pending]
+        created, errors = [], []
+        for disk, future in futures:
+            try:
+                future.result()
+                created.append(disk.path)
+            except Exception as e:
+                errors.append(str(e))
+
+        if errors:
+            self.discard(created)
+            raise RuntimeError("; ".join(errors))
+        return created
+
+    def discard(self, paths: List[str]) -> None:
+        """Eliminar discos y liberar sus referencias a imágenes base"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError as e:
+                self.logger.warning(f"No se pudo eliminar disco {path}: {e}")
+            self.registry.release(path)
+
+    def _create_disk(self, disk: DiskConfig) -> None:
+        disk_path = Path(disk.path)
+        disk_path.parent.mkdir(parents=True, exist_ok=True)
+
+        cmd = ["qemu-img", "create", "-f", disk.format.value]
+        if disk.backing_image:
+            backing_format = self.registry.format_of(disk.backing_image)
+            cmd.extend(["-b", disk.backing_image, "-F", backing_format])
+            self.logger.info(f"Creando overlay {disk.path} sobre {disk.backing_image}")
+        else:
+            self.logger.info(f"Creando disco {disk.path} ({disk.size_gb}GB)")
+        cmd.append(str(disk.path))
+        # Sin tamaño, el overlay hereda el de la imagen base
+        if disk.size_gb:
+            cmd.append(f"{disk.size_gb}G")
+
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Error creando disco {disk.path}: {result.stderr}")
+
+        if disk.backing_image:
+            self.registry.acquire(disk.backing_image, disk.path)
+
+    def shutdown(self) -> None:
+        """Detener el pool de qemu-img"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
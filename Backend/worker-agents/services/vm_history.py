@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Historial compacto de métricas de VMs con niveles de resolución
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from models.vm import VMStats
+
+
+# Métricas almacenadas (una fila float32 por métrica)
+METRICS = (
+    "cpu_usage_percent",
+    "memory_usage_percent",
+    "disk_read_bytes_per_sec",
+    "disk_write_bytes_per_sec",
+    "network_rx_bytes_per_sec",
+    "network_tx_bytes_per_sec",
+)
+
+# Niveles de retención: (nombre, resolución en segundos, muestras retenidas)
+TIERS = (
+    ("1s", 1, 600),      # 10 minutos
+    ("10s", 10, 720),    # 2 horas
+    ("60s", 60, 1440),   # 24 horas
+)
+
+
+class _MetricRing:
+    """Buffer circular columnar: timestamps float64 + una fila float32 por métrica"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((len(METRICS), capacity), dtype=np.float32)
+        self.size = 0
+        self.head = 0   # Próxima posición a escribir
+
+    def append(self, timestamp: float, values: np.ndarray) -> None:
+        """Añadir una muestra sobrescribiendo la más antigua si está lleno"""
+        self.timestamps[self.head] = timestamp
+        self.values[:, self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def last_timestamp(self) -> float:
+        """Timestamp de la muestra más reciente (0 si está vacío)"""
+        if not self.size:
+            return 0.0
+        return float(self.timestamps[self.head - 1])
+
+    def window(self, since: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Muestras con timestamp >= since, en orden cronológico"""
+        if self.size < self.capacity:
+            timestamps = self.timestamps[:self.size]
+            values = self.values[:, :self.size]
+        else:
+            order = np.roll(np.arange(self.capacity), -self.head)
+            timestamps = self.timestamps[order]
+            values = self.values[:, order]
+
+        mask = timestamps >= since
+        return timestamps[mask], values[:, mask]
+
+
+class _Downsampler:
+    """Acumula muestras de alta resolución y emite la media por intervalo"""
+
+    def __init__(self, resolution: int):
+        self.resolution = resolution
+        self.bucket: Optional[int] = None
+        self.sums = np.zeros(len(METRICS), dtype=np.float64)
+        self.count = 0
+
+    def add(self, timestamp: float, values: np.ndarray) -> Optional[Tuple[float, np.ndarray]]:
+        """Acumular una muestra; devuelve el intervalo cerrado si se cruzó el límite"""
+        bucket = int(timestamp // self.resolution)
+        closed = None
+        if self.bucket is not None and bucket != self.bucket and self.count:
+            closed = (float(self.bucket * self.resolution), self.sums / self.count)
+            self.sums = np.zeros(len(METRICS), dtype=np.float64)
+            self.count = 0
+
+        self.bucket = bucket
+        self.sums += values
+        self.count += 1
+        return closed
+
+
+class _VMSeries:
+    """Series de una VM en todos los niveles de resolución"""
+
+    def __init__(self):
+        self.rings = {name: _MetricRing(capacity) for name, _, capacity in TIERS}
+        self.downsamplers = {name: _Downsampler(resolution) for name, resolution, _ in TIERS[1:]}
+
+    def record(self, timestamp: float, values: np.ndarray) -> None:
+        self.rings[TIERS[0][0]].append(timestamp, values)
+        for name, downsampler in self.downsamplers.items():
+            closed = downsampler.add(timestamp, values)
+            if closed is not None:
+                self.rings[name].append(*closed)
+
+
+class MetricHistoryStore:
+    """
+    Historial de métricas por VM sin TSDB externa
+
+    Cada VM guarda sus métricas en columnas NumPy (float64 para el tiempo y
+    float32 por métrica, 32 bytes por muestra) en tres niveles de resolución
+    con retención fija, de modo que la memoria está acotada por VM. Las
+    consultas calculan min/avg/max/p95 de una ventana con reducciones
+    vectorizadas.
+    """
+
+    def __init__(self, max_idle_seconds: float = 86400.0):
+        """
+        Inicializar almacén
+
+        Args:
+            max_idle_seconds: Tiempo sin muestras tras el cual se descarta una VM
+        """
+        self.max_idle_seconds = max_idle_seconds
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._series: Dict[str, _VMSeries] = {}
+        self._records = 0
+
+    def record(self, vm_name: str, stats: VMStats) -> None:
+        """Registrar una muestra de estadísticas de una VM"""
+        values = np.array([getattr(stats, metric) for metric in METRICS], dtype=np.float64)
+        timestamp = stats.sampled_at
+
+        with self._lock:
+            series = self._series.get(vm_name)
+            if series is None:
+                series = _VMSeries()
+                self._series[vm_name] = series
+            series.record(timestamp, values)
+
+            # Purga periódica de VMs eliminadas o detenidas hace tiempo
+            self._records += 1
+            if self._records % 10000 == 0:
+                self._prune(timestamp)
+
+    def _prune(self, now: float) -> None:
+        """Descartar VMs sin muestras recientes"""
+        limit = now - self.max_idle_seconds
+        for vm_name in list(self._series):
+            if self._series[vm_name].rings[TIERS[0][0]].last_timestamp() < limit:
+                del self._series[vm_name]
+
+    def query(self, vm_name: str, window_seconds: int,
+              resolution: Optional[str] = None,
+              include_points: bool = False) -> Optional[Dict]:
+        """
+        Resumir las métricas de una VM en una ventana de tiempo
+
+        Args:
+            vm_name: Nombre de la VM
+            window_seconds: Tamaño de la ventana hacia atrás desde la última muestra
+            resolution: Nivel a consultar (1s, 10s, 60s); si no se indica se usa
+                el más fino cuya retención cubre la ventana
+            include_points: Incluir la serie completa además del resumen
+
+        Returns:
+            Diccionario con el resumen por métrica o None si no hay historial
+        """
+        tier = self._select_tier(window_seconds, resolution)
+
+        with self._lock:
+            series = self._series.get(vm_name)
+            if series is None:
+                return None
+            ring = series.rings[tier]
+            end = series.rings[TIERS[0][0]].last_timestamp()
+            timestamps, values = ring.window(end - window_seconds)
+
+        result = {
+            "name": vm_name,
+            "resolution": tier,
+            "window_seconds": window_seconds,
+            "samples": int(timestamps.size),
+            "start": float(timestamps[0]) if timestamps.size else None,
+            "end": float(timestamps[-1]) if timestamps.size else None,
+            "metrics": {},
+        }
+
+        if timestamps.size:
+            minimums = values.min(axis=1)
+            averages = values.mean(axis=1, dtype=np.float64)
+            maximums = values.max(axis=1)
+            p95s = np.percentile(values, 95, axis=1)
+            for i, metric in enumerate(METRICS):
+                result["metrics"][metric] = {
+                    "min": float(minimums[i]),
+                    "avg": float(averages[i]),
+                    "max": float(maximums[i]),
+                    "p95": float(p95s[i]),
+                }
+
+        if include_points:
+            result["timestamps"] = timestamps.tolist()
+            result["points"] = {metric: values[i].tolist() for i, metric in enumerate(METRICS)}
+
+        return result
+
+    @staticmethod
+    def _select_tier(window_seconds: int, resolution: Optional[str]) -> str:
+        """Elegir el nivel de resolución para una ventana"""
+        names = [name for name, _, _ in TIERS]
+        if resolution:
+            if resolution not in names:
+                raise ValueError(f"Resolución '{resolution}' no soportada (usar {', '.join(names)})")
+            return resolution
+
+        for name, res, capacity in TIERS:
+            if res * capacity >= window_seconds:
+                return name
+        return names[-1]
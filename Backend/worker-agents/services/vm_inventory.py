@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Inventario en memoria de dominios libvirt
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import libvirt
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Set, Any
+
+from models.vm import VMInfo, VMState
+
+
+class DomainInventory:
+    """
+    Caché en memoria de la información de VMs del host
+
+    Se carga completa al arrancar el worker y se mantiene al día con los
+    eventos de ciclo de vida y de dispositivos de libvirt. Cada evento solo
+    invalida la entrada del dominio afectado; la entrada se vuelve a leer
+    de libvirt en la siguiente consulta.
+
+    Las entradas solo sirven los datos estructurales (estado, memoria
+    asignada, vCPUs, dispositivos). Los contadores de ejecución (memoria
+    usada, tiempo de CPU, uptime) no generan eventos: se toman de la última
+    muestra del DomainStatsSampler, así que las consultas no llaman a libvirt.
+    """
+
+    def __init__(self, vm_service):
+        """
+        Inicializar inventario
+
+        Args:
+            vm_service: VMService propietario (provee conexión y parseo de dominios)
+        """
+        self.vm_service = vm_service
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.RLock()
+        self._entries: Dict[str, VMInfo] = {}   # uuid -> VMInfo
+        self._by_name: Dict[str, str] = {}      # nombre -> uuid
+        self._stale: Set[str] = set()           # uuids pendientes de refrescar
+        self._totals = self._empty_totals()
+        self._ready = False
+
+        self._running = False
+        self._event_thread: Optional[threading.Thread] = None
+        self._callback_ids: List[int] = []
+        self._attached_conn: Optional[libvirt.virConnect] = None
+
+    @property
+    def ready(self) -> bool:
+        """Indica si el inventario está cargado y puede servir consultas"""
+        return self._ready
+
+    @property
+    def running(self) -> bool:
+        """Indica si el bucle de eventos está en marcha"""
+        return self._running
+
+    def start(self) -> None:
+        """Arrancar el bucle de eventos libvirt y cargar el inventario completo"""
+        if self._running:
+            return
+
+        # La implementación de eventos debe registrarse antes de abrir la conexión
+        libvirt.virEventRegisterDefaultImpl()
+        self.vm_service.close_connection()
+
+        self._running = True
+        self._event_thread = threading.Thread(
+            target=self._run_event_loop,
+            name="libvirt-events",
+            daemon=True
+        )
+        self._event_thread.start()
+
+        # Obtener una conexión registra los callbacks en la principal (ver VMService._get_connection)
+        self.vm_service._get_connection()
+        self.reload()
+
+    def stop(self) -> None:
+        """Detener el bucle de eventos y descartar el inventario"""
+        self._running = False
+        self._detach()
+        with self._lock:
+            self._ready = False
+            self._entries.clear()
+            self._by_name.clear()
+            self._stale.clear()
+
+    def _run_event_loop(self) -> None:
+        """Bucle de eventos libvirt (hilo en segundo plano)"""
+        # Timeout periódico para que el bucle detecte la parada
+        libvirt.virEventAddTimeout(1000, lambda timer, opaque: None, None)
+        while self._running:
+            try:
+                libvirt.virEventRunDefaultImpl()
+            except libvirt.libvirtError as e:
+                self.logger.error(f"Error en bucle de eventos libvirt: {e}")
+
+    def attach(self, conn: libvirt.virConnect) -> None:
+        """Registrar los callbacks de eventos en una conexión (nueva o reabierta)"""
+        if not self._running or conn is self._attached_conn:
+            return
+
+        self._detach()
+
+        events = [
+            (libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self._on_lifecycle),
+            (libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_ADDED, self._on_device_change),
+            (libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED, self._on_device_change),
+        ]
+        for event_id, callback in events:
+            self._callback_ids.append(conn.domainEventRegisterAny(None, event_id, callback, None))
+
+        conn.registerCloseCallback(self._on_connection_closed, None)
+        self._attached_conn = conn
+
+        # Los eventos perdidos mientras no había conexión obligan a refrescar todo
+        self.vm_service.device_cache.clear()
+        self.invalidate_all()
+        self.logger.info("Callbacks de eventos libvirt registrados")
+
+    def _detach(self) -> None:
+        """Eliminar los callbacks registrados en la conexión actual"""
+        conn = self._attached_conn
+        self._attached_conn = None
+        if conn is None:
+            return
+
+        for callback_id in self._callback_ids:
+            try:
+                conn.domainEventDeregisterAny(callback_id)
+            except libvirt.libvirtError:
+                pass
+        self._callback_ids = []
+
+        try:
+            conn.unregisterCloseCallback()
+        except libvirt.libvirtError:
+            pass
+
+    # Callbacks de eventos (se ejecutan en el hilo del bucle de eventos)
+    def _on_lifecycle(self, conn, domain, event, detail, opaque):
+        """Evento de ciclo de vida: solo se invalida el dominio afectado"""
+        uuid = domain.UUIDString()
+        # El XML solo cambia al (re)definir o eliminar el dominio
+        if event in (libvirt.VIR_DOMAIN_EVENT_DEFINED, libvirt.VIR_DOMAIN_EVENT_UNDEFINED):
+            self.vm_service.device_cache.invalidate(uuid)
+        if event == libvirt.VIR_DOMAIN_EVENT_UNDEFINED:
+            self.vm_service.snapshot_index.forget(uuid)
+            # Dominio eliminado fuera del worker: liberar su reserva, solo si
+            # sigue siendo la de este UUID (no la de una VM recreada)
+            self.vm_service.placement.release_domain(domain.name(), uuid)
+            self.remove(uuid)
+        else:
+            self.invalidate(uuid)
+
+    def _on_device_change(self, conn, domain, dev_alias, opaque):
+        """Hotplug/unplug de dispositivos: cambia discos o interfaces del dominio"""
+        self.vm_service.device_cache.invalidate(domain.UUIDString())
+        self.invalidate(domain.UUIDString())
+
+    def _on_connection_closed(self, conn, reason, opaque):
+        """La conexión se cerró: los callbacks ya no son válidos"""
+        self.logger.warning(f"Conexión libvirt cerrada (razón {reason}), inventario invalidado")
+        self._attached_conn = None
+        self._callback_ids = []
+        self.vm_service.connections.local.mark_broken(conn)
+        self.vm_service.device_cache.clear()
+        self.invalidate_all()
+
+    # Mantenimiento de entradas
+    def reload(self) -> None:
+        """Recargar el inventario completo desde libvirt"""
+        # Las invalidaciones que lleguen durante la lectura se conservan
+        with self._lock:
+            self._stale.clear()
+        self._load()
+
+    def _load(self) -> None:
+        """Leer todos los dominios y reemplazar las entradas (sin tocar _stale)"""
+        service = self.vm_service
+        conn = service._get_connection()
+
+        entries = {}
+        for record in service._list_domain_records(conn):
+            vm_info = service._build_vm_info(
+                record["domain"], record["info"], record["autostart"], record["persistent"]
+            )
+            entries[vm_info.uuid] = vm_info
+
+        with self._lock:
+            self._entries = entries
+            self._by_name = {vm_info.name: uuid for uuid, vm_info in entries.items()}
+            self._totals = self._empty_totals()
+            for vm_info in entries.values():
+                self._account(vm_info, 1)
+            self._ready = True
+
+        self.logger.info(f"Inventario de dominios cargado: {len(entries)} VMs")
+
+    def invalidate(self, uuid: str) -> None:
+        """Marcar un dominio para refrescarlo en la próxima consulta"""
+        with self._lock:
+            self._stale.add(uuid)
+
+    def invalidate_all(self) -> None:
+        """Marcar todos los dominios (y los posibles nuevos) para refrescar"""
+        with self._lock:
+            if self._ready:
+                self._stale.update(self._entries.keys())
+                self._stale.add("*")
+
+    def remove(self, uuid: str) -> None:
+        """Eliminar un dominio del inventario"""
+        with self._lock:
+            vm_info = self._entries.pop(uuid, None)
+            if vm_info is not None:
+                self._account(vm_info, -1)
+                if self._by_name.get(vm_info.name) == uuid:
+                    del self._by_name[vm_info.name]
+            self._stale.discard(uuid)
+
+    def _store(self, vm_info: VMInfo) -> None:
+        """Guardar o reemplazar la entrada de un dominio"""
+        previous = self._entries.get(vm_info.uuid)
+        if previous is not None:
+            self._account(previous, -1)
+            if previous.name != vm_info.name:
+                self._by_name.pop(previous.name, None)
+        self._entries[vm_info.uuid] = vm_info
+        self._by_name[vm_info.name] = vm_info.uuid
+        self._account(vm_info, 1)
+
+    @staticmethod
+    def _empty_totals() -> Dict[str, int]:
+        return {
+            "active": 0, "inactive": 0,
+            "vcpus": 0, "memory_mb": 0,
+            "active_vcpus": 0, "active_memory_mb": 0
+        }
+
+    def _account(self, vm_info: VMInfo, sign: int) -> None:
+        """Sumar (1) o restar (-1) un dominio de los contadores (con el lock tomado)"""
+        totals = self._totals
+        totals["vcpus"] += sign * vm_info.vcpus
+        totals["memory_mb"] += sign * vm_info.memory_mb
+        if vm_info.state == VMState.SHUTOFF:
+            totals["inactive"] += sign
+        else:
+            totals["active"] += sign
+            totals["active_vcpus"] += sign * vm_info.vcpus
+            totals["active_memory_mb"] += sign * vm_info.memory_mb
+
+    def _refresh_stale(self) -> None:
+        """Volver a leer de libvirt solo los dominios invalidados"""
+        with self._lock:
+            if not self._stale:
+                return
+            # Un evento que llegue durante la lectura vuelve a marcar el dominio
+            stale = set(self._stale)
+            self._stale.clear()
+
+        try:
+            # Invalidación global (reconexión): recargar todo
+            if "*" in stale:
+                self._load()
+                return
+            conn = self.vm_service._get_connection()
+        except (libvirt.libvirtError, RuntimeError):
+            with self._lock:
+                self._stale.update(stale)
+            raise
+
+        for uuid in stale:
+            try:
+                domain = conn.lookupByUUIDString(uuid)
+                vm_info = self.vm_service._get_vm_info(domain)
+            except libvirt.libvirtError as e:
+                if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
+                    # El dominio ya no existe (p.ej. transitorio detenido)
+                    self.remove(uuid)
+                else:
+                    self.logger.warning(f"Error refrescando dominio {uuid}: {e}")
+                    self.invalidate(uuid)
+                continue
+            except RuntimeError as e:
+                # Error transitorio (p.ej. conexión reiniciada): reintentar en la próxima consulta
+                self.logger.warning(f"Error refrescando dominio {uuid}: {e}")
+                self.invalidate(uuid)
+                continue
+
+            with self._lock:
+                self._store(vm_info)
+
+    def _with_runtime(self, entries: List[VMInfo]) -> List[VMInfo]:
+        """Completar memoria, tiempo de CPU y uptime con la última muestra del sampler"""
+        sampler = self.vm_service.stats_sampler
+        now = time.time()
+        result = []
+        for vm_info in entries:
+            if vm_info.state == VMState.SHUTOFF:
+                result.append(vm_info)
+                continue
+            history = sampler.history(vm_info.name)
+            if not history:
+                # Aún sin muestra (o sampler detenido): sin uptime conocido
+                result.append(vm_info.copy(update={"uptime": None}))
+                continue
+            sample = history[-1]
+            result.append(vm_info.copy(update={
+                # Mismo criterio que VMService._build_vm_info (memoria actual del dominio)
+                "memory_used_mb": sample.memory_total_kib // 1024,
+                "cpu_time": sample.cpu_time_ns,
+                "uptime": max(int(now - sample.started_at), 0)
+            }))
+        return result
+
+    # Consultas
+    def list(self) -> List[VMInfo]:
+        """Listar todas las VMs ordenadas por nombre"""
+        self._refresh_stale()
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda vm_info: vm_info.name)
+        return self._with_runtime(entries)
+
+    def get(self, vm_name: str) -> Optional[VMInfo]:
+        """Obtener una VM por nombre (None si no está en el inventario)"""
+        self._refresh_stale()
+        with self._lock:
+            uuid = self._by_name.get(vm_name)
+            vm_info = self._entries.get(uuid) if uuid else None
+        return self._with_runtime([vm_info])[0] if vm_info is not None else None
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Contadores mantenidos al día con cada alta, baja y refresco
+
+        Returns:
+            {active, inactive, vcpus, memory_mb, active_vcpus, active_memory_mb}
+            (vcpus/memory_mb suman todas las VMs definidas; active_* solo las activas)
+        """
+        self._refresh_stale()
+        with self._lock:
+            return dict(self._totals)
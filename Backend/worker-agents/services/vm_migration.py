@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Migraciones de VMs en segundo plano con seguimiento de progreso
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import libvirt
+import logging
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from models.vm import MigrationJob, MigrationProgress, MigrationStatus, VMMigrationConfig
+from services.libvirt_pool import LibvirtConnectionPool
+
+
+# Migraciones simultáneas hacia un mismo host destino
+MAX_MIGRATIONS_PER_HOST = 2
+
+# Migraciones simultáneas en total (hilos del pool)
+MIGRATION_WORKERS = 8
+
+# Segundos entre lecturas de jobStats
+PROGRESS_INTERVAL = 1.0
+
+# Trabajos terminados que se conservan para consulta
+FINISHED_JOBS_KEPT = 100
+
+FINAL_STATES = (MigrationStatus.COMPLETED, MigrationStatus.FAILED, MigrationStatus.CANCELLED)
+
+
+def _now() -> str:
+    return datetime.now().isoformat()
+
+
+class _MigrationCancelled(Exception):
+    """Cancelación pedida antes de que empezara el job de libvirt"""
+
+
+class MigrationManager:
+    """
+    Cola de migraciones en vivo
+
+    Cada migración es un trabajo: migrate3 bloquea su hilo del pool mientras
+    un hilo monitor lee domain.jobStats() cada segundo, publica el progreso y
+    aplica el ajuste en caliente (downtime máximo, cambio a post-copy). Las
+    conexiones a los hosts destino salen de los pools remotos de VMService
+    (una por hilo de migración, reutilizada entre migraciones) y un
+    semáforo por host limita cuántas se ejecutan a la vez contra cada uno;
+    las que esperan quedan en estado queued.
+    """
+
+    def __init__(self, vm_service, max_per_host: int = MAX_MIGRATIONS_PER_HOST,
+                 max_workers: int = MIGRATION_WORKERS):
+        """
+        Inicializar gestor
+
+        Args:
+            vm_service: VMService propietario (provee la conexión local)
+            max_per_host: Migraciones simultáneas por host destino
+            max_workers: Migraciones simultáneas en total
+        """
+        self.vm_service = vm_service
+        self.max_per_host = max_per_host
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, MigrationJob] = {}
+        self._active: Dict[str, str] = {}             # vm_name -> job_id
+        self._finished: Deque[str] = deque()
+        self._domains: Dict[str, libvirt.virDomain] = {}  # job_id -> dominio en migración
+        self._cancel_requested: Set[str] = set()           # job_ids en curso a abortar
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="migration")
+
+    def submit(self, vm_name: str, config: VMMigrationConfig) -> MigrationJob:
+        """
+        Encolar la migración de una VM
+
+        Raises:
+            RuntimeError: Si la VM no existe o ya tiene una migración en curso
+        """
+        try:
+            self.vm_service._get_connection().lookupByName(vm_name)
+        except libvirt.libvirtError:
+            raise RuntimeError(f"VM '{vm_name}' no encontrada")
+
+        job = MigrationJob(
+            job_id=uuid.uuid4().hex[:12],
+            vm_name=vm_name,
+            destination_host=config.destination_host,
+            status=MigrationStatus.QUEUED,
+            config=config,
+            created_at=_now()
+        )
+        with self._lock:
+            if vm_name in self._active:
+                raise RuntimeError(
+                    f"Ya existe una migración en curso de la VM '{vm_name}' ({self._active[vm_name]})"
+                )
+            self._jobs[job.job_id] = job
+            self._active[vm_name] = job.job_id
+            snapshot = job.copy(deep=True)
+
+        self._executor.submit(self._run, job.job_id)
+        self.logger.info(f"Migración {job.job_id} de VM {vm_name} a {config.destination_host} encolada")
+        return snapshot
+
+    def get(self, job_id: str) -> MigrationJob:
+        """
+        Estado de un trabajo
+
+        Raises:
+            RuntimeError: Si el trabajo no existe
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise RuntimeError(f"Migración '{job_id}' no encontrada")
+            return job.copy(deep=True)
+
+    def list_jobs(self, vm_name: Optional[str] = None) -> List[MigrationJob]:
+        """Trabajos en curso y terminados recientemente (más recientes primero)"""
+        with self._lock:
+            jobs = [
+                job.copy(deep=True) for job in self._jobs.values()
+                if vm_name is None or job.vm_name == vm_name
+            ]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> MigrationJob:
+        """
+        Cancelar un trabajo: si está en cola no llega a empezar, si está en
+        curso se aborta el job de libvirt (no es posible una vez en post-copy)
+
+        Raises:
+            RuntimeError: Si el trabajo no existe, ya terminó o está en post-copy
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                raise RuntimeError(f"Migración '{job_id}' no encontrada")
+            if job.status in FINAL_STATES:
+                raise RuntimeError(f"La migración '{job_id}' ya terminó ({job.status.value})")
+            if job.status == MigrationStatus.POSTCOPY:
+                raise RuntimeError(f"La migración '{job_id}' está en post-copy y no puede cancelarse")
+            if job.status == MigrationStatus.QUEUED:
+                self._finish(job, MigrationStatus.CANCELLED)
+                return job.copy(deep=True)
+            # Si migrate3 aún no empezó (p.ej. conectando al destino), _migrate
+            # no llega a lanzarlo; si empezó y abortJob se adelanta, el monitor
+            # lo repite en cuanto libvirt publique el job
+            self._cancel_requested.add(job_id)
+            domain = self._domains.get(job_id)
+
+        if domain is not None:
+            try:
+                domain.abortJob()
+            except libvirt.libvirtError as e:
+                if e.get_error_code() != libvirt.VIR_ERR_OPERATION_INVALID:
+                    raise RuntimeError(f"Error cancelando migración '{job_id}': {e}")
+            else:
+                with self._lock:
+                    self._cancel_requested.discard(job_id)
+        self.logger.info(f"Cancelación de la migración {job_id} solicitada")
+        return self.get(job_id)
+
+    def shutdown(self) -> None:
+        """Detener el pool de migraciones (las conexiones las cierra VMService)"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            host = job.destination_host
+            slot = self._host_slots.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+
+        with slot:
+            with self._lock:
+                if job.status == MigrationStatus.CANCELLED:
+                    return
+                job.status = MigrationStatus.RUNNING
+                job.started_at = _now()
+            try:
+                self._migrate(job)
+            except _MigrationCancelled:
+                self._cancelled(job)
+            except libvirt.libvirtError as e:
+                if e.get_error_code() == libvirt.VIR_ERR_OPERATION_ABORTED:
+                    self._cancelled(job)
+                else:
+                    self._fail(job, e)
+            except Exception as e:
+                self._fail(job, e)
+            else:
+                with self._lock:
+                    job.progress.percent = 100.0
+                    job.progress.data_remaining = 0
+                    self._finish(job, MigrationStatus.COMPLETED)
+                self.logger.info(f"Migración {job_id} de VM {job.vm_name} completada")
+            finally:
+                with self._lock:
+                    self._domains.pop(job_id, None)
+                    self._cancel_requested.discard(job_id)
+
+    def _migrate(self, job: MigrationJob) -> None:
+        config = job.config
+        domain = self.vm_service._get_connection().lookupByName(job.vm_name)
+        dest_pool = self._destination_pool(job.destination_host)
+        dest_conn = dest_pool.get()
+
+        flags = libvirt.VIR_MIGRATE_PEER2PEER
+        if config.live:
+            flags |= libvirt.VIR_MIGRATE_LIVE
+        if config.compressed:
+            flags |= libvirt.VIR_MIGRATE_COMPRESSED
+        if config.auto_converge:
+            flags |= libvirt.VIR_MIGRATE_AUTO_CONVERGE
+        if config.postcopy:
+            flags |= libvirt.VIR_MIGRATE_POSTCOPY
+
+        params: Dict[str, Any] = {}
+        if config.bandwidth_mbps:
+            params[libvirt.VIR_MIGRATE_PARAM_BANDWIDTH] = config.bandwidth_mbps
+        if config.parallel_connections:
+            flags |= libvirt.VIR_MIGRATE_PARALLEL
+            params[libvirt.VIR_MIGRATE_PARAM_PARALLEL_CONNECTIONS] = config.parallel_connections
+
+        with self._lock:
+            if job.job_id in self._cancel_requested:
+                raise _MigrationCancelled()
+            self._domains[job.job_id] = domain
+
+        stop = threading.Event()
+        monitor = threading.Thread(
+            target=self._monitor, args=(job, domain, stop),
+            name=f"migration-monitor-{job.job_id}", daemon=True
+        )
+        monitor.start()
+        try:
+            domain.migrate3(dest_conn, params, flags)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() in (libvirt.VIR_ERR_SYSTEM_ERROR, libvirt.VIR_ERR_RPC):
+                # Conexión al destino rota: no reutilizarla
+                dest_pool.mark_broken(dest_conn)
+            raise
+        finally:
+            stop.set()
+            monitor.join()
+
+    def _monitor(self, job: MigrationJob, domain: libvirt.virDomain, stop: threading.Event) -> None:
+        """Leer jobStats periódicamente y aplicar el ajuste en caliente"""
+        config = job.config
+        downtime_set = config.max_downtime_ms is None
+        postcopy_started = False
+        abort_sent = False
+
+        while not stop.wait(PROGRESS_INTERVAL):
+            try:
+                stats = domain.jobStats()
+            except libvirt.libvirtError:
+                continue
+            if stats.get("type", libvirt.VIR_DOMAIN_JOB_NONE) == libvirt.VIR_DOMAIN_JOB_NONE:
+                continue
+
+            progress = self._progress(stats)
+            with self._lock:
+                job.progress = progress
+                abort = job.job_id in self._cancel_requested and not abort_sent
+
+            try:
+                if abort:
+                    # Cancelación que llegó antes de que libvirt iniciara el job
+                    abort_sent = True
+                    domain.abortJob()
+                    continue
+                # Solo tiene efecto con el job de migración ya iniciado
+                if not downtime_set:
+                    domain.migrateSetMaxDowntime(config.max_downtime_ms, 0)
+                    downtime_set = True
+                if (config.postcopy and not postcopy_started
+                        and progress.memory_iteration >= config.postcopy_after_iterations):
+                    domain.migrateStartPostCopy(0)
+                    postcopy_started = True
+                    with self._lock:
+                        job.status = MigrationStatus.POSTCOPY
+                    self.logger.info(
+                        f"Migración {job.job_id}: cambio a post-copy tras "
+                        f"{progress.memory_iteration} iteraciones"
+                    )
+            except libvirt.libvirtError as e:
+                self.logger.warning(f"Migración {job.job_id}: ajuste no aplicado: {e}")
+
+    @staticmethod
+    def _progress(stats: Dict[str, Any]) -> MigrationProgress:
+        total = stats.get("data_total", 0)
+        processed = stats.get("data_processed", 0)
+        return MigrationProgress(
+            data_total=total,
+            data_processed=processed,
+            data_remaining=stats.get("data_remaining", 0),
+            memory_dirty_rate=stats.get("memory_dirty_rate", 0),
+            memory_iteration=stats.get("memory_iteration", 0),
+            downtime_ms=stats.get("downtime"),
+            elapsed_ms=stats.get("time_elapsed", 0),
+            percent=round(processed * 100 / total, 2) if total else 0.0
+        )
+
+    def _destination_pool(self, host: str) -> LibvirtConnectionPool:
+        """Pool de conexiones al libvirt del host destino (compartido con VMService)"""
+        return self.vm_service.connections.remote(f"qemu+ssh://{host}/system")
+
+    def _cancelled(self, job: MigrationJob) -> None:
+        with self._lock:
+            self._finish(job, MigrationStatus.CANCELLED)
+        self.logger.info(f"Migración {job.job_id} de VM {job.vm_name} cancelada")
+
+    def _fail(self, job: MigrationJob, error: Exception) -> None:
+        with self._lock:
+            job.error = str(error)
+            self._finish(job, MigrationStatus.FAILED)
+        self.logger.error(f"Migración {job.job_id} de VM {job.vm_name} fallida: {error}")
+
+    def _finish(self, job: MigrationJob, status: MigrationStatus) -> None:
+        """Cerrar un trabajo (con el lock tomado) y podar los terminados antiguos"""
+        job.status = status
+        job.finished_at = _now()
+        if self._active.get(job.vm_name) == job.job_id:
+            del self._active[job.vm_name]
+        self._finished.append(job.job_id)
+        while len(self._finished) > FINISHED_JOBS_KEPT:
+            self._jobs.pop(self._finished.popleft(), None)
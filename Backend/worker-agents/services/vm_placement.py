@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Colocación de VMs en la topología NUMA del host con vCPUs fijadas
+TeleCluster Orchestrator - Worker Agent
+
+Sin <cputune>/<numatune> el planificador del kernel mueve las vCPUs de un
+socket a otro y la memoria de la VM acaba repartida entre nodos, con la
+latencia de acceso remoto que eso implica en los workers de dos sockets.
+El motor elige un nodo (o varios si la VM no cabe en uno), fija cada vCPU a
+una CPU física y restringe la memoria a esos nodos.
+
+Políticas:
+- pack: llenar primero el nodo más ocupado en el que la VM quepa, dejando
+  nodos enteros libres para VMs grandes
+- spread: usar el nodo menos ocupado, repartiendo la carga entre sockets
+- isolate: cores físicos completos (con sus hermanos SMT) reservados en
+  exclusiva; ninguna otra VM fijada puede usarlos
+
+Dentro del nodo elegido cada vCPU va a la CPU física con menos vCPUs
+fijadas. Las políticas compartidas admiten hasta MAX_VCPUS_PER_PCPU vCPUs
+por CPU física.
+
+Las VMs con hugepages (con o sin política) reservan además páginas del pool
+de su tamaño: del nodo elegido si la memoria es strict y del pool global en
+cualquier caso. Una VM que dejaría un pool con más páginas comprometidas que
+reservadas en el kernel se rechaza al crearla, en lugar de fallar al
+arrancar.
+"""
+
+import libvirt
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from models.vm import HugepagePoolStatus, NUMACell, NodeUsage, PlacementPolicy, VMConfig
+from services.host_capacity import memory_to_kib
+from services.hugepages import read_pools
+
+
+# vCPUs fijadas por CPU física en las políticas compartidas (pack/spread)
+MAX_VCPUS_PER_PCPU = 4
+
+# Espacio de nombres de los metadatos del worker en el XML de dominio
+PLACEMENT_NS = "https://telecluster.local/xmlns/placement"
+
+
+class Placement(NamedTuple):
+    """Resultado de colocar una VM"""
+    policy: PlacementPolicy
+    vcpu_pins: List[int]          # CPU física de cada vCPU
+    emulator_cpus: List[int]      # CPUs de los hilos del emulador (QEMU, E/S)
+    nodes: List[int]              # Nodos NUMA de la memoria
+    memory_mode: str              # strict (un nodo) o interleave (varios)
+    memory_mb: int
+    exclusive: List[int]          # CPUs reservadas en exclusiva (isolate)
+
+
+class HugepageReservation(NamedTuple):
+    """Hugepages comprometidas por una VM"""
+    size_kib: int
+    pages: int
+    nodes: List[int]              # Nodos de los que salen (vacío = cualquiera)
+
+
+def parse_cpuset(cpuset: str) -> Set[int]:
+    """Convertir una lista de CPUs de libvirt ("0-3,8,^2") en un conjunto"""
+    cpus: Set[int] = set()
+    excluded: Set[int] = set()
+    for part in cpuset.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        target = excluded if part.startswith("^") else cpus
+        part = part.lstrip("^")
+        if "-" in part:
+            start, end = part.split("-", 1)
+            target.update(range(int(start), int(end) + 1))
+        else:
+            target.add(int(part))
+    return cpus - excluded
+
+
+def format_cpuset(cpus: Iterable[int]) -> str:
+    """Convertir CPUs en una lista compacta de libvirt ("0-3,8")"""
+    ordered = sorted(set(cpus))
+    ranges = []
+    start = prev = None
+    for cpu in ordered:
+        if start is None:
+            start = prev = cpu
+        elif cpu == prev + 1:
+            prev = cpu
+        else:
+            ranges.append(f"{start}-{prev}" if prev > start else str(start))
+            start = prev = cpu
+    if start is not None:
+        ranges.append(f"{start}-{prev}" if prev > start else str(start))
+    return ",".join(ranges)
+
+
+class PlacementEngine:
+    """
+    Reserva de CPUs físicas y memoria por nodo NUMA
+
+    El uso se reconstruye una vez de los <cputune>/<numatune> de los dominios
+    definidos (la política viene de los metadatos del worker) y después se
+    actualiza con cada alta y baja hecha por el worker, y con los eventos de
+    undefine de dominios eliminados fuera de él (virsh, migración).
+    """
+
+    def __init__(self, vm_service):
+        """
+        Inicializar motor
+
+        Args:
+            vm_service: VMService propietario (provee conexión y capacidad del host)
+        """
+        self.vm_service = vm_service
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._usage: Dict[int, int] = {}              # CPU física -> vCPUs fijadas
+        self._exclusive: Set[int] = set()
+        self._node_memory: Dict[int, int] = {}        # nodo -> MB comprometidos
+        self._domains: Dict[str, Placement] = {}      # nombre -> colocación
+        self._hugepages: Dict[str, HugepageReservation] = {}
+        self._uuids: Dict[str, str] = {}              # nombre -> UUID del dominio definido
+
+    def place(self, config: VMConfig) -> Optional[Placement]:
+        """
+        Elegir y reservar CPUs, nodos y hugepages para una VM
+
+        Returns:
+            Colocación reservada, o None si la VM no pide colocación
+
+        Raises:
+            RuntimeError: Si no hay capacidad para la política pedida o
+                no quedan hugepages en el pool
+        """
+        if config.placement == PlacementPolicy.NONE and config.hugepages is None:
+            return None
+        cells = self._cells()
+
+        with self._lock:
+            self._ensure_loaded()
+            # Reserva de un dominio con ese nombre eliminado fuera del worker
+            self._unreserve(config.name)
+
+            pages = 0
+            available = None
+            if config.hugepages is not None:
+                pages = config.memory_mb * 1024 // config.hugepages.size_kib
+                available = self._hugepages_available(config.hugepages.size_kib, cells)
+                if available.get(None, 0) < pages:
+                    raise RuntimeError(
+                        f"Sin capacidad de hugepages {config.hugepages.value} para la VM "
+                        f"'{config.name}' (necesita {pages}, disponibles {available.get(None, 0)})"
+                    )
+
+            placement = None
+            if config.placement != PlacementPolicy.NONE:
+                if config.placement == PlacementPolicy.ISOLATE:
+                    placement = self._place_isolated(config, cells, pages, available)
+                else:
+                    placement = self._place_shared(config, cells, pages, available)
+                if placement is None:
+                    raise RuntimeError(
+                        f"Sin capacidad NUMA para la VM '{config.name}' "
+                        f"({config.vcpus} vCPUs, {config.memory_mb} MB, política {config.placement.value})"
+                    )
+                self._reserve(config.name, placement)
+
+            if pages:
+                self._hugepages[config.name] = HugepageReservation(
+                    config.hugepages.size_kib, pages, placement.nodes if placement else []
+                )
+
+        if placement is not None:
+            self.logger.info(
+                f"VM {config.name} colocada ({placement.policy.value}): nodos {placement.nodes}, "
+                f"vCPUs en {format_cpuset(placement.vcpu_pins)}"
+            )
+        return placement
+
+    def release(self, vm_name: str) -> None:
+        """Liberar las CPUs y la memoria reservadas para una VM"""
+        with self._lock:
+            self._unreserve(vm_name)
+
+    def bind(self, vm_name: str, uuid: str) -> None:
+        """Asociar la reserva de una VM al UUID del dominio ya definido"""
+        with self._lock:
+            if vm_name in self._domains or vm_name in self._hugepages:
+                self._uuids[vm_name] = uuid
+
+    def release_domain(self, vm_name: str, uuid: str) -> bool:
+        """
+        Liberar la reserva de un dominio eliminado, solo si es la de ese UUID
+
+        Una VM recreada con el mismo nombre tiene otro UUID (o aún ninguno, si
+        no se ha definido), así que un evento de undefine atrasado no libera
+        su reserva.
+
+        Returns:
+            True si había una reserva de ese dominio
+        """
+        with self._lock:
+            if self._uuids.get(vm_name) != uuid:
+                return False
+            self._unreserve(vm_name)
+            return True
+
+    def usage(self) -> List[NodeUsage]:
+        """Uso por nodo NUMA: vCPUs fijadas, CPUs exclusivas y memoria comprometida"""
+        cells = self._cells()
+        with self._lock:
+            self._ensure_loaded()
+            return [
+                NodeUsage(
+                    node=cell.id,
+                    cpus=len(cell.cpus),
+                    pinned_vcpus=sum(self._usage.get(cpu, 0) for cpu in cell.cpus),
+                    exclusive_cpus=len(self._exclusive.intersection(cell.cpus)),
+                    memory_mb=cell.memory_mb,
+                    committed_memory_mb=self._node_memory.get(cell.id, 0)
+                )
+                for cell in cells
+            ]
+
+    def hugepage_pools(self) -> List[HugepagePoolStatus]:
+        """Pools de hugepages del host (global y por nodo) con las páginas comprometidas"""
+        cells = self._cells()
+        with self._lock:
+            self._ensure_loaded()
+            committed = {
+                size_kib: self._hugepages_committed(size_kib)
+                for size_kib in {reservation.size_kib for reservation in self._hugepages.values()}
+            }
+
+        pools = []
+        for node in [None] + [cell.id for cell in cells]:
+            for size_kib, counters in sorted(read_pools(node).items()):
+                used = committed.get(size_kib, {}).get(node, 0)
+                pools.append(HugepagePoolStatus(
+                    size_kib=size_kib,
+                    node=node,
+                    total=counters.total,
+                    free=counters.free,
+                    reserved=counters.reserved,
+                    committed=used,
+                    available=max(counters.total - used, 0)
+                ))
+        return pools
+
+    def reset(self) -> None:
+        """Descartar el uso conocido; se reconstruye en la próxima colocación"""
+        with self._lock:
+            self._loaded = False
+
+    def _cells(self) -> List[NUMACell]:
+        capacity = self.vm_service.capacity.get()
+        if capacity.numa_cells:
+            return capacity.numa_cells
+        # Host sin topología NUMA en las capacidades: un único nodo
+        return [NUMACell(id=0, memory_mb=capacity.memory_mb, cpus=list(range(capacity.cpu_count)))]
+
+    def _free_memory(self, cell: NUMACell) -> int:
+        return cell.memory_mb - self._node_memory.get(cell.id, 0)
+
+    def _fits_memory(self, cell: NUMACell, memory_mb: int, pages: int,
+                     available: Optional[Dict[Optional[int], int]]) -> bool:
+        if self._free_memory(cell) < memory_mb:
+            return False
+        if available is None:
+            return True
+        # Host sin pools por nodo en sysfs: solo cuenta el global
+        return available.get(cell.id, available.get(None, 0)) >= pages
+
+    def _hugepages_committed(self, size_kib: int) -> Dict[Optional[int], int]:
+        """Páginas comprometidas de un tamaño por pool (None = global)"""
+        committed: Dict[Optional[int], int] = {None: 0}
+        for reservation in self._hugepages.values():
+            if reservation.size_kib != size_kib:
+                continue
+            committed[None] += reservation.pages
+            for node in reservation.nodes:
+                share = reservation.pages // len(reservation.nodes)
+                committed[node] = committed.get(node, 0) + share
+        return committed
+
+    def _hugepages_available(self, size_kib: int, cells: List[NUMACell]) -> Dict[Optional[int], int]:
+        """Páginas de un tamaño aún sin comprometer por pool (None = global)"""
+        committed = self._hugepages_committed(size_kib)
+        available = {}
+        for node in [None] + [cell.id for cell in cells]:
+            pool = read_pools(node).get(size_kib)
+            if pool is not None:
+                available[node] = pool.total - committed.get(node, 0)
+        return available
+
+    def _load(self, cell: NUMACell) -> int:
+        return sum(self._usage.get(cpu, 0) for cpu in cell.cpus)
+
+    def _shared_cpus(self, cells: List[NUMACell]) -> List[int]:
+        """CPUs con hueco para otra vCPU, de menos a más cargada"""
+        cpus = [
+            cpu for cell in cells for cpu in cell.cpus
+            if cpu not in self._exclusive and self._usage.get(cpu, 0) < MAX_VCPUS_PER_PCPU
+        ]
+        return sorted(cpus, key=lambda cpu: (self._usage.get(cpu, 0), cpu))
+
+    def _place_shared(self, config: VMConfig, cells: List[NUMACell], pages: int = 0,
+                      available: Optional[Dict[Optional[int], int]] = None) -> Optional[Placement]:
+        fitting = [
+            cell for cell in cells
+            if self._fits_memory(cell, config.memory_mb, pages, available)
+            and len(self._shared_cpus([cell])) >= config.vcpus
+        ]
+        if fitting:
+            if config.placement == PlacementPolicy.PACK:
+                cell = max(fitting, key=lambda cell: (self._load(cell), -cell.id))
+            else:
+                cell = min(fitting, key=lambda cell: (self._load(cell), cell.id))
+            pins = self._shared_cpus([cell])[:config.vcpus]
+            return Placement(
+                config.placement, pins, sorted(set(pins)), [cell.id], "strict",
+                config.memory_mb, []
+            )
+
+        # No cabe en un nodo: repartir entre nodos con la memoria intercalada
+        cpus = self._shared_cpus(cells)
+        if len(cpus) < config.vcpus:
+            return None
+        pins = cpus[:config.vcpus]
+        nodes = sorted({cell.id for cell in cells if set(pins).intersection(cell.cpus)})
+        used = [cell for cell in cells if cell.id in nodes]
+        if not all(self._fits_memory(cell, config.memory_mb // len(used), pages // len(used), available)
+                   for cell in used):
+            nodes = [cell.id for cell in cells]
+            if not all(self._fits_memory(cell, config.memory_mb // len(cells), pages // len(cells), available)
+                       for cell in cells):
+                return None
+        return Placement(
+            config.placement, pins, sorted(set(pins)), nodes, "interleave",
+            config.memory_mb, []
+        )
+
+    def _place_isolated(self, config: VMConfig, cells: List[NUMACell], pages: int = 0,
+                        available: Optional[Dict[Optional[int], int]] = None) -> Optional[Placement]:
+        best = None
+        for cell in cells:
+            if not self._fits_memory(cell, config.memory_mb, pages, available):
+                continue
+            cores = self._free_cores(cell)
+            chosen: List[List[int]] = []
+            threads = 0
+            for core in cores:
+                if threads >= config.vcpus:
+                    break
+                chosen.append(core)
+                threads += len(core)
+            if threads < config.vcpus:
+                continue
+            # Mejor ajuste: el nodo con menos cores libres en el que cabe
+            if best is None or len(cores) < best[0]:
+                best = (len(cores), cell, chosen)
+
+        if best is None:
+            return None
+        _, cell, chosen = best
+        exclusive = sorted(cpu for core in chosen for cpu in core)
+        pins = exclusive[:config.vcpus]
+        # Los hilos del emulador van a las CPUs compartidas del nodo
+        housekeeping = [
+            cpu for cpu in cell.cpus if cpu not in self._exclusive and cpu not in exclusive
+        ]
+        return Placement(
+            config.placement, pins, housekeeping or exclusive, [cell.id], "strict",
+            config.memory_mb, exclusive
+        )
+
+    def _free_cores(self, cell: NUMACell) -> List[List[int]]:
+        """Cores físicos del nodo sin ninguna vCPU fijada ni reserva exclusiva"""
+        cores = []
+        seen: Set[int] = set()
+        for cpu in cell.cpus:
+            if cpu in seen:
+                continue
+            siblings = sorted(parse_cpuset(cell.siblings.get(cpu, str(cpu))))
+            seen.update(siblings)
+            if all(self._usage.get(sibling, 0) == 0 and sibling not in self._exclusive
+                   for sibling in siblings):
+                cores.append(siblings)
+        return cores
+
+    def _reserve(self, vm_name: str, placement: Placement) -> None:
+        """Registrar una colocación (con el lock tomado)"""
+        for cpu in placement.vcpu_pins:
+            self._usage[cpu] = self._usage.get(cpu, 0) + 1
+        self._exclusive.update(placement.exclusive)
+        share = placement.memory_mb // len(placement.nodes)
+        for node in placement.nodes:
+            self._node_memory[node] = self._node_memory.get(node, 0) + share
+        self._domains[vm_name] = placement
+
+    def _unreserve(self, vm_name: str) -> None:
+        """Deshacer la reserva de una VM (con el lock tomado)"""
+        self._uuids.pop(vm_name, None)
+        self._hugepages.pop(vm_name, None)
+        placement = self._domains.pop(vm_name, None)
+        if placement is None:
+            return
+        for cpu in placement.vcpu_pins:
+            self._usage[cpu] = max(self._usage.get(cpu, 0) - 1, 0)
+        self._exclusive.difference_update(placement.exclusive)
+        share = placement.memory_mb // len(placement.nodes)
+        for node in placement.nodes:
+            self._node_memory[node] = max(self._node_memory.get(node, 0) - share, 0)
+
+    def _ensure_loaded(self) -> None:
+        """Reconstruir el uso desde los dominios definidos (con el lock tomado)"""
+        if self._loaded:
+            return
+        self._usage, self._exclusive, self._node_memory, self._domains = {}, set(), {}, {}
+        self._hugepages, self._uuids = {}, {}
+        try:
+            domains = self.vm_service._get_connection().listAllDomains(0)
+        except libvirt.libvirtError as e:
+            raise RuntimeError(f"Error leyendo colocación de dominios: {e}")
+
+        for domain in domains:
+            try:
+                root = ET.fromstring(domain.XMLDesc(0))
+                placement = self._from_xml(root)
+                hugepages = self._hugepages_from_xml(root, placement)
+            except (libvirt.libvirtError, ET.ParseError, ValueError) as e:
+                self.logger.warning(f"No se pudo leer la colocación de un dominio: {e}")
+                continue
+            if placement is not None:
+                self._reserve(domain.name(), placement)
+            if hugepages is not None:
+                self._hugepages[domain.name()] = hugepages
+            if placement is not None or hugepages is not None:
+                self._uuids[domain.name()] = domain.UUIDString()
+        self._loaded = True
+        self.logger.info(f"Colocación NUMA sincronizada: {len(self._domains)} VMs fijadas")
+
+    @staticmethod
+    def _from_xml(root: ET.Element) -> Optional[Placement]:
+        pins = {
+            int(pin.get("vcpu")): min(parse_cpuset(pin.get("cpuset")))
+            for pin in root.iterfind("cputune/vcpupin")
+        }
+        if not pins:
+            return None
+
+        policy = PlacementPolicy.PACK
+        meta = root.find(f"metadata/{{{PLACEMENT_NS}}}placement")
+        if meta is not None:
+            policy = PlacementPolicy(meta.get("policy", PlacementPolicy.PACK.value))
+
+        memory = root.find("numatune/memory")
+        nodes = sorted(parse_cpuset(memory.get("nodeset", ""))) if memory is not None else [0]
+        memory_mode = memory.get("mode", "strict") if memory is not None else "strict"
+        memory_kib = _memory_kib(root)
+
+        vcpu_pins = [pins[vcpu] for vcpu in sorted(pins)]
+        emulator = root.find("cputune/emulatorpin")
+        emulator_cpus = sorted(parse_cpuset(emulator.get("cpuset"))) if emulator is not None else vcpu_pins
+        exclusive = []
+        if policy == PlacementPolicy.ISOLATE:
+            # Cores completos: puede incluir hermanos SMT sin vCPU asignada
+            exclusive = sorted(parse_cpuset(meta.get("exclusive", format_cpuset(vcpu_pins))))
+        return Placement(
+            policy, vcpu_pins, emulator_cpus, nodes or [0], memory_mode, memory_kib // 1024, exclusive
+        )
+
+    @staticmethod
+    def _hugepages_from_xml(root: ET.Element, placement: Optional[Placement]) -> Optional[HugepageReservation]:
+        backing = root.find("memoryBacking/hugepages")
+        if backing is None:
+            return None
+        page = backing.find("page")
+        size_kib = 2048
+        if page is not None:
+            size_kib = memory_to_kib(int(page.get("size")), page.get("unit"))
+        return HugepageReservation(
+            size_kib, _memory_kib(root) // size_kib, placement.nodes if placement else []
+        )
+
+
+def _memory_kib(root: ET.Element) -> int:
+    memory = root.find("memory")
+    if memory is None:
+        return 0
+    return memory_to_kib(int(memory.text), memory.get("unit"))
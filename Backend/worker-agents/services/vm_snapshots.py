@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Índice en memoria de los snapshots de cada VM
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import libvirt
+import logging
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+
+from models.vm import VMSnapshot, VMState
+
+
+class _SnapshotTree:
+    """Snapshots de un dominio en orden de creación, con su padre y el actual"""
+
+    __slots__ = ("snapshots", "current")
+
+    def __init__(self):
+        self.snapshots: Dict[str, VMSnapshot] = {}
+        self.current: Optional[str] = None
+
+
+def snapshot_from_xml(vm_name: str, xml_desc: str) -> VMSnapshot:
+    """Construir un VMSnapshot desde el XML de libvirt (<domainsnapshot>)"""
+    root = ET.fromstring(xml_desc)
+    description = root.findtext("description")
+    parent = root.findtext("parent/name")
+    memory = root.find("memory")
+    state = root.findtext("state")
+    try:
+        snapshot_state = VMState(state) if state else VMState.SHUTOFF
+    except ValueError:
+        snapshot_state = VMState.NOSTATE
+    return VMSnapshot(
+        name=root.findtext("name"),
+        vm_name=vm_name,
+        created_at=root.findtext("creationTime") or "",
+        description=description or None,
+        state=snapshot_state,
+        memory_snapshot=memory is not None and memory.get("snapshot", "no") != "no",
+        parent=parent
+    )
+
+
+def _creation_order(snapshot: VMSnapshot) -> int:
+    return int(snapshot.created_at) if snapshot.created_at.isdigit() else 0
+
+
+class SnapshotIndex:
+    """
+    Metadatos de snapshots por dominio (UUID)
+
+    El árbol de un dominio se construye la primera vez que se consulta (un
+    getXMLDesc por snapshot) y después se mantiene con las operaciones del
+    propio worker: crear, eliminar y revertir. Las consultas comparan el
+    número de snapshots y el snapshot actual (nombre y hora de creación) con
+    los del árbol para detectar cambios hechos fuera del worker (virsh), en
+    cuyo caso se reconstruye: un snapshot-delete seguido de snapshot-create
+    deja el mismo número, pero el nuevo pasa a ser el actual.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._trees: Dict[str, _SnapshotTree] = {}
+
+    def list(self, domain: libvirt.virDomain, offset: int = 0, limit: Optional[int] = None,
+             current_chain: bool = False) -> Tuple[List[VMSnapshot], int, Optional[str]]:
+        """
+        Listar snapshots de un dominio
+
+        Args:
+            domain: Dominio libvirt
+            offset: Snapshots a saltar
+            limit: Máximo de snapshots devueltos (None = todos)
+            current_chain: Solo el snapshot actual y sus ancestros (del actual a la raíz)
+
+        Returns:
+            (página de snapshots, total tras el filtro, nombre del snapshot actual)
+        """
+        tree = self._tree(domain)
+        with self._lock:
+            if current_chain:
+                snapshots = []
+                name = tree.current
+                while name is not None and name in tree.snapshots:
+                    snapshots.append(tree.snapshots[name])
+                    name = tree.snapshots[name].parent
+            else:
+                snapshots = list(tree.snapshots.values())
+            current = tree.current
+
+        end = None if limit is None else offset + limit
+        page = [
+            snapshot.copy(update={"current": snapshot.name == current})
+            for snapshot in snapshots[offset:end]
+        ]
+        return page, len(snapshots), current
+
+    def added(self, domain: libvirt.virDomain, snapshot: VMSnapshot) -> None:
+        """Registrar un snapshot recién creado (pasa a ser el actual)"""
+        with self._lock:
+            tree = self._trees.get(domain.UUIDString())
+            if tree is None:
+                return
+            tree.snapshots[snapshot.name] = snapshot
+            tree.current = snapshot.name
+
+    def deleted(self, domain: libvirt.virDomain, name: str) -> None:
+        """Quitar un snapshot; sus hijos pasan a colgar de su padre, como hace libvirt"""
+        with self._lock:
+            tree = self._trees.get(domain.UUIDString())
+            if tree is None:
+                return
+            removed = tree.snapshots.pop(name, None)
+            if removed is None:
+                return
+            for child_name, child in tree.snapshots.items():
+                if child.parent == name:
+                    tree.snapshots[child_name] = child.copy(update={"parent": removed.parent})
+            if tree.current == name:
+                tree.current = removed.parent
+
+    def reverted(self, domain: libvirt.virDomain, name: str) -> None:
+        """Marcar el snapshot al que se revirtió como actual"""
+        with self._lock:
+            tree = self._trees.get(domain.UUIDString())
+            if tree is not None and name in tree.snapshots:
+                tree.current = name
+
+    def forget(self, uuid: str) -> None:
+        """Descartar el árbol de un dominio (eliminado o redefinido)"""
+        with self._lock:
+            self._trees.pop(uuid, None)
+
+    def clear(self) -> None:
+        """Descartar todos los árboles"""
+        with self._lock:
+            self._trees.clear()
+
+    def _tree(self, domain: libvirt.virDomain) -> _SnapshotTree:
+        uuid = domain.UUIDString()
+        signature = self._signature(domain)
+        with self._lock:
+            tree = self._trees.get(uuid)
+            if tree is not None and self._tree_signature(tree) == signature:
+                return tree
+
+        tree = self._build(domain)
+        with self._lock:
+            self._trees[uuid] = tree
+        return tree
+
+    @staticmethod
+    def _signature(domain: libvirt.virDomain) -> Tuple[int, Optional[str], Optional[str]]:
+        """(número de snapshots, actual, hora de creación del actual) según libvirt"""
+        count = domain.snapshotNum()
+        if count == 0:
+            return 0, None, None
+        try:
+            current = domain.snapshotCurrent()
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN_SNAPSHOT:
+                return count, None, None
+            raise
+        root = ET.fromstring(current.getXMLDesc())
+        return count, current.getName(), root.findtext("creationTime") or ""
+
+    @staticmethod
+    def _tree_signature(tree: _SnapshotTree) -> Tuple[int, Optional[str], Optional[str]]:
+        """Misma firma calculada con el árbol en memoria (con el lock tomado)"""
+        current = tree.snapshots.get(tree.current) if tree.current else None
+        if current is None:
+            return len(tree.snapshots), None, None
+        return len(tree.snapshots), current.name, current.created_at
+
+    def _build(self, domain: libvirt.virDomain) -> _SnapshotTree:
+        vm_name = domain.name()
+        snapshots = [
+            snapshot_from_xml(vm_name, snap.getXMLDesc())
+            for snap in domain.listAllSnapshots()
+        ]
+
+        tree = _SnapshotTree()
+        for snapshot in sorted(snapshots, key=_creation_order):
+            tree.snapshots[snapshot.name] = snapshot
+        if domain.hasCurrentSnapshot():
+            tree.current = domain.snapshotCurrent().getName()
+        self.logger.info(f"Índice de snapshots de VM {vm_name} construido: {len(snapshots)} snapshots")
+        return tree
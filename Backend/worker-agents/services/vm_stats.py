@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Muestreo periódico de estadísticas de VMs usando getAllDomainStats
+TeleCluster Orchestrator - Worker Agent
+"""
+
+import libvirt
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional
+
+import psutil
+
+from models.vm import VMStats
+
+
+class DomainSample(NamedTuple):
+    """Muestra de contadores acumulados de un dominio"""
+    timestamp: float          # time.time() de la muestra
+    cpu_time_ns: int          # cpu.time acumulado
+    vcpus: int
+    memory_total_kib: int
+    memory_used_kib: int
+    disk_read_bytes: int
+    disk_write_bytes: int
+    network_rx_bytes: int
+    network_tx_bytes: int
+    started_at: float         # Arranque del proceso QEMU (para uptime)
+
+
+class DomainStatsSampler:
+    """
+    Sampler en segundo plano de estadísticas de dominios activos
+
+    Cada intervalo hace una única llamada a getAllDomainStats para todos los
+    dominios activos y guarda la muestra en un buffer circular de tamaño fijo
+    por dominio. El uso de CPU y las tasas de disco/red se calculan con la
+    diferencia entre las dos últimas muestras, por lo que las consultas no
+    bloquean sobre libvirt.
+    """
+
+    SAMPLE_STATS = (
+        libvirt.VIR_DOMAIN_STATS_STATE |
+        libvirt.VIR_DOMAIN_STATS_CPU_TOTAL |
+        libvirt.VIR_DOMAIN_STATS_BALLOON |
+        libvirt.VIR_DOMAIN_STATS_VCPU |
+        libvirt.VIR_DOMAIN_STATS_BLOCK |
+        libvirt.VIR_DOMAIN_STATS_INTERFACE
+    )
+
+    def __init__(self, vm_service, interval: float = 1.0, history_size: int = 60):
+        """
+        Inicializar sampler
+
+        Args:
+            vm_service: VMService propietario (provee la conexión a libvirt)
+            interval: Segundos entre muestras
+            history_size: Muestras retenidas por dominio
+        """
+        self.vm_service = vm_service
+        self.interval = interval
+        self.history_size = history_size
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, Deque[DomainSample]] = {}
+        self._start_times: Dict[tuple, float] = {}   # (nombre, id de dominio) -> arranque
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[str, VMStats], None]] = []
+
+    @property
+    def running(self) -> bool:
+        """Indica si el hilo de muestreo está activo"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, listener: Callable[[str, VMStats], None]) -> None:
+        """Registrar un callable(vm_name, VMStats) invocado tras cada muestra"""
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Arrancar el hilo de muestreo"""
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="vm-stats-sampler", daemon=True)
+        self._thread.start()
+        self.logger.info(f"Sampler de estadísticas iniciado (intervalo {self.interval}s)")
+
+    def stop(self) -> None:
+        """Detener el hilo de muestreo"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+        self._thread = None
+
+    def _run(self) -> None:
+        """Bucle de muestreo"""
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.sample_once()
+            except Exception as e:
+                self.logger.warning(f"Error muestreando estadísticas de VMs: {e}")
+            elapsed = time.monotonic() - started
+            self._stop_event.wait(max(0.0, self.interval - elapsed))
+
+    def sample_once(self) -> None:
+        """Tomar una muestra de todos los dominios activos"""
+        conn = self.vm_service._get_connection()
+        records = conn.getAllDomainStats(
+            self.SAMPLE_STATS, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE
+        )
+        now = time.time()
+
+        samples = {}
+        for domain, stats in records:
+            name = domain.name()
+            samples[name] = self._build_sample(domain, name, stats, now)
+
+        with self._lock:
+            # Descartar dominios que ya no están activos
+            for name in list(self._buffers):
+                if name not in samples:
+                    del self._buffers[name]
+            self._start_times = {
+                key: value for key, value in self._start_times.items() if key[0] in samples
+            }
+
+            for name, sample in samples.items():
+                buffer = self._buffers.get(name)
+                if buffer is None:
+                    buffer = deque(maxlen=self.history_size)
+                    self._buffers[name] = buffer
+                buffer.append(sample)
+
+        if self._listeners:
+            for name in samples:
+                stats = self.latest(name)
+                for listener in self._listeners:
+                    try:
+                        listener(name, stats)
+                    except Exception as e:
+                        self.logger.warning(f"Error en listener de estadísticas: {e}")
+
+    def sample_domain(self, conn: libvirt.virConnect, domain: libvirt.virDomain) -> DomainSample:
+        """Tomar una muestra puntual de un único dominio (sin guardarla)"""
+        records = conn.domainListGetStats([domain], self.SAMPLE_STATS, 0)
+        stats = records[0][1] if records else {}
+        return self._build_sample(domain, domain.name(), stats, time.time())
+
+    def _build_sample(self, domain: libvirt.virDomain, name: str,
+                      stats: Dict[str, Any], now: float) -> DomainSample:
+        """Convertir el diccionario de getAllDomainStats en una muestra"""
+        disk_read = disk_write = 0
+        for i in range(stats.get("block.count", 0)):
+            disk_read += stats.get(f"block.{i}.rd.bytes", 0)
+            disk_write += stats.get(f"block.{i}.wr.bytes", 0)
+
+        net_rx = net_tx = 0
+        for i in range(stats.get("net.count", 0)):
+            net_rx += stats.get(f"net.{i}.rx.bytes", 0)
+            net_tx += stats.get(f"net.{i}.tx.bytes", 0)
+
+        memory_total = stats.get("balloon.current", stats.get("balloon.maximum", 0))
+        if "balloon.available" in stats and "balloon.unused" in stats:
+            # Datos del driver balloon del invitado
+            memory_used = stats["balloon.available"] - stats["balloon.unused"]
+        else:
+            memory_used = stats.get("balloon.rss", memory_total)
+
+        return DomainSample(
+            timestamp=now,
+            cpu_time_ns=stats.get("cpu.time", 0),
+            vcpus=stats.get("vcpu.current", 1) or 1,
+            memory_total_kib=memory_total,
+            memory_used_kib=memory_used,
+            disk_read_bytes=disk_read,
+            disk_write_bytes=disk_write,
+            network_rx_bytes=net_rx,
+            network_tx_bytes=net_tx,
+            started_at=self._domain_start_time(domain, name, now)
+        )
+
+    def _domain_start_time(self, domain: libvirt.virDomain, name: str, now: float) -> float:
+        """Hora de arranque del dominio, a partir del proceso QEMU si es posible"""
+        key = (name, domain.ID())
+        with self._lock:
+            started_at = self._start_times.get(key)
+        if started_at is not None:
+            return started_at
+
+        started_at = now
+        try:
+            with open(f"/run/libvirt/qemu/{name}.pid") as f:
+                started_at = psutil.Process(int(f.read().strip())).create_time()
+        except (OSError, ValueError, psutil.Error):
+            # Sin acceso al pidfile: contar desde la primera vez que se vio activo
+            pass
+
+        # La lectura del pidfile queda fuera del lock; si otro hilo llegó antes, gana el suyo
+        with self._lock:
+            return self._start_times.setdefault(key, started_at)
+
+    def latest(self, vm_name: str) -> Optional[VMStats]:
+        """Estadísticas calculadas con las dos últimas muestras (None si no hay)"""
+        with self._lock:
+            buffer = self._buffers.get(vm_name)
+            if not buffer:
+                return None
+            samples = list(buffer)[-2:]
+        return self.build_stats(vm_name, samples)
+
+    def history(self, vm_name: str) -> List[DomainSample]:
+        """Muestras retenidas de un dominio (de la más antigua a la más reciente)"""
+        with self._lock:
+            return list(self._buffers.get(vm_name, ()))
+
+    @staticmethod
+    def build_stats(vm_name: str, samples: List[DomainSample]) -> VMStats:
+        """Construir VMStats a partir de una o dos muestras consecutivas"""
+        current = samples[-1]
+        cpu_usage = 0.0
+        disk_read_rate = disk_write_rate = net_rx_rate = net_tx_rate = 0.0
+
+        if len(samples) > 1:
+            previous = samples[-2]
+            elapsed = current.timestamp - previous.timestamp
+            # Un reinicio del dominio resetea los contadores: no hay delta válido
+            restarted = current.started_at != previous.started_at
+            if elapsed > 0 and not restarted:
+                cpu_delta = current.cpu_time_ns - previous.cpu_time_ns
+                cpu_usage = cpu_delta / (elapsed * 1e9 * current.vcpus) * 100
+                cpu_usage = min(max(cpu_usage, 0.0), 100.0)
+
+                disk_read_rate = max(current.disk_read_bytes - previous.disk_read_bytes, 0) / elapsed
+                disk_write_rate = max(current.disk_write_bytes - previous.disk_write_bytes, 0) / elapsed
+                net_rx_rate = max(current.network_rx_bytes - previous.network_rx_bytes, 0) / elapsed
+                net_tx_rate = max(current.network_tx_bytes - previous.network_tx_bytes, 0) / elapsed
+
+        memory_total = current.memory_total_kib * 1024
+        memory_used = current.memory_used_kib * 1024
+        memory_usage_percent = (memory_used / memory_total) * 100 if memory_total > 0 else 0
+
+        return VMStats(
+            name=vm_name,
+            cpu_usage_percent=round(cpu_usage, 2),
+            memory_usage_percent=memory_usage_percent,
+            memory_used_mb=memory_used // (1024 * 1024),
+            memory_total_mb=memory_total // (1024 * 1024),
+            disk_read_bytes=current.disk_read_bytes,
+            disk_write_bytes=current.disk_write_bytes,
+            network_rx_bytes=current.network_rx_bytes,
+            network_tx_bytes=current.network_tx_bytes,
+            uptime_seconds=max(int(current.timestamp - current.started_at), 0),
+            disk_read_bytes_per_sec=disk_read_rate,
+            disk_write_bytes_per_sec=disk_write_rate,
+            network_rx_bytes_per_sec=net_rx_rate,
+            network_tx_bytes_per_sec=net_tx_rate,
+            sampled_at=current.timestamp
+        )
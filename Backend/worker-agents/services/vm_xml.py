@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Generación y lectura de XML de dominios libvirt
+TeleCluster Orchestrator - Worker Agent
+
+La generación usa plantillas compiladas por "flavor": todo lo que depende de
+la forma de la VM (memoria, vCPUs, número y tipo de discos y NICs...) se
+resuelve una vez y queda en un string.Template; por VM solo se sustituyen
+los campos propios (nombre, rutas de disco, MACs, fuentes de red, VNC).
+
+La lectura solo analiza el bloque <devices> (el resto del XML de un dominio
+activo -cpu, features, seclabel, metadata- es la mitad del documento) y
+recorre sus hijos directos una vez, sin búsquedas recursivas. Se probó
+iterparse, pero en CPython el coste por evento en Python es mayor que el de
+construir el fragmento completo con el parser en C.
+"""
+
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from functools import lru_cache
+from string import Template
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from models.vm import DiskConfig, NetworkConfig, NetworkType, VMConfig
+from services.vm_placement import PLACEMENT_NS, Placement, format_cpuset
+
+
+TEMPLATE_CACHE_SIZE = 256
+DEVICE_CACHE_SIZE = 4096
+
+# Máximo de colas por NIC virtio-net (límite de colas de un tap en Linux)
+MAX_NET_QUEUES = 256
+
+# Tipos de NIC respaldados por un tap (bridge o red libvirt): los únicos con
+# multiqueue y vhost-net; una interfaz hostdev es una VF del host
+TAP_NETWORK_TYPES = (NetworkType.BRIDGE, NetworkType.NAT, NetworkType.ISOLATED)
+
+_TARGET_LETTERS = "abcdefghijklmnopqrstuvwxyz"
+_ATTR_ENTITIES = {"'": "&apos;", '"': "&quot;"}
+
+
+class DomainDevices(NamedTuple):
+    """Dispositivos de un dominio relevantes para VMInfo"""
+    vnc_port: Optional[int]
+    networks: List[Dict[str, Any]]
+    disks: List[Dict[str, Any]]
+
+
+def flavor_key(config: VMConfig, placement: Optional[Placement] = None) -> Tuple:
+    """Clave de la plantilla: todo lo estructural de la configuración"""
+    return (
+        (placement.policy.value, placement.memory_mode) if placement else None,
+        config.memory_mb,
+        config.vcpus,
+        config.iothreads,
+        config.arch,
+        tuple(config.boot_order),
+        tuple(
+            (disk.format.value, disk.bus, _disk_driver(disk), _disk_iotune(disk))
+            for disk in config.disks
+        ),
+        tuple(
+            (net.network_type.value, net.model, bool(net.mac_address), bool(net.source),
+             _net_driver(net, config.vcpus), net.mtu)
+            for net in config.networks
+        ),
+        # Como en el XML original, vnc_port=0 equivale a puerto automático
+        bool(config.vnc_port),
+        (
+            config.hugepages.size_kib if config.hugepages else None,
+            config.memory_locked,
+            config.ksm_mergeable,
+            config.balloon,
+        ),
+    )
+
+
+def render_domain_xml(config: VMConfig, placement: Optional[Placement] = None) -> str:
+    """Generar el XML de un dominio a partir de la plantilla de su flavor"""
+    values = {"name": _attr(config.name)}
+    if placement:
+        for i, cpu in enumerate(placement.vcpu_pins):
+            values[f"vcpu{i}_cpuset"] = str(cpu)
+        values["emulator_cpuset"] = format_cpuset(placement.emulator_cpus)
+        values["numa_nodeset"] = format_cpuset(placement.nodes)
+        values["exclusive_cpuset"] = format_cpuset(placement.exclusive)
+    for i, disk in enumerate(config.disks):
+        values[f"disk{i}_path"] = _attr(disk.path)
+    for i, net in enumerate(config.networks):
+        if net.mac_address:
+            values[f"net{i}_mac"] = _attr(net.mac_address)
+        if net.source:
+            values[f"net{i}_source"] = _attr(net.source)
+    if config.vnc_port:
+        values["vnc_port"] = str(config.vnc_port)
+
+    return _compiled_template(flavor_key(config, placement)).substitute(values)
+
+
+def template_cache_info() -> Dict[str, Any]:
+    """Aciertos/fallos de la caché de plantillas"""
+    info = _compiled_template.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hit_ratio": round(info.hits / lookups, 4) if lookups else 0.0
+    }
+
+
+def _disk_driver(disk: DiskConfig) -> Tuple:
+    """Atributos extra de <driver> de un disco (perfil ya resuelto, ver apply_io_profiles)"""
+    attrs = (
+        ("cache", disk.cache.value if disk.cache else None),
+        ("io", disk.io.value if disk.io else None),
+        ("discard", "unmap" if disk.discard else None),
+        ("iothread", disk.iothread),
+    )
+    return tuple((name, value) for name, value in attrs if value is not None)
+
+
+def _disk_iotune(disk: DiskConfig) -> Tuple:
+    """Límites <iotune> de un disco (solo los distintos de cero)"""
+    if disk.iotune is None:
+        return ()
+    return tuple((name, value) for name, value in disk.iotune.dict().items() if value)
+
+
+def is_virtio_tap(net: NetworkConfig) -> bool:
+    """Indica si una NIC es virtio-net sobre un tap (admite colas y vhost)"""
+    return net.model == "virtio" and net.network_type in TAP_NETWORK_TYPES
+
+
+def _net_driver(net: NetworkConfig, vcpus: int) -> Optional[Tuple]:
+    """Atributos de <driver> de una NIC (None si no hace falta el elemento)"""
+    if not is_virtio_tap(net):
+        return None
+    # Multiqueue: por defecto una cola por vCPU, como recomienda virtio-net
+    queues = net.queues if net.queues is not None else min(vcpus, MAX_NET_QUEUES)
+    attrs = (
+        ("name", None if net.vhost is None else ("vhost" if net.vhost else "qemu")),
+        ("queues", queues if queues > 1 else None),
+        ("rx_queue_size", net.rx_queue_size),
+        ("tx_queue_size", net.tx_queue_size),
+        ("ioeventfd", _on_off(net.ioeventfd)),
+        ("event_idx", _on_off(net.event_idx)),
+    )
+    attrs = tuple((name, value) for name, value in attrs if value is not None)
+    return attrs or None
+
+
+def _on_off(value: Optional[bool]) -> Optional[str]:
+    return None if value is None else ("on" if value else "off")
+
+
+def _attr(value: str) -> str:
+    return escape(value, _ATTR_ENTITIES)
+
+
+def _static(value: str) -> str:
+    """Valor fijo de la plantilla: escapado para XML y para string.Template"""
+    return _attr(str(value)).replace("$", "$$")
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _compiled_template(flavor: Tuple) -> Template:
+    """Compilar la plantilla de un flavor (los campos por VM quedan como $placeholders)"""
+    (pinning, memory_mb, vcpus, iothreads, arch, boot_order, disks, networks, fixed_vnc,
+     memory_profile) = flavor
+    hugepage_kib, memory_locked, ksm_mergeable, balloon = memory_profile
+
+    parts = [f"""<domain type='kvm'>
+  <name>$name</name>"""]
+
+    # Colocación NUMA: metadatos del worker, vCPUs fijadas y memoria por nodo
+    if pinning:
+        policy, memory_mode = pinning
+        exclusive = " exclusive='$exclusive_cpuset'" if policy == "isolate" else ""
+        parts.append(f"""
+  <metadata>
+    <tc:placement xmlns:tc='{PLACEMENT_NS}' policy='{policy}'{exclusive}/>
+  </metadata>""")
+
+    parts.append(f"""
+  <memory unit='MiB'>{memory_mb}</memory>
+  <vcpu placement='static'>{vcpus}</vcpu>""")
+    if iothreads:
+        parts.append(f"\n  <iothreads>{iothreads}</iothreads>")
+
+    if pinning:
+        parts.append("\n  <cputune>")
+        for i in range(vcpus):
+            parts.append(f"\n    <vcpupin vcpu='{i}' cpuset='$vcpu{i}_cpuset'/>")
+        parts.append(f"""
+    <emulatorpin cpuset='$emulator_cpuset'/>""")
+        # Los iothreads comparten las CPUs del emulador, fuera de las vCPUs
+        for i in range(1, iothreads + 1):
+            parts.append(f"\n    <iothreadpin iothread='{i}' cpuset='$emulator_cpuset'/>")
+        parts.append(f"""
+  </cputune>
+  <numatune>
+    <memory mode='{memory_mode}' nodeset='$numa_nodeset'/>
+  </numatune>""")
+
+    # Respaldo de memoria: hugepages, sin fusión KSM, bloqueada en RAM
+    if hugepage_kib or memory_locked or not ksm_mergeable:
+        parts.append("\n  <memoryBacking>")
+        if hugepage_kib:
+            parts.append(f"""
+    <hugepages>
+      <page size='{hugepage_kib}' unit='KiB'/>
+    </hugepages>""")
+        if not ksm_mergeable:
+            parts.append("\n    <nosharepages/>")
+        if memory_locked:
+            parts.append("\n    <locked/>")
+        parts.append("\n  </memoryBacking>")
+
+    parts.append(f"""
+  <os>
+    <type arch='{_static(arch)}' machine='pc'>hvm</type>""")
+
+    # Orden de boot
+    for boot_dev in boot_order:
+        parts.append(f"\n    <boot dev='{_static(boot_dev)}'/>")
+
+    parts.append("""
+  </os>
+  <features>
+    <acpi/>
+    <apic/>
+  </features>
+  <cpu mode='host-model'/>
+  <clock offset='utc'/>
+  <on_poweroff>destroy</on_poweroff>
+  <on_reboot>restart</on_reboot>
+  <on_crash>destroy</on_crash>
+  <devices>
+    <emulator>/usr/bin/qemu-system-x86_64</emulator>""")
+
+    # Discos
+    for i, (disk_format, bus, driver, iotune) in enumerate(disks):
+        driver_attrs = "".join(f" {name}='{value}'" for name, value in driver)
+        parts.append(f"""
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='{disk_format}'{driver_attrs}/>
+      <source file='$disk{i}_path'/>
+      <target dev='vd{_TARGET_LETTERS[i]}' bus='{_static(bus)}'/>""")
+        if iotune:
+            parts.append("\n      <iotune>")
+            for name, value in iotune:
+                parts.append(f"\n        <{name}>{value}</{name}>")
+            parts.append("\n      </iotune>")
+        parts.append("""
+    </disk>""")
+
+    # Interfaces de red
+    for i, (network_type, model, has_mac, has_source, driver, mtu) in enumerate(networks):
+        parts.append(f"""
+    <interface type='{network_type}'>""")
+        if has_mac:
+            parts.append(f"\n      <mac address='$net{i}_mac'/>")
+        if has_source:
+            if network_type == "bridge":
+                parts.append(f"\n      <source bridge='$net{i}_source'/>")
+            elif network_type == "network":
+                parts.append(f"\n      <source network='$net{i}_source'/>")
+        parts.append(f"""
+      <model type='{_static(model)}'/>""")
+        if driver:
+            attrs = "".join(f" {name}='{value}'" for name, value in driver)
+            parts.append(f"\n      <driver{attrs}/>")
+        if mtu:
+            parts.append(f"\n      <mtu size='{mtu}'/>")
+        parts.append("""
+    </interface>""")
+
+    # VNC: puerto fijo o automático
+    if fixed_vnc:
+        parts.append("""
+    <graphics type='vnc' port='$vnc_port' autoport='no' listen='0.0.0.0'/>""")
+    else:
+        parts.append("""
+    <graphics type='vnc' port='-1' autoport='yes' listen='0.0.0.0'/>""")
+
+    # Balloon: sin él la memoria no se puede reclamar ni hay memoryStats del invitado
+    if balloon:
+        parts.append("""
+    <memballoon model='virtio'>
+      <stats period='10'/>
+    </memballoon>""")
+    else:
+        parts.append("""
+    <memballoon model='none'/>""")
+
+    parts.append("""
+    <console type='pty'>
+      <target type='serial' port='0'/>
+    </console>
+  </devices>
+</domain>""")
+
+    return Template("".join(parts))
+
+
+def parse_domain_devices(xml_desc: str) -> DomainDevices:
+    """Extraer discos, interfaces y puerto VNC de un XML de dominio"""
+    start = xml_desc.find("<devices>")
+    end = xml_desc.rfind("</devices>")
+    try:
+        if start < 0 or end < 0:
+            raise ET.ParseError("sin bloque <devices>")
+        devices = ET.fromstring(xml_desc[start:end + len("</devices>")])
+    except ET.ParseError:
+        # Fragmento no autocontenido (p.ej. prefijos de namespace): documento completo
+        devices = ET.fromstring(xml_desc).find("devices")
+        if devices is None:
+            return DomainDevices(None, [], [])
+
+    vnc_port = None
+    networks: List[Dict[str, Any]] = []
+    disks: List[Dict[str, Any]] = []
+    for elem in devices:
+        if elem.tag == "disk":
+            disk = _parse_disk(elem)
+            if disk is not None:
+                disks.append(disk)
+        elif elem.tag == "interface":
+            networks.append(_parse_interface(elem))
+        elif elem.tag == "graphics" and elem.get("type") == "vnc" and vnc_port is None:
+            vnc_port = int(elem.get("port", 0))
+
+    return DomainDevices(vnc_port, networks, disks)
+
+
+def _parse_interface(iface: ET.Element) -> Dict[str, Any]:
+    mac = iface.find("mac")
+    net_info = {
+        "type": iface.get("type"),
+        "mac": mac.get("address") if mac is not None else None,
+        "source": None
+    }
+
+    # Obtener fuente según tipo
+    source = iface.find("source")
+    if source is not None:
+        if net_info["type"] == "bridge":
+            net_info["source"] = source.get("bridge")
+        elif net_info["type"] == "network":
+            net_info["source"] = source.get("network")
+    return net_info
+
+
+def _parse_disk(disk: ET.Element) -> Optional[Dict[str, Any]]:
+    if disk.get("type") != "file":
+        return None
+    source = disk.find("source")
+    target = disk.find("target")
+    if source is None or target is None:
+        return None
+    return {
+        "path": source.get("file"),
+        "device": target.get("dev"),
+        "bus": target.get("bus"),
+        "type": disk.get("device", "disk")
+    }
+
+
+class DomainDeviceCache:
+    """
+    Caché LRU de los dispositivos parseados de cada dominio, por UUID
+
+    Una entrada es válida mientras no llegue un evento de define/undefine o
+    de hotplug de dispositivos (ver DomainInventory) y mientras el dominio
+    mantenga el mismo ID de ejecución: al arrancar o parar cambia el ID y con
+    él el puerto VNC asignado automáticamente, así que se vuelve a leer.
+    Un acierto evita tanto XMLDesc() como el parseo.
+
+    Cada invalidación sube la generación del UUID (y clear() la de toda la
+    caché); un fallo solo guarda su lectura si la generación no cambió
+    mientras se leía el XML, para no cachear dispositivos anteriores al evento.
+    """
+
+    def __init__(self, maxsize: int = DEVICE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[int, DomainDevices]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}   # uuid -> invalidaciones recibidas
+        self._epoch = 0                          # clear() recibidos
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def devices(self, domain) -> DomainDevices:
+        """Dispositivos de un dominio (de la caché o leyendo su XML)"""
+        uuid = domain.UUIDString()
+        run_id = domain.ID()
+        with self._lock:
+            entry = self._entries.get(uuid)
+            if entry is not None and entry[0] == run_id:
+                self._entries.move_to_end(uuid)
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+            generation = (self._epoch, self._generations.get(uuid, 0))
+
+        devices = parse_domain_devices(domain.XMLDesc())
+        with self._lock:
+            if generation != (self._epoch, self._generations.get(uuid, 0)):
+                # Invalidado durante la lectura: el XML puede ser anterior al evento
+                return devices
+            self._entries[uuid] = (run_id, devices)
+            self._entries.move_to_end(uuid)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return devices
+
+    def invalidate(self, uuid: str) -> None:
+        """Descartar la entrada de un dominio (XML redefinido o dispositivos cambiados)"""
+        with self._lock:
+            self._generations[uuid] = self._generations.get(uuid, 0) + 1
+            if self._entries.pop(uuid, None) is not None:
+                self._invalidations += 1
+
+    def clear(self) -> None:
+        """Descartar todas las entradas (p.ej. tras perder eventos en una reconexión)"""
+        with self._lock:
+            self._invalidations += len(self._entries)
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos, fallos e invalidaciones"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0
+            }
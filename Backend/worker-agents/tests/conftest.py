@@ -0,0 +1,23 @@
+"""
+Configuración común de los tests del Worker Agent
+"""
+
+import os
+import sys
+
+import pytest
+
+# Los módulos del agente se importan desde su directorio raíz (models, services)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKEBIN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakebin")
+
+
+@pytest.fixture
+def fake_bin(tmp_path, monkeypatch):
+    """iptables-restore, iptables-save, ipset y qemu-img falsos (tests/fakebin) con estado en tmp_path"""
+    monkeypatch.setenv("PATH", FAKEBIN_DIR + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.setenv("FAKE_IPTABLES_STATE", str(tmp_path / "iptables.json"))
+    monkeypatch.setenv("FAKE_IPSET_STATE", str(tmp_path / "ipset.json"))
+    monkeypatch.setenv("FAKE_QEMU_IMG_LOG", str(tmp_path / "qemu-img.log"))
+    return tmp_path
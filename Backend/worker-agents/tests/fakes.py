@@ -0,0 +1,207 @@
+"""
+Dobles de libvirt para los tests: conexión y dominios en memoria
+
+Solo implementan las llamadas que usan los servicios probados; cualquier
+otra falla con AttributeError, que es preferible a un éxito silencioso.
+Cada llamada a la conexión o a un dominio cuenta como un viaje de ida y
+vuelta (calls) y puede simular su latencia (latency) para los benchmarks.
+"""
+
+import os
+import time
+from typing import Dict, Iterable, List, Optional
+
+import libvirt
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def fixture(name: str) -> str:
+    """Contenido de un fichero de tests/fixtures"""
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return f.read()
+
+
+class FakeLibvirtError(libvirt.libvirtError):
+    """libvirtError con código propio (el real lo toma del último error de libvirt)"""
+
+    def __init__(self, message: str, code: int = libvirt.VIR_ERR_INTERNAL_ERROR):
+        Exception.__init__(self, message)
+        self.code = code
+
+    def get_error_code(self) -> int:
+        return self.code
+
+
+class FakeDomain:
+    """Dominio definido con su XML y un estado fijo"""
+
+    def __init__(self, name: str, xml: str = "", uuid: Optional[str] = None,
+                 state: int = libvirt.VIR_DOMAIN_SHUTOFF, memory_kib: int = 1048576,
+                 vcpus: int = 1, domain_id: int = -1, autostart: bool = False,
+                 persistent: bool = True, cpu_time: int = 0):
+        self._name = name
+        self._xml = xml or f"<domain type='kvm'><name>{name}</name></domain>"
+        self._uuid = uuid or f"00000000-0000-0000-0000-{abs(hash(name)) % 10 ** 12:012d}"
+        self._state = state
+        self._memory_kib = memory_kib
+        self._vcpus = vcpus
+        self._id = domain_id
+        self._autostart = autostart
+        self._persistent = persistent
+        self._cpu_time = cpu_time
+        self._conn: Optional["FakeConnection"] = None
+
+    def _rpc(self, call: str) -> None:
+        if self._conn is not None:
+            self._conn._rpc(call)
+
+    # Datos locales del objeto (sin ida y vuelta en libvirt-python)
+    def name(self) -> str:
+        return self._name
+
+    def UUIDString(self) -> str:
+        return self._uuid
+
+    def ID(self) -> int:
+        return self._id
+
+    # Llamadas al daemon
+    def XMLDesc(self, flags: int = 0) -> str:
+        self._rpc("XMLDesc")
+        return self._xml
+
+    def state(self, flags: int = 0) -> List[int]:
+        self._rpc("state")
+        return [self._state, 0]
+
+    def info(self) -> List[int]:
+        self._rpc("info")
+        return [self._state, self._memory_kib, self._memory_kib, self._vcpus, self._cpu_time]
+
+    def isActive(self) -> int:
+        self._rpc("isActive")
+        return int(self.running)
+
+    def isPersistent(self) -> int:
+        self._rpc("isPersistent")
+        return int(self._persistent)
+
+    def autostart(self) -> int:
+        self._rpc("autostart")
+        return int(self._autostart)
+
+    @property
+    def running(self) -> bool:
+        return self._state == libvirt.VIR_DOMAIN_RUNNING
+
+    def stats(self) -> Dict[str, int]:
+        """Registro de getAllDomainStats (state, balloon, vcpu y cpu.time)"""
+        return {
+            "state.state": self._state,
+            "state.reason": 1,
+            "balloon.maximum": self._memory_kib,
+            "balloon.current": self._memory_kib,
+            "vcpu.current": self._vcpus,
+            "vcpu.maximum": self._vcpus,
+            "cpu.time": self._cpu_time,
+        }
+
+
+class FakeConnection:
+    """Conexión con capacidades fijas y un conjunto de dominios definidos"""
+
+    def __init__(self, capabilities: str = "", domains: Iterable[FakeDomain] = (),
+                 memory_mb: int = 16384, cpus: int = 8, hostname: str = "worker-test",
+                 latency: float = 0.0):
+        self.capabilities = capabilities
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+        self.hostname = hostname
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self.domains: Dict[str, FakeDomain] = {}
+        for domain in domains:
+            self.add(domain)
+
+    def add(self, domain: FakeDomain) -> FakeDomain:
+        domain._conn = self
+        self.domains[domain.name()] = domain
+        return domain
+
+    def _rpc(self, call: str) -> None:
+        self.calls[call] = self.calls.get(call, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def round_trips(self) -> int:
+        return sum(self.calls.values())
+
+    # Host
+    def getInfo(self) -> list:
+        return ["x86_64", self.memory_mb, self.cpus, 2400, 1, 2, 2, 2]
+
+    def getCapabilities(self) -> str:
+        self._rpc("getCapabilities")
+        return self.capabilities
+
+    def getType(self) -> str:
+        return "QEMU"
+
+    def getVersion(self) -> int:
+        return 6002000
+
+    def getLibVersion(self) -> int:
+        return 8000000
+
+    def getHostname(self) -> str:
+        return self.hostname
+
+    def getMaxVcpus(self, type: Optional[str]) -> int:
+        return 288
+
+    def isAlive(self) -> int:
+        return 1
+
+    # Dominios
+    def listAllDomains(self, flags: int = 0) -> List[FakeDomain]:
+        self._rpc("listAllDomains")
+        return self._select(flags)
+
+    def getAllDomainStats(self, stats: int = 0, flags: int = 0) -> List[tuple]:
+        self._rpc("getAllDomainStats")
+        return [(domain, domain.stats()) for domain in self._select(flags)]
+
+    def domainListGetStats(self, domains: List[FakeDomain], stats: int = 0, flags: int = 0) -> List[tuple]:
+        self._rpc("domainListGetStats")
+        return [(domain, domain.stats()) for domain in domains]
+
+    def _select(self, flags: int) -> List[FakeDomain]:
+        """Dominios que cumplen un flag VIR_CONNECT_LIST_DOMAINS_* (0 = todos)"""
+        filters = {
+            libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE: lambda domain: domain.running,
+            libvirt.VIR_CONNECT_LIST_DOMAINS_INACTIVE: lambda domain: not domain.running,
+            libvirt.VIR_CONNECT_LIST_DOMAINS_AUTOSTART: lambda domain: domain._autostart,
+            libvirt.VIR_CONNECT_LIST_DOMAINS_TRANSIENT: lambda domain: not domain._persistent,
+            libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE: lambda domain: domain.running,
+        }
+        keep = filters.get(flags, lambda domain: True)
+        return [domain for domain in self.domains.values() if keep(domain)]
+
+    def lookupByName(self, name: str) -> FakeDomain:
+        self._rpc("lookupByName")
+        domain = self.domains.get(name)
+        if domain is None:
+            raise FakeLibvirtError(f"Domain not found: no domain with matching name '{name}'",
+                                   libvirt.VIR_ERR_NO_DOMAIN)
+        return domain
+
+    def lookupByUUIDString(self, uuid: str) -> FakeDomain:
+        self._rpc("lookupByUUIDString")
+        for domain in self.domains.values():
+            if domain.UUIDString() == uuid:
+                return domain
+        raise FakeLibvirtError(f"Domain not found: no domain with matching uuid '{uuid}'",
+                               libvirt.VIR_ERR_NO_DOMAIN)
@@ -0,0 +1,77 @@
+"""
+Orden de las reglas de firewall compiladas a ipset
+
+iptables aplica la primera coincidencia: los grupos y las reglas directas
+deben quedar en la cadena en el orden en que se dieron de alta, sin que las
+denegaciones salten por delante de las aceptaciones existentes.
+"""
+
+import json
+
+import pytest
+
+from models.nat import Protocol
+from services.firewall import FirewallPolicyCompiler
+from services.iptables import IptablesRuleEngine
+
+
+@pytest.fixture
+def compiler(fake_bin):
+    return FirewallPolicyCompiler(IptablesRuleEngine())
+
+
+def chain(fake_bin, name: str):
+    tables = json.loads((fake_bin / "iptables.json").read_text())
+    return [line for line in tables["filter"] if line.startswith(f"-A {name} ")]
+
+
+def add(compiler, rule_id, action, source=None, port=None, chain="INPUT"):
+    return compiler.add_rule(rule_id, chain, action, Protocol.tcp if port else Protocol.all,
+                             source, None, port, None)
+
+
+def test_groups_keep_creation_order(compiler, fake_bin):
+    add(compiler, "00000001", "ACCEPT", source="10.0.0.5", port=22)
+    add(compiler, "00000002", "DROP", port=22)
+    # Miembro nuevo del primer grupo: hereda su posición, no va al final
+    add(compiler, "00000003", "ACCEPT", source="10.0.0.6", port=22)
+
+    accept_set = compiler._members["00000001"][0]
+    drop_set = compiler._members["00000002"][0]
+    assert compiler._members["00000003"][0] == accept_set
+    assert chain(fake_bin, "INPUT") == [
+        f"-A INPUT -p tcp -m set --match-set {accept_set} src,dst "
+        f"-m comment --comment {accept_set[5:]}:firewall-set -j ACCEPT",
+        f"-A INPUT -p tcp -m set --match-set {drop_set} dst "
+        f"-m comment --comment {drop_set[5:]}:firewall-set -j DROP",
+    ]
+
+
+def test_catch_all_deny_is_appended_after_accepts(compiler, fake_bin):
+    add(compiler, "00000001", "ACCEPT", source="192.168.1.0/24")
+    add(compiler, "00000002", "DROP")
+
+    rules = chain(fake_bin, "INPUT")
+    assert len(rules) == 2
+    assert rules[0].endswith("-j ACCEPT")
+    assert rules[1] == "-A INPUT -m comment --comment 00000002:firewall -j DROP"
+
+
+def test_group_slot_survives_member_churn(compiler, fake_bin):
+    add(compiler, "00000001", "ACCEPT", source="10.0.0.5", port=22)
+    add(compiler, "00000002", "ACCEPT", source="10.0.0.6", port=22)
+    add(compiler, "00000003", "REJECT", port=22)
+
+    # Quitar un miembro es un ipset del: la regla del grupo no se mueve
+    assert compiler.remove_rule("00000001")
+    rules = chain(fake_bin, "INPUT")
+    assert [rule.rsplit(" ", 1)[1] for rule in rules] == ["ACCEPT", "REJECT"]
+
+    # El último miembro elimina el grupo; el siguiente alta va al final
+    assert compiler.remove_rule("00000002")
+    add(compiler, "00000004", "ACCEPT", source="10.0.0.7", port=22)
+    rules = chain(fake_bin, "INPUT")
+    assert [rule.rsplit(" ", 1)[1] for rule in rules] == ["REJECT", "ACCEPT"]
+    assert json.loads((fake_bin / "ipset.json").read_text()).keys() == {
+        compiler._members["00000003"][0], compiler._members["00000004"][0]
+    }
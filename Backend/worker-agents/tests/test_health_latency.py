@@ -0,0 +1,86 @@
+"""
+Prueba de carga: la latencia de /health no crece mientras hay operaciones largas
+
+Las operaciones bloqueantes se simulan con time.sleep dentro de los servicios
+(libvirt y comandos ip); si alguna ocupara el bucle de eventos, /health
+esperaría a que terminase. Ejecutar con -s para ver las latencias.
+"""
+
+import asyncio
+import statistics
+import time
+
+import pytest
+
+pytest.importorskip("libvirt")
+httpx = pytest.importorskip("httpx")
+
+import main
+from api import vm as vm_api
+from services.network import NetworkService
+from utils.executor import LIBVIRT_POOL_SIZE
+
+
+SLOW_SECONDS = 1.0
+PROBES = 20
+
+
+def slow(result):
+    def call(*args, **kwargs):
+        time.sleep(SLOW_SECONDS)
+        return result
+    return call
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # /health sin depender de los comandos del host de pruebas
+    monkeypatch.setattr(main, "validate_environment", lambda: {"all_required_available": True})
+    monkeypatch.setattr(main, "check_permissions", lambda: {"can_modify_network": True})
+    monkeypatch.setattr(vm_api.vm_service, "list_vms_with_total", slow(([], 0)))
+    monkeypatch.setattr(NetworkService, "list_interfaces", staticmethod(slow([])))
+    return main.app
+
+
+async def probe_health(client: "httpx.AsyncClient") -> list:
+    latencies = []
+    for _ in range(PROBES):
+        started = time.perf_counter()
+        response = await client.get("/health")
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200
+        await asyncio.sleep(0.02)
+    return latencies
+
+
+async def run_load(app) -> tuple:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://worker") as client:
+        idle = await probe_health(client)
+
+        # Más llamadas libvirt que hilos en su pool y comandos ip hasta su límite
+        slow_requests = [client.get("/vm/list") for _ in range(LIBVIRT_POOL_SIZE + 4)]
+        slow_requests += [client.get("/network/interfaces") for _ in range(8)]
+        started = time.perf_counter()
+        load = asyncio.gather(*slow_requests)
+        await asyncio.sleep(0.05)
+        busy = await probe_health(client)
+        responses = await load
+        elapsed = time.perf_counter() - started
+
+    assert all(response.status_code == 200 for response in responses)
+    return idle, busy, elapsed
+
+
+def test_health_latency_stays_flat_under_long_operations(app):
+    idle, busy, elapsed = asyncio.run(run_load(app))
+
+    idle_p50, busy_p50 = statistics.median(idle), statistics.median(busy)
+    print(f"\n/health p50 en reposo {idle_p50:.1f} ms, con carga {busy_p50:.1f} ms "
+          f"(máx {max(busy):.1f} ms); operaciones largas completadas en {elapsed:.2f} s")
+
+    # Las sondas se hicieron mientras las operaciones largas seguían en curso
+    assert elapsed >= SLOW_SECONDS
+    # Ninguna sonda esperó a una operación larga
+    assert max(busy) < SLOW_SECONDS * 1000 / 4
+    assert busy_p50 < idle_p50 + 50
@@ -0,0 +1,192 @@
+"""
+Tests del pool de conexiones a libvirt (una por hilo, keepalive y reconexión)
+"""
+
+import gc
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+from fakes import FakeLibvirtError
+from services import libvirt_pool
+from services.libvirt_pool import LibvirtConnectionPool
+
+
+class Clock:
+    """Reloj manual: sleep() avanza el tiempo sin esperar"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class PoolConnection:
+    def __init__(self, number: int):
+        self.number = number
+        self.alive = True
+        self.keepalive = None
+        self.alive_checks = 0
+        self.closed = False
+
+    def setKeepAlive(self, interval: int, count: int) -> int:
+        self.keepalive = (interval, count)
+        return 0
+
+    def isAlive(self) -> int:
+        self.alive_checks += 1
+        return int(self.alive)
+
+    def close(self) -> int:
+        self.closed = True
+        return 0
+
+
+class Libvirtd:
+    """libvirt.open falso; down=True simula un libvirtd caído"""
+
+    def __init__(self):
+        self.opened = []
+        self.attempts = 0
+        self.down = False
+
+    def open(self, uri: str) -> PoolConnection:
+        self.attempts += 1
+        if self.down:
+            raise FakeLibvirtError("Failed to connect socket to '/run/libvirt/libvirt-sock'")
+        conn = PoolConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(libvirt_pool, "time", SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+
+@pytest.fixture
+def libvirtd(monkeypatch):
+    libvirtd = Libvirtd()
+    monkeypatch.setattr(libvirt, "open", libvirtd.open, raising=False)
+    return libvirtd
+
+
+@pytest.fixture
+def pool(clock, libvirtd):
+    return LibvirtConnectionPool("qemu:///system", health_interval=5.0, retries=3)
+
+
+def in_thread(function):
+    """Ejecutar en un hilo nuevo (que termina) y devolver su resultado o su excepción"""
+    result = {}
+
+    def run():
+        try:
+            result["value"] = function()
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def test_each_thread_reuses_its_own_connection(pool, libvirtd):
+    first = pool.get()
+    assert pool.get() is first
+    other = in_thread(pool.get)
+
+    assert other is not first
+    assert len(libvirtd.opened) == 2
+    # Dentro del intervalo de comprobación no se pregunta isAlive() en cada petición
+    assert first.alive_checks == 0
+    assert first.keepalive == (libvirt_pool.KEEPALIVE_INTERVAL, libvirt_pool.KEEPALIVE_COUNT)
+    stats = pool.stats()
+    assert (stats["acquires"], stats["reused"], stats["opened"]) == (3, 1, 2)
+
+
+def test_primary_connection_is_separate_from_thread_connections(pool):
+    primary = pool.primary()
+
+    assert pool.primary() is primary
+    assert pool.get() is not primary
+
+
+def test_dead_connection_is_replaced_after_health_check(pool, clock, libvirtd):
+    first = pool.get()
+    first.alive = False
+
+    assert pool.get() is first               # aún dentro del intervalo
+    clock.now += 5.0
+    second = pool.get()
+
+    assert second is not first and first.closed
+    assert first.alive_checks == 1
+    stats = pool.stats()
+    assert (stats["reconnects"], stats["health_checks"], stats["open_handles"]) == (1, 1, 1)
+
+
+def test_broken_connection_reconnects_without_health_check(pool):
+    first = pool.get()
+    pool.mark_broken(first)
+
+    second = pool.get()
+
+    assert second is not first and first.closed
+    assert first.alive_checks == 0
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_libvirtd_down_backs_off_and_fails_fast(pool, clock, libvirtd):
+    libvirtd.down = True
+
+    with pytest.raises(RuntimeError, match="No se pudo conectar"):
+        pool.get()
+    assert libvirtd.attempts == 3
+    assert clock.sleeps == [0.5, 1.0]
+
+    # El resto de hilos falla sin volver a intentarlo mientras dura la espera
+    with pytest.raises(RuntimeError, match="reintento en"):
+        in_thread(pool.get)
+    assert libvirtd.attempts == 3
+
+    libvirtd.down = False
+    clock.now += libvirt_pool.INITIAL_BACKOFF
+    conn = pool.get()
+    assert conn is libvirtd.opened[0]
+    stats = pool.stats()
+    assert (stats["failures"], stats["last_error"], stats["retry_in_s"]) == (2, None, 0.0)
+
+
+def test_thread_exit_closes_its_connection(pool):
+    conn = in_thread(pool.get)
+    gc.collect()
+
+    assert conn.closed
+    assert pool.stats()["open_handles"] == 0
+
+
+def test_close_all_forces_new_connections(pool, libvirtd):
+    primary = pool.primary()
+    conn = pool.get()
+
+    pool.close_all()
+
+    assert primary.closed and conn.closed
+    assert pool.get() is not conn
+    assert pool.primary() is not primary
+    assert len(libvirtd.opened) == 4
@@ -0,0 +1,114 @@
+"""
+Benchmark de churn de reglas NAT del worker (5000 port forwards) con iptables-restore falso
+
+Cada port forward son dos reglas (DNAT y FORWARD). Se dan de alta 5000, se
+sustituyen todas por otras 5000 y se eliminan, en lotes de /nat/bulk; cada
+lote debe ser un único iptables-restore y no debe volver a leerse la tabla
+con iptables-save. Ejecutar con -s para ver los tiempos.
+"""
+
+import itertools
+import json
+import subprocess
+import time
+
+import pytest
+
+from models.nat import PortForwardRequest
+from services import iptables, nat
+from services.firewall import FirewallPolicyCompiler
+from services.iptables import IptablesRuleEngine
+from services.nat import NATService
+
+
+RULES = 5000
+BATCH = 500
+CHURN_SECONDS = 10
+
+
+@pytest.fixture
+def engine(fake_bin, monkeypatch):
+    """Motor y compilador nuevos con contador de procesos lanzados"""
+    engine = IptablesRuleEngine()
+    monkeypatch.setattr(nat, "rule_engine", engine)
+    monkeypatch.setattr(nat, "firewall_compiler", FirewallPolicyCompiler(engine))
+    # Ids secuenciales: con 10000 uuid4 truncados a 8 hex puede haber colisiones
+    counter = itertools.count(1)
+    monkeypatch.setattr(NATService, "_new_rule_id", staticmethod(lambda: f"{next(counter):08x}"))
+
+    calls = []
+    run = subprocess.run
+
+    def counting_run(argv, *args, **kwargs):
+        calls.append(argv[0])
+        return run(argv, *args, **kwargs)
+
+    monkeypatch.setattr(iptables.subprocess, "run", counting_run)
+    engine.calls = calls
+    return engine
+
+
+def requests(first_port: int):
+    return [
+        PortForwardRequest(external_port=first_port + i, internal_ip=f"10.{i // 250}.{i % 250}.10",
+                           internal_port=22, description=f"lab vm {i}")
+        for i in range(RULES)
+    ]
+
+
+def batches(items):
+    return [items[i:i + BATCH] for i in range(0, len(items), BATCH)]
+
+
+def kernel_rules(fake_bin) -> dict:
+    tables = json.loads((fake_bin / "iptables.json").read_text())
+    return {table: len(rules) for table, rules in tables.items()}
+
+
+def test_bulk_churn_of_5000_port_forwards(engine, fake_bin):
+    started = time.perf_counter()
+
+    added = []
+    for batch in batches(requests(20000)):
+        result = NATService.apply_bulk(batch, [], [])
+        assert result["success"], result
+        added += [entry["rule_id"] for entry in result["added"]]
+    load_seconds = time.perf_counter() - started
+    assert kernel_rules(fake_bin) == {"nat": RULES, "filter": RULES}
+
+    # Sustituir cada lote por uno nuevo en la misma transacción
+    replaced = []
+    for old_ids, batch in zip(batches(added), batches(requests(40000))):
+        result = NATService.apply_bulk(batch, [], old_ids)
+        assert result["success"] and not result["not_found"], result
+        replaced += [entry["rule_id"] for entry in result["added"]]
+    assert kernel_rules(fake_bin) == {"nat": RULES, "filter": RULES}
+
+    for old_ids in batches(replaced):
+        assert NATService.apply_bulk([], [], old_ids)["removed"] == old_ids
+    elapsed = time.perf_counter() - started
+
+    print(f"\n{RULES} port forwards: alta {load_seconds:.2f} s, churn completo {elapsed:.2f} s, "
+          f"{engine.calls.count('iptables-restore')} iptables-restore")
+
+    assert kernel_rules(fake_bin) == {"nat": 0, "filter": 0}
+    # Una lectura inicial por tabla y un proceso por lote
+    assert engine.calls.count("iptables-save") == 2
+    assert engine.calls.count("iptables-restore") == 3 * RULES // BATCH
+    assert elapsed < CHURN_SECONDS
+
+
+def test_single_removal_does_not_rescan_the_table(engine, fake_bin):
+    for batch in batches(requests(20000)):
+        NATService.apply_bulk(batch, [], [])
+    rule_id = engine.find(lambda rule, tag: tag == "lab vm 4999")[0]
+    engine.calls.clear()
+
+    started = time.perf_counter()
+    result = NATService.remove_port_forward(rule_id=rule_id)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"\nbaja de una regla con {2 * RULES} en el kernel: {elapsed_ms:.1f} ms")
+
+    assert result["success"]
+    assert sorted(result["removed_rules"]) == [f"filter:FORWARD:{rule_id}", f"nat:PREROUTING:{rule_id}"]
+    assert engine.calls == ["iptables-restore"]
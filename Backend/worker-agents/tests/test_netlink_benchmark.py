@@ -0,0 +1,166 @@
+"""
+Benchmark del volcado netlink frente al camino anterior con subprocesos
+
+El camino anterior lanzaba un "ip link show" para el listado y un
+"ip addr show <interfaz>" por interfaz. Se compara en el propio host con el
+binario ip real y, a escala (2000 pares veth), con un socket netlink falso
+que sirve mensajes RTM_NEWLINK/RTM_NEWADDR sintéticos frente al coste por
+proceso medido en el host. Ejecutar con -s para ver los tiempos.
+"""
+
+import shutil
+import socket
+import struct
+import subprocess
+import time
+
+import pytest
+
+from services import netlink
+from services.netlink import (
+    IFADDRMSG, IFF_UP, IFINFOMSG, IFLA_ADDRESS, IFLA_IFNAME, IFLA_INFO_KIND, IFLA_LINK,
+    IFLA_LINKINFO, IFLA_MASTER, IFLA_MTU, IFLA_OPERSTATE, IFA_LOCAL, NLMSG_DONE, NLMSG_HDR,
+    RTATTR, RTM_GETLINK, RTM_NEWADDR, RTM_NEWLINK, dump_interfaces
+)
+from services.network import NetworkService
+from services.veth import VethService
+
+
+PAIRS = 2000
+NLM_F_MULTI = 0x2
+
+
+def subprocess_listing(names) -> int:
+    """Referencia: un ip link show más un ip addr show por interfaz"""
+    forks = 1
+    subprocess.run(["ip", "link", "show"], capture_output=True, text=True, check=True)
+    for name in names:
+        subprocess.run(["ip", "addr", "show", name], capture_output=True, text=True)
+        forks += 1
+    return forks
+
+
+def timed(function, *args, repeat: int = 1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return result, (time.perf_counter() - started) * 1000 / repeat
+
+
+def rtattr(attr_type: int, value: bytes) -> bytes:
+    length = RTATTR.size + len(value)
+    return RTATTR.pack(length, attr_type) + value + b"\0" * (-length % 4)
+
+
+def link_message(index: int, name: str, peer: int, master: int = 0, kind: str = "veth") -> bytes:
+    attrs = (
+        rtattr(IFLA_IFNAME, name.encode() + b"\0")
+        + rtattr(IFLA_MTU, struct.pack("=I", 1500))
+        + rtattr(IFLA_ADDRESS, bytes([0x52, 0x54, 0, 0, index >> 8 & 0xff, index & 0xff]))
+        + rtattr(IFLA_OPERSTATE, bytes([6]))
+        + rtattr(IFLA_LINK, struct.pack("=I", peer))
+        + rtattr(IFLA_LINKINFO, rtattr(IFLA_INFO_KIND, kind.encode() + b"\0"))
+    )
+    if master:
+        attrs += rtattr(IFLA_MASTER, struct.pack("=I", master))
+    return IFINFOMSG.pack(socket.AF_UNSPEC, 1, index, IFF_UP, 0) + attrs
+
+
+def address_message(index: int) -> bytes:
+    address = socket.inet_aton(f"10.{index >> 16 & 0xff}.{index >> 8 & 0xff}.{index & 0xff}")
+    return IFADDRMSG.pack(socket.AF_INET, 24, 0, 0, index) + rtattr(IFA_LOCAL, address)
+
+
+class FakeNetlinkSocket:
+    """Socket rtnetlink que responde a los dumps con mensajes pregenerados"""
+
+    DATAGRAM = 32 * 1024
+
+    def __init__(self, links, addresses):
+        self.replies = {RTM_GETLINK: (RTM_NEWLINK, links), 22: (RTM_NEWADDR, addresses)}
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send(self, data: bytes) -> int:
+        _, msg_type, _, seq, _ = NLMSG_HDR.unpack_from(data)
+        reply_type, payloads = self.replies[msg_type]
+        messages = [
+            NLMSG_HDR.pack(NLMSG_HDR.size + len(payload), reply_type, NLM_F_MULTI, seq, 0) + payload
+            for payload in payloads
+        ]
+        messages.append(NLMSG_HDR.pack(NLMSG_HDR.size + 4, NLMSG_DONE, NLM_F_MULTI, seq, 0) + b"\0" * 4)
+
+        datagram = b""
+        for message in messages:
+            if len(datagram) + len(message) > self.DATAGRAM:
+                self.pending.append(datagram)
+                datagram = b""
+            datagram += message
+        self.pending.append(datagram)
+        return len(data)
+
+    def recv(self, size: int) -> bytes:
+        return self.pending.pop(0)
+
+
+@pytest.fixture(scope="module")
+def veth_dump():
+    """2000 pares veth (4000 enlaces con dirección); un extremo de cada par en un bridge"""
+    links = [link_message(1, "br-lab", 0, kind="bridge")]
+    addresses = []
+    for pair in range(PAIRS):
+        a, b = 2 + 2 * pair, 3 + 2 * pair
+        links.append(link_message(a, f"veth{pair}a", b, master=1))
+        links.append(link_message(b, f"veth{pair}b", a))
+        addresses += [address_message(a), address_message(b)]
+    return links, addresses
+
+
+@pytest.fixture(scope="module")
+def fork_ms():
+    """Coste medio de lanzar "ip" en este host"""
+    if shutil.which("ip") is None:
+        pytest.skip("ip no disponible")
+    _, elapsed_ms = timed(subprocess_listing, [], repeat=20)
+    return elapsed_ms
+
+
+def test_netlink_matches_ip_on_host(fork_ms):
+    try:
+        table = dump_interfaces()
+    except OSError as e:
+        pytest.skip(f"netlink no disponible: {e}")
+
+    output = subprocess.run(["ip", "-o", "link", "show"], capture_output=True, text=True, check=True).stdout
+    names = {line.split(": ")[1].split("@")[0] for line in output.splitlines() if line.strip()}
+    assert {link.name for link in table.links} == names
+
+    interfaces, netlink_ms = timed(NetworkService.list_interfaces, repeat=20)
+    forks, subprocess_ms = timed(subprocess_listing, names)
+    print(f"\nhost ({len(names)} interfaces): netlink {netlink_ms:.2f} ms, "
+          f"subprocesos {subprocess_ms:.1f} ms ({forks} procesos)")
+    assert {interface.name for interface in interfaces} == names
+    assert netlink_ms < subprocess_ms
+
+
+def test_netlink_dump_scales_to_thousands_of_veths(monkeypatch, veth_dump, fork_ms):
+    monkeypatch.setattr(netlink, "_open_socket", lambda: FakeNetlinkSocket(*veth_dump))
+
+    pairs, veth_ms = timed(VethService.list_veth_pairs)
+    interfaces, list_ms = timed(NetworkService.list_interfaces)
+    projected_ms = fork_ms * (1 + len(interfaces))
+    print(f"\n{PAIRS} pares veth: list_veth_pairs {veth_ms:.0f} ms, list_interfaces {list_ms:.0f} ms; "
+          f"subprocesos estimados {projected_ms:.0f} ms ({1 + len(interfaces)} x {fork_ms:.1f} ms)")
+
+    assert len(pairs) == PAIRS
+    first = next(pair for pair in pairs if pair.name1 == "veth0a")
+    assert (first.name2, first.bridge1, first.bridge2) == ("veth0b", "br-lab", None)
+    assert len(interfaces) == 2 * PAIRS + 1
+    assert interfaces[1].ip_addresses == ["10.0.0.2/24"]
+
+    assert list_ms * 10 < projected_ms
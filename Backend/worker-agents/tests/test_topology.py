@@ -0,0 +1,121 @@
+"""
+Tests del compilador de topologías (/network/apply) con una tabla de
+interfaces simulada y la salida de error de ip -batch
+"""
+
+import socket
+import subprocess
+
+import pytest
+
+from models.topology import TopologyApplyRequest
+from services import topology
+from services.netlink import Address, InterfaceTable, Link
+from services.topology import TopologyService
+
+
+LAB = {
+    "bridges": [{"name": "br-lab"}],
+    "taps": [{"name": "tap-vm1", "bridge": "br-lab"}],
+    "veths": [{"name1": "veth-a", "name2": "veth-b", "bridge1": "br-lab"}],
+    "vlans": [{"parent_interface": "eth0", "vlan_id": 100, "bridge": "br-lab"}],
+    "addresses": [{"interface": "br-lab", "address": "10.0.0.1/24"}],
+}
+
+
+def link(index: int, name: str, kind: str = None, master: int = None, peer: int = None) -> Link:
+    return Link(index, name, 0x1, "up", 1500, None, kind, master, peer, None)
+
+
+def interfaces(*links: Link, addresses=None) -> InterfaceTable:
+    return InterfaceTable(list(links), addresses or {})
+
+
+@pytest.fixture
+def table(monkeypatch):
+    """Tabla de interfaces que devuelve dump_interfaces (solo eth0 al empezar)"""
+    current = {"table": interfaces(link(1, "lo"), link(2, "eth0"))}
+    monkeypatch.setattr(topology, "dump_interfaces", lambda: current["table"])
+    return current
+
+
+def apply(**kwargs):
+    return TopologyService.apply_topology(TopologyApplyRequest(**dict(LAB, **kwargs)))
+
+
+def test_dry_run_compiles_a_single_ip_batch(table):
+    result = apply(dry_run=True)
+
+    assert result["ip_batch"] == [
+        "link add name br-lab type bridge",
+        "link set br-lab up",
+        "tuntap add dev tap-vm1 mode tap",
+        "link set tap-vm1 up",
+        "link set tap-vm1 master br-lab",
+        "link add veth-a type veth peer name veth-b",
+        "link set veth-a master br-lab",
+        "link set veth-a up",
+        "link set veth-b up",
+        "link add link eth0 name eth0.100 type vlan id 100 protocol 802.1Q",
+        "link set eth0.100 master br-lab",
+        "link set eth0.100 up",
+        "addr add 10.0.0.1/24 dev br-lab",
+    ]
+    assert result["ovs_command"] is None
+    assert all(r["success"] and not r["unchanged"] for r in result["results"])
+
+
+def test_reapplying_an_existing_topology_is_unchanged(table, monkeypatch):
+    table["table"] = interfaces(
+        link(1, "lo"), link(2, "eth0"), link(3, "br-lab", "bridge"),
+        link(4, "tap-vm1", "tun", master=3), link(5, "veth-a", "veth", master=3, peer=6),
+        link(6, "veth-b", "veth", peer=5), link(7, "eth0.100", "vlan", master=3, peer=2),
+        addresses={3: [Address(socket.AF_INET, "10.0.0.1", 24)]},
+    )
+    preview = apply(dry_run=True)
+
+    # Sin altas: solo los link set de estado, que no fallan si ya se cumplen
+    assert not [line for line in preview["ip_batch"] if " add " in f" {line}"]
+    assert all(r["unchanged"] for r in preview["results"])
+
+    runs = []
+    monkeypatch.setattr(topology.subprocess, "run", lambda argv, **kwargs: (
+        runs.append(kwargs["input"]), subprocess.CompletedProcess(argv, 0, "", "")
+    )[1])
+    result = apply()
+
+    assert result["success"]
+    assert (result["applied"], result["unchanged"], result["failed"]) == (0, 5, 0)
+    assert len(runs) == 1
+
+
+def test_batch_errors_map_to_their_lines():
+    stderr = (
+        "RTNETLINK answers: File exists\n"
+        "Command failed -:1\n"
+        "Cannot find device \"eth9\"\n"
+        "Command failed -:4\n"
+    )
+    errors, fatal = TopologyService._parse_batch_errors(stderr)
+    assert errors == [(1, "RTNETLINK answers: File exists"), (4, 'Cannot find device "eth9"')]
+    assert fatal is None
+
+    errors, fatal = TopologyService._parse_batch_errors('Error: argument "x" is wrong: invalid\n')
+    assert errors == []
+    assert fatal == 'Error: argument "x" is wrong: invalid'
+
+
+def test_failed_lines_are_reported_on_their_objects(table, monkeypatch):
+    # Línea 3 = tuntap add de tap-vm1; línea 10 = la VLAN (eth0 sin soporte 802.1Q)
+    stderr = "ioctl(TUNSETIFF): Device or resource busy\nCommand failed -:3\n" \
+             "RTNETLINK answers: Operation not supported\nCommand failed -:10\n"
+    monkeypatch.setattr(topology.subprocess, "run",
+                        lambda argv, **kwargs: subprocess.CompletedProcess(argv, 1, "", stderr))
+    result = apply()
+
+    by_name = {r["name"]: r for r in result["results"]}
+    assert not result["success"] and result["failed"] == 2
+    assert by_name["tap-vm1"]["error"] == \
+        "'tuntap add dev tap-vm1 mode tap': ioctl(TUNSETIFF): Device or resource busy"
+    assert "Operation not supported" in by_name["eth0.100"]["error"]
+    assert by_name["br-lab"]["success"] and by_name["veth-a-veth-b"]["success"]
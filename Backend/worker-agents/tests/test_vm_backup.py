@@ -0,0 +1,157 @@
+"""
+Tests de la cadena de backups incrementales (checkpoints + qemu-img rebase -u)
+"""
+
+import json
+import os
+import time
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+from fakes import FakeConnection, FakeDomain, FakeLibvirtError
+from models.vm import BackupMode, BackupStatus, DiskConfig, VMBackupRequest, VMConfig
+from services import vm_backup
+from services.vm_backup import FINAL_STATES, BackupManager
+from services.vm_xml import DomainDeviceCache, render_domain_xml
+
+
+class FakeCheckpoint:
+    def __init__(self, domain: "BackupDomain", name: str):
+        self.domain = domain
+        self.name = name
+
+    def delete(self, flags: int = 0) -> None:
+        del self.domain.checkpoints[self.name]
+
+
+class BackupDomain(FakeDomain):
+    """Dominio en ejecución cuyo block job de backup escribe los ficheros destino"""
+
+    def __init__(self):
+        config = VMConfig(name="web01", vcpus=2, memory_mb=2048, networks=[], disks=[
+            DiskConfig(path="/var/lib/libvirt/images/web01.qcow2"),
+            DiskConfig(path="/var/lib/libvirt/images/web01-data.qcow2"),
+        ])
+        super().__init__("web01", render_domain_xml(config), state=libvirt.VIR_DOMAIN_RUNNING, domain_id=1)
+        self.checkpoints = {}
+        self.backups = []           # (padre incremental, ficheros destino) de cada backupBegin
+        self.fail_next = False
+        self._polls = 0
+        self._result = None
+
+    def backupBegin(self, backup_xml: str, checkpoint_xml: str, flags: int = 0) -> None:
+        backup = ET.fromstring(backup_xml)
+        incremental = backup.find("incremental")
+        files = {disk.get("name"): disk.find("target").get("file") for disk in backup.iter("disk")}
+        for path in files.values():
+            with open(path, "wb") as f:
+                f.write(b"\0" * 512)
+        name = ET.fromstring(checkpoint_xml).findtext("name")
+        self.checkpoints[name] = FakeCheckpoint(self, name)
+        self.backups.append((incremental.text if incremental is not None else None, files))
+        self._polls = 1
+        self._result = libvirt.VIR_DOMAIN_JOB_FAILED if self.fail_next else libvirt.VIR_DOMAIN_JOB_COMPLETED
+        self.fail_next = False
+
+    def jobStats(self, flags: int = 0) -> dict:
+        if flags == libvirt.VIR_DOMAIN_JOB_STATS_COMPLETED:
+            return {"type": self._result, "disk_total": 1024, "errmsg": "disco lleno"}
+        if self._polls:
+            self._polls -= 1
+            return {"type": libvirt.VIR_DOMAIN_JOB_UNBOUNDED, "disk_total": 1024, "disk_processed": 512}
+        return {"type": libvirt.VIR_DOMAIN_JOB_NONE}
+
+    def checkpointLookupByName(self, name: str, flags: int = 0) -> FakeCheckpoint:
+        if name not in self.checkpoints:
+            raise FakeLibvirtError(f"no checkpoint '{name}'", libvirt.VIR_ERR_NO_DOMAIN_CHECKPOINT)
+        return self.checkpoints[name]
+
+
+@pytest.fixture
+def domain():
+    return BackupDomain()
+
+
+@pytest.fixture
+def manager(fake_bin, domain, monkeypatch):
+    monkeypatch.setattr(vm_backup, "POLL_INTERVAL", 0)
+    conn = FakeConnection(domains=[domain])
+    vm_service = SimpleNamespace(_get_connection=lambda: conn, device_cache=DomainDeviceCache())
+    manager = BackupManager(vm_service, backup_dir=str(fake_bin / "backups"), keep_checkpoints=2)
+    yield manager
+    manager.shutdown()
+
+
+def run_backup(manager: BackupManager, incremental: bool = True):
+    job = manager.submit("web01", VMBackupRequest(incremental=incremental))
+    deadline = time.monotonic() + 5
+    while job.status not in FINAL_STATES:
+        assert time.monotonic() < deadline, "el backup no terminó"
+        time.sleep(0.01)
+        job = manager.get(job.job_id)
+    return job
+
+
+def rebases(fake_bin) -> list:
+    log = fake_bin / "qemu-img.log"
+    if not log.exists():
+        return []
+    return [json.loads(line) for line in log.read_text().splitlines()]
+
+
+def test_incremental_backup_links_to_previous_file(manager, domain, fake_bin):
+    full = run_backup(manager)
+    incremental = run_backup(manager)
+
+    assert full.status == incremental.status == BackupStatus.COMPLETED
+    assert (full.mode, full.parent) == (BackupMode.FULL, None)
+    assert (incremental.mode, incremental.parent) == (BackupMode.INCREMENTAL, full.checkpoint)
+    # QEMU solo copia los bloques marcados desde el checkpoint anterior
+    assert [parent for parent, _ in domain.backups] == [None, full.checkpoint]
+
+    first, second = manager.chain("web01")
+    assert second.parent == first.checkpoint
+    assert sorted(second.files) == sorted(first.files) == ["vda", "vdb"]
+    # Cada disco incremental apunta a su padre sin reescribir datos (-u)
+    assert sorted(rebases(fake_bin)) == sorted(
+        ["rebase", "-u", "-F", "qcow2", "-b", first.files[disk], second.files[disk]]
+        for disk in ("vda", "vdb")
+    )
+
+
+def test_missing_parent_checkpoint_falls_back_to_full(manager, domain, fake_bin):
+    full = run_backup(manager)
+    domain.checkpoints.clear()      # p.ej. VM redefinida: libvirt perdió los bitmaps
+
+    job = run_backup(manager)
+
+    assert (job.mode, job.parent) == (BackupMode.FULL, None)
+    assert [entry.parent for entry in manager.chain("web01")] == [None, None]
+    assert rebases(fake_bin) == []
+    assert full.checkpoint != job.checkpoint
+
+
+def test_old_checkpoints_are_pruned(manager, domain):
+    jobs = [run_backup(manager) for _ in range(3)]
+
+    # keep_checkpoints=2: el bitmap más antiguo se borra, la cadena de ficheros no
+    assert sorted(domain.checkpoints) == sorted(job.checkpoint for job in jobs[1:])
+    assert [entry.checkpoint for entry in manager.chain("web01")] == [job.checkpoint for job in jobs]
+
+
+def test_failed_block_job_leaves_chain_untouched(manager, domain, fake_bin):
+    full = run_backup(manager)
+    domain.fail_next = True
+
+    failed = run_backup(manager)
+
+    assert failed.status == BackupStatus.FAILED and failed.error == "disco lleno"
+    assert list(domain.checkpoints) == [full.checkpoint]
+    assert not any(os.path.exists(path) for path in domain.backups[-1][1].values())
+    assert [entry.checkpoint for entry in manager.chain("web01")] == [full.checkpoint]
+    # El siguiente incremental sigue partiendo del último backup completado
+    assert run_backup(manager).parent == full.checkpoint
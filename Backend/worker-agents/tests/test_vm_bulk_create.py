@@ -0,0 +1,95 @@
+"""
+Tests de la creación de VMs en lote (POST /vm/bulk-create)
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("libvirt")
+httpx = pytest.importorskip("httpx")
+
+import main
+from api import vm as vm_api
+from utils.executor import BULK_CREATE_LIMIT, LIBVIRT_POOL_SIZE
+
+
+class ConcurrencyProbe:
+    """create_vm falso que registra cuántas creaciones coinciden en el tiempo"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, config):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        return f"uuid-{config.name}"
+
+
+def bulk_request(count: int, concurrency: int) -> dict:
+    return {
+        "template": {"name": "plantilla", "memory_mb": 1024, "vcpus": 1, "disks": [], "networks": []},
+        "count": count,
+        "name_pattern": "lab-vm{index:02d}",
+        "start": False,
+        "concurrency": concurrency,
+    }
+
+
+def send(payload: dict) -> httpx.Response:
+    transport = httpx.ASGITransport(app=main.app)
+
+    async def call():
+        async with httpx.AsyncClient(transport=transport, base_url="http://worker") as client:
+            return await client.post("/vm/bulk-create", json=payload)
+
+    return asyncio.run(call())
+
+
+def post(payload: dict) -> list:
+    response = send(payload)
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_bulk_create_leaves_libvirt_threads_free(monkeypatch):
+    probe = ConcurrencyProbe()
+    monkeypatch.setattr(vm_api.vm_service, "create_vm", probe)
+
+    events = post(bulk_request(count=12, concurrency=BULK_CREATE_LIMIT))
+
+    assert events[-1]["summary"]["succeeded"] == 12
+    assert [event["status"] for event in events[:-1]] == ["created"] * 12
+    assert probe.peak == BULK_CREATE_LIMIT < LIBVIRT_POOL_SIZE
+
+
+def test_bulk_create_honours_lower_concurrency(monkeypatch):
+    probe = ConcurrencyProbe()
+    monkeypatch.setattr(vm_api.vm_service, "create_vm", probe)
+
+    post(bulk_request(count=6, concurrency=2))
+
+    assert probe.peak == 2
+
+
+def test_bulk_create_rejects_concurrency_above_limit():
+    response = send(bulk_request(count=2, concurrency=BULK_CREATE_LIMIT + 1))
+
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("pattern", ["lab-vm{index.x}", "lab-vm{index[0]}", "lab-vm{name}", "lab-vm"])
+def test_bulk_create_rejects_invalid_name_pattern(pattern):
+    payload = bulk_request(count=2, concurrency=2)
+    payload["name_pattern"] = pattern
+
+    assert send(payload).status_code == 422
@@ -0,0 +1,157 @@
+"""
+Benchmark del listado de VMs contra una conexión libvirt simulada de 1000 dominios
+
+Cada llamada al daemon cuesta una latencia fija (LATENCY), que es lo que
+domina en un host real: el listado masivo (listAllDomains + getAllDomainStats)
+debe hacer un número de viajes constante más un XMLDesc por VM devuelta,
+frente a los cuatro viajes por dominio de la enumeración uno a uno.
+Ejecutar con -s para ver los tiempos.
+"""
+
+import time
+import xml.etree.ElementTree as ET
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+from fakes import FakeConnection, FakeDomain
+from models.vm import DiskConfig, NetworkConfig, VMConfig, VMListFilter, VMState
+from services.vm import VMService
+from services.vm_xml import render_domain_xml
+
+
+DOMAINS = 1000
+LATENCY = 0.00005
+
+
+def make_connection() -> FakeConnection:
+    conn = FakeConnection(latency=LATENCY)
+    for i in range(DOMAINS):
+        name = f"lab{i // 50:02d}-vm{i % 50:02d}"
+        config = VMConfig(
+            name=name, vcpus=2, memory_mb=2048,
+            disks=[DiskConfig(path=f"/var/lib/libvirt/images/{name}.qcow2")],
+            networks=[NetworkConfig(network_type="bridge", source=f"br-lab{i // 50:02d}",
+                                    mac_address=f"52:54:00:00:{i // 256:02x}:{i % 256:02x}")]
+        )
+        running = i % 3 != 0
+        conn.add(FakeDomain(
+            name, render_domain_xml(config),
+            uuid=f"00000000-0000-0000-0000-{i:012d}",
+            state=libvirt.VIR_DOMAIN_RUNNING if running else libvirt.VIR_DOMAIN_SHUTOFF,
+            memory_kib=2048 * 1024, vcpus=2, domain_id=i + 1 if running else -1,
+            autostart=i % 10 == 0, cpu_time=i * 10 ** 9
+        ))
+    return conn
+
+
+def make_service(conn: FakeConnection) -> VMService:
+    service = VMService()
+    service._get_connection = lambda: conn
+    return service
+
+
+def list_one_by_one(conn: FakeConnection) -> int:
+    """Referencia: enumeración por dominio con info/autostart/isPersistent/XMLDesc"""
+    listed = 0
+    for domain in conn.listAllDomains(0):
+        domain.info()
+        domain.autostart()
+        domain.isPersistent()
+        ET.fromstring(domain.XMLDesc(0))
+        listed += 1
+    return listed
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+@pytest.fixture(scope="module")
+def conn():
+    return make_connection()
+
+
+def test_bulk_listing_round_trips(conn):
+    service = make_service(conn)
+
+    conn.calls.clear()
+    (vms, total), elapsed_ms = timed(service.list_vms_with_total, None)
+    print(f"\nlistado masivo en frío: {elapsed_ms:.0f} ms, {conn.round_trips} llamadas")
+
+    assert total == len(vms) == DOMAINS
+    # Sin llamadas por dominio salvo el XML (caché de dispositivos vacía)
+    assert conn.calls.get("info", 0) == 0
+    assert conn.calls.get("autostart", 0) == conn.calls.get("isPersistent", 0) == 0
+    assert conn.calls["XMLDesc"] == DOMAINS
+    assert conn.round_trips == DOMAINS + 3
+
+    by_name = {vm.name: vm for vm in vms}
+    vm = by_name["lab00-vm01"]
+    assert vm.state == VMState.RUNNING and vm.cpu_time == 10 ** 9
+    assert by_name["lab00-vm00"].autostart and by_name["lab00-vm00"].state == VMState.SHUTOFF
+    assert vm.disks[0]["path"] == "/var/lib/libvirt/images/lab00-vm01.qcow2"
+
+    # Con la caché caliente el listado completo no vuelve a pedir XML
+    conn.calls.clear()
+    _, warm_ms = timed(service.list_vms_with_total, None)
+    print(f"listado masivo en caliente: {warm_ms:.0f} ms, {conn.round_trips} llamadas")
+    assert conn.round_trips == 3
+
+
+def test_filtered_page_reads_only_returned_xml(conn):
+    service = make_service(conn)
+    conn.calls.clear()
+    vms, total = service.list_vms_with_total(
+        VMListFilter(state=VMState.RUNNING, name_pattern="^lab0", limit=50)
+    )
+
+    assert total == DOMAINS
+    assert len(vms) == 50
+    assert all(vm.state == VMState.RUNNING and vm.name.startswith("lab0") for vm in vms)
+    assert conn.calls["XMLDesc"] == 50
+
+
+def test_bulk_listing_beats_one_by_one(conn):
+    listed, reference_ms = timed(list_one_by_one, conn)
+    service = make_service(conn)
+    (vms, _), bulk_ms = timed(service.list_vms_with_total, None)
+    print(f"\nuno a uno: {reference_ms:.0f} ms; masivo en frío: {bulk_ms:.0f} ms")
+
+    assert listed == len(vms) == DOMAINS
+    assert bulk_ms < reference_ms
+
+
+def test_inventory_serves_listing_from_memory(conn):
+    service = make_service(conn)
+    service.inventory.reload()
+
+    conn.calls.clear()
+    (vms, total), elapsed_ms = timed(service.list_vms_with_total, None)
+    print(f"\ninventario: {elapsed_ms:.1f} ms, {conn.round_trips} llamadas")
+
+    assert total == len(vms) == DOMAINS
+    # Los contadores de ejecución salen del buffer del sampler
+    assert conn.calls == {}
+
+
+def test_inventory_runtime_fields_come_from_sampler(conn, monkeypatch):
+    service = make_service(conn)
+    service.inventory.reload()
+    monkeypatch.setattr(time, "time", lambda: 1_000_000.0)
+    service.stats_sampler.sample_once()
+
+    monkeypatch.setattr(time, "time", lambda: 1_000_090.0)
+    conn.calls.clear()
+    running = service.get_vm_info("lab00-vm01")
+    stopped = service.get_vm_info("lab00-vm00")
+
+    assert conn.calls == {}
+    assert running.cpu_time == 10 ** 9
+    assert running.memory_used_mb == 2048
+    # Sin pidfile, el arranque es la primera muestra en la que se vio activo
+    assert running.uptime == 90
+    assert stopped.uptime is None
@@ -0,0 +1,316 @@
+"""
+Tests del gestor de migraciones en segundo plano
+
+La lógica de cola, progreso, ajuste en caliente y cancelación se prueba con
+dominios falsos cuyo migrate3 se bloquea hasta que el test lo libera. El
+driver test:///default de libvirt (sin soporte de migración) cubre la
+búsqueda real de dominios y el camino de error.
+"""
+
+import threading
+import time
+from typing import Optional
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+from fakes import FakeConnection, FakeDomain, FakeLibvirtError
+from models.vm import MigrationStatus, VMMigrationConfig
+from services import vm_migration
+from services.vm_migration import MigrationManager
+
+
+class MigratingDomain(FakeDomain):
+    """Dominio cuyo migrate3 dura hasta release() o abortJob()"""
+
+    def __init__(self, name: str, error: int = None, early_aborts: int = 0):
+        super().__init__(name, state=libvirt.VIR_DOMAIN_RUNNING, domain_id=1)
+        self.error = error
+        self.early_aborts = early_aborts   # abortJob() que llegan antes que el job
+        self.abort_calls = 0
+        self.migrations = []
+        self.downtimes = []
+        self.postcopy_started = False
+        self.started = threading.Event()
+        self._released = threading.Event()
+        self._aborted = False
+        self._stats_calls = 0
+
+    def migrate3(self, dest_conn, params, flags):
+        self.migrations.append((dest_conn, params, flags))
+        self.started.set()
+        if self.error is not None:
+            raise FakeLibvirtError("error de migración simulado", self.error)
+        self._released.wait(5)
+        if self._aborted:
+            raise FakeLibvirtError("operation aborted: migration job: canceled by client",
+                                   libvirt.VIR_ERR_OPERATION_ABORTED)
+
+    def release(self):
+        self._released.set()
+
+    def abortJob(self):
+        self.abort_calls += 1
+        if self.abort_calls <= self.early_aborts:
+            raise FakeLibvirtError("Requested operation is not valid: no job is active on the domain",
+                                   libvirt.VIR_ERR_OPERATION_INVALID)
+        self._aborted = True
+        self._released.set()
+
+    def jobStats(self, flags=0):
+        # Cada lectura es una iteración más de pre-copia
+        self._stats_calls += 1
+        processed = min(self._stats_calls * 256, 1024)
+        return {
+            "type": libvirt.VIR_DOMAIN_JOB_UNBOUNDED,
+            "data_total": 1024,
+            "data_processed": processed,
+            "data_remaining": 1024 - processed,
+            "memory_dirty_rate": 500,
+            "memory_iteration": self._stats_calls,
+            "time_elapsed": self._stats_calls * 10,
+        }
+
+    def migrateSetMaxDowntime(self, downtime, flags=0):
+        self.downtimes.append(downtime)
+
+    def migrateStartPostCopy(self, flags=0):
+        self.postcopy_started = True
+
+
+class FakePool:
+    """Pool de conexiones a un host destino"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.broken = []
+        self.gate: Optional[threading.Event] = None   # Conexión lenta al destino
+        self.connecting = threading.Event()
+
+    def get(self):
+        self.connecting.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        return self.conn
+
+    def mark_broken(self, conn):
+        self.broken.append(conn)
+
+
+class FakeConnections:
+    def __init__(self, open_remote):
+        self.open_remote = open_remote
+        self.pools = {}
+
+    def remote(self, uri: str) -> FakePool:
+        if uri not in self.pools:
+            self.pools[uri] = FakePool(self.open_remote(uri))
+        return self.pools[uri]
+
+
+class FakeVMService:
+    """Lo que el gestor usa de VMService: conexión local y pools remotos"""
+
+    def __init__(self, conn, open_remote=None):
+        self.conn = conn
+        self.connections = FakeConnections(open_remote or (lambda uri: FakeConnection(hostname=uri)))
+
+    def _get_connection(self):
+        return self.conn
+
+
+def wait_for(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condición no alcanzada")
+        time.sleep(0.01)
+
+
+@pytest.fixture(autouse=True)
+def fast_progress(monkeypatch):
+    monkeypatch.setattr(vm_migration, "PROGRESS_INTERVAL", 0.01)
+
+
+@pytest.fixture
+def conn():
+    return FakeConnection()
+
+
+@pytest.fixture
+def manager(conn):
+    manager = MigrationManager(FakeVMService(conn), max_per_host=1)
+    yield manager
+    for domain in conn.domains.values():
+        domain.release()
+    manager.shutdown()
+
+
+def status(manager, job) -> MigrationStatus:
+    return manager.get(job.job_id).status
+
+
+def test_migration_flags_progress_and_completion(conn, manager):
+    domain = conn.add(MigratingDomain("web01"))
+    job = manager.submit("web01", VMMigrationConfig(
+        destination_host="worker2", auto_converge=True, bandwidth_mbps=500,
+        parallel_connections=4, max_downtime_ms=300
+    ))
+    assert job.status == MigrationStatus.QUEUED
+
+    wait_for(lambda: manager.get(job.job_id).progress.percent > 0)
+    running = manager.get(job.job_id)
+    assert running.status == MigrationStatus.RUNNING
+    assert running.progress.data_total == 1024
+    assert running.progress.memory_dirty_rate == 500
+
+    dest_conn, params, flags = domain.migrations[0]
+    pool = manager.vm_service.connections.pools["qemu+ssh://worker2/system"]
+    assert dest_conn is pool.conn
+    assert flags == (libvirt.VIR_MIGRATE_PEER2PEER | libvirt.VIR_MIGRATE_LIVE
+                     | libvirt.VIR_MIGRATE_AUTO_CONVERGE | libvirt.VIR_MIGRATE_PARALLEL)
+    assert params == {libvirt.VIR_MIGRATE_PARAM_BANDWIDTH: 500,
+                      libvirt.VIR_MIGRATE_PARAM_PARALLEL_CONNECTIONS: 4}
+
+    # El downtime máximo se fija una sola vez, con el job ya iniciado
+    wait_for(lambda: domain._stats_calls >= 3)
+    assert domain.downtimes == [300]
+
+    domain.release()
+    wait_for(lambda: status(manager, job) == MigrationStatus.COMPLETED)
+    finished = manager.get(job.job_id)
+    assert finished.progress.percent == 100.0
+    assert finished.progress.data_remaining == 0
+    assert finished.finished_at is not None
+
+
+def test_postcopy_switch_and_cancel_refused(conn, manager):
+    domain = conn.add(MigratingDomain("db01"))
+    job = manager.submit("db01", VMMigrationConfig(
+        destination_host="worker2", postcopy=True, postcopy_after_iterations=2
+    ))
+
+    wait_for(lambda: status(manager, job) == MigrationStatus.POSTCOPY)
+    assert domain.postcopy_started
+    assert domain.migrations[0][2] & libvirt.VIR_MIGRATE_POSTCOPY
+    with pytest.raises(RuntimeError, match="post-copy"):
+        manager.cancel(job.job_id)
+
+    domain.release()
+    wait_for(lambda: status(manager, job) == MigrationStatus.COMPLETED)
+
+
+def test_per_host_limit_queues_and_cancel_queued(conn, manager):
+    first = conn.add(MigratingDomain("vm1"))
+    second = conn.add(MigratingDomain("vm2"))
+    other = conn.add(MigratingDomain("vm3"))
+
+    job1 = manager.submit("vm1", VMMigrationConfig(destination_host="worker2"))
+    job2 = manager.submit("vm2", VMMigrationConfig(destination_host="worker2"))
+    job3 = manager.submit("vm3", VMMigrationConfig(destination_host="worker3"))
+
+    # max_per_host=1: vm2 espera a vm1, vm3 va a otro host y arranca
+    first.started.wait(5)
+    other.started.wait(5)
+    assert status(manager, job2) == MigrationStatus.QUEUED
+
+    cancelled = manager.cancel(job2.job_id)
+    assert cancelled.status == MigrationStatus.CANCELLED
+
+    first.release()
+    other.release()
+    wait_for(lambda: status(manager, job1) == status(manager, job3) == MigrationStatus.COMPLETED)
+    assert second.migrations == []
+
+
+def test_cancel_running_migration_aborts_job(conn, manager):
+    domain = conn.add(MigratingDomain("vm1"))
+    job = manager.submit("vm1", VMMigrationConfig(destination_host="worker2"))
+    domain.started.wait(5)
+
+    manager.cancel(job.job_id)
+    wait_for(lambda: status(manager, job) == MigrationStatus.CANCELLED)
+
+    # La VM queda libre para otra migración
+    domain.started.clear()
+    domain._aborted = False
+    domain._released.clear()
+    retry = manager.submit("vm1", VMMigrationConfig(destination_host="worker2"))
+    assert retry.job_id != job.job_id
+
+
+def test_cancel_while_connecting_to_destination(conn, manager):
+    domain = conn.add(MigratingDomain("vm1"))
+    pool = manager.vm_service.connections.remote("qemu+ssh://worker2/system")
+    pool.gate = threading.Event()
+
+    job = manager.submit("vm1", VMMigrationConfig(destination_host="worker2"))
+    pool.connecting.wait(5)
+    assert status(manager, job) == MigrationStatus.RUNNING
+    manager.cancel(job.job_id)
+
+    # Al terminar de conectar no se lanza migrate3
+    pool.gate.set()
+    wait_for(lambda: status(manager, job) == MigrationStatus.CANCELLED)
+    assert domain.migrations == []
+
+
+def test_cancel_before_libvirt_job_starts_is_retried(conn, manager):
+    domain = conn.add(MigratingDomain("vm1", early_aborts=1))
+    job = manager.submit("vm1", VMMigrationConfig(destination_host="worker2"))
+    domain.started.wait(5)
+
+    # abortJob falla (sin job activo aún); el monitor lo repite
+    manager.cancel(job.job_id)
+    wait_for(lambda: status(manager, job) == MigrationStatus.CANCELLED)
+    assert domain.abort_calls == 2
+
+
+def test_duplicate_and_unknown_vm_are_rejected(conn, manager):
+    conn.add(MigratingDomain("vm1"))
+    manager.submit("vm1", VMMigrationConfig(destination_host="worker2"))
+
+    with pytest.raises(RuntimeError, match="Ya existe una migración"):
+        manager.submit("vm1", VMMigrationConfig(destination_host="worker3"))
+    with pytest.raises(RuntimeError, match="no encontrada"):
+        manager.submit("missing", VMMigrationConfig(destination_host="worker2"))
+
+
+def test_broken_destination_connection_is_discarded(conn, manager):
+    domain = conn.add(MigratingDomain("vm1", error=libvirt.VIR_ERR_RPC))
+    job = manager.submit("vm1", VMMigrationConfig(destination_host="worker2"))
+
+    wait_for(lambda: status(manager, job) == MigrationStatus.FAILED)
+    pool = manager.vm_service.connections.pools["qemu+ssh://worker2/system"]
+    assert pool.broken == [pool.conn]
+    assert "error de migración simulado" in manager.get(job.job_id).error
+
+
+@pytest.fixture
+def test_driver():
+    """Conexión al driver test:///default (dominio "test" en ejecución)"""
+    try:
+        return libvirt.open("test:///default")
+    except (AttributeError, libvirt.libvirtError) as e:
+        pytest.skip(f"driver test:///default no disponible: {e}")
+
+
+def test_test_driver_lookup_and_unsupported_migration(test_driver):
+    # Destino: otra conexión al mismo driver de pruebas
+    service = FakeVMService(test_driver, open_remote=lambda uri: libvirt.open("test:///default"))
+    manager = MigrationManager(service)
+    try:
+        with pytest.raises(RuntimeError, match="no encontrada"):
+            manager.submit("no-existe", VMMigrationConfig(destination_host="worker2"))
+
+        job = manager.submit("test", VMMigrationConfig(destination_host="worker2"))
+        wait_for(lambda: manager.get(job.job_id).status in vm_migration.FINAL_STATES)
+
+        # El driver de pruebas no implementa migraciones peer-to-peer
+        failed = manager.get(job.job_id)
+        assert failed.status == MigrationStatus.FAILED
+        assert failed.error
+        assert manager.list_jobs("test")[0].job_id == job.job_id
+    finally:
+        manager.shutdown()
@@ -0,0 +1,319 @@
+"""
+Tests del motor de colocación NUMA/CPU (pack, spread, isolate y hugepages)
+
+El host de las fixtures tiene dos nodos NUMA con dos cores SMT de dos
+hilos cada uno: nodo 0 = cores (0,2) y (1,3); nodo 1 = cores (4,6) y (5,7).
+"""
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+from fakes import FakeConnection, FakeDomain, fixture
+from models.vm import DiskConfig, NUMACell, PlacementPolicy, VMConfig
+from services import hugepages
+from services.host_capacity import HostCapacityModel, memory_to_kib
+from services.vm_inventory import DomainInventory
+from services.vm_placement import PlacementEngine
+from services.vm_snapshots import SnapshotIndex
+from services.vm_xml import DomainDeviceCache, render_domain_xml
+
+
+class FakeVMService:
+    """Lo que el motor (y los eventos del inventario) usan de VMService"""
+
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+        self.capacity = HostCapacityModel(self)
+        self.device_cache = DomainDeviceCache()
+        self.snapshot_index = SnapshotIndex()
+
+    def _get_connection(self) -> FakeConnection:
+        return self.conn
+
+
+def make_engine(*domains: FakeDomain) -> PlacementEngine:
+    conn = FakeConnection(fixture("capabilities.xml"), domains)
+    return PlacementEngine(FakeVMService(conn))
+
+
+def make_config(name: str, vcpus: int = 1, memory_mb: int = 1024,
+                placement: str = "pack", **kwargs) -> VMConfig:
+    values = {"disks": [], "networks": []}
+    values.update(kwargs)
+    return VMConfig(name=name, vcpus=vcpus, memory_mb=memory_mb, placement=placement, **values)
+
+
+@pytest.fixture
+def sysfs(tmp_path, monkeypatch):
+    """Pools de 2 MiB en un sysfs falso: 512 páginas globales, 256 por nodo"""
+    def write_pool(base, total):
+        pool = base / "hugepages-2048kB"
+        pool.mkdir(parents=True)
+        (pool / "nr_hugepages").write_text(f"{total}\n")
+        (pool / "free_hugepages").write_text(f"{total}\n")
+
+    write_pool(tmp_path / "kernel" / "mm" / "hugepages", 512)
+    for node in (0, 1):
+        write_pool(tmp_path / "node" / f"node{node}" / "hugepages", 256)
+    monkeypatch.setattr(hugepages, "HUGEPAGES_DIR", str(tmp_path / "kernel" / "mm" / "hugepages"))
+    monkeypatch.setattr(hugepages, "NODE_DIR", str(tmp_path / "node"))
+    return tmp_path
+
+
+def test_no_policy_does_not_reserve():
+    engine = make_engine()
+    assert engine.place(make_config("plain", placement="none")) is None
+    assert all(node.pinned_vcpus == 0 for node in engine.usage())
+
+
+def test_pack_fills_one_node_before_the_next():
+    engine = make_engine()
+    first = engine.place(make_config("a", vcpus=2))
+    second = engine.place(make_config("b", vcpus=2))
+
+    assert first.nodes == second.nodes == [0]
+    assert first.memory_mode == "strict"
+    # Las vCPUs van a las CPUs menos cargadas del nodo elegido
+    assert sorted(first.vcpu_pins + second.vcpu_pins) == [0, 1, 2, 3]
+
+
+def test_spread_balances_nodes():
+    engine = make_engine()
+    placements = [engine.place(make_config(f"vm{i}", placement="spread")) for i in range(4)]
+
+    assert [p.nodes for p in placements] == [[0], [1], [0], [1]]
+    usage = {node.node: node for node in engine.usage()}
+    assert usage[0].pinned_vcpus == usage[1].pinned_vcpus == 2
+    assert usage[0].committed_memory_mb == usage[1].committed_memory_mb == 2048
+
+
+def test_shared_vm_larger_than_a_node_interleaves_memory():
+    engine = make_engine()
+    placement = engine.place(make_config("big", vcpus=2, memory_mb=12288, placement="spread"))
+
+    assert placement.nodes == [0, 1]
+    assert placement.memory_mode == "interleave"
+
+
+def test_isolate_takes_whole_cores_with_smt_siblings():
+    engine = make_engine()
+    placement = engine.place(make_config("rt", vcpus=1, placement="isolate"))
+
+    # Una vCPU reserva el core completo (el hermano SMT queda sin usar)
+    assert placement.vcpu_pins == [0]
+    assert placement.exclusive == [0, 2]
+    # El emulador va a las CPUs no exclusivas del mismo nodo
+    assert placement.emulator_cpus == [1, 3]
+
+    # Las VMs compartidas ya no pueden usar el core reservado
+    shared = engine.place(make_config("web", vcpus=2))
+    assert set(shared.vcpu_pins).isdisjoint({0, 2})
+
+
+def test_isolate_prefers_the_tightest_node():
+    engine = make_engine()
+    engine.place(make_config("rt1", vcpus=2, placement="isolate"))
+    second = engine.place(make_config("rt2", vcpus=2, placement="isolate"))
+
+    # El nodo 0 solo tiene un core libre: mejor ajuste antes que abrir el nodo 1
+    assert second.nodes == [0]
+    assert second.exclusive == [1, 3]
+
+
+def test_isolate_rejects_when_no_free_cores():
+    engine = make_engine()
+    for name in ("rt1", "rt2"):
+        engine.place(make_config(name, vcpus=4, placement="isolate"))
+
+    with pytest.raises(RuntimeError, match="Sin capacidad NUMA"):
+        engine.place(make_config("rt3", vcpus=1, placement="isolate"))
+
+
+def test_release_returns_cores_and_memory():
+    engine = make_engine()
+    engine.place(make_config("rt", vcpus=2, memory_mb=2048, placement="isolate"))
+    engine.release("rt")
+
+    assert all(node.exclusive_cpus == 0 and node.committed_memory_mb == 0
+               for node in engine.usage())
+
+
+def test_free_cores_groups_smt_siblings():
+    engine = make_engine()
+    cell = engine._cells()[0]
+    assert engine._free_cores(cell) == [[0, 2], [1, 3]]
+
+    # Una vCPU compartida en un hilo ocupa el core entero para isolate
+    engine._usage[3] = 1
+    assert engine._free_cores(cell) == [[0, 2]]
+
+    engine._exclusive.add(2)
+    assert engine._free_cores(cell) == []
+
+
+def test_free_cores_without_sibling_information():
+    engine = make_engine()
+    cell = NUMACell(id=0, memory_mb=4096, cpus=[0, 1, 2])
+    assert engine._free_cores(cell) == [[0], [1], [2]]
+
+
+def test_from_xml_reads_policy_and_exclusive_cores():
+    placement = PlacementEngine._from_xml(ET.fromstring(fixture("domain_isolated.xml")))
+
+    assert placement.policy == PlacementPolicy.ISOLATE
+    assert placement.vcpu_pins == [4]
+    assert placement.emulator_cpus == [5, 7]
+    assert placement.nodes == [1]
+    assert placement.memory_mb == 2048
+    assert placement.exclusive == [4, 6]
+
+
+def test_from_xml_ignores_unpinned_domains():
+    assert PlacementEngine._from_xml(ET.fromstring(fixture("domain_unpinned.xml"))) is None
+
+
+@pytest.mark.parametrize("policy", ["pack", "spread", "isolate"])
+def test_rendered_xml_round_trips(policy):
+    engine = make_engine()
+    config = make_config("vm", vcpus=2, memory_mb=2048, placement=policy)
+    placement = engine.place(config)
+
+    root = ET.fromstring(render_domain_xml(config, placement))
+    assert PlacementEngine._from_xml(root) == placement
+
+
+
+def test_iothreads_are_pinned_with_the_emulator():
+    engine = make_engine()
+    config = make_config("io", vcpus=2, placement="isolate", iothreads=2,
+                         disks=[DiskConfig(path="/var/lib/libvirt/images/io.qcow2", iothread=2)])
+    placement = engine.place(config)
+
+    cputune = ET.fromstring(render_domain_xml(config, placement)).find("cputune")
+    emulator = cputune.find("emulatorpin").get("cpuset")
+    vcpus = {pin.get("cpuset") for pin in cputune.findall("vcpupin")}
+    assert [(pin.get("iothread"), pin.get("cpuset")) for pin in cputune.findall("iothreadpin")] == [
+        ("1", emulator), ("2", emulator)
+    ]
+    assert emulator not in vcpus
+
+def test_usage_is_rebuilt_from_defined_domains(sysfs):
+    engine = make_engine(
+        FakeDomain("db01", fixture("domain_isolated.xml")),
+        FakeDomain("web01", fixture("domain_unpinned.xml"))
+    )
+    usage = {node.node: node for node in engine.usage()}
+
+    assert usage[1].exclusive_cpus == 2
+    assert usage[1].pinned_vcpus == 1
+    assert usage[1].committed_memory_mb == 2048
+    assert usage[0].pinned_vcpus == 0
+
+    # El core (4,6) del dominio existente no se vuelve a entregar
+    placement = engine.place(make_config("rt", vcpus=2, placement="isolate"))
+    assert set(placement.exclusive).isdisjoint({4, 6})
+
+    # Y sus 1024 páginas de 2 MiB cuentan como comprometidas en el nodo 1
+    pools = {(pool.node, pool.size_kib): pool for pool in engine.hugepage_pools()}
+    assert pools[(None, 2048)].committed == 1024
+    assert pools[(1, 2048)].committed == 1024
+
+
+def test_hugepages_reserved_from_the_global_pool(sysfs):
+    engine = make_engine()
+    engine.place(make_config("hp", memory_mb=512, placement="none", hugepages="2M"))
+
+    pools = {(pool.node, pool.size_kib): pool for pool in engine.hugepage_pools()}
+    assert pools[(None, 2048)].committed == 256
+    assert pools[(None, 2048)].available == 256
+
+
+def test_hugepage_overcommit_is_rejected(sysfs):
+    engine = make_engine()
+    engine.place(make_config("hp1", memory_mb=768, placement="none", hugepages="2M"))
+
+    with pytest.raises(RuntimeError, match="Sin capacidad de hugepages"):
+        engine.place(make_config("hp2", memory_mb=512, placement="none", hugepages="2M"))
+
+    # Tras liberar la primera vuelve a caber
+    engine.release("hp1")
+    assert engine.place(make_config("hp2", memory_mb=512, placement="none", hugepages="2M")) is None
+
+
+def test_hugepages_respect_per_node_pools(sysfs):
+    engine = make_engine()
+    # 256 páginas caben justas en el nodo 0
+    first = engine.place(make_config("hp1", memory_mb=512, placement="pack", hugepages="2M"))
+    assert first.nodes == [0]
+
+    # El pool del nodo 0 está agotado: la siguiente va al nodo 1 aunque pack prefiera el 0
+    second = engine.place(make_config("hp2", memory_mb=512, placement="pack", hugepages="2M"))
+    assert second.nodes == [1]
+
+    with pytest.raises(RuntimeError, match="Sin capacidad de hugepages"):
+        engine.place(make_config("hp3", memory_mb=2, placement="pack", hugepages="2M"))
+
+
+def undefine_event(engine: PlacementEngine, domain: FakeDomain) -> None:
+    """Evento de undefine de libvirt (p.ej. virsh undefine) entregado al inventario"""
+    service = engine.vm_service
+    service.placement = engine
+    DomainInventory(service)._on_lifecycle(
+        service.conn, domain, libvirt.VIR_DOMAIN_EVENT_UNDEFINED, 0, None
+    )
+
+
+def test_undefine_event_releases_the_domain_reservation(sysfs):
+    domain = FakeDomain("db01", fixture("domain_isolated.xml"))
+    engine = make_engine(domain)
+    assert {node.node: node.exclusive_cpus for node in engine.usage()}[1] == 2
+
+    undefine_event(engine, domain)
+
+    assert all(node.exclusive_cpus == 0 and node.committed_memory_mb == 0
+               for node in engine.usage())
+    assert all(pool.committed == 0 for pool in engine.hugepage_pools())
+
+
+def test_late_undefine_event_keeps_the_reservation_of_a_recreated_vm():
+    old = FakeDomain("rt", uuid="00000000-0000-0000-0000-00000000000a")
+    engine = make_engine()
+    engine.place(make_config("rt", vcpus=2, placement="isolate"))
+    engine.bind("rt", old.UUIDString())
+
+    # Recreada con el mismo nombre antes de que llegue el evento de la anterior
+    engine.place(make_config("rt", vcpus=2, placement="isolate"))
+    engine.bind("rt", "00000000-0000-0000-0000-00000000000b")
+    undefine_event(engine, old)
+
+    assert sum(node.exclusive_cpus for node in engine.usage()) == 2
+    assert engine.release_domain("rt", "00000000-0000-0000-0000-00000000000b")
+    assert sum(node.exclusive_cpus for node in engine.usage()) == 0
+
+
+def test_reservation_without_domain_is_not_released_by_events():
+    engine = make_engine()
+    engine.place(make_config("rt", vcpus=2, placement="isolate"))
+
+    # Reserva en curso (aún sin defineXML): ningún UUID la libera
+    assert not engine.release_domain("rt", "00000000-0000-0000-0000-00000000000a")
+    assert sum(node.exclusive_cpus for node in engine.usage()) == 2
+
+
+@pytest.mark.parametrize("value, unit, kib", [
+    (2048, None, 2048),
+    (2048, "KiB", 2048),
+    (2, "M", 2048),
+    (2, "MiB", 2048),
+    (1, "GiB", 1024 ** 2),
+    (1, "G", 1024 ** 2),
+    (1, "T", 1024 ** 3),
+    (2048000, "KB", 2000000),
+    (1048576, "bytes", 1024),
+    (4, "MB", 3906),
+])
+def test_memory_units(value, unit, kib):
+    assert memory_to_kib(value, unit) == kib
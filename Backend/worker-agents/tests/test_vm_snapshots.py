@@ -0,0 +1,126 @@
+"""
+Tests del índice de snapshots en memoria frente a cambios hechos con virsh
+"""
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+from fakes import FakeDomain, FakeLibvirtError
+from services.vm_snapshots import SnapshotIndex, snapshot_from_xml
+
+
+class FakeSnapshot:
+    def __init__(self, name: str, created: int, parent: str = None):
+        self.name = name
+        self.xml = (
+            f"<domainsnapshot><name>{name}</name><creationTime>{created}</creationTime>"
+            + (f"<parent><name>{parent}</name></parent>" if parent else "")
+            + "<state>shutoff</state></domainsnapshot>"
+        )
+
+    def getName(self) -> str:
+        return self.name
+
+    def getXMLDesc(self, flags: int = 0) -> str:
+        return self.xml
+
+
+class SnapshotDomain(FakeDomain):
+    """Dominio con snapshots; snapshot_create/delete imitan a virsh"""
+
+    def __init__(self):
+        super().__init__("web01")
+        self.snapshots = {}
+        self.current = None
+        self.builds = 0
+
+    # Cambios de virsh (fuera del worker)
+    def snapshot_create(self, name: str, created: int) -> FakeSnapshot:
+        snapshot = FakeSnapshot(name, created, self.current)
+        self.snapshots[name] = snapshot
+        self.current = name
+        return snapshot
+
+    def snapshot_delete(self, name: str) -> None:
+        del self.snapshots[name]
+        if self.current == name:
+            self.current = None
+
+    # API de libvirt
+    def snapshotNum(self, flags: int = 0) -> int:
+        return len(self.snapshots)
+
+    def snapshotCurrent(self, flags: int = 0) -> FakeSnapshot:
+        if self.current is None:
+            raise FakeLibvirtError("no current snapshot", libvirt.VIR_ERR_NO_DOMAIN_SNAPSHOT)
+        return self.snapshots[self.current]
+
+    def hasCurrentSnapshot(self, flags: int = 0) -> int:
+        return int(self.current is not None)
+
+    def listAllSnapshots(self, flags: int = 0):
+        self.builds += 1
+        return list(self.snapshots.values())
+
+
+def names(index: SnapshotIndex, domain: SnapshotDomain):
+    snapshots, _, current = index.list(domain)
+    return [snapshot.name for snapshot in snapshots], current
+
+
+@pytest.fixture
+def domain():
+    domain = SnapshotDomain()
+    domain.snapshot_create("base", 100)
+    domain.snapshot_create("patched", 200)
+    return domain
+
+
+def test_listing_is_served_from_the_index(domain):
+    index = SnapshotIndex()
+    assert names(index, domain) == (["base", "patched"], "patched")
+    assert names(index, domain) == (["base", "patched"], "patched")
+    assert domain.builds == 1
+
+
+def test_virsh_delete_then_create_rebuilds_the_index(domain):
+    index = SnapshotIndex()
+    names(index, domain)
+
+    # Mismo número de snapshots que antes
+    domain.snapshot_delete("base")
+    domain.snapshot_create("upgraded", 300)
+
+    assert names(index, domain) == (["patched", "upgraded"], "upgraded")
+    assert domain.builds == 2
+
+
+def test_virsh_recreating_the_current_snapshot_rebuilds_the_index(domain):
+    index = SnapshotIndex()
+    names(index, domain)
+
+    domain.snapshot_delete("patched")
+    domain.snapshot_create("patched", 250)
+
+    snapshots, _, _ = index.list(domain)
+    assert snapshots[-1].created_at == "250"
+    assert domain.builds == 2
+
+
+def test_worker_changes_keep_the_index(domain):
+    index = SnapshotIndex()
+    names(index, domain)
+
+    snapshot = domain.snapshot_create("third", 300)
+    index.added(domain, snapshot_from_xml("web01", snapshot.getXMLDesc()))
+    assert names(index, domain) == (["base", "patched", "third"], "third")
+
+    domain.current = "base"
+    index.reverted(domain, "base")
+    assert names(index, domain)[1] == "base"
+
+    domain.snapshot_delete("third")
+    index.deleted(domain, "third")
+    assert names(index, domain) == (["base", "patched"], "base")
+    assert domain.builds == 1
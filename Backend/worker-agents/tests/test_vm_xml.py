@@ -0,0 +1,262 @@
+"""
+Tests del XML generado para los dominios (plantillas por flavor)
+"""
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+libvirt = pytest.importorskip("libvirt")
+
+from pydantic import ValidationError
+
+from fakes import FakeConnection, FakeDomain, FakeLibvirtError
+from models.vm import DiskConfig, DiskIOTune, NetworkConfig, VMConfig
+from services.vm import VMService
+from services.vm_disks import apply_io_profiles
+from services.vm_xml import DomainDeviceCache, render_domain_xml
+
+
+def vm_config(**kwargs) -> VMConfig:
+    values = {
+        "name": "web01", "vcpus": 4, "memory_mb": 2048,
+        "disks": [DiskConfig(path="/var/lib/libvirt/images/web01.qcow2")],
+        "networks": [NetworkConfig(network_type="bridge", source="br-lab")],
+    }
+    values.update(kwargs)
+    return VMConfig(**values)
+
+
+def render(config: VMConfig) -> ET.Element:
+    return ET.fromstring(render_domain_xml(config))
+
+
+def test_virtio_bridge_defaults_to_one_queue_per_vcpu():
+    interface = render(vm_config()).find("devices/interface")
+    assert interface.get("type") == "bridge"
+    assert interface.find("driver").get("queues") == "4"
+
+
+def test_hostdev_interface_has_no_multiqueue_driver():
+    config = vm_config(networks=[
+        NetworkConfig(network_type="bridge", source="br-lab"),
+        NetworkConfig(network_type="hostdev", mac_address="52:54:00:00:00:01"),
+    ])
+    bridge, hostdev = render(config).findall("devices/interface")
+
+    assert bridge.find("driver").get("queues") == "4"
+    assert hostdev.get("type") == "hostdev"
+    assert hostdev.find("driver") is None
+
+
+def test_hostdev_interface_rejects_queues_and_vhost():
+    with pytest.raises(ValidationError, match="hostdev"):
+        NetworkConfig(network_type="hostdev", queues=4)
+    with pytest.raises(ValidationError, match="hostdev"):
+        NetworkConfig(network_type="hostdev", vhost=True)
+
+
+@pytest.mark.parametrize("vnc_port, port, autoport", [
+    (None, "-1", "yes"),
+    (0, "-1", "yes"),
+    (5901, "5901", "no"),
+])
+def test_vnc_port_zero_means_autoport(vnc_port, port, autoport):
+    graphics = render(vm_config(vnc_port=vnc_port)).find("devices/graphics")
+    assert (graphics.get("port"), graphics.get("autoport")) == (port, autoport)
+
+
+
+def test_default_memory_profile_has_virtio_balloon_and_no_backing():
+    domain = render(vm_config())
+
+    assert domain.find("memoryBacking") is None
+    balloon = domain.find("devices/memballoon")
+    assert balloon.get("model") == "virtio"
+    assert balloon.find("stats").get("period") == "10"
+
+
+def test_hugepages_locked_and_no_ksm_render_memory_backing():
+    domain = render(vm_config(memory_mb=4096, hugepages="1G", memory_locked=True,
+                              ksm_mergeable=False, balloon=False))
+
+    backing = domain.find("memoryBacking")
+    page = backing.find("hugepages/page")
+    assert (page.get("size"), page.get("unit")) == ("1048576", "KiB")
+    assert backing.find("nosharepages") is not None
+    assert backing.find("locked") is not None
+    assert domain.find("devices/memballoon").get("model") == "none"
+
+
+@pytest.mark.parametrize("profile, children", [
+    ({"hugepages": "2M"}, ["hugepages"]),
+    ({"ksm_mergeable": False}, ["nosharepages"]),
+    ({"memory_locked": True}, ["locked"]),
+])
+def test_memory_profiles_do_not_share_a_template(profile, children):
+    # Misma forma de VM: solo el perfil de memoria distingue el flavor
+    render(vm_config())
+    backing = render(vm_config(**profile)).find("memoryBacking")
+
+    assert [child.tag for child in backing] == children
+    assert render(vm_config()).find("memoryBacking") is None
+
+
+def test_hugepages_require_whole_pages():
+    with pytest.raises(ValidationError, match="múltiplo"):
+        vm_config(memory_mb=1536, hugepages="1G")
+    assert vm_config(memory_mb=1536, hugepages="2M").hugepages.size_kib == 2048
+
+
+def disk_drivers(config: VMConfig, io_uring: bool = False) -> list:
+    domain = render(apply_io_profiles(config, io_uring))
+    return [disk.find("driver").attrib for disk in domain.findall("devices/disk")]
+
+
+def test_default_io_profile_leaves_the_driver_untouched():
+    config = vm_config()
+
+    assert apply_io_profiles(config, io_uring=True) is config
+    assert disk_drivers(config) == [{"name": "qemu", "type": "qcow2"}]
+    assert render(config).find("iothreads") is None
+
+
+@pytest.mark.parametrize("disk_format, io_uring, io", [
+    ("qcow2", True, "io_uring"),
+    ("qcow2", False, "native"),
+    ("raw", True, "native"),
+])
+def test_performance_profile_picks_cache_io_and_an_iothread(disk_format, io_uring, io):
+    config = vm_config(disks=[DiskConfig(path="/var/lib/libvirt/images/web01.img",
+                                         format=disk_format, profile="performance")])
+    domain = render(apply_io_profiles(config, io_uring))
+
+    assert domain.findtext("iothreads") == "1"
+    assert domain.find("devices/disk/driver").attrib == {
+        "name": "qemu", "type": disk_format, "cache": "none", "io": io, "iothread": "1"
+    }
+
+
+def test_performance_disks_spread_across_iothreads():
+    disks = [DiskConfig(path=f"/var/lib/libvirt/images/web01-{i}.qcow2", profile="performance")
+             for i in range(3)]
+    drivers = disk_drivers(vm_config(disks=disks, iothreads=2))
+
+    assert [driver["iothread"] for driver in drivers] == ["1", "2", "1"]
+
+
+def test_explicit_disk_options_override_the_profile():
+    disk = DiskConfig(path="/var/lib/libvirt/images/web01.qcow2", profile="performance",
+                      cache="writeback", discard=True, bus="sata")
+    driver, = disk_drivers(vm_config(disks=[disk]), io_uring=True)
+
+    # Sin cache=none no hay AIO nativo; los discos no virtio no usan iothreads
+    assert driver == {"name": "qemu", "type": "qcow2", "cache": "writeback",
+                      "io": "io_uring", "discard": "unmap"}
+
+
+def test_iotune_renders_only_the_limits_set():
+    disk = DiskConfig(path="/var/lib/libvirt/images/web01.qcow2",
+                      iotune=DiskIOTune(total_iops_sec=500, read_bytes_sec=10485760, write_bytes_sec=0))
+    iotune = render(vm_config(disks=[disk])).find("devices/disk/iotune")
+
+    assert {child.tag: child.text for child in iotune} == {
+        "total_iops_sec": "500", "read_bytes_sec": "10485760"
+    }
+    assert render(vm_config()).find("devices/disk/iotune") is None
+
+
+def test_disk_iothread_must_exist():
+    disk = DiskConfig(path="/var/lib/libvirt/images/web01.qcow2", iothread=2)
+    with pytest.raises(ValidationError, match="iothread 2"):
+        vm_config(disks=[disk], iothreads=1)
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"cache": "writeback", "io": "native"}, "io=native"),
+    ({"bus": "sata", "iothread": 1}, "virtio"),
+    ({"iotune": {"total_iops_sec": 100, "read_iops_sec": 50}}, "total_iops_sec"),
+    ({"iotune": {"total_bytes_sec": 100, "write_bytes_sec": 50}}, "total_bytes_sec"),
+])
+def test_invalid_disk_io_options_are_rejected(kwargs, message):
+    with pytest.raises(ValidationError, match=message):
+        DiskConfig(path="/var/lib/libvirt/images/web01.qcow2", **kwargs)
+
+
+class IOTuneDomain(FakeDomain):
+    """Dominio en ejecución con un disco vda y sus límites <iotune>"""
+
+    def __init__(self):
+        super().__init__("web01", state=libvirt.VIR_DOMAIN_RUNNING, domain_id=3)
+        self.iotune = {"total_iops_sec": 0, "read_bytes_sec": 0, "write_bytes_sec": 0}
+        self.set_calls = []
+
+    def blockIoTune(self, device: str, flags: int = 0) -> dict:
+        if device != "vda":
+            raise FakeLibvirtError(f"disk '{device}' not found", libvirt.VIR_ERR_INVALID_ARG)
+        return dict(self.iotune)
+
+    def setBlockIoTune(self, device: str, params: dict, flags: int = 0) -> None:
+        self.blockIoTune(device)
+        self.set_calls.append((params, flags))
+        self.iotune.update(params)
+
+
+def test_disk_iotune_changes_live_and_persistent_definition():
+    domain = IOTuneDomain()
+    service = VMService()
+    conn = FakeConnection(domains=[domain])
+    service._get_connection = lambda: conn
+
+    result = service.set_disk_iotune("web01", "vda", DiskIOTune(total_iops_sec=200, read_bytes_sec=0))
+
+    # Solo se envían los campos pedidos (0 quita el límite)
+    assert domain.set_calls == [(
+        {"total_iops_sec": 200, "read_bytes_sec": 0},
+        libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_AFFECT_LIVE,
+    )]
+    assert (result.total_iops_sec, result.read_bytes_sec) == (200, 0)
+    with pytest.raises(RuntimeError, match="Disco 'vdz' no encontrado"):
+        service.set_disk_iotune("web01", "vdz", DiskIOTune(total_iops_sec=1))
+
+class HotplugDuringRead(FakeDomain):
+    """Dominio cuyo hotplug (y su evento) llega mientras se lee el XML antiguo"""
+
+    def __init__(self, cache: DomainDeviceCache, old_xml: str, new_xml: str):
+        super().__init__("web01", new_xml, domain_id=7)
+        self.cache = cache
+        self.old_xml = old_xml
+        self.reads = 0
+
+    def XMLDesc(self, flags: int = 0) -> str:
+        self.reads += 1
+        if self.reads == 1:
+            self.cache.invalidate(self.UUIDString())
+            return self.old_xml
+        return self._xml
+
+
+def test_device_cache_does_not_store_reads_raced_by_invalidate():
+    one_nic = render_domain_xml(vm_config())
+    two_nics = render_domain_xml(vm_config(networks=[
+        NetworkConfig(network_type="bridge", source="br-lab"),
+        NetworkConfig(network_type="bridge", source="br-mgmt"),
+    ]))
+    cache = DomainDeviceCache()
+    domain = HotplugDuringRead(cache, one_nic, two_nics)
+
+    assert len(cache.devices(domain).networks) == 1
+    # La lectura anterior al evento no quedó cacheada
+    assert len(cache.devices(domain).networks) == 2
+    assert len(cache.devices(domain).networks) == 2
+    assert domain.reads == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_device_cache_clear_discards_in_flight_reads():
+    cache = DomainDeviceCache()
+    domain = FakeDomain("web01", render_domain_xml(vm_config()), domain_id=7)
+    domain.XMLDesc = lambda flags=0: (cache.clear(), FakeDomain.XMLDesc(domain))[1]
+
+    cache.devices(domain)
+    assert cache.stats()["size"] == 0
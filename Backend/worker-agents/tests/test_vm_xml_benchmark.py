@@ -0,0 +1,134 @@
+"""
+Benchmark de generación y lectura de XML de dominios (10000 dominios)
+
+Generación: plantilla compilada por flavor frente a compilarla para cada VM.
+Lectura: solo el bloque <devices> frente al documento completo, sobre XML
+con el aspecto de un dominio activo (cpu con features, seclabel). Ejecutar
+con -s para ver el rendimiento.
+"""
+
+import time
+import xml.etree.ElementTree as ET
+
+import pytest
+
+pytest.importorskip("libvirt")
+
+from models.vm import DiskConfig, NetworkConfig, VMConfig
+from services import vm_xml
+from services.vm_xml import (
+    DomainDevices, _compiled_template, _parse_disk, _parse_interface, parse_domain_devices,
+    render_domain_xml
+)
+
+
+DOMAINS = 10000
+FLAVORS = [(1, 1024, 1, 1), (2, 2048, 1, 1), (2, 4096, 2, 1), (4, 8192, 2, 2)]
+
+ACTIVE_CPU = "<cpu mode='custom' match='exact' check='full'>\n    <model fallback='forbid'>Skylake-Server-IBRS</model>\n" + "".join(
+    f"    <feature policy='require' name='{feature}'/>\n"
+    for feature in ("ss", "vmx", "pdcm", "hypervisor", "tsc_adjust", "clflushopt", "umip", "pku",
+                    "md-clear", "stibp", "arch-capabilities", "ssbd", "xsaves", "ibpb", "amd-stibp",
+                    "amd-ssbd", "rdctl-no", "ibrs-all", "skip-l1dfl-vmentry", "mds-no")
+) + "  </cpu>"
+ACTIVE_SECLABEL = (
+    "  <seclabel type='dynamic' model='selinux' relabel='yes'>\n"
+    "    <label>system_u:system_r:svirt_t:s0:c123,c456</label>\n"
+    "    <imagelabel>system_u:object_r:svirt_image_t:s0:c123,c456</imagelabel>\n"
+    "  </seclabel>\n"
+    "  <seclabel type='dynamic' model='dac' relabel='yes'>\n"
+    "    <label>+107:+107</label>\n"
+    "    <imagelabel>+107:+107</imagelabel>\n"
+    "  </seclabel>\n</domain>"
+)
+
+
+def make_configs():
+    configs = []
+    for i in range(DOMAINS):
+        vcpus, memory_mb, disks, nics = FLAVORS[i % len(FLAVORS)]
+        name = f"lab{i // 100:03d}-vm{i % 100:02d}"
+        configs.append(VMConfig(
+            name=name, vcpus=vcpus, memory_mb=memory_mb,
+            disks=[DiskConfig(path=f"/var/lib/libvirt/images/{name}-{d}.qcow2") for d in range(disks)],
+            networks=[
+                NetworkConfig(network_type="bridge", source=f"br-lab{i // 100:03d}",
+                              mac_address=f"52:54:00:{i >> 8 & 0xff:02x}:{i & 0xff:02x}:{n:02x}")
+                for n in range(nics)
+            ]
+        ))
+    return configs
+
+
+def as_active(xml_desc: str) -> str:
+    """Añadir lo que libvirt incluye en el XML de un dominio en ejecución"""
+    return xml_desc.replace("<cpu mode='host-model'/>", ACTIVE_CPU).replace("</domain>", ACTIVE_SECLABEL)
+
+
+def parse_full_document(xml_desc: str) -> DomainDevices:
+    """Referencia: documento completo y búsquedas recursivas"""
+    root = ET.fromstring(xml_desc)
+    disks = [disk for disk in (_parse_disk(elem) for elem in root.findall(".//devices/disk")) if disk]
+    networks = [_parse_interface(elem) for elem in root.findall(".//devices/interface")]
+    graphics = root.find(".//devices/graphics[@type='vnc']")
+    return DomainDevices(int(graphics.get("port", 0)) if graphics is not None else None, networks, disks)
+
+
+def rate(count: int, seconds: float) -> str:
+    return f"{count / seconds:,.0f}/s ({seconds * 1000:.0f} ms)"
+
+
+@pytest.fixture(scope="module")
+def configs():
+    return make_configs()
+
+
+def best_of(rounds: int, function, *args):
+    """Menor tiempo de varias rondas (la ventaja de la caché es de ~1.5x y una pausa la taparía)"""
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - started)
+    return result, min(timings)
+
+
+def render_all(configs) -> list:
+    return [render_domain_xml(config) for config in configs]
+
+
+def test_template_build_throughput(configs, monkeypatch):
+    _compiled_template.cache_clear()
+    documents, cached = best_of(3, render_all, configs)
+    misses = _compiled_template.cache_info().misses
+
+    # Misma generación compilando la plantilla para cada VM
+    monkeypatch.setattr(vm_xml, "_compiled_template", _compiled_template.__wrapped__)
+    uncached_documents, uncached = best_of(3, render_all, configs)
+
+    print(f"\ngeneración: plantilla en caché {rate(DOMAINS, cached)}, compilando por VM {rate(DOMAINS, uncached)}")
+
+    assert misses == len(FLAVORS)
+    assert uncached_documents == documents
+    assert ET.fromstring(documents[-1]).findtext("name") == configs[-1].name
+    assert cached < uncached
+
+
+def test_device_parse_throughput(configs):
+    documents = [as_active(render_domain_xml(config)) for config in configs]
+
+    started = time.perf_counter()
+    fragment = [parse_domain_devices(xml_desc) for xml_desc in documents]
+    fragment_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    full = [parse_full_document(xml_desc) for xml_desc in documents]
+    full_seconds = time.perf_counter() - started
+
+    print(f"\nlectura: solo <devices> {rate(DOMAINS, fragment_seconds)}, "
+          f"documento completo {rate(DOMAINS, full_seconds)}")
+
+    assert fragment == full
+    assert fragment[1].disks[0]["path"] == "/var/lib/libvirt/images/lab000-vm01-0.qcow2"
+    assert fragment[1].networks[0] == {"type": "bridge", "mac": "52:54:00:00:01:00", "source": "br-lab000"}
+    assert fragment_seconds < full_seconds
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Capa de ejecución asíncrona para operaciones bloqueantes
+TeleCluster Orchestrator - Worker Agent
+
+Las llamadas a libvirt y a comandos del sistema (ip, iptables, ovs-vsctl)
+bloquean el hilo que las ejecuta. Los endpoints son async, por lo que se
+derivan a pools de hilos acotados o a subprocesos asíncronos para que el
+bucle de eventos siga atendiendo peticiones (p.ej. /health) mientras tanto.
+"""
+
+import asyncio
+import functools
+import logging
+import subprocess
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de los pools de hilos
+LIBVIRT_POOL_SIZE = 8
+SYSTEM_POOL_SIZE = 16
+
+# Creaciones en lote simultáneas: la otra mitad del pool de libvirt queda
+# libre para el resto de endpoints (listados, acciones, consola...)
+BULK_CREATE_LIMIT = LIBVIRT_POOL_SIZE // 2
+
+# Concurrencia máxima por recurso (la clave es el prefijo antes de ':')
+# La suma de los límites del pool de sistema deja hilos libres para /health
+RESOURCE_LIMITS = {
+    "iptables": 1,      # xtables usa un lock global: serializar evita esperas
+    "ovs": 4,
+    "ip": 8,
+    "diagnostics": 4,   # ping / traceroute
+    "vm": 1,            # vm:<nombre> -> una operación mutante por VM
+}
+DEFAULT_RESOURCE_LIMIT = 4
+
+_libvirt_executor = ThreadPoolExecutor(max_workers=LIBVIRT_POOL_SIZE, thread_name_prefix="libvirt")
+_system_executor = ThreadPoolExecutor(max_workers=SYSTEM_POOL_SIZE, thread_name_prefix="system")
+
+# Los semáforos por clave (p.ej. vm:<nombre>) se liberan cuando nadie los usa
+_semaphores: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+
+
+def _semaphore(resource: str) -> asyncio.Semaphore:
+    """Obtener (o crear) el semáforo de un recurso"""
+    semaphore = _semaphores.get(resource)
+    if semaphore is None:
+        limit = RESOURCE_LIMITS.get(resource.split(":", 1)[0], DEFAULT_RESOURCE_LIMIT)
+        semaphore = asyncio.Semaphore(limit)
+        _semaphores[resource] = semaphore
+    return semaphore
+
+
+async def _run_in_executor(executor: ThreadPoolExecutor, func: Callable, args: tuple,
+                           kwargs: Dict[str, Any], resource: Optional[str]) -> Any:
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    if resource is None:
+        return await loop.run_in_executor(executor, call)
+
+    semaphore = _semaphore(resource)
+    async with semaphore:
+        return await loop.run_in_executor(executor, call)
+
+
+async def run_libvirt(func: Callable, *args, resource: Optional[str] = None, **kwargs) -> Any:
+    """
+    Ejecutar una llamada bloqueante a libvirt en el pool de libvirt
+
+    Args:
+        func: Función a ejecutar
+        resource: Recurso a serializar (p.ej. "vm:<nombre>"), opcional
+    """
+    return await _run_in_executor(_libvirt_executor, func, args, kwargs, resource)
+
+
+async def run_blocking(func: Callable, *args, resource: Optional[str] = None, **kwargs) -> Any:
+    """
+    Ejecutar una función bloqueante (comandos de red, ficheros) en el pool de sistema
+
+    Args:
+        func: Función a ejecutar
+        resource: Recurso cuyo límite de concurrencia aplicar (ip, iptables, ovs...)
+    """
+    return await _run_in_executor(_system_executor, func, args, kwargs, resource)
+
+
+async def run_command(cmd: List[str], timeout: Optional[float] = None,
+                      resource: Optional[str] = None, check: bool = False,
+                      input: Optional[str] = None) -> subprocess.CompletedProcess:
+    """
+    Ejecutar un comando como subproceso asíncrono (sin ocupar hilos)
+
+    Args:
+        cmd: Comando como lista de argumentos (sin shell)
+        timeout: Segundos máximos de ejecución
+        resource: Recurso cuyo límite de concurrencia aplicar
+        check: Lanzar CalledProcessError si el código de salida no es 0
+        input: Texto a escribir en la entrada estándar
+
+    Returns:
+        CompletedProcess con stdout/stderr como texto, igual que subprocess.run
+
+    Raises:
+        subprocess.TimeoutExpired: Si se supera el timeout (el proceso se mata)
+        subprocess.CalledProcessError: Si check=True y el comando falla
+    """
+    if resource is None:
+        return await _spawn(cmd, timeout, check, input)
+
+    async with _semaphore(resource):
+        return await _spawn(cmd, timeout, check, input)
+
+
+async def _spawn(cmd: List[str], timeout: Optional[float], check: bool,
+                 input: Optional[str]) -> subprocess.CompletedProcess:
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    try:
+        stdout, stderr = await asyncio.wait_for(
+            process.communicate(input.encode() if input is not None else None),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+
+    result = subprocess.CompletedProcess(
+        cmd, process.returncode,
+        stdout.decode(errors="replace"), stderr.decode(errors="replace")
+    )
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            result.returncode, cmd, output=result.stdout, stderr=result.stderr
+        )
+    return result
+
+
+def shutdown_executors() -> None:
+    """Detener los pools de hilos (al cerrar la aplicación)"""
+    _libvirt_executor.shutdown(wait=False, cancel_futures=True)
+    _system_executor.shutdown(wait=False, cancel_futures=True)
+    logger.info("Pools de ejecución detenidos")